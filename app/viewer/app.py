@@ -55,6 +55,8 @@ from app.viewer.styles import Theme
 from core.engine.game_controller import GameController
 from core.engine.game_io import DICE_CANCEL_TOKEN, dice_values_from_user_text, parse_dice_values
 from core.engine.event_bus import get_event_bus
+from core.engine.state_export import subscribe_state_written, unsubscribe_state_written
+from core.engine.state_stream import stream_path_for
 from core.engine.mission import validate_deploy_coord
 
 
@@ -280,6 +282,8 @@ class HoverLogListWidget(QtWidgets.QListWidget):
 
 
 class ViewerWindow(QtWidgets.QMainWindow):
+    statePushed = QtCore.Signal()
+
     def __init__(self, state_path, model_path=None):
         super().__init__()
         self.state_path = state_path
@@ -478,8 +482,22 @@ class ViewerWindow(QtWidgets.QMainWindow):
         if app is not None:
             app.installEventFilter(self)
 
+        # Кадры приходят push-ом: из движка в этом процессе и через QFileSystemWatcher из чужого.
+        self._state_push_pending = False
+        self.statePushed.connect(self._on_state_pushed, QtCore.Qt.QueuedConnection)
+        subscribe_state_written(self._on_state_written)
+        self._state_fs_watcher = QFileSystemWatcher(self)
+        self._state_fs_watcher.directoryChanged.connect(lambda _path: self._request_state_push())
+        self._state_fs_watcher.fileChanged.connect(lambda _path: self._request_state_push())
+        self._watch_state_files()
+
+        # Опрос остаётся страховкой (сетевые ФС, потерянные события ФС).
+        try:
+            poll_ms = max(50, int(os.getenv("VIEWER_STATE_POLL_MS", "1000")))
+        except (TypeError, ValueError):
+            poll_ms = 1000
         self.timer = QtCore.QTimer(self)
-        self.timer.setInterval(300)
+        self.timer.setInterval(poll_ms)
         self.timer.timeout.connect(self._poll_state)
         self.timer.start()
 
@@ -1906,6 +1924,38 @@ class ViewerWindow(QtWidgets.QMainWindow):
     def _fit_view(self):
         self.map_scene.fit_to_view()
 
+    def _watch_state_files(self) -> None:
+        watcher = self._state_fs_watcher
+        state_path = os.path.abspath(self.state_path)
+        state_dir = os.path.dirname(state_path)
+        # os.replace снимает файл с наблюдения — каталог ловит атомарные записи, файлы ловят дозапись потока.
+        candidates = [state_dir, state_path, stream_path_for(state_path)]
+        watched = set(watcher.files()) | set(watcher.directories())
+        missing = [path for path in candidates if path not in watched and os.path.exists(path)]
+        if missing:
+            watcher.addPaths(missing)
+
+    def _on_state_written(self, state_path, _state_seq):
+        # Вызывается из потока движка: только ставим кадр в очередь GUI-потока.
+        if os.path.abspath(state_path) != os.path.abspath(self.state_path):
+            return
+        self._request_state_push()
+
+    def _request_state_push(self) -> None:
+        if self._state_push_pending:
+            return
+        self._state_push_pending = True
+        self.statePushed.emit()
+
+    def _on_state_pushed(self) -> None:
+        self._state_push_pending = False
+        self._watch_state_files()
+        self._poll_state()
+
+    def closeEvent(self, event):
+        unsubscribe_state_written(self._on_state_written)
+        super().closeEvent(event)
+
     def _poll_state(self):
         if not os.path.exists(self.state_watcher.path):
             self.map_scene.set_error_message(
@@ -2,7 +2,9 @@ import json
 import os
 import time
 from dataclasses import dataclass, field
-from typing import Any, Dict
+from typing import Any, Dict, Optional
+
+from core.engine.state_stream import StateStreamReader, stream_path_for
 
 
 def _default_state() -> Dict[str, Any]:
@@ -62,8 +64,31 @@ class StateWatcher:
     mtime_ns: int = 0
     size: int = -1
     state: Dict[str, Any] = field(default_factory=_default_state)
+    stream: Optional[StateStreamReader] = None
+
+    def __post_init__(self) -> None:
+        if self.stream is None:
+            self.stream = StateStreamReader(stream_path_for(self.path))
+
+    def _stream_is_current(self) -> bool:
+        # Поток свежее state.json → движок пишет в режиме STATE_STREAM_MODE=stream.
+        try:
+            stream_mtime = os.stat(self.stream.path).st_mtime_ns
+        except OSError:
+            return False
+        try:
+            json_mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return True
+        return stream_mtime >= json_mtime
 
     def load_if_changed(self) -> bool:
+        if self._stream_is_current():
+            payload = self.stream.poll()
+            if payload is None:
+                return False
+            self.state = merge_with_defaults(payload)
+            return True
         if not os.path.exists(self.path):
             return False
         stat = os.stat(self.path)
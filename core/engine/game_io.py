@@ -1,16 +1,17 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from collections import deque
 from typing import Any, Dict, Optional, List
 import re
 import os
 import threading
 import queue
 import atexit
-import time
+import datetime
 
 from core.engine.io_profiler import get_io_profiler
-from project_paths import RESPONSE_PATH
+from project_paths import AGENT_TRAIN_LOG_PATH, RESPONSE_PATH
 
 
 LOG_DEFAULT_PATH = str(RESPONSE_PATH)
@@ -18,8 +19,25 @@ DICE_CANCEL_TOKEN = "__cancel_shoot__"
 
 
 class _AsyncLogWriter:
+    """Общий буферизованный приёмник строк логов (GUI/консоль, AGENT_LOG_FILE среды).
+
+    submit() — только append в deque (без локов и syscalls на игровом потоке); фоновый поток
+    раз в GUI_LOG_FLUSH_INTERVAL_SEC (или по набору GUI_LOG_BATCH_SIZE строк) забирает всё
+    накопленное и пишет одним writelines на файл. flush() дописывает хвост синхронно.
+
+    Очередь ограничена GUI_LOG_MAX_PENDING строками: при переполнении строка отбрасывается
+    (и будит воркер), счётчик потерь по файлу пишется в сам лог при shutdown(). atexit в
+    дочерних процессах multiprocessing не вызывается — воркеры зовут flush_log_writer() сами.
+    """
+
     def __init__(self) -> None:
-        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self._pending: deque = deque()
+        self._max_pending = max(1, int(os.getenv("GUI_LOG_MAX_PENDING", "10000") or "10000"))
+        self._dropped: dict[str, int] = {}
+        self._batch_size = max(1, int(os.getenv("GUI_LOG_BATCH_SIZE", "32") or "32"))
+        self._flush_interval = max(0.05, float(os.getenv("GUI_LOG_FLUSH_INTERVAL_SEC", "0.20") or "0.20"))
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
         self._stop = threading.Event()
         self._thread = threading.Thread(target=self._worker, name="game-io-log-writer", daemon=True)
         self._thread.start()
@@ -27,31 +45,24 @@ class _AsyncLogWriter:
     def submit(self, path: str, message: str) -> None:
         if message is None:
             return
-        try:
-            self._queue.put_nowait((path, message.rstrip("\n") + "\n"))
-        except queue.Full:
+        if len(self._pending) >= self._max_pending:
             # Не блокируем игровой поток из-за переполнения очереди логов.
+            get_io_profiler().incr("log dropped")
+            self._dropped[path] = self._dropped.get(path, 0) + 1
+            self._wake.set()
             return
-
-    def _worker(self) -> None:
-        batch_size = max(1, int(os.getenv("GUI_LOG_BATCH_SIZE", "32") or "32"))
-        flush_interval = max(0.05, float(os.getenv("GUI_LOG_FLUSH_INTERVAL_SEC", "0.20") or "0.20"))
-        pending: dict[str, list[str]] = {}
-        last_flush = time.monotonic()
-
-        while not self._stop.is_set() or not self._queue.empty():
-            timeout = max(0.01, flush_interval - (time.monotonic() - last_flush))
-            try:
-                path, payload = self._queue.get(timeout=timeout)
+        self._pending.append((path, message.rstrip("\n") + "\n"))
+        if len(self._pending) >= self._batch_size:
+            self._wake.set()
+
+    def _drain(self) -> None:
+        # Лок держим и на выборку, и на запись — иначе flush() из другого потока обгонит
+        # уже выбранную воркером пачку и строки в файле перемешаются.
+        with self._write_lock:
+            pending: dict[str, list[str]] = {}
+            while self._pending:
+                path, payload = self._pending.popleft()
                 pending.setdefault(path, []).append(payload)
-            except queue.Empty:
-                pass
-
-            buffered = sum(len(lines) for lines in pending.values())
-            should_flush = buffered >= batch_size or (time.monotonic() - last_flush) >= flush_interval
-            if not should_flush or not pending:
-                continue
-
             for path, lines in pending.items():
                 try:
                     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -60,18 +71,39 @@ class _AsyncLogWriter:
                             handle.writelines(lines)
                 except OSError:
                     continue
-            pending.clear()
-            last_flush = time.monotonic()
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self._flush_interval)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def flush(self) -> None:
+        self._drain()
 
     def shutdown(self) -> None:
         self._stop.set()
+        self._wake.set()
         self._thread.join(timeout=1.0)
+        dropped, self._dropped = self._dropped, {}
+        for path, count in dropped.items():
+            self._pending.append((path, f"[LOG] log writer dropped {count} line(s): buffer full\n"))
+        self._drain()
+
+    def dropped_lines(self) -> dict[str, int]:
+        return dict(self._dropped)
 
 
 _ASYNC_LOG_WRITER = _AsyncLogWriter()
 atexit.register(_ASYNC_LOG_WRITER.shutdown)
 
 
+def flush_log_writer() -> None:
+    """Дописать накопленные строки логов на диск (перед чтением лог-файла / выходом)."""
+    _ASYNC_LOG_WRITER.flush()
+
+
 @dataclass
 class Request:
     kind: str
@@ -170,9 +202,16 @@ def parse_dice_values(text: str, count: int, min_value: int = 1, max_value: int
 
 
 def _append_log_line(message: str, path: Optional[str] = None) -> None:
+    append_log_line(message, path)
+
+
+def append_log_line(message: str, path: Optional[str] = None, *, category: Optional[str] = None) -> None:
+    """Строка в лог-файл через общий буферизованный writer; ``category`` — счётчик ``log lines[...]`` в IOProfiler."""
     if message is None:
         return
     log_path = path or LOG_DEFAULT_PATH
+    if category:
+        get_io_profiler().incr(f"log lines[{category}]")
     async_enabled = os.getenv("GUI_LOG_ASYNC_WRITE", "1") == "1"
     if async_enabled:
         _ASYNC_LOG_WRITER.submit(log_path, message)
@@ -184,6 +223,12 @@ def _append_log_line(message: str, path: Optional[str] = None) -> None:
             handle.write(message.rstrip("\n") + "\n")
 
 
+def append_train_agent_log(message: str) -> None:
+    """Строка с меткой времени в агентский лог обучения — дефолтный ``log`` фоновых помощников вместо print."""
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    append_log_line(f"{timestamp} | {message}", str(AGENT_TRAIN_LOG_PATH), category="train")
+
+
 class ConsoleIO(BaseIO):
     def __init__(self, log_path: Optional[str] = None):
         self.log_path = log_path or LOG_DEFAULT_PATH
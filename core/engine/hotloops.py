@@ -13,6 +13,7 @@ def _as_bool_env(name: str, default: bool = True) -> bool:
 
 _NUMBA_ENABLED = False
 _numba_scan_targets = None
+_numba_batch_raytrace = None
 
 if _as_bool_env("ENABLE_NUMBA_HOTLOOPS", default=True):
     try:
@@ -35,9 +36,82 @@ if _as_bool_env("ENABLE_NUMBA_HOTLOOPS", default=True):
                     count += 1
             return out[:count]
 
+        @njit(cache=True)
+        def _numba_batch_raytrace(
+            a_points: np.ndarray,
+            b_points: np.ndarray,
+            opaque: np.ndarray,
+            obscuring: np.ndarray,
+            blocked_out: np.ndarray,
+            obscured_out: np.ndarray,
+        ) -> None:
+            w = opaque.shape[0]
+            h = opaque.shape[1]
+            inf = np.inf
+            for r in range(a_points.shape[0]):
+                x0 = a_points[r, 0]
+                y0 = a_points[r, 1]
+                x1 = b_points[r, 0]
+                y1 = b_points[r, 1]
+                x = int(np.floor(x0))
+                y = int(np.floor(y0))
+                xe = int(np.floor(x1))
+                ye = int(np.floor(y1))
+                blocked = False
+                obscured = False
+                if x != xe or y != ye:
+                    dx = x1 - x0
+                    dy = y1 - y0
+                    sx = 0 if dx == 0 else (1 if dx > 0 else -1)
+                    sy = 0 if dy == 0 else (1 if dy > 0 else -1)
+                    if sx != 0:
+                        tdx = abs(1.0 / dx)
+                        tmx = ((x + 1.0) - x0) / dx if sx > 0 else (x0 - float(x)) / (-dx)
+                    else:
+                        tdx = inf
+                        tmx = inf
+                    if sy != 0:
+                        tdy = abs(1.0 / dy)
+                        tmy = ((y + 1.0) - y0) / dy if sy > 0 else (y0 - float(y)) / (-dy)
+                    else:
+                        tdy = inf
+                        tmy = inf
+                    cap = abs(xe - x) + abs(ye - y) + 2
+                    steps = 0
+                    while (x != xe or y != ye) and steps < cap:
+                        steps += 1
+                        if tmx < tmy:
+                            x += sx
+                            tmx += tdx
+                            mid = x != xe or y != ye
+                        elif tmy < tmx:
+                            y += sy
+                            tmy += tdy
+                            mid = x != xe or y != ye
+                        else:
+                            # Corner hit: the first of the two cells is always a middle cell.
+                            x += sx
+                            if 0 <= x < w and 0 <= y < h:
+                                if opaque[x, y]:
+                                    blocked = True
+                                if obscuring[x, y]:
+                                    obscured = True
+                            y += sy
+                            tmx += tdx
+                            tmy += tdy
+                            mid = x != xe or y != ye
+                        if mid and 0 <= x < w and 0 <= y < h:
+                            if opaque[x, y]:
+                                blocked = True
+                            if obscuring[x, y]:
+                                obscured = True
+                blocked_out[r] = blocked
+                obscured_out[r] = obscured
+
         _NUMBA_ENABLED = True
     except Exception:
         _numba_scan_targets = None
+        _numba_batch_raytrace = None
 
 
 def scan_targets_in_range(
@@ -68,3 +142,91 @@ def scan_targets_in_range(
     dy = coords[:, 1] - float(src[1])
     mask = (health > 0) & (in_attack == 0) & ((dx * dx + dy * dy) <= range_sq)
     return np.flatnonzero(mask).astype(np.int64), False
+
+
+def _numpy_batch_raytrace(
+    a_points: np.ndarray,
+    b_points: np.ndarray,
+    opaque: np.ndarray,
+    obscuring: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Та же DDA-траверсия, что visibility.raytrace, но шагом по всем лучам сразу."""
+    n = a_points.shape[0]
+    w, h = opaque.shape
+    x0 = a_points[:, 0]
+    y0 = a_points[:, 1]
+    x1 = b_points[:, 0]
+    y1 = b_points[:, 1]
+    x = np.floor(x0).astype(np.int64)
+    y = np.floor(y0).astype(np.int64)
+    xe = np.floor(x1).astype(np.int64)
+    ye = np.floor(y1).astype(np.int64)
+    dx = x1 - x0
+    dy = y1 - y0
+    sx = np.sign(dx).astype(np.int64)
+    sy = np.sign(dy).astype(np.int64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tdx = np.where(sx != 0, np.abs(1.0 / dx), np.inf)
+        tdy = np.where(sy != 0, np.abs(1.0 / dy), np.inf)
+        tmx = np.where(sx > 0, ((x + 1.0) - x0) / dx, np.where(sx < 0, (x0 - x) / (-dx), np.inf))
+        tmy = np.where(sy > 0, ((y + 1.0) - y0) / dy, np.where(sy < 0, (y0 - y) / (-dy), np.inf))
+    blocked = np.zeros(n, dtype=bool)
+    obscured = np.zeros(n, dtype=bool)
+    cap = np.abs(xe - x) + np.abs(ye - y) + 2
+
+    def _mark(cx: np.ndarray, cy: np.ndarray, mask: np.ndarray) -> None:
+        mask = mask & (cx >= 0) & (cx < w) & (cy >= 0) & (cy < h)
+        if not mask.any():
+            return
+        idx = np.flatnonzero(mask)
+        blocked[idx] |= opaque[cx[idx], cy[idx]]
+        obscured[idx] |= obscuring[cx[idx], cy[idx]]
+
+    steps = np.zeros(n, dtype=np.int64)
+    active = ((x != xe) | (y != ye)) & (steps < cap)
+    while active.any():
+        steps += active
+        mx = active & (tmx < tmy)
+        my = active & (tmy < tmx)
+        corner = active & ~mx & ~my
+        step_x = mx | corner
+        x = np.where(step_x, x + sx, x)
+        # угол: первая из двух клеток (сдвиг по x) всегда промежуточная
+        _mark(x, y, corner)
+        step_y = my | corner
+        y = np.where(step_y, y + sy, y)
+        tmx = np.where(step_x, tmx + tdx, tmx)
+        tmy = np.where(step_y, tmy + tdy, tmy)
+        _mark(x, y, active & ((x != xe) | (y != ye)))
+        active = ((x != xe) | (y != ye)) & (steps < cap)
+    return blocked, obscured
+
+
+def batch_raytrace(
+    a_points: np.ndarray,
+    b_points: np.ndarray,
+    opaque_grid: np.ndarray,
+    obscuring_grid: np.ndarray | None = None,
+) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """
+    Пакетная трассировка N лучей a_points[i] -> b_points[i] по сетке.
+    Возвращает tuple: (blocked[N], obscured[N], использован_numba) — флаги по промежуточным
+    клеткам луча (без начальной и конечной), как _build_ray_report в visibility.py.
+    Сетки индексируются [cell[0], cell[1]]; клетки вне сетки считаются пустыми.
+    """
+    a = np.ascontiguousarray(a_points, dtype=np.float64).reshape(-1, 2)
+    b = np.ascontiguousarray(b_points, dtype=np.float64).reshape(-1, 2)
+    opaque = np.ascontiguousarray(opaque_grid, dtype=np.bool_)
+    obscuring = np.zeros_like(opaque) if obscuring_grid is None else np.ascontiguousarray(obscuring_grid, dtype=np.bool_)
+    n = a.shape[0]
+    if n == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0, dtype=bool), _NUMBA_ENABLED
+
+    if _NUMBA_ENABLED and _numba_batch_raytrace is not None:
+        blocked = np.empty(n, dtype=np.bool_)
+        obscured = np.empty(n, dtype=np.bool_)
+        _numba_batch_raytrace(a, b, opaque, obscuring, blocked, obscured)
+        return blocked, obscured, True
+
+    blocked, obscured = _numpy_batch_raytrace(a, b, opaque, obscuring)
+    return blocked, obscured, False
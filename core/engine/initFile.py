@@ -8,6 +8,7 @@ if str(_PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(_PROJECT_ROOT))
 
 from project_paths import CORE_DIR, TRAIN_DATA_PATH, UNITS_PATH, ensure_runtime_dirs
+from core.engine.unitData import unit_catalog
 
 
 _UNIT_DATA_PATH = str(CORE_DIR / "engine" / "unitData.json")
@@ -131,18 +132,17 @@ def addingWeapons(m, e, selected_model=None, selected_enemy=None):
     if selected_enemy is None:
         selected_enemy = []
 
-    with open(_UNIT_DATA_PATH, encoding="utf-8") as j:
-        data = json.loads(j.read())
+    catalog = unit_catalog(_UNIT_DATA_PATH)
 
     model = []
     enemy = []
 
-    for i in data["UnitData"]:
+    for i in catalog.units:
         for idx, j in enumerate(m):
             weaps = ["None", "None"]
             if i["Name"] == j:
                 for k in i["Weapons"]:
-                    for l in data["WeaponData"]:
+                    for l in catalog.weapons:
                         if l["Name"][0:len(k)].lower() == k.lower():
                             if l["Type"] == "Ranged":
                                 weaps[0] = l["Name"]
@@ -162,7 +162,7 @@ def addingWeapons(m, e, selected_model=None, selected_enemy=None):
             weaps = ["None", "None"]
             if i["Name"] == j:
                 for k in i["Weapons"]:
-                    for l in data["WeaponData"]:
+                    for l in catalog.weapons:
                         if l["Name"].lower() == k.lower():
                             if l["Type"] == "Ranged":
                                 weaps[0] = l["Name"]
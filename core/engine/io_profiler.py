@@ -9,12 +9,13 @@ from typing import Iterator
 
 
 class IOProfiler:
-    """Лёгкий агрегатор таймингов I/O по категориям."""
+    """Лёгкий агрегатор таймингов I/O по категориям (+ простые счётчики событий без тайминга)."""
 
     def __init__(self) -> None:
         self._enabled = os.getenv("IO_PROFILE_ENABLED", "1") == "1"
         self._lock = threading.Lock()
         self._stats: dict[str, dict[str, float]] = {}
+        self._counters: dict[str, int] = {}
 
     @property
     def enabled(self) -> bool:
@@ -31,6 +32,16 @@ class IOProfiler:
             slot["total_s"] += float(elapsed_s)
             slot["max_s"] = max(slot["max_s"], float(elapsed_s))
 
+    def incr(self, counter: str, n: int = 1) -> None:
+        if not self._enabled:
+            return
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + int(n)
+
+    def counters(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
     @contextmanager
     def timed(self, category: str) -> Iterator[None]:
         started = time.perf_counter()
@@ -63,6 +74,7 @@ class IOProfiler:
         payload = {
             "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
             "categories": self.snapshot(),
+            "counters": self.counters(),
         }
         with open(profile_path, "w", encoding="utf-8") as handle:
             json.dump(payload, handle, ensure_ascii=False, indent=2)
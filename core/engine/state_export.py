@@ -1,6 +1,8 @@
+import itertools
 import json
 import os
 import tempfile
+import threading
 import time
 from datetime import datetime
 
@@ -8,11 +10,40 @@ from core.engine.visibility import visibility_report
 
 from core.engine.event_bus import get_event_recorder
 from core.engine.io_profiler import get_io_profiler
+from core.engine.state_stream import get_state_stream_writer, state_stream_mode, stream_path_for
 from project_paths import RESPONSE_PATH, STATE_JSON_PATH
 
 
 DEFAULT_STATE_PATH = str(STATE_JSON_PATH)
 
+# Push-уведомления о записанном состоянии (viewer в том же процессе реагирует без опроса).
+_STATE_SEQ = itertools.count(1)
+_STATE_LISTENERS: list = []
+_STATE_LISTENERS_LOCK = threading.Lock()
+
+
+def subscribe_state_written(callback) -> None:
+    """callback(state_path, state_seq) вызывается после каждой атомарной записи состояния."""
+    with _STATE_LISTENERS_LOCK:
+        if callback not in _STATE_LISTENERS:
+            _STATE_LISTENERS.append(callback)
+
+
+def unsubscribe_state_written(callback) -> None:
+    with _STATE_LISTENERS_LOCK:
+        if callback in _STATE_LISTENERS:
+            _STATE_LISTENERS.remove(callback)
+
+
+def _notify_state_written(state_path: str, state_seq: int) -> None:
+    with _STATE_LISTENERS_LOCK:
+        listeners = list(_STATE_LISTENERS)
+    for callback in listeners:
+        try:
+            callback(state_path, state_seq)
+        except Exception:
+            continue
+
 
 def _safe_int(value, fallback=None):
     try:
@@ -270,63 +301,70 @@ def _nearest_barricade_distance(env, unit_cell: tuple[int, int]) -> float | None
     return float(min_dist)
 
 
-def _unit_status_payload(env, side: str, idx: int) -> dict:
-    own_coords = env.unit_coords if side == "model" else env.enemy_coords
+def _status_distance(env, attacker_side: str, attacker_idx: int, target_side: str, target_idx: int) -> float:
+    if hasattr(env, "_shooting_distance_between_units"):
+        try:
+            return float(env._shooting_distance_between_units(attacker_side, int(attacker_idx), target_side, int(target_idx)))
+        except Exception:
+            pass
+    if hasattr(env, "_distance_between_units"):
+        try:
+            return float(env._distance_between_units(attacker_side, int(attacker_idx), target_side, int(target_idx)))
+        except Exception:
+            pass
+    attacker_pool = env.unit_coords if attacker_side == "model" else env.enemy_coords
+    target_pool = env.unit_coords if target_side == "model" else env.enemy_coords
+    if not (0 <= int(attacker_idx) < len(attacker_pool) and 0 <= int(target_idx) < len(target_pool)):
+        return float("inf")
+    attacker_cell = (int(attacker_pool[int(attacker_idx)][0]), int(attacker_pool[int(attacker_idx)][1]))
+    target_cell = (int(target_pool[int(target_idx)][0]), int(target_pool[int(target_idx)][1]))
+    return float(max(abs(attacker_cell[0] - target_cell[0]), abs(attacker_cell[1] - target_cell[1])))
+
+
+def _status_has_los(env, terrain: dict, attacker_side: str, attacker_idx: int, target_side: str, target_idx: int) -> bool:
+    if hasattr(env, "_unit_has_los"):
+        try:
+            return bool(env._unit_has_los(attacker_side, int(attacker_idx), target_side, int(target_idx)))
+        except Exception:
+            pass
+    attacker_pool = env.unit_coords if attacker_side == "model" else env.enemy_coords
+    target_pool = env.unit_coords if target_side == "model" else env.enemy_coords
+    if not (0 <= int(attacker_idx) < len(attacker_pool) and 0 <= int(target_idx) < len(target_pool)):
+        return False
+    attacker_cell = (int(attacker_pool[int(attacker_idx)][0]), int(attacker_pool[int(attacker_idx)][1]))
+    target_cell = (int(target_pool[int(target_idx)][0]), int(target_pool[int(target_idx)][1]))
+    report = visibility_report(
+        attacker_cell,
+        target_cell,
+        opaque_cells_set=terrain["opaque"],
+        obscuring_cells_set=terrain["obscuring"],
+        target_cover_cells_set=_target_cover_cells(env, target_cell, radius=3),
+        visibility_mode=terrain["visibility_mode"],
+    )
+    return bool(report.get("los", False))
+
+
+def _status_terrain(env, versions: dict | None = None) -> dict:
+    """Террейн-входы статуса; у env с кэшем статусов живут до смены раскладки."""
+    def _build() -> dict:
+        return {
+            "obscuring": env.get_terrain_obscuring_cells_set() if hasattr(env, "get_terrain_obscuring_cells_set") else set(),
+            "opaque": getattr(env, "terrain_opaque_cells", set()),
+            "visibility_mode": getattr(env, "visibility_mode", "single_ray"),
+        }
+
+    if versions is not None:
+        return env.cached_unit_status("*", -1, "terrain", versions["terrain"], _build)
+    return _build()
+
+
+def _status_visibility(env, side: str, idx: int, unit_cell: tuple[int, int], terrain: dict) -> dict:
+    enemy_side = "enemy" if side == "model" else "model"
     enemy_coords = env.enemy_coords if side == "model" else env.unit_coords
+    enemy_health = env.enemy_health if side == "model" else env.unit_health
     enemy_weapon = env.enemy_weapon if side == "model" else env.unit_weapon
     own_weapon = env.unit_weapon if side == "model" else env.enemy_weapon
-    unit_data = env._get_unit_data(side, idx) if hasattr(env, "_get_unit_data") else {}
-
-    if idx >= len(own_coords):
-        return {"in_cover": False, "obscured": False, "fully_visible": False, "objective_state": None}
-
-    unit_cell = (int(own_coords[idx][0]), int(own_coords[idx][1]))
-    obscuring_cells = env.get_terrain_obscuring_cells_set() if hasattr(env, "get_terrain_obscuring_cells_set") else set()
     target_cover_cells = _target_cover_cells(env, unit_cell, radius=3)
-    opaque_cells = getattr(env, "terrain_opaque_cells", set())
-    visibility_mode = getattr(env, "visibility_mode", "single_ray")
-
-    def _distance_between_units_local(attacker_side: str, attacker_idx: int, target_side: str, target_idx: int) -> float:
-        if hasattr(env, "_shooting_distance_between_units"):
-            try:
-                return float(env._shooting_distance_between_units(attacker_side, int(attacker_idx), target_side, int(target_idx)))
-            except Exception:
-                pass
-        if hasattr(env, "_distance_between_units"):
-            try:
-                return float(env._distance_between_units(attacker_side, int(attacker_idx), target_side, int(target_idx)))
-            except Exception:
-                pass
-        attacker_pool = env.unit_coords if attacker_side == "model" else env.enemy_coords
-        target_pool = env.unit_coords if target_side == "model" else env.enemy_coords
-        if not (0 <= int(attacker_idx) < len(attacker_pool) and 0 <= int(target_idx) < len(target_pool)):
-            return float("inf")
-        attacker_cell = (int(attacker_pool[int(attacker_idx)][0]), int(attacker_pool[int(attacker_idx)][1]))
-        target_cell = (int(target_pool[int(target_idx)][0]), int(target_pool[int(target_idx)][1]))
-        return float(max(abs(attacker_cell[0] - target_cell[0]), abs(attacker_cell[1] - target_cell[1])))
-
-    def _has_los_between_units_local(attacker_side: str, attacker_idx: int, target_side: str, target_idx: int) -> bool:
-        if hasattr(env, "_unit_has_los"):
-            try:
-                return bool(env._unit_has_los(attacker_side, int(attacker_idx), target_side, int(target_idx)))
-            except Exception:
-                pass
-        attacker_pool = env.unit_coords if attacker_side == "model" else env.enemy_coords
-        target_pool = env.unit_coords if target_side == "model" else env.enemy_coords
-        if not (0 <= int(attacker_idx) < len(attacker_pool) and 0 <= int(target_idx) < len(target_pool)):
-            return False
-        attacker_cell = (int(attacker_pool[int(attacker_idx)][0]), int(attacker_pool[int(attacker_idx)][1]))
-        target_cell = (int(target_pool[int(target_idx)][0]), int(target_pool[int(target_idx)][1]))
-        target_cover_local = _target_cover_cells(env, target_cell, radius=3)
-        report_local = visibility_report(
-            attacker_cell,
-            target_cell,
-            opaque_cells_set=opaque_cells,
-            obscuring_cells_set=obscuring_cells,
-            target_cover_cells_set=target_cover_local,
-            visibility_mode=visibility_mode,
-        )
-        return bool(report_local.get("los", False))
 
     enemies_seeing = 0
     obscured_seen = 0
@@ -337,13 +375,12 @@ def _unit_status_payload(env, side: str, idx: int) -> dict:
     for enemy_idx, enemy in enumerate(enemy_coords):
         if not isinstance(enemy, (list, tuple)) or len(enemy) < 2:
             continue
-        enemy_id = env._unit_id("enemy" if side == "model" else "model", enemy_idx) if hasattr(env, "_unit_id") else None
-        enemy_side = "enemy" if side == "model" else "model"
-        if not _has_los_between_units_local(enemy_side, enemy_idx, side, idx):
+        enemy_id = env._unit_id(enemy_side, enemy_idx) if hasattr(env, "_unit_id") else None
+        if not _status_has_los(env, terrain, enemy_side, enemy_idx, side, idx):
             continue
         if enemy_id is not None:
             seen_by_ids.append(int(enemy_id))
-        distance = _distance_between_units_local(enemy_side, enemy_idx, side, idx)
+        distance = _status_distance(env, enemy_side, enemy_idx, side, idx)
         range_limit = 0.0
         if enemy_idx < len(enemy_weapon) and isinstance(enemy_weapon[enemy_idx], dict):
             range_limit = float(enemy_weapon[enemy_idx].get("Range", 0) or 0)
@@ -353,10 +390,10 @@ def _unit_status_payload(env, side: str, idx: int) -> dict:
         report = visibility_report(
             (int(enemy[0]), int(enemy[1])),
             unit_cell,
-            opaque_cells_set=opaque_cells,
-            obscuring_cells_set=obscuring_cells,
+            opaque_cells_set=terrain["opaque"],
+            obscuring_cells_set=terrain["obscuring"],
             target_cover_cells_set=target_cover_cells,
-            visibility_mode=visibility_mode,
+            visibility_mode=terrain["visibility_mode"],
         )
         if bool(report.get("fully_visible", False)):
             fully_visible_seen += 1
@@ -367,45 +404,15 @@ def _unit_status_payload(env, side: str, idx: int) -> dict:
         elif enemy_id is not None:
             exposed_to.append(int(enemy_id))
 
-    obscured = enemies_seeing > 0 and obscured_seen > 0
-    fully_visible = enemies_seeing > 0 and fully_visible_seen == enemies_seeing
-
-    in_cover = False
-    dist_cover = _nearest_barricade_distance(env, unit_cell)
-    cover_source_terrain_id = _nearest_covering_barricade_id(env, unit_cell)
-    if hasattr(env, "_unit_has_keyword") and hasattr(env, "_barricade_cells"):
-        is_infantry = env._unit_has_keyword(unit_data, "infantry")
-        if is_infantry and dist_cover is not None:
-            in_cover = float(dist_cover) <= 3.0
-    if not in_cover:
-        cover_source_terrain_id = None
-
-    objective_state = _objective_state_for_unit(env, side, unit_cell)
-
-    used_advance = False
-    advance_roll = None
-    used_advance_list = getattr(env, "model_used_advance" if side == "model" else "enemy_used_advance", None)
-    advance_roll_list = getattr(env, "model_advance_roll" if side == "model" else "enemy_advance_roll", None)
-    if isinstance(used_advance_list, (list, tuple)) and idx < len(used_advance_list):
-        used_advance = bool(used_advance_list[idx])
-    if isinstance(advance_roll_list, (list, tuple)) and idx < len(advance_roll_list):
-        raw_roll = advance_roll_list[idx]
-        if raw_roll is not None:
-            try:
-                advance_roll = int(raw_roll)
-            except Exception:
-                advance_roll = None
-
     engagement_with: list[int] = []
     for enemy_idx, enemy in enumerate(enemy_coords):
         if not isinstance(enemy, (list, tuple)) or len(enemy) < 2:
             continue
-        enemy_hp = env.enemy_health[enemy_idx] if side == "model" else env.unit_health[enemy_idx]
-        if float(enemy_hp or 0.0) <= 0:
+        if float(enemy_health[enemy_idx] or 0.0) <= 0:
             continue
         enemy_cell = (int(enemy[0]), int(enemy[1]))
         if max(abs(enemy_cell[0] - unit_cell[0]), abs(enemy_cell[1] - unit_cell[1])) <= 1:
-            enemy_id = env._unit_id("enemy" if side == "model" else "model", enemy_idx) if hasattr(env, "_unit_id") else None
+            enemy_id = env._unit_id(enemy_side, enemy_idx) if hasattr(env, "_unit_id") else None
             if enemy_id is not None:
                 engagement_with.append(int(enemy_id))
 
@@ -420,29 +427,56 @@ def _unit_status_payload(env, side: str, idx: int) -> dict:
             range_eps = 0.0
     if idx < len(own_weapon) and isinstance(own_weapon[idx], dict):
         own_range = float(own_weapon[idx].get("Range", 0) or 0)
-    enemy_side = "enemy" if side == "model" else "model"
     for enemy_idx, enemy in enumerate(enemy_coords):
         if not isinstance(enemy, (list, tuple)) or len(enemy) < 2:
             continue
-        enemy_hp = env.enemy_health[enemy_idx] if side == "model" else env.unit_health[enemy_idx]
-        if float(enemy_hp or 0.0) <= 0:
+        if float(enemy_health[enemy_idx] or 0.0) <= 0:
             continue
-        if not _has_los_between_units_local(side, idx, enemy_side, enemy_idx):
+        if not _status_has_los(env, terrain, side, idx, enemy_side, enemy_idx):
             continue
-        enemy_id = env._unit_id("enemy" if side == "model" else "model", enemy_idx) if hasattr(env, "_unit_id") else None
+        enemy_id = env._unit_id(enemy_side, enemy_idx) if hasattr(env, "_unit_id") else None
         if enemy_id is None:
             continue
         can_see_ids.append(int(enemy_id))
         if own_range > 0:
-            distance = _distance_between_units_local(side, idx, enemy_side, enemy_idx)
+            distance = _status_distance(env, side, idx, enemy_side, enemy_idx)
             if distance <= (own_range + range_eps):
                 in_range_targets.append(int(enemy_id))
 
+    return {
+        "obscured": enemies_seeing > 0 and obscured_seen > 0,
+        "fully_visible": enemies_seeing > 0 and fully_visible_seen == enemies_seeing,
+        "obscured_vs": sorted(set(obscured_vs)),
+        "exposed_to": sorted(set(exposed_to)),
+        "engagement_with": sorted(set(engagement_with)),
+        "in_range_targets": sorted(set(in_range_targets)),
+        "can_see_ids": sorted(set(can_see_ids)),
+        "seen_by_ids": sorted(set(seen_by_ids)),
+    }
+
+
+def _status_cover(env, side: str, idx: int, unit_cell: tuple[int, int]) -> dict:
+    unit_data = env._get_unit_data(side, idx) if hasattr(env, "_get_unit_data") else {}
+    in_cover = False
+    dist_cover = _nearest_barricade_distance(env, unit_cell)
+    cover_source_terrain_id = _nearest_covering_barricade_id(env, unit_cell)
+    if hasattr(env, "_unit_has_keyword") and hasattr(env, "_barricade_cells"):
+        is_infantry = env._unit_has_keyword(unit_data, "infantry")
+        if is_infantry and dist_cover is not None:
+            in_cover = float(dist_cover) <= 3.0
+    if not in_cover:
+        cover_source_terrain_id = None
+    return {
+        "in_cover": bool(in_cover),
+        "dist_cover": dist_cover,
+        "cover_source_terrain_id": cover_source_terrain_id,
+    }
+
+
+def _status_reachable(env, side: str, idx: int, movement_phase: bool) -> dict:
     reachable_cells: list[list[int]] = []
     move_cells: list[list[int]] = []
     advance_cells: list[list[int]] = []
-    phase_raw = str(getattr(env, "phase", "") or "").lower()
-    movement_phase = ("move" in phase_raw) or ("движ" in phase_raw) or ("movement" in phase_raw)
     if movement_phase and hasattr(env, "get_unit_movement_overlay"):
         try:
             overlay = env.get_unit_movement_overlay(side, idx)
@@ -478,26 +512,104 @@ def _unit_status_payload(env, side: str, idx: int) -> dict:
             reachable_cells = []
             move_cells = []
             advance_cells = []
+    return {"reachable_cells": reachable_cells, "move_cells": move_cells, "advance_cells": advance_cells}
+
+
+def _unit_status_payload(env, side: str, idx: int, versions: dict | None = None) -> dict:
+    own_coords = env.unit_coords if side == "model" else env.enemy_coords
+
+    if idx >= len(own_coords):
+        return {"in_cover": False, "obscured": False, "fully_visible": False, "objective_state": None}
+
+    unit_cell = (int(own_coords[idx][0]), int(own_coords[idx][1]))
+    if versions is None and hasattr(env, "unit_status_versions"):
+        versions = env.unit_status_versions()
+    terrain = _status_terrain(env, versions)
+    phase_raw = str(getattr(env, "phase", "") or "").lower()
+    movement_phase = ("move" in phase_raw) or ("движ" in phase_raw) or ("movement" in phase_raw)
+
+    if versions is not None:
+        # Тяжёлые куски (LOS/дистанции/укрытие/досягаемость) берём из кэша env по версии входов.
+        enemy_side = "enemy" if side == "model" else "model"
+        own_sig = versions[side][idx] if idx < len(versions[side]) else None
+        visibility = env.cached_unit_status(
+            side, idx, "visibility",
+            (own_sig, versions[enemy_side], versions["terrain"]),
+            lambda: _status_visibility(env, side, idx, unit_cell, terrain),
+        )
+        cover = env.cached_unit_status(
+            side, idx, "cover",
+            (unit_cell, versions["terrain"]),
+            lambda: _status_cover(env, side, idx, unit_cell),
+        )
+        reachable = env.cached_unit_status(
+            side, idx, "reachable",
+            (movement_phase, versions["model"], versions["enemy"], versions["terrain"],
+             env._movement_budget_for_unit(side, idx) if movement_phase and hasattr(env, "_movement_budget_for_unit") else None),
+            lambda: _status_reachable(env, side, idx, movement_phase),
+        )
+    else:
+        visibility = _status_visibility(env, side, idx, unit_cell, terrain)
+        cover = _status_cover(env, side, idx, unit_cell)
+        reachable = _status_reachable(env, side, idx, movement_phase)
+
+    objective_state = _objective_state_for_unit(env, side, unit_cell)
+
+    used_advance = False
+    advance_roll = None
+    used_advance_list = getattr(env, "model_used_advance" if side == "model" else "enemy_used_advance", None)
+    advance_roll_list = getattr(env, "model_advance_roll" if side == "model" else "enemy_advance_roll", None)
+    if isinstance(used_advance_list, (list, tuple)) and idx < len(used_advance_list):
+        used_advance = bool(used_advance_list[idx])
+    if isinstance(advance_roll_list, (list, tuple)) and idx < len(advance_roll_list):
+        raw_roll = advance_roll_list[idx]
+        if raw_roll is not None:
+            try:
+                advance_roll = int(raw_roll)
+            except Exception:
+                advance_roll = None
 
     return {
-        "in_cover": bool(in_cover),
-        "obscured": bool(obscured),
-        "fully_visible": bool(fully_visible),
+        "in_cover": cover["in_cover"],
+        "obscured": bool(visibility["obscured"]),
+        "fully_visible": bool(visibility["fully_visible"]),
         "objective_state": objective_state,
         "used_advance": bool(used_advance),
         "advance_roll": advance_roll,
-        "dist_cover": dist_cover,
-        "cover_source_terrain_id": cover_source_terrain_id,
-        "obscured_vs": sorted(set(obscured_vs)),
-        "exposed_to": sorted(set(exposed_to)),
-        "engagement_with": sorted(set(engagement_with)),
-        "in_range_targets": sorted(set(in_range_targets)),
-        "can_see_ids": sorted(set(can_see_ids)),
-        "seen_by_ids": sorted(set(seen_by_ids)),
-        "in_range_ids": sorted(set(in_range_targets)),
-        "reachable_cells": reachable_cells,
-        "move_cells": move_cells,
-        "advance_cells": advance_cells,
+        "dist_cover": cover["dist_cover"],
+        "cover_source_terrain_id": cover["cover_source_terrain_id"],
+        "obscured_vs": list(visibility["obscured_vs"]),
+        "exposed_to": list(visibility["exposed_to"]),
+        "engagement_with": list(visibility["engagement_with"]),
+        "in_range_targets": list(visibility["in_range_targets"]),
+        "can_see_ids": list(visibility["can_see_ids"]),
+        "seen_by_ids": list(visibility["seen_by_ids"]),
+        "in_range_ids": list(visibility["in_range_targets"]),
+        "reachable_cells": list(reachable["reachable_cells"]),
+        "move_cells": list(reachable["move_cells"]),
+        "advance_cells": list(reachable["advance_cells"]),
+    }
+
+
+def _threat_overlay_enabled() -> bool:
+    # Opt-in: viewer пока не рисует threat_overlay, а списки карт раздувают каждый state.json.
+    raw = str(os.getenv("STATE_THREAT_OVERLAY", "0")).strip().lower()
+    return raw in {"1", "true", "yes", "on"}
+
+
+def _threat_overlay(env) -> dict | None:
+    """Тепловые карты угрозы model-стороны для хода player (см. Warhammer40kEnv.board_threat_maps)."""
+    if not _threat_overlay_enabled():
+        return None
+    board_threat_maps = getattr(env, "board_threat_maps", None)
+    if not callable(board_threat_maps):
+        return None
+    maps = board_threat_maps()
+    return {
+        "source_side": "model",
+        "shoot": [[round(float(v), 3) for v in row] for row in maps["shoot"].tolist()],
+        "charge": [[round(float(v), 3) for v in row] for row in maps["charge"].tolist()],
+        "exposure_count": maps["exposure_count"].tolist(),
     }
 
 
@@ -507,6 +619,7 @@ def write_state_json(env, path=None):
     os.makedirs(os.path.dirname(state_path), exist_ok=True)
 
     board_width = _safe_int(getattr(env, "b_hei", None), None)
+    status_versions = env.unit_status_versions() if hasattr(env, "unit_status_versions") else None
 
     units = []
     for idx, coords in enumerate(getattr(env, "enemy_coords", [])):
@@ -525,7 +638,7 @@ def write_state_json(env, path=None):
                                                     if hasattr(env, "enemy_model_positions") and idx < len(env.enemy_model_positions) else []),
                                    facing=_resolve_unit_facing(unit_data, coords, board_width),
                                    weapon_profile=weapon_profile)
-        unit_payload["unit_status"] = _unit_status_payload(env, "enemy", idx)
+        unit_payload["unit_status"] = _unit_status_payload(env, "enemy", idx, status_versions)
         units.append(unit_payload)
 
     for idx, coords in enumerate(getattr(env, "unit_coords", [])):
@@ -544,7 +657,7 @@ def write_state_json(env, path=None):
                                                     if hasattr(env, "unit_model_positions") and idx < len(env.unit_model_positions) else []),
                                    facing=_resolve_unit_facing(unit_data, coords, board_width),
                                    weapon_profile=weapon_profile)
-        unit_payload["unit_status"] = _unit_status_payload(env, "model", idx)
+        unit_payload["unit_status"] = _unit_status_payload(env, "model", idx, status_versions)
         units.append(unit_payload)
 
     if _status_debug_enabled() and hasattr(env, "_append_agent_log"):
@@ -640,6 +753,7 @@ def write_state_json(env, path=None):
         active_side = "model"
 
     movement_overlay = None
+    threat_overlay = None
     phase_raw = str(getattr(env, "phase", "") or "").lower()
     if ("move" in phase_raw or "движ" in phase_raw or "movement" in phase_raw) and hasattr(env, "get_unit_movement_overlay"):
         try:
@@ -674,6 +788,8 @@ def write_state_json(env, path=None):
                         cy = _safe_int(cell[1], None)
                         if cx is not None and cy is not None:
                             movement_overlay["advance_cells"].append([cx, cy])
+            if active_side == "player":
+                threat_overlay = _threat_overlay(env)
 
     payload = {
         "board": {
@@ -689,6 +805,7 @@ def write_state_json(env, path=None):
         "phase": getattr(env, "phase", None),
         "active": active_side,
         "movement_overlay": movement_overlay,
+        "threat_overlay": threat_overlay,
         "vp": {"player": _safe_int(getattr(env, "enemyVP", None), None),
                "model": _safe_int(getattr(env, "modelVP", None), None)},
         "cp": {"player": _safe_int(getattr(env, "enemyCP", None), None),
@@ -712,6 +829,7 @@ def write_state_json(env, path=None):
         },
         "payload_kind": "light",
         "generated_at": datetime.utcnow().isoformat() + "Z",
+        "state_seq": next(_STATE_SEQ),
     }
 
     payload_mode = str(os.getenv("STATE_PAYLOAD_MODE", "auto")).strip().lower()
@@ -729,6 +847,24 @@ def write_state_json(env, path=None):
         payload["log_tail"] = _read_log_tail()
         payload["model_events"] = _read_event_tail()
 
+    if state_stream_mode() == "stream":
+        try:
+            with io_profiler.timed("state stream"):
+                get_state_stream_writer(stream_path_for(state_path)).write(payload)
+        except Exception as exc:
+            # Ротация/запись потока может упасть (на Windows файл держит viewer) — не роняем шаг env,
+            # а пишем этот кадр в state.json.
+            io_profiler.incr("state stream errors")
+            if hasattr(env, "_append_agent_log"):
+                env._append_agent_log(
+                    f"[STATE][STREAM][WARN] запись потока не удалась, пишем state.json. Детали: {exc}"
+                )
+        else:
+            # Поток покрывает viewer; state.json обновляем только для full payload (внешние читатели, fallback).
+            if not include_full_payload and os.path.exists(state_path):
+                _notify_state_written(state_path, payload["state_seq"])
+                return payload
+
     state_dir = os.path.dirname(state_path)
     temp_path = None
     try:
@@ -742,7 +878,7 @@ def write_state_json(env, path=None):
                 suffix=".tmp",
             ) as handle:
                 temp_path = handle.name
-                json.dump(payload, handle, ensure_ascii=False, indent=2)
+                handle.write(json.dumps(payload, ensure_ascii=False, indent=2))
                 handle.flush()
                 os.fsync(handle.fileno())
 
@@ -754,4 +890,5 @@ def write_state_json(env, path=None):
             except OSError:
                 pass
 
+    _notify_state_written(state_path, payload["state_seq"])
     return payload
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Any
+
+# Бинарный поток состояния для viewer: keyframe + компактные дельты вместо полной перезаписи state.json.
+#
+# Формат файла (little-endian):
+#   заголовок  MAGIC(4) | version:u16 | generation:u64
+#   запись     kind:u8 | length:u32 | zlib(json-compact)
+# Статика (террейн без covering_unit_ids) уходит отдельной записью KIND_STATIC один раз на раскладку.
+# Ротация: при превышении STATE_STREAM_MAX_BYTES писатель атомарно подменяет файл новым поколением
+# (заголовок + статика + keyframe); читатель замечает смену generation и перечитывает с последнего keyframe.
+
+STREAM_MAGIC = b"WHST"
+STREAM_VERSION = 1
+_HEADER = struct.Struct("<4sHQ")
+_RECORD = struct.Struct("<BI")
+
+KIND_KEYFRAME = 0
+KIND_DELTA = 1
+KIND_STATIC = 2
+
+# Глубина diff: верхний уровень → units → unit → unit_status.
+_DIFF_DEPTH = 3
+
+
+def stream_path_for(state_path: str) -> str:
+    return os.path.splitext(str(state_path))[0] + ".stream"
+
+
+def state_stream_mode() -> str:
+    """off — только state.json; stream — поток дельт, state.json пишется лишь для full payload."""
+    mode = str(os.getenv("STATE_STREAM_MODE", "off")).strip().lower()
+    return mode if mode in {"off", "stream"} else "off"
+
+
+def _encode(body: dict) -> bytes:
+    raw = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 1)
+
+
+def _decode(blob: bytes) -> dict:
+    data = json.loads(zlib.decompress(blob).decode("utf-8"))
+    return data if isinstance(data, dict) else {}
+
+
+def diff_dict(prev: dict, cur: dict, depth: int = _DIFF_DEPTH) -> dict:
+    """Патч prev → cur: s — заменить значение, p — вложенный патч, d — удалить ключи."""
+    patch: dict[str, Any] = {}
+    set_values = {}
+    nested = {}
+    for key, value in cur.items():
+        if key not in prev:
+            set_values[key] = value
+            continue
+        old = prev[key]
+        if old == value:
+            continue
+        if depth > 0 and isinstance(old, dict) and isinstance(value, dict):
+            nested[key] = diff_dict(old, value, depth - 1)
+        else:
+            set_values[key] = value
+    removed = [key for key in prev if key not in cur]
+    if set_values:
+        patch["s"] = set_values
+    if nested:
+        patch["p"] = nested
+    if removed:
+        patch["d"] = removed
+    return patch
+
+
+def apply_patch(target: dict, patch: dict) -> dict:
+    for key in patch.get("d") or ():
+        target.pop(key, None)
+    for key, value in (patch.get("s") or {}).items():
+        target[key] = value
+    for key, sub in (patch.get("p") or {}).items():
+        child = target.get(key)
+        if not isinstance(child, dict):
+            child = {}
+            target[key] = child
+        apply_patch(child, sub)
+    return target
+
+
+def _unit_key(unit: dict) -> str:
+    return f"{unit.get('side')}:{unit.get('id')}"
+
+
+def split_payload(payload: dict) -> tuple[dict, dict]:
+    """payload из write_state_json → (wire, static).
+
+    В wire юниты лежат словарём по side:id (дельта на уровне полей юнита), а от террейна остаётся
+    только динамическая часть covering_unit_ids.
+    """
+    wire = dict(payload)
+    units = [u for u in (payload.get("units") or []) if isinstance(u, dict)]
+    wire["units"] = {_unit_key(u): u for u in units}
+    wire["units_order"] = [_unit_key(u) for u in units]
+
+    static_features = []
+    cover = {}
+    for feature in payload.get("terrain_features") or []:
+        if not isinstance(feature, dict):
+            continue
+        static_features.append({k: v for k, v in feature.items() if k != "covering_unit_ids"})
+        cover[str(feature.get("id") or "")] = list(feature.get("covering_unit_ids") or [])
+    raw = json.dumps(static_features, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    layout = hashlib.blake2b(raw, digest_size=8).hexdigest()
+    wire.pop("terrain_features", None)
+    wire["terrain_cover"] = cover
+    wire["terrain_layout"] = layout
+    return wire, {"layout": layout, "terrain_features": static_features}
+
+
+def join_payload(wire: dict, static: dict) -> dict:
+    payload = copy.deepcopy(wire)
+    units = payload.pop("units", {}) or {}
+    order = payload.pop("units_order", []) or []
+    payload["units"] = [units[key] for key in order if key in units]
+    cover = payload.pop("terrain_cover", {}) or {}
+    payload.pop("terrain_layout", None)
+    payload["terrain_features"] = [
+        dict(feature, covering_unit_ids=list(cover.get(str(feature.get("id") or ""), [])))
+        for feature in (static.get("terrain_features") or [])
+    ]
+    return payload
+
+
+class StateStreamWriter:
+    """Писатель потока; один экземпляр на путь (см. get_state_stream_writer)."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.max_bytes = max(4096, int(os.getenv("STATE_STREAM_MAX_BYTES", str(8 * 1024 * 1024))))
+        self.keyframe_every = max(1, int(os.getenv("STATE_STREAM_KEYFRAME_EVERY", "256")))
+        self._lock = threading.Lock()
+        self._handle = None
+        self._ino = None
+        self._size = 0
+        self._wire: dict | None = None
+        self._layout: str | None = None
+        self._since_keyframe = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_handle()
+
+    def _close_handle(self) -> None:
+        if self._handle is not None:
+            try:
+                self._handle.close()
+            except OSError:
+                pass
+        self._handle = None
+        self._ino = None
+
+    def _replaced_externally(self) -> bool:
+        # Другой писатель подменил файл своим поколением — наши дельты к нему не применимы.
+        try:
+            return os.stat(self.path).st_ino != self._ino
+        except OSError:
+            return True
+
+    def _start_generation(self, wire: dict, static: dict) -> int:
+        self._close_handle()
+        generation = int.from_bytes(os.urandom(8), "little")
+        blob = bytearray(_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, generation))
+        for kind, body in ((KIND_STATIC, static), (KIND_KEYFRAME, wire)):
+            data = _encode(body)
+            blob += _RECORD.pack(kind, len(data)) + data
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as handle:
+            handle.write(blob)
+        os.replace(temp_path, self.path)
+        self._handle = open(self.path, "ab", buffering=0)
+        self._ino = os.fstat(self._handle.fileno()).st_ino
+        self._size = len(blob)
+        self._wire = wire
+        self._layout = static.get("layout")
+        self._since_keyframe = 0
+        return len(blob)
+
+    def _append(self, kind: int, body: dict) -> int:
+        data = _encode(body)
+        self._handle.write(_RECORD.pack(kind, len(data)) + data)
+        self._size += _RECORD.size + len(data)
+        return _RECORD.size + len(data)
+
+    def write(self, payload: dict) -> int:
+        """Дописывает состояние в поток; возвращает число записанных байт."""
+        wire, static = split_payload(payload)
+        with self._lock:
+            if (
+                self._handle is None
+                or self._wire is None
+                or self._size >= self.max_bytes
+                or self._replaced_externally()
+            ):
+                return self._start_generation(wire, static)
+            written = 0
+            if static["layout"] != self._layout:
+                written += self._append(KIND_STATIC, static)
+                self._layout = static["layout"]
+            self._since_keyframe += 1
+            if self._since_keyframe >= self.keyframe_every:
+                written += self._append(KIND_KEYFRAME, wire)
+                self._since_keyframe = 0
+            else:
+                patch = diff_dict(self._wire, wire)
+                if patch or written:
+                    written += self._append(KIND_DELTA, patch)
+            self._wire = wire
+            return written
+
+
+_WRITERS: dict[str, StateStreamWriter] = {}
+_WRITERS_LOCK = threading.Lock()
+
+
+def get_state_stream_writer(path: str) -> StateStreamWriter:
+    key = os.path.abspath(path)
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(key)
+        if writer is None:
+            writer = StateStreamWriter(key)
+            _WRITERS[key] = writer
+        return writer
+
+
+class StateStreamReader:
+    """Инкрементальный читатель: держит offset и применяет только новые записи."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.generation: int | None = None
+        self.offset = 0
+        self._wire: dict | None = None
+        self._static: dict = {}
+
+    def _reset(self, handle, generation: int) -> None:
+        # Новое поколение: пропускаем всё до последнего keyframe (и последней статики перед ним).
+        self.generation = generation
+        self._wire = None
+        self._static = {}
+        offset = _HEADER.size
+        last_keyframe = None
+        last_static = None
+        handle.seek(0, os.SEEK_END)
+        end = handle.tell()
+        while offset + _RECORD.size <= end:
+            handle.seek(offset)
+            kind, length = _RECORD.unpack(handle.read(_RECORD.size))
+            if offset + _RECORD.size + length > end:
+                break
+            if kind == KIND_KEYFRAME:
+                last_keyframe = offset
+            elif kind == KIND_STATIC:
+                last_static = offset
+            offset += _RECORD.size + length
+        if last_static is not None and (last_keyframe is None or last_static < last_keyframe):
+            handle.seek(last_static)
+            _, length = _RECORD.unpack(handle.read(_RECORD.size))
+            self._static = _decode(handle.read(length))
+        self.offset = last_keyframe if last_keyframe is not None else _HEADER.size
+
+    def poll(self) -> dict | None:
+        """Возвращает собранный payload, если с прошлого вызова пришли записи, иначе None."""
+        try:
+            handle = open(self.path, "rb")
+        except OSError:
+            return None
+        with handle:
+            head = handle.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                return None
+            magic, version, generation = _HEADER.unpack(head)
+            if magic != STREAM_MAGIC or version != STREAM_VERSION:
+                return None
+            if generation != self.generation:
+                self._reset(handle, generation)
+            handle.seek(self.offset)
+            data = handle.read()
+        changed = False
+        pos = 0
+        while pos + _RECORD.size <= len(data):
+            kind, length = _RECORD.unpack_from(data, pos)
+            end = pos + _RECORD.size + length
+            if end > len(data):
+                break  # запись ещё дописывается
+            body = _decode(data[pos + _RECORD.size:end])
+            if kind == KIND_KEYFRAME:
+                self._wire = body
+            elif kind == KIND_STATIC:
+                self._static = body
+            elif kind == KIND_DELTA and self._wire is not None:
+                apply_patch(self._wire, body)
+            pos = end
+            changed = True
+        self.offset += pos
+        if not changed or self._wire is None:
+            return None
+        return join_payload(self._wire, self._static)
@@ -1,26 +1,108 @@
+import bisect
 import json
 import os
+import threading
+from types import MappingProxyType
 from project_paths import CORE_DIR
 
 
 _UNIT_DATA_PATH = str(CORE_DIR / "engine" / "unitData.json")
 
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class UnitCatalog:
+    """Индексированный снимок unitData.json; записи неизменяемые и общие для всех потребителей."""
+
+    def __init__(self, data: dict, stamp=None) -> None:
+        self.stamp = stamp
+        self.units = tuple(_freeze(u) for u in data.get("UnitData", []) if isinstance(u, dict))
+        self.weapons = tuple(_freeze(w) for w in data.get("WeaponData", []) if isinstance(w, dict))
+        self._unit_by_army_name = {}
+        self._unit_by_name = {}
+        for record in self.units:
+            name = str(record.get("Name", "")).lower()
+            self._unit_by_army_name.setdefault((str(record.get("Army", "")).lower(), name), record)
+            self._unit_by_name.setdefault(name, record)
+        self._weapon_by_name = {}
+        for record in self.weapons:
+            self._weapon_by_name.setdefault(str(record.get("Name", "")).lower(), record)
+        # Префиксный индекс: имена по алфавиту + порядок в файле (совпадение — первое по файлу).
+        ordered = sorted((str(w.get("Name", "")).lower(), order) for order, w in enumerate(self.weapons))
+        self._weapon_names = [name for name, _ in ordered]
+        self._weapon_orders = [order for _, order in ordered]
+        self._weapon_prefix_hits = {}
+
+    def unit(self, army: str, name: str):
+        return self._unit_by_army_name.get((str(army).lower(), str(name).lower()))
+
+    def unit_by_name(self, name: str):
+        return self._unit_by_name.get(str(name).lower())
+
+    def weapon(self, name: str):
+        return self._weapon_by_name.get(str(name).lower())
+
+    def weapon_by_prefix(self, prefix: str):
+        key = str(prefix).lower()
+        if key in self._weapon_prefix_hits:
+            return self._weapon_prefix_hits[key]
+        lo = bisect.bisect_left(self._weapon_names, key)
+        hi = lo
+        while hi < len(self._weapon_names) and self._weapon_names[hi].startswith(key):
+            hi += 1
+        record = self.weapons[min(self._weapon_orders[lo:hi])] if hi > lo else None
+        self._weapon_prefix_hits[key] = record
+        return record
+
+
+_CATALOG = None
+_CATALOG_LOCK = threading.Lock()
+
+
+def unit_catalog(path: str = _UNIT_DATA_PATH) -> UnitCatalog:
+    """Общий на процесс каталог; перечитывается, если у файла сменились mtime/размер."""
+    global _CATALOG
+    try:
+        st = os.stat(path)
+        stamp = (path, st.st_mtime_ns, st.st_size)
+    except OSError:
+        stamp = (path, None, None)
+    catalog = _CATALOG
+    if catalog is not None and catalog.stamp == stamp:
+        return catalog
+    with _CATALOG_LOCK:
+        if _CATALOG is None or _CATALOG.stamp != stamp:
+            with open(path, encoding="utf-8") as j:
+                _CATALOG = UnitCatalog(json.loads(j.read()), stamp=stamp)
+        return _CATALOG
+
+
 def unitData(army, unitName):
-    with open(_UNIT_DATA_PATH, encoding="utf-8") as j:
-        data = json.loads(j.read())
-    for i in data["UnitData"]:
-        if i["Army"].lower() == army.lower() and i["Name"].lower() == unitName.lower():
-            return i
+    record = unit_catalog().unit(army, unitName)
+    if record is not None:
+        return _thaw(record)
     print("Юнит не найден")
     return {}
 
 def weaponData(name):
     if name == "None":
         return "None"
-    with open(_UNIT_DATA_PATH, encoding="utf-8") as j:
-        data = json.loads(j.read())
-    for i in data["WeaponData"]:
-        if i["Name"][0:len(name)].lower() == name.lower():
-            return i
+    record = unit_catalog().weapon_by_prefix(name)
+    if record is not None:
+        return _thaw(record)
     print(name, "Оружие не найдено")
     return {}
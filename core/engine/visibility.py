@@ -1,6 +1,9 @@
 import math
+from collections import OrderedDict
 from typing import Iterable
 
+import numpy as np
+
 
 Cell = tuple[int, int]
 Point = tuple[float, float]
@@ -233,3 +236,216 @@ def visibility_report(
         "target_cover_cells_count": len(obscuring),
         "ray_reports": rays,
     }
+
+
+# Смещения сэмпл-точек внутри клетки в порядке get_cell_sample_points.
+_SAMPLE_OFFSETS: dict[str, np.ndarray] = {
+    mode: np.asarray(get_cell_sample_points((0, 0), mode=mode), dtype=np.float64)
+    for mode in _VALID_VISIBILITY_MODES
+}
+
+
+def cells_to_grid(cells: Iterable[Cell] | None, shape: tuple[int, int]) -> np.ndarray:
+    """Boolean grid ``[shape[0], shape[1]]`` with ``True`` on the given cells (off-grid cells dropped)."""
+    grid = np.zeros(shape, dtype=bool)
+    if cells:
+        arr = np.asarray([(int(x), int(y)) for x, y in cells], dtype=np.int64).reshape(-1, 2)
+        ok = (arr[:, 0] >= 0) & (arr[:, 0] < shape[0]) & (arr[:, 1] >= 0) & (arr[:, 1] < shape[1])
+        arr = arr[ok]
+        grid[arr[:, 0], arr[:, 1]] = True
+    return grid
+
+
+def batch_visibility(
+    a_cells,
+    b_cells,
+    opaque_cells_set: Iterable[Cell] | None = None,
+    obscuring_cells_set: Iterable[Cell] | None = None,
+    target_cover_cells_set: Iterable[Cell] | None = None,
+    visibility_mode: str = "single_ray",
+    *,
+    grid_shape: tuple[int, int] | None = None,
+    opaque_grid: np.ndarray | None = None,
+    obscuring_grid: np.ndarray | None = None,
+) -> dict:
+    """
+    Vectorized ``visibility_report`` for N cell pairs at once (flags only, no crossed cells).
+
+    All rays of all pairs go through one ``hotloops.batch_raytrace`` call (numba when
+    ENABLE_NUMBA_HOTLOOPS allows, NumPy otherwise). Returns per-pair arrays
+    ``los``, ``obscured``, ``fully_visible``, ``partially_visible``, ``rays_clear``,
+    ``rays_obscured`` plus ``rays_total`` and ``used_numba``.
+    Precomputed ``opaque_grid`` / ``obscuring_grid`` (indexed ``[cell[0], cell[1]]``)
+    skip the set -> grid conversion.
+    """
+    from core.engine.hotloops import batch_raytrace
+
+    mode = _normalize_mode(visibility_mode)
+    a = np.asarray(a_cells, dtype=np.int64).reshape(-1, 2)
+    b = np.asarray(b_cells, dtype=np.int64).reshape(-1, 2)
+    n = min(a.shape[0], b.shape[0])
+    a = a[:n]
+    b = b[:n]
+    cover = target_cover_cells_set if target_cover_cells_set is not None else obscuring_cells_set
+    if grid_shape is None:
+        if opaque_grid is not None:
+            grid_shape = tuple(opaque_grid.shape)
+        elif obscuring_grid is not None:
+            grid_shape = tuple(obscuring_grid.shape)
+        else:
+            hi = [a.max(axis=0) if n else np.zeros(2, np.int64), b.max(axis=0) if n else np.zeros(2, np.int64)]
+            for cells in (opaque_cells_set, cover):
+                if cells:
+                    hi.append(np.asarray([(int(x), int(y)) for x, y in cells], dtype=np.int64).max(axis=0))
+            grid_shape = tuple(int(v) + 1 for v in np.max(np.stack(hi), axis=0))
+    if opaque_grid is None:
+        opaque_grid = cells_to_grid(opaque_cells_set, grid_shape)
+    if obscuring_grid is None:
+        obscuring_grid = cells_to_grid(cover, grid_shape)
+
+    offsets = _SAMPLE_OFFSETS[mode]
+    r = offsets.shape[0]
+    a_pts = (a[:, None, :].astype(np.float64) + offsets[None, :, :]).reshape(-1, 2)
+    b_pts = (b[:, None, :].astype(np.float64) + offsets[None, :, :]).reshape(-1, 2)
+    blocked, obscured, used_numba = batch_raytrace(a_pts, b_pts, opaque_grid, obscuring_grid)
+    clear = ~blocked.reshape(n, r)
+    obscured_clear = obscured.reshape(n, r) & clear
+
+    rays_clear = clear.sum(axis=1)
+    rays_obscured = obscured_clear.sum(axis=1)
+    los = rays_clear > 0
+    fully_visible = los & (rays_obscured == 0) & (rays_clear == r)
+    return {
+        "los": los,
+        "obscured": rays_obscured > 0,
+        "fully_visible": fully_visible,
+        "partially_visible": los & ~fully_visible,
+        "rays_clear": rays_clear,
+        "rays_obscured": rays_obscured,
+        "rays_total": int(r),
+        "used_numba": bool(used_numba),
+    }
+
+
+class LosMatrix:
+    """
+    Cell-to-cell LOS table for one static opaque layout (board size + mode).
+
+    Terrain does not change during an episode, so ``visibility_report(...)["los"]``
+    between two cells is a pure function of the pair. The table stores it as
+    uint8 (0 = not computed yet, 1 = clear, 2 = blocked) and is filled lazily:
+    the first query per pair runs the regular raytrace, every later one is an
+    array lookup. 40x60 board -> 2400^2 bytes (~5.8 MB) at most.
+
+    Only LOS is cached: ``obscured`` depends on per-target cover cells and still
+    goes through ``visibility_report``.
+    """
+
+    def __init__(self, opaque_cells: Iterable[Cell], width: int, height: int, visibility_mode: str = "single_ray"):
+        self.opaque = frozenset((int(x), int(y)) for x, y in opaque_cells)
+        self.width = int(width)
+        self.height = int(height)
+        self.visibility_mode = _normalize_mode(visibility_mode)
+        self.n_cells = self.width * self.height
+        self._table = np.zeros((self.n_cells, self.n_cells), dtype=np.uint8) if self.opaque else None
+        self.opaque_grid = cells_to_grid(self.opaque, (self.width, self.height))
+
+    def __reduce__(self):
+        # Таблица не пиклится: в другом процессе берём (или строим) свою из кэша.
+        return (los_matrix_for, (self.opaque, self.width, self.height, self.visibility_mode))
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._table is None else int(self._table.nbytes)
+
+    def _index(self, cell: Cell) -> int:
+        x, y = int(cell[0]), int(cell[1])
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return x * self.height + y
+        return -1
+
+    def _compute(self, a_cell: Cell, b_cell: Cell) -> bool:
+        a_samples = get_cell_sample_points(a_cell, mode=self.visibility_mode)
+        b_samples = get_cell_sample_points(b_cell, mode=self.visibility_mode)
+        opaque = self.opaque
+        for a_point, b_point in zip(a_samples, b_samples):
+            crossed = raytrace(a_point, b_point)
+            if not any(cell in opaque for cell in crossed[1:-1]):
+                return True
+        return False
+
+    def has_los(self, a_cell: Cell, b_cell: Cell) -> bool:
+        if self._table is None:
+            return True
+        ia = self._index(a_cell)
+        ib = self._index(b_cell)
+        if ia < 0 or ib < 0:
+            return self._compute(a_cell, b_cell)
+        state = self._table[ia, ib]
+        if state == 0:
+            state = 1 if self._compute(a_cell, b_cell) else 2
+            self._table[ia, ib] = state
+        return state == 1
+
+    def has_los_from(self, a_cell: Cell, b_cells) -> np.ndarray:
+        """``has_los(a_cell, b)`` for every row of ``b_cells`` (N x 2); one table-row lookup."""
+        b_cells = np.asarray(b_cells, dtype=np.int64).reshape(-1, 2)
+        if self._table is None:
+            return np.ones(len(b_cells), dtype=bool)
+        ia = self._index(a_cell)
+        inside = (b_cells[:, 0] >= 0) & (b_cells[:, 0] < self.width) & (b_cells[:, 1] >= 0) & (b_cells[:, 1] < self.height)
+        states = np.zeros(len(b_cells), dtype=np.uint8)
+        if ia >= 0:
+            ib = b_cells[inside, 0] * self.height + b_cells[inside, 1]
+            row = self._table[ia]
+            missing = ib[row[ib] == 0]
+            if len(missing):
+                # Незаполненные пары — одним вызовом пакетного raytracer (как fill), а не по одной.
+                targets = np.stack([missing // self.height, missing % self.height], axis=1)
+                flags = batch_visibility(
+                    np.repeat(np.array([[int(a_cell[0]), int(a_cell[1])]], dtype=np.int64), len(missing), axis=0),
+                    targets,
+                    visibility_mode=self.visibility_mode,
+                    opaque_grid=self.opaque_grid,
+                )
+                row[missing] = np.where(flags["los"], 1, 2)
+            states[inside] = row[ib]
+        for k in np.nonzero(states == 0)[0]:
+            states[k] = 1 if self.has_los(a_cell, (int(b_cells[k, 0]), int(b_cells[k, 1]))) else 2
+        return states == 1
+
+    def fill(self) -> None:
+        """Compute every pair up front via the batched raytracer (lazy fill is the default)."""
+        if self._table is None:
+            return
+        cells = np.stack(np.meshgrid(np.arange(self.width), np.arange(self.height), indexing="ij"), axis=-1).reshape(-1, 2)
+        for ia in range(self.n_cells):
+            row = self._table[ia]
+            if row.all():
+                continue
+            flags = batch_visibility(
+                np.repeat(cells[ia:ia + 1], self.n_cells, axis=0),
+                cells,
+                visibility_mode=self.visibility_mode,
+                opaque_grid=self.opaque_grid,
+            )
+            row[:] = np.where(flags["los"], 1, 2)
+
+
+_LOS_MATRIX_CACHE: "OrderedDict[tuple, LosMatrix]" = OrderedDict()
+_LOS_MATRIX_CACHE_MAX = 8
+
+
+def los_matrix_for(opaque_cells: Iterable[Cell], width: int, height: int, visibility_mode: str = "single_ray") -> LosMatrix:
+    """Shared ``LosMatrix`` keyed by (opaque layout, board size, mode); small LRU."""
+    opaque = frozenset((int(x), int(y)) for x, y in opaque_cells)
+    key = (opaque, int(width), int(height), _normalize_mode(visibility_mode))
+    matrix = _LOS_MATRIX_CACHE.get(key)
+    if matrix is None:
+        matrix = LosMatrix(opaque, width, height, visibility_mode)
+        _LOS_MATRIX_CACHE[key] = matrix
+        while len(_LOS_MATRIX_CACHE) > _LOS_MATRIX_CACHE_MAX:
+            _LOS_MATRIX_CACHE.popitem(last=False)
+    else:
+        _LOS_MATRIX_CACHE.move_to_end(key)
+    return matrix
@@ -0,0 +1,279 @@
+"""Copy-on-write delta snapshots for Warhammer40kEnv (MCTS rollouts).
+
+``snapshot_state`` / ``restore_state`` copy the whole runtime state even when a
+simulated step touches a handful of units.  A delta frame instead records only
+what changes and undoes it by replaying the journal backwards:
+
+    mark = env.begin_delta()
+    env.step(...); env.enemyTurn(...)
+    env.undo_delta(mark)          # O(changed fields)
+
+What gets journaled
+-------------------
+- Attribute rebinding (``self.phase = ...``, ``self.unit_anchor_coords = [...]``):
+  while a frame is open the env runs under a journaling subclass whose
+  ``__setattr__`` remembers the first old binding per attribute.
+- In-place edits of the per-unit lists (health, coords, anchors, wounds,
+  model positions, flags): these are held as ``JournalList`` — a ``list``
+  subclass that logs ``(list, index, old)`` on ``__setitem__`` and a full
+  copy on structural ops (append/pop/...).  Lists stored into a
+  ``JournalList`` while a frame is open are wrapped too, so nested pairs
+  (``self.unit_coords[i][0] -= 1``) stay covered.
+- Small containers (strat dicts, stratagem log, sets, objective OC) are
+  copied at ``begin_delta`` — they are a few dozen bytes.  The ``board``
+  array is not copied: ``updateBoard`` always rebinds a fresh array before
+  writing cells, so the rebind journal restores the old one.
+- Unit object anchors and RNG states are saved at ``begin_delta`` and put
+  back on undo (``set_anchor`` only for units that actually moved).
+
+Objects handed out from inside a frame (``get_info()["model health"]``)
+alias live state and see the undo; copy them if they must outlive the frame.
+Frames nest; ``commit_delta`` keeps the changes and folds the frame into its
+parent.  Closing the outermost frame always puts the base class back, even
+if the undo itself fails; an env pickled or deep-copied inside a frame comes
+out as the base class without the journal.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+# Per-unit containers journaled in place.
+JOURNALED_LIST_ATTRS: tuple[str, ...] = (
+    "unit_health", "enemy_health",
+    "unit_coords", "enemy_coords",
+    "unit_anchor_coords", "enemy_anchor_coords",
+    "unitInAttack", "enemyInAttack",
+    "unitFellBack", "enemyFellBack",
+    "model_used_advance", "enemy_used_advance",
+    "model_advance_roll", "enemy_advance_roll",
+    "unitCharged", "enemyCharged",
+    "unit_model_wounds", "enemy_model_wounds",
+    "unit_model_positions", "enemy_model_positions",
+    "_objective_hold_streaks",
+    "turn_order",
+)
+
+# Small containers copied at begin_delta.
+COPIED_ATTRS: tuple[str, ...] = (
+    "modelStrat", "enemyStrat",
+    "stratagem_used", "active_stratagem_effects",
+    "_phase_unit_logged", "_terrain_shaping_shot_bonus_units",
+    "viewer_activation",
+    "model_obj_oc", "enemy_obj_oc",
+)
+
+# Attributes that never need journaling (the journal itself, derived caches).
+_UNJOURNALED_ATTRS = frozenset({
+    "_delta_journal",
+    "_distance_cache",
+    "_shoot_target_cache",
+    "_shoot_target_reject_cache",
+    "_los_matrix_cache",
+    "_barricade_grid_cache",
+    "_occupancy_grid_cache",
+    "_legal_mask_cache",
+    "_obs_encoder",
+})
+
+MISSING = object()
+_FULL = object()
+
+
+def copy_small(value: Any) -> Any:
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, set):
+        return set(value)
+    if isinstance(value, list):
+        return [dict(x) if isinstance(x, dict) else x for x in value]
+    return value
+
+
+class JournalList(list):
+    """``list`` that logs in-place edits into a ``DeltaJournal`` while it is active."""
+
+    __slots__ = ("_journal",)
+
+    def __init__(self, iterable=(), journal: DeltaJournal | None = None):
+        super().__init__(iterable)
+        self._journal = journal
+
+    # Pickle / copy as a plain list: the journal is process-local.
+    def __reduce__(self):
+        return (list, (list(self),))
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        import copy
+
+        return copy.deepcopy(list(self), memo)
+
+    def _log_full(self) -> None:
+        j = self._journal
+        if j is None:
+            return
+        if j.frames:
+            j.entries.append((self, _FULL, list.copy(self)))
+        else:
+            j.stale = True
+
+    def __setitem__(self, idx, value):
+        j = self._journal
+        if j is not None:
+            if not j.frames:
+                j.stale = True
+            elif isinstance(idx, slice):
+                j.entries.append((self, _FULL, list.copy(self)))
+                value = [j.wrap(v) for v in value]
+            else:
+                j.entries.append((self, idx, list.__getitem__(self, idx)))
+                value = j.wrap(value)
+        list.__setitem__(self, idx, value)
+
+    def __delitem__(self, idx):
+        self._log_full()
+        list.__delitem__(self, idx)
+
+    def __iadd__(self, other):
+        self._log_full()
+        return list.__iadd__(self, other)
+
+    def __imul__(self, n):
+        self._log_full()
+        return list.__imul__(self, n)
+
+    def append(self, value):
+        self._log_full()
+        j = self._journal
+        list.append(self, j.wrap(value) if j is not None and j.frames else value)
+
+    def extend(self, values):
+        self._log_full()
+        j = self._journal
+        if j is not None and j.frames:
+            values = [j.wrap(v) for v in values]
+        list.extend(self, values)
+
+    def insert(self, idx, value):
+        self._log_full()
+        j = self._journal
+        list.insert(self, idx, j.wrap(value) if j is not None and j.frames else value)
+
+    def pop(self, *args):
+        self._log_full()
+        return list.pop(self, *args)
+
+    def remove(self, value):
+        self._log_full()
+        list.remove(self, value)
+
+    def clear(self):
+        self._log_full()
+        list.clear(self)
+
+    def sort(self, *args, **kwargs):
+        self._log_full()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self):
+        self._log_full()
+        list.reverse(self)
+
+
+@dataclass
+class DeltaMark:
+    """Handle returned by ``begin_delta``; pass it back to undo/commit."""
+
+    depth: int
+    start: int
+    rebinds: dict = field(default_factory=dict)
+    copies: dict = field(default_factory=dict)
+    unit_anchors: tuple = ()
+    random_state: Any = None
+    np_random_state: Any = None
+
+
+class DeltaJournal:
+    """Per-env undo log shared by all of its ``JournalList`` containers."""
+
+    def __init__(self) -> None:
+        self.entries: list[tuple] = []
+        self.frames: list[DeltaMark] = []
+        # Set when a journaled list is edited outside any frame: nested plain lists may
+        # have been stored into it, so the next begin_delta re-walks the containers.
+        self.stale = False
+
+    def owns(self, value: Any) -> bool:
+        return isinstance(value, JournalList) and value._journal is self
+
+    def wrap(self, value: Any) -> Any:
+        """Deep-convert plain (or foreign-journal) lists into lists journaled here."""
+        if type(value) is list or (isinstance(value, JournalList) and value._journal is not self):
+            return JournalList((self.wrap(v) for v in value), self)
+        return value
+
+    def adopt_children(self, lst: JournalList) -> None:
+        """Make sure every nested list inside ``lst`` is journaled here."""
+        for i, child in enumerate(lst):
+            if self.owns(child):
+                self.adopt_children(child)
+            elif isinstance(child, list):
+                if self.frames:
+                    self.entries.append((lst, i, child))
+                list.__setitem__(lst, i, self.wrap(child))
+
+    def record_rebind(self, env_dict: dict, name: str) -> None:
+        frame = self.frames[-1]
+        if name not in frame.rebinds and name not in _UNJOURNALED_ATTRS:
+            frame.rebinds[name] = env_dict.get(name, MISSING)
+
+    def rewind(self, start: int) -> None:
+        entries = self.entries
+        while len(entries) > start:
+            lst, idx, old = entries.pop()
+            if idx is _FULL:
+                list.__setitem__(lst, slice(None), old)
+            else:
+                list.__setitem__(lst, idx, old)
+
+
+_JOURNALING_CLASSES: dict[type, type] = {}
+
+
+def _new_instance(cls: type) -> Any:
+    """Unpickle helper for journaling subclasses: a bare instance of the base class."""
+    return cls.__new__(cls)
+
+
+def journaling_class(cls: type) -> type:
+    """Subclass of ``cls`` whose ``__setattr__`` records the first old binding per frame."""
+    sub = _JOURNALING_CLASSES.get(cls)
+    if sub is None:
+        base_setattr = cls.__setattr__
+
+        def __setattr__(self, name, value):
+            journal = self.__dict__.get("_delta_journal")
+            if journal is not None and journal.frames:
+                journal.record_rebind(self.__dict__, name)
+            base_setattr(self, name, value)
+
+        def __reduce_ex__(self, protocol):
+            # Подкласс создан динамически и по имени не импортируется: пиклим как базовый класс.
+            # Журнал держит ссылки на живые списки этого процесса — в копию он не попадает.
+            state = {k: v for k, v in self.__dict__.items() if k != "_delta_journal"}
+            return _new_instance, (cls,), state
+
+        sub = type(
+            cls.__name__,
+            (cls,),
+            {"__setattr__": __setattr__, "__reduce_ex__": __reduce_ex__, "_delta_base_class": cls},
+        )
+        _JOURNALING_CLASSES[cls] = sub
+    return sub
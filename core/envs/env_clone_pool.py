@@ -20,14 +20,13 @@ Each env in the pool is used by at most one thread at a time.  The pool
 itself is protected by a threading.Semaphore so borrowers block when all
 clones are in use.
 
-Limitations
------------
-- The clones share the *same* ``model`` / ``enemy`` Unit object lists as the
-  original env.  Moving units via ``set_anchor`` in one clone therefore races
-  with other clones.  The pool mitigates this by saving/restoring unit coords
-  through the slim snapshot mechanism (``_model_unit_coords`` /
-  ``_enemy_unit_coords`` keys), but users should be aware that deeper shared
-  state (e.g. weapon data dicts) is read-only in practice and safe.
+Isolation
+---------
+- Each clone gets its own ``model`` / ``enemy`` Unit objects, board array,
+  derived caches and (in ``ENV_STATE_MODE=array``) its own packed state
+  buffer, so ``set_anchor`` / ``restore_state`` in one clone never touch
+  another.  Static per-unit data (weapon / unit data dicts) stays shared and
+  is read-only in practice.
 - numpy.random state is isolated per clone via per-thread seed injection.
 - Logging inside simulation_mode is suppressed by design (simulation_mode
   already sets ``_simulation_mode_depth > 0``).
@@ -39,6 +38,36 @@ import threading
 from contextlib import contextmanager
 from typing import Any, Generator
 
+_CLONE_CACHE_ATTRS = ("_distance_cache", "_shoot_target_cache", "_shoot_target_reject_cache")
+
+
+def _isolate_clone(clone: Any, base_env: Any) -> None:
+    """Detach the mutable containers a shallow ``copy.copy`` would share."""
+    for side in ("model", "enemy"):
+        units = getattr(base_env, side, None)
+        if units is not None:
+            # copy.copy per Unit + own coords array: data/weapon dicts stay shared.
+            own = []
+            for unit in units:
+                u = copy.copy(unit)
+                if hasattr(unit, "unit_coords"):
+                    u.unit_coords = unit.unit_coords.copy()
+                    u.anchor_coords = u.unit_coords
+                if hasattr(unit, "unit_models"):
+                    u.unit_models = copy.deepcopy(unit.unit_models)
+                own.append(u)
+            setattr(clone, side, own)
+    board = getattr(base_env, "board", None)
+    if board is not None and hasattr(board, "copy"):
+        clone.board = board.copy()
+    for attr in _CLONE_CACHE_ATTRS:
+        if hasattr(base_env, attr):
+            setattr(clone, attr, {})
+    if hasattr(base_env, "_state_buffer"):
+        clone._state_buffer = None
+    # Delta journal is per-env: the clone opens its own on first begin_delta.
+    clone.__dict__.pop("_delta_journal", None)
+
 
 class EnvClonePool:
     """Pre-warmed pool of env clones for thread-parallel MCTS simulations.
@@ -63,7 +92,7 @@ class EnvClonePool:
         snap = base_env.snapshot_state() if hasattr(base_env, "snapshot_state") else None
         for _ in range(self._pool_size):
             clone = copy.copy(base_env)
-            # Deep-copy the mutable state but share the immutable model/enemy refs
+            _isolate_clone(clone, base_env)
             if snap is not None and hasattr(clone, "restore_state"):
                 clone.restore_state(snap)
             self._available.append(clone)
@@ -0,0 +1,245 @@
+"""EnvProcessPool — worker processes with private env replicas for MCTS rollouts.
+
+``EnvClonePool`` runs rollouts on threads, so env stepping (pure Python) is
+serialised by the GIL.  This pool moves the rollouts into worker processes:
+
+    pool = EnvProcessPool(base_env, n_workers=8)
+    pool.set_payload(worker_mcts)          # picklable, shared by every task
+    pool.sync_root(env)                    # before each search
+    results = pool.map(rollout_fn, common_kwargs, tasks)
+    pool.close()
+
+Each worker holds its own deep replica of the env (unpickled once at start),
+so Unit objects, board and caches are never shared with the parent.
+
+Root sync
+---------
+The numeric part of the root state is packed with ``EnvStateBuffer`` (the
+``ENV_STATE_MODE=array`` layout) and written into one shared ``RawArray``
+allocated at pool start; workers copy it out with ``restore_state``.  Only
+the small Python leftovers (RNG states, strat dicts, phase) go through the
+pipe.  If the roster changes (new Unit objects after a reset with other
+armies) or the packed state does not fit the shared block, the full env is
+re-pickled to the workers instead.
+
+Tasks
+-----
+``map(fn, common, tasks)`` splits ``tasks`` into one contiguous chunk per
+worker; each worker calls ``fn(env, payload, **common, **task)`` for its
+chunk and results come back in task order.  ``fn`` must be a module-level
+function.  ``fn`` is responsible for restoring the replica between tasks
+(``snapshot_state`` / ``begin_delta``); workers also restore the root before
+every chunk.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+import pickle
+import threading
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from core.engine.game_io import flush_log_writer
+
+_START_METHOD = os.getenv("MCTS_PROCESS_START_METHOD", "spawn")
+# Запас shared-блока относительно упакованного состояния на старте (юниты могут добавиться).
+_SHARED_HEADROOM = 2
+
+
+def _roster_signature(env: Any) -> tuple[int, ...]:
+    return tuple(id(u) for u in (list(getattr(env, "model", None) or []) + list(getattr(env, "enemy", None) or [])))
+
+
+def _pack_root(env: Any) -> tuple[Optional[np.ndarray], dict]:
+    """(packed numeric buffer, python aux) or (None, full snapshot)."""
+    if hasattr(env, "_snapshot_state_array"):
+        snap = env._snapshot_state_array()
+        if snap is not None:
+            packed = snap.pop("_state_buffer")
+            return packed, snap
+    return None, env.snapshot_state()
+
+
+def _worker_main(conn, shared, env_bytes: bytes) -> None:
+    env = pickle.loads(env_bytes)
+    shared_view = np.frombuffer(shared, dtype=np.float64)
+    payload = None
+    root: Optional[dict] = None
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            break
+        kind = msg[0]
+        try:
+            if kind == "close":
+                break
+            if kind == "env":
+                env = pickle.loads(msg[1])
+                root = None
+                conn.send(("ok", None))
+            elif kind == "payload":
+                payload = msg[1]
+                conn.send(("ok", None))
+            elif kind == "root":
+                _kind, n, aux = msg
+                if n >= 0:
+                    root = dict(aux)
+                    root["_state_buffer"] = shared_view[:n].copy()
+                else:
+                    root = aux
+                env.restore_state(root)
+                conn.send(("ok", None))
+            elif kind == "run":
+                _kind, fn, common, tasks = msg
+                if root is not None:
+                    env.restore_state(root)
+                out = [fn(env, payload, **common, **task) for task in tasks]
+                conn.send(("ok", out))
+            else:
+                conn.send(("err", f"unknown message {kind!r}"))
+        except Exception as exc:
+            conn.send(("err", f"{type(exc).__name__}: {exc}"))
+    flush_log_writer()
+    conn.close()
+
+
+class EnvProcessPool:
+    """Pool of worker processes, each with a private env replica.
+
+    Parameters
+    ----------
+    base_env:
+        Env to replicate (unwrapped ``Warhammer40kEnv``).  Must be picklable.
+    n_workers:
+        Number of worker processes.
+    start_method:
+        multiprocessing start method; ``spawn`` by default (safe with torch
+        threads), override with ``MCTS_PROCESS_START_METHOD``.
+    """
+
+    def __init__(self, base_env: Any, n_workers: int = 4, *, start_method: str | None = None) -> None:
+        self._n_workers = max(1, int(n_workers))
+        self._ctx = mp.get_context(start_method or _START_METHOD)
+        self._lock = threading.Lock()
+        packed, _aux = _pack_root(base_env)
+        capacity = max(1, int(packed.size) * _SHARED_HEADROOM) if packed is not None else 1
+        self._shared = self._ctx.RawArray("d", capacity)
+        self._shared_view = np.frombuffer(self._shared, dtype=np.float64)
+        self._roster = _roster_signature(base_env)
+        env_bytes = pickle.dumps(base_env, protocol=pickle.HIGHEST_PROTOCOL)
+        self._conns = []
+        self._procs = []
+        for _ in range(self._n_workers):
+            parent_conn, child_conn = self._ctx.Pipe()
+            proc = self._ctx.Process(
+                target=_worker_main,
+                args=(child_conn, self._shared, env_bytes),
+                daemon=True,
+            )
+            proc.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._procs.append(proc)
+        self._closed = False
+
+    @property
+    def n_workers(self) -> int:
+        return self._n_workers
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _broadcast(self, msg: tuple) -> list[Any]:
+        for conn in self._conns:
+            conn.send(msg)
+        return self._collect()
+
+    def _collect(self) -> list[Any]:
+        out = []
+        errors = []
+        for conn in self._conns:
+            status, value = conn.recv()
+            if status != "ok":
+                errors.append(value)
+            out.append(value)
+        if errors:
+            raise RuntimeError(f"EnvProcessPool worker failed: {errors[0]}")
+        return out
+
+    def set_payload(self, payload: Any) -> None:
+        """Send a picklable object handed to every task function as ``payload``."""
+        with self._lock:
+            self._broadcast(("payload", payload))
+
+    def sync_root(self, env: Any) -> None:
+        """Move every replica to ``env``'s current state."""
+        with self._lock:
+            roster = _roster_signature(env)
+            if roster != self._roster:
+                self._roster = roster
+                self._broadcast(("env", pickle.dumps(env, protocol=pickle.HIGHEST_PROTOCOL)))
+            packed, aux = _pack_root(env)
+            if packed is not None and packed.size <= self._shared_view.size:
+                self._shared_view[: packed.size] = packed
+                self._broadcast(("root", int(packed.size), aux))
+            else:
+                if packed is not None:
+                    aux = env.snapshot_state()
+                self._broadcast(("root", -1, aux))
+
+    def map(self, fn: Callable[..., Any], common: dict, tasks: list[dict]) -> list[Any]:
+        """Run ``fn(env, payload, **common, **task)`` for every task; results in task order."""
+        if not tasks:
+            return []
+        with self._lock:
+            n = len(tasks)
+            chunk = (n + self._n_workers - 1) // self._n_workers
+            used = []
+            for i, conn in enumerate(self._conns):
+                part = tasks[i * chunk: (i + 1) * chunk]
+                if part:
+                    conn.send(("run", fn, common, part))
+                    used.append(conn)
+            results: list[Any] = []
+            errors = []
+            for conn in used:
+                status, value = conn.recv()
+                if status != "ok":
+                    errors.append(value)
+                    continue
+                results.extend(value)
+            if errors:
+                raise RuntimeError(f"EnvProcessPool worker failed: {errors[0]}")
+            return results
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for conn in self._conns:
+            try:
+                conn.send(("close",))
+            except (BrokenPipeError, OSError):
+                pass
+        for proc in self._procs:
+            proc.join(timeout=5.0)
+            if proc.is_alive():
+                proc.terminate()
+        for conn in self._conns:
+            conn.close()
+
+    def __enter__(self) -> EnvProcessPool:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,172 @@
+"""ObservationEncoder — preallocated observation layout for Warhammer40kEnv.
+
+``get_observation_for_side`` used to append every value to a Python list and
+convert it with ``np.array`` on each call.  The encoder is built once per
+reset (unit/objective counts are fixed for an episode) and keeps one float32
+buffer per side with fixed offsets:
+
+    [ own units (hp, row, col) * N | own CP | enemy units * M | enemy CP
+      | objectives (row, col) * K | game_over | phase block (optional) ]
+
+"own"/"enemy" are relative to the requested side, so the two sides have
+different unit-block sizes; each side gets its own layout.  Objective markers
+do not move during an episode and are written once; per call only the unit
+block (one slice assignment), ``game_over`` and the phase block are written.
+
+``encode(env, side, out=None)`` writes straight into ``out`` when it is given
+(e.g. one row of a batched shared-memory observation tensor) and returns it;
+otherwise it returns a fresh copy of the internal buffer, so callers may keep
+the result (replay buffers, MCTS nodes).
+
+The phase block (``PHASE_OBS_FEATURES=1``) is decided when the encoder is
+built: phase one-hot (6) + timing main (1) + CP self/enemy / 12 (2) + per
+stratagem "available now" (K) + "used this round" (K), K = ``len(REGISTRY)``.
+The encoder is the only implementation of this block.
+"""
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import numpy as np
+
+_PHASE_ORDER = ("command", "movement", "shooting", "charge", "fight", "scoring")
+
+
+class _SideLayout:
+    __slots__ = ("n_own", "n_other", "own_cp", "other_units", "other_cp", "objectives", "game_over", "phase", "size")
+
+    def __init__(self, n_own: int, n_other: int, n_objectives: int, phase_len: int) -> None:
+        self.n_own = n_own
+        self.n_other = n_other
+        self.own_cp = 3 * n_own
+        self.other_units = self.own_cp + 1
+        self.other_cp = self.other_units + 3 * n_other
+        self.objectives = self.other_cp + 1
+        self.game_over = self.objectives + 2 * n_objectives
+        self.phase = self.game_over + 1
+        self.size = self.phase + phase_len
+
+
+class ObservationEncoder:
+    """Fixed-offset observation writer for one episode layout."""
+
+    def __init__(self, n_model: int, n_enemy: int, n_objectives: int, *, phase_features: bool = False) -> None:
+        self.n_model = int(n_model)
+        self.n_enemy = int(n_enemy)
+        self.n_objectives = int(n_objectives)
+        self.phase_features = bool(phase_features)
+
+        if self.phase_features:
+            from core.engine.phases.stratagems import REGISTRY
+
+            self._strat_ids = {d.id: k for k, d in enumerate(REGISTRY)}
+            # [phase, stratagem] — стратагема разрешена в фазе
+            self._strat_phase = np.array(
+                [[p in tuple(ph.value for ph in d.phases) for d in REGISTRY] for p in _PHASE_ORDER],
+                dtype=bool,
+            ).reshape(len(_PHASE_ORDER), len(REGISTRY))
+            self._strat_cost = np.array([float(d.cp_cost) for d in REGISTRY], dtype=np.float32)
+            phase_len = len(_PHASE_ORDER) + 1 + 2 + 2 * len(REGISTRY)
+        else:
+            self._strat_ids = {}
+            phase_len = 0
+
+        self._layouts = {
+            "model": _SideLayout(self.n_model, self.n_enemy, self.n_objectives, phase_len),
+            "enemy": _SideLayout(self.n_enemy, self.n_model, self.n_objectives, phase_len),
+        }
+        self._buffers = {side: np.zeros(lay.size, dtype=np.float32) for side, lay in self._layouts.items()}
+        self._objectives_ref: Any = None
+
+    @classmethod
+    def for_env(cls, env: Any, *, phase_features: bool = False) -> ObservationEncoder:
+        return cls(
+            len(env.unit_health),
+            len(env.enemy_health),
+            len(env.coordsOfOM),
+            phase_features=phase_features,
+        )
+
+    def matches(self, env: Any) -> bool:
+        return (
+            len(env.unit_health) == self.n_model
+            and len(env.enemy_health) == self.n_enemy
+            and len(env.coordsOfOM) == self.n_objectives
+        )
+
+    def size(self, side: str = "model") -> int:
+        return self._layouts["enemy" if side == "enemy" else "model"].size
+
+    def _sync_objectives(self, objectives) -> None:
+        # Маркеры неподвижны в пределах эпизода: блок пишется в шаблоны один раз.
+        if objectives is self._objectives_ref:
+            return
+        self._objectives_ref = objectives
+        for side, lay in self._layouts.items():
+            if self.n_objectives:
+                block = self._buffers[side][lay.objectives:lay.game_over]
+                block.reshape(self.n_objectives, 2)[:] = np.asarray(objectives, dtype=np.float32)[:, :2]
+
+    def encode(self, env: Any, side: str = "model", out: Optional[np.ndarray] = None) -> np.ndarray:
+        side = "enemy" if side == "enemy" else "model"
+        lay = self._layouts[side]
+        if out is not None and (out.shape != (lay.size,) or not out.flags.c_contiguous):
+            raise ValueError(f"out must be a contiguous ({lay.size},) array, got shape {out.shape}")
+        self._sync_objectives(env.coordsOfOM)
+        buf = self._buffers[side]
+
+        if side == "enemy":
+            own_h, own_c, own_cp = env.enemy_health, env.enemy_coords, env.enemyCP
+            oth_h, oth_c, oth_cp = env.unit_health, env.unit_coords, env.modelCP
+        else:
+            own_h, own_c, own_cp = env.unit_health, env.unit_coords, env.modelCP
+            oth_h, oth_c, oth_cp = env.enemy_health, env.enemy_coords, env.enemyCP
+
+        # Юнит-блоки и CP идут подряд с нуля — одна запись среза вместо поэлементного np.array.
+        head = []
+        for i in range(lay.n_own):
+            c = own_c[i]
+            head += (own_h[i], c[0], c[1])
+        head.append(own_cp)
+        for i in range(lay.n_other):
+            c = oth_c[i]
+            head += (oth_h[i], c[0], c[1])
+        head.append(oth_cp)
+        buf[:lay.objectives] = head
+        buf[lay.game_over] = 1.0 if env.game_over else 0.0
+        if self.phase_features:
+            self._write_phase_block(buf[lay.phase:lay.size], env, side)
+
+        if out is None:
+            return buf.copy()
+        out[:] = buf
+        return out
+
+    def _write_phase_block(self, block: np.ndarray, env: Any, side: str) -> None:
+        n_phase = len(_PHASE_ORDER)
+        k = len(self._strat_ids)
+        block[:] = 0.0
+        cur_phase = str(getattr(env, "phase", "command") or "command")
+        phase_idx = _PHASE_ORDER.index(cur_phase) if cur_phase in _PHASE_ORDER else -1
+        if phase_idx >= 0:
+            block[phase_idx] = 1.0
+        # timing: считаем MAIN (1.0); reaction-окна пока вне obs-петли
+        block[n_phase] = 1.0
+
+        cp_self = float(env.modelCP if side == "model" else env.enemyCP)
+        cp_enemy = float(env.enemyCP if side == "model" else env.modelCP)
+        block[n_phase + 1] = cp_self / 12.0
+        block[n_phase + 2] = cp_enemy / 12.0
+
+        avail = block[n_phase + 3:n_phase + 3 + k]
+        if phase_idx >= 0:
+            avail[:] = self._strat_phase[phase_idx] & (cp_self >= self._strat_cost)
+
+        used = block[n_phase + 3 + k:n_phase + 3 + 2 * k]
+        cur_round = int(getattr(env, "battle_round", 1))
+        for rec in getattr(env, "stratagem_used", None) or ():
+            if rec[0] != side or (len(rec) >= 3 and int(rec[2]) != cur_round):
+                continue
+            slot = self._strat_ids.get(rec[1])
+            if slot is not None:
+                used[slot] = 1.0
@@ -0,0 +1,353 @@
+"""SharedMemoryVecEnv — subprocess env workers with shared-memory step I/O.
+
+The plain ``USE_SUBPROC_ENVS`` path pickles ``(obs, reward, done, res, info,
+mask)`` through a Pipe on every step.  In shared-memory mode every worker
+owns one row of a few preallocated arrays and the pipe only carries one
+command byte each way:
+
+    parent                                   worker
+    actions[i] = row; send_bytes(b"s")  ->   read actions[i], env.step(...)
+                                             obs[i], reward[i], done[i],
+                                             masks[i], health/VP rows = ...
+    recv_bytes() == b"k"                <-   send_bytes(b"k")
+
+The full ``info`` dict is only pickled for steps that end the episode and
+for resets (``b"i" + pickle``); for ordinary steps the parent rebuilds the
+lean train info (the same keys as ``_lean_train_info`` in train.py) from the arrays.
+
+Layout (one row per env):
+
+- ``obs``          float32 ``[n, obs_dim]``
+- ``reward``       float64 ``[n]``, ``done`` uint8 ``[n]``
+- ``action``       int64 ``[n, n_heads]`` in ``ordered_action_keys`` order
+- ``mask``         bool ``[n, sum(head_sizes)]`` — legal masks by head; heads the
+                   worker does not send (``masks=None`` or missing key) stay all-True
+- ``model_health`` / ``enemy_health`` float32 ``[n, n_units]``
+- ``in_attack``    int64 ``[n, n_model, 2]`` — ``unitInAttack`` pairs
+- ``stats``        float64 ``[n, 4]`` — model VP, player VP, turn, battle round
+- ``objectives``   int16 ``[n, 2, 16]`` — model/player controlled objective indices, -1 padded
+- ``labels``       uint8 ``[n, 2, 32]`` — utf-8 "end reason" and "winner" (empty = None)
+
+Blocks are ``multiprocessing.shared_memory`` segments, so they can be
+attached to workers that were started before the layout was known (the
+obs size and head sizes come from the worker's first reset).
+"""
+from __future__ import annotations
+
+import pickle
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+CMD_STEP = b"s"
+CMD_ENEMY_TURN = b"e"
+CMD_RESET = b"r"
+CMD_DETACH = b"x"
+ACK = b"k"
+ACK_INFO = b"i"
+ACK_ERROR = b"!"
+
+_STATS = ("model VP", "player VP", "turn", "battle round")
+_OBJECTIVE_KEYS = ("model controlled objectives", "player controlled objectives")
+_MAX_OBJECTIVES = 16
+_LABEL_KEYS = ("end reason", "winner")
+_LABEL_BYTES = 32
+
+
+@dataclass
+class SharedVecSpec:
+    n_envs: int
+    obs_dim: int
+    keys: tuple[str, ...]
+    head_sizes: tuple[int, ...]
+    n_model: int
+    n_enemy: int
+    mission: str = ""
+    names: dict[str, str] = field(default_factory=dict)
+
+    def fields(self) -> dict[str, tuple[tuple[int, ...], Any]]:
+        n = int(self.n_envs)
+        return {
+            "obs": ((n, int(self.obs_dim)), np.float32),
+            "reward": ((n,), np.float64),
+            "done": ((n,), np.uint8),
+            "action": ((n, len(self.head_sizes)), np.int64),
+            "mask": ((n, int(sum(self.head_sizes))), np.bool_),
+            "model_health": ((n, int(self.n_model)), np.float32),
+            "enemy_health": ((n, int(self.n_enemy)), np.float32),
+            "in_attack": ((n, int(self.n_model), 2), np.int64),
+            "stats": ((n, len(_STATS)), np.float64),
+            "objectives": ((n, len(_OBJECTIVE_KEYS), _MAX_OBJECTIVES), np.int16),
+            "labels": ((n, len(_LABEL_KEYS), _LABEL_BYTES), np.uint8),
+        }
+
+    @property
+    def head_offsets(self) -> list[int]:
+        return [0] + list(np.cumsum(self.head_sizes, dtype=np.int64).tolist())
+
+
+def _as_number(value: float) -> int | float:
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Блоки создаёт и удаляет родитель. Воркеры multiprocessing делят с ним resource_tracker,
+    # поэтому повторная регистрация при attach безвредна; track=False (3.13+) её просто убирает.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class _SharedArrays:
+    """numpy views over the named shared-memory blocks of a spec."""
+
+    def __init__(self, spec: SharedVecSpec, *, create: bool) -> None:
+        self._blocks: list[shared_memory.SharedMemory] = []
+        self._owner = create
+        self.arrays: dict[str, np.ndarray] = {}
+        for name, (shape, dtype) in spec.fields().items():
+            nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            if create:
+                block = shared_memory.SharedMemory(create=True, size=nbytes)
+                spec.names[name] = block.name
+            else:
+                block = _attach(spec.names[name])
+            self._blocks.append(block)
+            arr = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            if create:
+                arr.fill(0)
+            self.arrays[name] = arr
+
+    def close(self) -> None:
+        self.arrays = {}
+        for block in self._blocks:
+            try:
+                block.close()
+                if self._owner:
+                    block.unlink()
+            except (FileNotFoundError, BufferError):
+                pass
+        self._blocks = []
+
+
+class SharedEnvSlot:
+    """Worker side: one row of the shared arrays."""
+
+    def __init__(self, spec: SharedVecSpec, idx: int) -> None:
+        self.spec = spec
+        self.idx = int(idx)
+        self._shared = _SharedArrays(spec, create=False)
+        self._offsets = spec.head_offsets
+
+    def row(self, name: str) -> np.ndarray:
+        return self._shared.arrays[name][self.idx]
+
+    def action_dict(self) -> dict[str, int]:
+        row = self._shared.arrays["action"][self.idx]
+        return {key: int(row[j]) for j, key in enumerate(self.spec.keys)}
+
+    def write(self, obs, reward: float, done: bool, info: dict | None, masks: dict | None) -> None:
+        arrs = self._shared.arrays
+        i = self.idx
+        arrs["obs"][i] = obs
+        arrs["reward"][i] = float(reward)
+        arrs["done"][i] = 1 if done else 0
+        mask_row = arrs["mask"][i]
+        for j, key in enumerate(self.spec.keys):
+            lo, hi = self._offsets[j], self._offsets[j + 1]
+            m = None if masks is None else masks.get(key)
+            if m is None or len(m) != hi - lo or not np.any(m):
+                mask_row[lo:hi] = True
+            else:
+                mask_row[lo:hi] = m
+        info = info or {}
+        arrs["model_health"][i] = info.get("model health", arrs["model_health"][i])
+        arrs["enemy_health"][i] = info.get("player health", arrs["enemy_health"][i])
+        in_attack = info.get("in attack")
+        if isinstance(in_attack, (list, tuple)) and len(in_attack) == arrs["in_attack"].shape[1]:
+            arrs["in_attack"][i] = in_attack
+        arrs["stats"][i] = [float(info.get(k, 0) or 0) for k in _STATS]
+        objectives = arrs["objectives"][i]
+        objectives.fill(-1)
+        for j, key in enumerate(_OBJECTIVE_KEYS):
+            controlled = list(info.get(key) or [])[:_MAX_OBJECTIVES]
+            objectives[j, : len(controlled)] = controlled
+        labels = arrs["labels"][i]
+        labels.fill(0)
+        for j, key in enumerate(_LABEL_KEYS):
+            raw = str(info.get(key) or "").encode("utf-8")[:_LABEL_BYTES]
+            labels[j, : len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+
+    def close(self) -> None:
+        self._shared.close()
+
+
+def serve_slot(
+    conn,
+    slot: SharedEnvSlot,
+    *,
+    step_fn: Callable[[dict], tuple],
+    reset_fn: Callable[[], tuple],
+    enemy_turn_fn: Callable[[], None],
+) -> None:
+    """Worker command loop for shared-memory mode; returns on ``CMD_DETACH``.
+
+    ``step_fn(action_dict) -> (obs, reward, done, info, masks)``,
+    ``reset_fn() -> (obs, info, masks)``.
+    """
+    try:
+        while True:
+            cmd = conn.recv_bytes()
+            try:
+                if cmd == CMD_STEP:
+                    obs, reward, done, info, masks = step_fn(slot.action_dict())
+                    slot.write(obs, reward, done, info, masks)
+                    conn.send_bytes(ACK_INFO + pickle.dumps(info) if done else ACK)
+                elif cmd == CMD_ENEMY_TURN:
+                    enemy_turn_fn()
+                    conn.send_bytes(ACK)
+                elif cmd == CMD_RESET:
+                    obs, info, masks = reset_fn()
+                    slot.write(obs, 0.0, False, info, masks)
+                    conn.send_bytes(ACK_INFO + pickle.dumps(info))
+                elif cmd == CMD_DETACH:
+                    conn.send_bytes(ACK)
+                    break
+                else:
+                    conn.send_bytes(ACK_ERROR + f"unknown command {cmd!r}".encode())
+            except Exception as exc:
+                conn.send_bytes(ACK_ERROR + f"{type(exc).__name__}: {exc}".encode())
+    finally:
+        slot.close()
+
+
+class SharedMemoryVecEnv:
+    """Parent side: batched step/enemy-turn/reset over already started workers.
+
+    ``conns`` are the pipes of workers that understand the ``("attach_shm",
+    (spec, idx))`` command and then switch to :func:`serve_slot`.  ``close()``
+    detaches the workers: they drop the shared blocks and go back to their
+    regular pickled command loop (save/close commands keep working).
+    """
+
+    def __init__(self, conns: list, spec: SharedVecSpec) -> None:
+        self.spec = spec
+        self._conns = list(conns)
+        self._shared = _SharedArrays(spec, create=True)
+        self._offsets = spec.head_offsets
+        self._key_index = {key: j for j, key in enumerate(spec.keys)}
+        self._closed = False
+        for idx, conn in enumerate(self._conns):
+            conn.send(("attach_shm", (spec, idx)))
+        for conn in self._conns:
+            reply = conn.recv()
+            if reply is not True:
+                self.close()
+                raise RuntimeError(f"SharedMemoryVecEnv: worker failed to attach: {reply}")
+
+    @property
+    def n_envs(self) -> int:
+        return len(self._conns)
+
+    def _recv(self, idx: int) -> Optional[dict]:
+        msg = self._conns[idx].recv_bytes()
+        head = msg[:1]
+        if head == ACK:
+            return None
+        if head == ACK_INFO:
+            return pickle.loads(msg[1:])
+        raise RuntimeError(f"SharedMemoryVecEnv worker {idx} failed: {msg[1:].decode(errors='replace')}")
+
+    def _recv_all(self) -> list[Optional[dict]]:
+        # Сначала дочитываем ответы всех воркеров, потом падаем: иначе непрочитанный ACK
+        # остаётся в pipe и следующая команда получит чужой ответ.
+        replies: list[Optional[dict]] = []
+        errors: list[str] = []
+        for idx in range(self.n_envs):
+            try:
+                replies.append(self._recv(idx))
+            except RuntimeError as exc:
+                replies.append(None)
+                errors.append(str(exc))
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return replies
+
+    def lean_info(self, idx: int) -> dict:
+        arrs = self._shared.arrays
+        stats = arrs["stats"][idx]
+        objectives = arrs["objectives"][idx]
+        end_reason, winner = (
+            bytes(label).rstrip(b"\0").decode("utf-8", errors="ignore") for label in arrs["labels"][idx]
+        )
+        return {
+            "model health": [_as_number(x) for x in arrs["model_health"][idx]],
+            "player health": [_as_number(x) for x in arrs["enemy_health"][idx]],
+            "in attack": arrs["in_attack"][idx].tolist(),
+            "model VP": _as_number(stats[0]),
+            "player VP": _as_number(stats[1]),
+            "mission": self.spec.mission,
+            "end reason": end_reason,
+            "winner": winner or None,
+            "turn": _as_number(stats[2]),
+            "battle round": _as_number(stats[3]),
+            "model controlled objectives": objectives[0][objectives[0] >= 0].tolist(),
+            "player controlled objectives": objectives[1][objectives[1] >= 0].tolist(),
+        }
+
+    def obs(self, idx: int) -> np.ndarray:
+        return self._shared.arrays["obs"][idx].copy()
+
+    def head_mask(self, idx: int, key: str) -> np.ndarray:
+        j = self._key_index[key]
+        return self._shared.arrays["mask"][idx, self._offsets[j]:self._offsets[j + 1]].copy()
+
+    def masks(self, idx: int) -> list[np.ndarray]:
+        row = self._shared.arrays["mask"][idx]
+        return [row[self._offsets[j]:self._offsets[j + 1]].copy() for j in range(len(self.spec.keys))]
+
+    def enemy_turn_all(self) -> None:
+        for conn in self._conns:
+            conn.send_bytes(CMD_ENEMY_TURN)
+        self._recv_all()
+
+    def step_all(self, actions) -> tuple[np.ndarray, np.ndarray, np.ndarray, list[dict]]:
+        """Step every env; ``actions`` is ``[n_envs, n_heads]`` in ``spec.keys`` order.
+
+        Returns copies of ``(obs, rewards, dones, infos)``; ``infos[i]`` is the
+        worker's full info for finished episodes and the lean info otherwise.
+        """
+        self._shared.arrays["action"][:] = np.asarray(actions, dtype=np.int64).reshape(self.n_envs, -1)
+        for conn in self._conns:
+            conn.send_bytes(CMD_STEP)
+        full = self._recv_all()
+        arrs = self._shared.arrays
+        infos = [full[i] if full[i] is not None else self.lean_info(i) for i in range(self.n_envs)]
+        return arrs["obs"].copy(), arrs["reward"].copy(), arrs["done"].astype(bool), infos
+
+    def reset(self, idx: int) -> tuple[np.ndarray, dict]:
+        self._conns[idx].send_bytes(CMD_RESET)
+        info = self._recv(idx)
+        return self.obs(idx), info if info is not None else self.lean_info(idx)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for idx, conn in enumerate(self._conns):
+            try:
+                conn.send_bytes(CMD_DETACH)
+                self._recv(idx)
+            except (BrokenPipeError, EOFError, OSError, RuntimeError):
+                pass
+        self._shared.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except Exception:
+            pass
@@ -0,0 +1,374 @@
+"""EnvStateBuffer — packed structure-of-arrays snapshot for Warhammer40kEnv.
+
+The regular ``snapshot_state`` walks dozens of nested Python lists and dicts.
+With ``ENV_STATE_MODE=array`` the env instead packs its numeric runtime state
+(health, coords, anchors, per-model wounds/positions, phase flags, CP/VP,
+objective streaks, board) into ONE preallocated float64 buffer:
+
+    snapshot -> pack into env-owned buffer, then ``buffer.copy()``
+    restore  -> ``np.copyto(buffer, snap)`` and column-wise ``tolist()`` decode
+
+Every per-unit field is copied as one numpy block: pairs as ``[n, 2]``,
+ragged wounds/positions through a ``[n, max_models]`` length mask (one flat
+gather/scatter per field), and integer-valued columns come back as ``int``
+via a single ``astype(int64).tolist()``.  Python only loops per element when
+a column really holds non-integer values.
+
+Layout
+------
+``[ scalars | lengths | model block | enemy block | streaks | board ]``
+
+- side block is a 2-D ``[n_units, width]`` view; each row holds one unit:
+  health, coords, anchor, in_attack, fell_back, used_advance, advance_roll,
+  charged, Unit-object anchor, then ragged wounds (``max_models``) and
+  ragged model positions (``max_models * 3``);
+- ``lengths`` stores the current length of every per-unit list and of every
+  ragged row, so partially-initialised lists (e.g. ``unitCharged`` right after
+  ``reset``) round-trip exactly;
+- ``advance_roll`` stores ``None`` as NaN.
+
+Non-numeric state (strings, sets, stratagem logs, RNG states) stays in a small
+Python side-dict built by the env itself.
+
+``pack`` returns ``None`` when the env no longer fits the layout (unit counts
+changed, more models than planned) — the caller then rebuilds the layout or
+falls back to the dict snapshot.
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+# (attr, kind): kind "num" keeps integer-valued numbers as int, "f" is float, "b" is bool.
+SCALAR_FIELDS: tuple[tuple[str, str], ...] = (
+    ("iter", "num"),
+    ("restarts", "num"),
+    ("enemyCP", "num"),
+    ("modelCP", "num"),
+    ("enemyOverwatch", "num"),
+    ("modelVP", "num"),
+    ("enemyVP", "num"),
+    ("battle_round", "num"),
+    ("numTurns", "num"),
+    ("_prev_vp_diff", "num"),
+    ("_target_cache_epoch", "num"),
+    ("_action_repeat_streak", "num"),
+    ("current_action_index", "num"),
+    ("viewer_step_seq", "num"),
+    ("_state_flush_last_ts", "f"),
+    ("playType", "b"),
+    ("_state_flush_pending", "b"),
+    ("game_over", "b"),
+    ("trunc", "b"),
+    ("_round_banner_shown", "b"),
+    ("_fight_env_logged", "b"),
+    ("_phase_event_emitted", "b"),
+    ("viewer_awaiting_ack", "b"),
+)
+
+# Per-side attribute names: (model side, enemy side).
+_SIDE_ATTRS: dict[str, tuple[str, str]] = {
+    "health": ("unit_health", "enemy_health"),
+    "coords": ("unit_coords", "enemy_coords"),
+    "anchors": ("unit_anchor_coords", "enemy_anchor_coords"),
+    "in_attack": ("unitInAttack", "enemyInAttack"),
+    "fell_back": ("unitFellBack", "enemyFellBack"),
+    "used_advance": ("model_used_advance", "enemy_used_advance"),
+    "advance_roll": ("model_advance_roll", "enemy_advance_roll"),
+    "charged": ("unitCharged", "enemyCharged"),
+    "wounds": ("unit_model_wounds", "enemy_model_wounds"),
+    "positions": ("unit_model_positions", "enemy_model_positions"),
+    "units": ("model", "enemy"),
+}
+
+# Per-unit 1-D columns: (field, kind). "opt" encodes None as NaN.
+_VECTOR_FIELDS: tuple[tuple[str, str], ...] = (
+    ("health", "num"),
+    ("fell_back", "b"),
+    ("used_advance", "b"),
+    ("advance_roll", "opt"),
+    ("charged", "num"),
+)
+_VECTOR_KIND: dict[str, str] = dict(_VECTOR_FIELDS)
+# Per-unit [x, y] pairs.
+_PAIR_FIELDS: tuple[str, ...] = ("coords", "anchors", "in_attack", "units")
+# Every per-unit list whose length is recorded in the lengths block.
+_LIST_FIELDS: tuple[str, ...] = tuple(f for f, _ in _VECTOR_FIELDS) + _PAIR_FIELDS + ("wounds", "positions")
+
+_POS_DIM = 3
+
+
+def _num(v: float):
+    return int(v) if v.is_integer() else v
+
+
+_num_elementwise = np.frompyfunc(lambda v: _num(float(v)), 1, 1)
+
+
+def _to_numbers(values: np.ndarray) -> list:
+    """``tolist()`` с целыми значениями как int (как _num), без прохода Python по элементам."""
+    ints = values.astype(np.int64)
+    if np.array_equal(ints, values):
+        return ints.tolist()
+    return _num_elementwise(values).tolist()
+
+
+def _decode(values: np.ndarray, kind: str) -> list:
+    if kind == "num":
+        return _to_numbers(values)
+    if kind == "b":
+        return (values != 0).tolist()
+    if kind == "opt":
+        missing = np.isnan(values)
+        out = _to_numbers(np.where(missing, 0.0, values))
+        for i in np.flatnonzero(missing).tolist():
+            out[i] = None
+        return out
+    return values.tolist()
+
+
+def _split(flat: list, lengths: list[int]) -> list[list]:
+    out = []
+    start = 0
+    for k in lengths:
+        out.append(flat[start:start + k])
+        start += k
+    return out
+
+
+def _unit_models_count(unit_data: Any) -> int:
+    if not isinstance(unit_data, dict):
+        return 1
+    try:
+        return max(1, int(unit_data.get("#OfModels", 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+class EnvStateBuffer:
+    """Preallocated contiguous state buffer bound to one env layout."""
+
+    def __init__(self, env: Any) -> None:
+        self.n_units = (len(env.unit_health), len(env.enemy_health))
+        max_models = 1
+        for side_i, data_attr in enumerate(("unit_data", "enemy_data")):
+            for unit_data in getattr(env, data_attr, []) or []:
+                max_models = max(max_models, _unit_models_count(unit_data))
+            for ragged in ("wounds", "positions"):
+                for row in getattr(env, _SIDE_ATTRS[ragged][side_i], []) or []:
+                    max_models = max(max_models, len(row))
+        self.max_models = int(max_models)
+        self.n_streaks = len(getattr(env, "_objective_hold_streaks", []) or [])
+        board = getattr(env, "board", None)
+        self.board_shape = tuple(board.shape) if isinstance(board, np.ndarray) else (0,)
+
+        # Column offsets inside one side row.
+        col = 0
+        self._vec_col: dict[str, int] = {}
+        for name, _kind in _VECTOR_FIELDS:
+            self._vec_col[name] = col
+            col += 1
+        self._pair_col: dict[str, int] = {}
+        for name in _PAIR_FIELDS:
+            self._pair_col[name] = col
+            col += 2
+        self._wounds_col = col
+        col += self.max_models
+        self._pos_col = col
+        col += self.max_models * _POS_DIM
+        self.row_width = col
+
+        # Lengths block: per side, one slot per list field plus one per ragged row.
+        self._len_stride = len(_LIST_FIELDS)
+        n_len = 0
+        self._len_off: list[int] = []
+        self._ragged_len_off: list[int] = []
+        for n in self.n_units:
+            self._len_off.append(n_len)
+            n_len += self._len_stride
+            self._ragged_len_off.append(n_len)
+            n_len += 2 * n
+
+        off = 0
+        self._scalars = slice(off, off + len(SCALAR_FIELDS))
+        off += len(SCALAR_FIELDS)
+        self._lengths = slice(off, off + n_len)
+        off += n_len
+        self._sides: list[slice] = []
+        for n in self.n_units:
+            self._sides.append(slice(off, off + n * self.row_width))
+            off += n * self.row_width
+        self._streaks = slice(off, off + self.n_streaks)
+        off += self.n_streaks
+        board_size = int(np.prod(self.board_shape)) if isinstance(board, np.ndarray) else 0
+        self._board = slice(off, off + board_size)
+        off += board_size
+
+        self.buffer = np.zeros(off, dtype=np.float64)
+        self._bind_views()
+
+    def _bind_views(self) -> None:
+        self._side_views = [
+            self.buffer[s].reshape(n, self.row_width) for s, n in zip(self._sides, self.n_units)
+        ]
+        self._len_view = self.buffer[self._lengths]
+        board_size = self._board.stop - self._board.start
+        self._board_view = self.buffer[self._board].reshape(self.board_shape) if board_size else None
+
+    # pickle/deepcopy разрывают связь view -> buffer; views пересобираются заново.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for k in ("_side_views", "_len_view", "_board_view"):
+            state.pop(k, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind_views()
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.buffer.nbytes)
+
+    def matches(self, env: Any) -> bool:
+        if (len(env.unit_health), len(env.enemy_health)) != self.n_units:
+            return False
+        if len(getattr(env, "_objective_hold_streaks", []) or []) != self.n_streaks:
+            return False
+        board = getattr(env, "board", None)
+        if isinstance(board, np.ndarray) and tuple(board.shape) != self.board_shape:
+            return False
+        return True
+
+    # ------------------------------------------------------------------
+    # pack
+    # ------------------------------------------------------------------
+
+    def pack(self, env: Any) -> np.ndarray | None:
+        """Write env state into the internal buffer and return a copy of it."""
+        if not self.matches(env):
+            return None
+        buf = self.buffer
+        _ga = getattr
+
+        scalars = buf[self._scalars]
+        values = [_ga(env, name, 0) for name, _kind in SCALAR_FIELDS]
+        scalars[:] = [0.0 if v is None else float(v) for v in values]
+
+        lens = self._len_view
+        slots = np.arange(self.max_models)
+        for side_i, n in enumerate(self.n_units):
+            rows = self._side_views[side_i]
+            len_off = self._len_off[side_i]
+            ragged_off = self._ragged_len_off[side_i]
+            for field_i, name in enumerate(_LIST_FIELDS):
+                values = _ga(env, _SIDE_ATTRS[name][side_i], None)
+                if name == "units":
+                    values = [u.showCoords() for u in values] if values is not None else None
+                m = len(values) if values is not None else 0
+                if m > n:
+                    return None
+                lens[len_off + field_i] = m
+                if m == 0:
+                    continue
+                if name in self._vec_col:
+                    col = self._vec_col[name]
+                    if name == "advance_roll":
+                        rows[:m, col] = [np.nan if v is None else v for v in values]
+                    else:
+                        rows[:m, col] = values
+                elif name in self._pair_col:
+                    col = self._pair_col[name]
+                    if all(len(p) == 2 for p in values):
+                        rows[:m, col:col + 2] = values
+                    else:
+                        rows[:m, col:col + 2] = [p[:2] for p in values]
+                else:
+                    counts = [len(row) for row in values]
+                    if max(counts) > self.max_models:
+                        return None
+                    start = ragged_off if name == "wounds" else ragged_off + n
+                    lens[start:start + m] = counts
+                    mask = slots < np.asarray(counts)[:, None]
+                    flat = [x for row in values for x in row]
+                    if name == "wounds":
+                        block = rows[:m, self._wounds_col:self._wounds_col + self.max_models]
+                        block[mask] = flat
+                        continue
+                    block = rows[:m, self._pos_col:self._pos_col + self.max_models * _POS_DIM]
+                    block = block.reshape(m, self.max_models, _POS_DIM)
+                    if flat and not all(len(p) == _POS_DIM for p in flat):
+                        flat = [(p[0], p[1], p[2] if len(p) > 2 else 0) for p in flat]
+                    if flat:
+                        block[mask] = flat
+
+        if self.n_streaks:
+            buf[self._streaks] = env._objective_hold_streaks
+        if self._board_view is not None:
+            np.copyto(self._board_view, env.board)
+        return buf.copy()
+
+    # ------------------------------------------------------------------
+    # unpack
+    # ------------------------------------------------------------------
+
+    def unpack(self, env: Any, packed: np.ndarray) -> None:
+        """Restore env state from a buffer previously returned by ``pack``."""
+        buf = self.buffer
+        np.copyto(buf, packed)
+
+        scalars = buf[self._scalars].tolist()
+        for (name, kind), v in zip(SCALAR_FIELDS, scalars):
+            if kind == "num":
+                v = _num(v)
+            elif kind == "b":
+                v = bool(v)
+            setattr(env, name, v)
+
+        lens = self._len_view.astype(np.int64)
+        slots = np.arange(self.max_models)
+        for side_i, n in enumerate(self.n_units):
+            rows = self._side_views[side_i]
+            len_off = self._len_off[side_i]
+            ragged_off = self._ragged_len_off[side_i]
+            for field_i, name in enumerate(_LIST_FIELDS):
+                m = int(lens[len_off + field_i])
+                attr = _SIDE_ATTRS[name][side_i]
+                if name in self._vec_col:
+                    setattr(env, attr, _decode(rows[:m, self._vec_col[name]], _VECTOR_KIND[name]))
+                elif name == "units":
+                    col = self._pair_col[name]
+                    self._restore_unit_anchors(getattr(env, attr, None) or [], rows[:m, col:col + 2])
+                elif name in self._pair_col:
+                    col = self._pair_col[name]
+                    setattr(env, attr, _to_numbers(rows[:m, col:col + 2]))
+                else:
+                    if name == "wounds":
+                        counts = lens[ragged_off:ragged_off + m]
+                        block = rows[:m, self._wounds_col:self._wounds_col + self.max_models]
+                    else:
+                        counts = lens[ragged_off + n:ragged_off + n + m]
+                        block = rows[:m, self._pos_col:self._pos_col + self.max_models * _POS_DIM]
+                        block = block.reshape(m, self.max_models, _POS_DIM)
+                    flat = _to_numbers(block[slots < counts[:, None]])
+                    setattr(env, attr, _split(flat, counts.tolist()))
+
+        if self.n_streaks:
+            env._objective_hold_streaks = [_num(v) for v in buf[self._streaks].tolist()]
+        if self._board_view is not None:
+            board = getattr(env, "board", None)
+            if isinstance(board, np.ndarray) and board.shape == self.board_shape:
+                np.copyto(board, self._board_view)
+            else:
+                env.board = self._board_view.copy()
+
+    @staticmethod
+    def _restore_unit_anchors(units: list, coords: np.ndarray) -> None:
+        """Call ``set_anchor`` only on Unit objects whose anchor actually moved."""
+        if not units or coords.size == 0:
+            return
+        current = np.asarray([u.showCoords()[:2] for u in units[: coords.shape[0]]], dtype=np.float64)
+        changed = np.flatnonzero(np.any(current != coords[: current.shape[0]], axis=1))
+        for i in changed.tolist():
+            units[i].set_anchor(int(coords[i, 0]), int(coords[i, 1]))
@@ -9,6 +9,7 @@ except Exception:  # pragma: no cover
     scan_targets_in_range = None
 import datetime
 import inspect
+import itertools
 import json
 import math
 import os
@@ -18,10 +19,12 @@ import sys
 import time
 from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, NamedTuple
 
 import reward_config as reward_cfg
 from core.engine.event_bus import get_event_bus, get_event_recorder
-from core.engine.game_io import DICE_CANCEL_TOKEN, get_active_io
+from core.engine.game_io import DICE_CANCEL_TOKEN, append_log_line, flush_log_writer, get_active_io
+from core.engine.io_profiler import get_io_profiler
 from core.engine.logging_utils import format_unit
 from core.engine.mission import (
     MISSION_NAME,
@@ -34,6 +37,10 @@ from core.engine.mission import (
 from core.engine.phases.stratagem_engine import apply as _apply_stratagem
 from core.engine.skills import apply_end_of_command_phase
 from core.engine.state_export import write_state_json
+from core.envs import delta_journal
+from core.envs.delta_journal import DeltaJournal, DeltaMark
+from core.envs.obs_encoder import ObservationEncoder
+from core.envs.state_buffer import EnvStateBuffer
 from project_paths import ARTIFACTS_METRICS_DIR, BOARD_PATH, RUNTIME_STATE_DIR
 
 from ..engine import utils as engine_utils
@@ -49,7 +56,7 @@ from ..engine.heuristic_targeting import (
     record_heur_move,
 )
 from ..engine.utils import *
-from ..engine.visibility import visibility_report
+from ..engine.visibility import LosMatrix, batch_visibility, los_matrix_for, visibility_report
 
 
 def _matplotlib_pyplot_agg():
@@ -69,6 +76,9 @@ def _matplotlib_pyplot_agg():
 ENV_RULESET_VERSION = os.getenv("ENV_RULESET_VERSION", "only_war_v1")
 
 _ACTION_KEYS_LOGGED = False
+# Номера версий террейна уникальны на процесс: undo_delta возвращает старую версию вместе
+# со старым набором клеток, и новая замена не может совпасть с уже закэшированной.
+_TERRAIN_VERSIONS = itertools.count(1)
 
 
 def build_env_contract_from_spaces(*, n_observations: int, n_actions: list[int], mission_name: str) -> dict:
@@ -274,6 +284,37 @@ def _fight_report_enabled() -> bool:
 def _heuristic_debug_enabled() -> bool:
     return os.getenv("HEURISTIC_DEBUG", "0") == "1" or os.getenv("REWARD_DEBUG", "0") == "1"
 
+
+class _EnvLogFlags(NamedTuple):
+    verbose: bool
+    terrain: bool
+    reward: bool
+    heuristic: bool
+    los: bool
+
+
+def _read_env_log_flags() -> _EnvLogFlags:
+    """Снимок переключателей логов среды: читается в __init__/reset, а не на каждое сообщение."""
+    return _EnvLogFlags(
+        verbose=_verbose_logs_enabled(),
+        terrain=os.getenv("TERRAIN_DEBUG", "0") == "1" or os.getenv("VIEWER_DEBUG", "0") == "1",
+        reward=os.getenv("REWARD_DEBUG", "0") == "1",
+        heuristic=_heuristic_debug_enabled(),
+        los=str(os.getenv("LOS_DEBUG", "0")).strip().lower() not in {"0", "false", "off", "no"},
+    )
+
+
+def _pop_heur_metrics_record(env) -> dict | None:
+    counters = getattr(env, "_heur_metric_counters", None)
+    if not isinstance(counters, dict) or int(counters.get("moves", 0)) <= 0:
+        return None
+    rec = dict(counters)
+    rec["winner"] = str(getattr(env, "last_winner", "") or "")
+    rec["end_reason"] = str(getattr(env, "last_end_reason", "") or "")
+    env._heur_metric_counters = None
+    return rec
+
+
 def auto_dice(num=1, max=6):
     """RNG-роллер с такой же сигнатурой, как player_dice (для логов бота)."""
     if num == 1:
@@ -954,6 +995,7 @@ class Warhammer40kEnv(gym.Env):
         # keep original references (handy + avoids AttributeError in some branches)
         self.enemy = enemy
         self.model = model
+        self._log_flags = _read_env_log_flags()
 
         savePath = "display/"
         if os.path.isdir(savePath):
@@ -1057,9 +1099,11 @@ class Warhammer40kEnv(gym.Env):
         self._last_action_signature: tuple[int, int, int, int, int, int] | None = None
         self._action_repeat_streak = 0
         self.terrain_features = list(getattr(self, "terrain_features", []) or [])
-        self.terrain_opaque_cells: set[tuple[int, int]] = set()
-        self.terrain_obscuring_cells: set[tuple[int, int]] = self.get_terrain_obscuring_cells_set()
+        self.terrain_opaque_cells = set()
         self.visibility_mode = str(os.getenv("VISIBILITY_MODE", "multi_ray_5") or "multi_ray_5").strip().lower()
+        # dict (по умолчанию) | array — упакованный снапшот в один numpy-буфер (см. core/envs/state_buffer.py).
+        self.state_mode = str(os.getenv("ENV_STATE_MODE", "dict") or "dict").strip().lower()
+        self._state_buffer = None
         self._terrain_shaping_shot_bonus_units: set[int] = set()
         log_name = str(
             os.getenv("AGENT_LOG_FILE", os.path.join("logs", "LOGS_FOR_AGENTS_PLAY.md"))
@@ -1135,6 +1179,82 @@ class Warhammer40kEnv(gym.Env):
                 int(getattr(self, "_simulation_mode_depth", 0) or 0) - 1,
             )
 
+    def _ensure_state_buffer(self):
+        buf = getattr(self, "_state_buffer", None)
+        if buf is None or not buf.matches(self):
+            buf = EnvStateBuffer(self)
+            self._state_buffer = buf
+        return buf
+
+    def _snapshot_state_array(self) -> dict | None:
+        """Array-mode snapshot: numeric state packed into one contiguous buffer.
+
+        Only immutable scalars, RNG states and the few non-numeric containers
+        (strategem journal, sets, strat dicts) stay in Python.
+        """
+        packed = self._ensure_state_buffer().pack(self)
+        if packed is None:
+            # Модели/юниты не влезли в раскладку — пересобираем её один раз.
+            self._state_buffer = None
+            packed = self._ensure_state_buffer().pack(self)
+            if packed is None:
+                return None
+        _ga = getattr
+        _su = _ga(self, "stratagem_used", None)
+        _ase = _ga(self, "active_stratagem_effects", None)
+        return {
+            "_state_buffer": packed,
+            "_random_state": random.getstate(),
+            "_np_random_state": np.random.get_state(),
+            "_simulation_mode_depth": int(_ga(self, "_simulation_mode_depth", 0) or 0),
+            "active_side": _ga(self, "active_side", "enemy"),
+            "phase": _ga(self, "phase", "command"),
+            "turn_order": list(_ga(self, "turn_order", []) or []),
+            "_last_action_signature": _ga(self, "_last_action_signature", None),
+            "last_end_reason": _ga(self, "last_end_reason", ""),
+            "last_winner": _ga(self, "last_winner", ""),
+            "viewer_activation": _ga(self, "viewer_activation", False),
+            "modelUpdates": _ga(self, "modelUpdates", ""),
+            "_enemy_cp_on": _ga(self, "_enemy_cp_on", None),
+            "_enemy_use_cp": _ga(self, "_enemy_use_cp", None),
+            "modelStrat": dict(_ga(self, "modelStrat", None) or {}),
+            "enemyStrat": dict(_ga(self, "enemyStrat", None) or {}),
+            "stratagem_used": [tuple(x) for x in _su] if _su is not None else [],
+            "active_stratagem_effects": [dict(x) for x in _ase] if _ase is not None else [],
+            "_phase_unit_logged": set(_ga(self, "_phase_unit_logged", None) or ()),
+            "_terrain_shaping_shot_bonus_units": set(_ga(self, "_terrain_shaping_shot_bonus_units", None) or ()),
+        }
+
+    def _restore_state_array(self, snapshot: dict) -> None:
+        packed = snapshot["_state_buffer"]
+        buf = self._state_buffer
+        if buf is None or buf.buffer.shape != packed.shape:
+            buf = self._ensure_state_buffer()
+        # Позиции моделей лежат в буфере как есть — _sync_model_positions_to_anchors не нужен,
+        # а set_anchor вызывается только для реально сдвинутых Unit.
+        buf.unpack(self, packed)
+        for _k in (
+            "active_side", "phase", "_last_action_signature", "last_end_reason", "last_winner",
+            "viewer_activation", "modelUpdates", "_enemy_cp_on", "_enemy_use_cp",
+        ):
+            setattr(self, _k, snapshot[_k])
+        self.turn_order = list(snapshot["turn_order"])
+        self.modelStrat = dict(snapshot["modelStrat"])
+        self.enemyStrat = dict(snapshot["enemyStrat"])
+        self.stratagem_used = list(snapshot["stratagem_used"])
+        self.active_stratagem_effects = [dict(x) for x in snapshot["active_stratagem_effects"]]
+        self._phase_unit_logged = set(snapshot["_phase_unit_logged"])
+        self._terrain_shaping_shot_bonus_units = set(snapshot["_terrain_shaping_shot_bonus_units"])
+        try:
+            random.setstate(snapshot["_random_state"])
+            np.random.set_state(snapshot["_np_random_state"])
+        except Exception:
+            pass
+        self._distance_cache.clear()
+        self._shoot_target_cache.clear()
+        self._shoot_target_reject_cache.clear()
+        self._simulation_mode_depth = int(snapshot.get("_simulation_mode_depth", 0) or 0)
+
     def snapshot_state(self) -> dict:
         """Compact runtime snapshot for simulation rollouts (no I/O objects).
 
@@ -1148,7 +1268,16 @@ class Warhammer40kEnv(gym.Env):
         - Sets (phase_unit_logged, terrain_bonus): set() copy.
         - Cache dicts (_distance_cache, etc.): NOT stored — cleared on restore
           via _invalidate_target_cache, which already fires on every step/turn.
+
+        With ``state_mode == "array"`` (ENV_STATE_MODE=array) the numeric part
+        is packed into one preallocated numpy buffer instead
+        (``_snapshot_state_array``); restore_state detects it by key.
         """
+        if getattr(self, "state_mode", "dict") == "array":
+            snap = self._snapshot_state_array()
+            if snap is not None:
+                return snap
+
         _self = self
         _ga = getattr
 
@@ -1255,6 +1384,9 @@ class Warhammer40kEnv(gym.Env):
     def restore_state(self, snapshot: dict) -> None:
         if not isinstance(snapshot, dict):
             return
+        if "_state_buffer" in snapshot:
+            self._restore_state_array(snapshot)
+            return
 
         _self = self
         _sa = object.__setattr__
@@ -1364,6 +1496,97 @@ class Warhammer40kEnv(gym.Env):
 
         _self._simulation_mode_depth = int(snapshot.get("_simulation_mode_depth", 0) or 0)
 
+    def begin_delta(self) -> DeltaMark:
+        """Open a copy-on-write delta frame (см. core/envs/delta_journal.py).
+
+        Дешёвая альтернатива snapshot_state для MCTS: журналируются только
+        изменённые поля, undo_delta проигрывает журнал назад.
+        """
+        journal = self.__dict__.get("_delta_journal")
+        if journal is None:
+            journal = DeltaJournal()
+            object.__setattr__(self, "_delta_journal", journal)
+        d = self.__dict__
+        # До открытия фрейма: адаптация списков пишется во внешний фрейм (если он есть),
+        # а на глубине 0 остаётся насовсем и переиспользуется следующими симуляциями.
+        for attr in delta_journal.JOURNALED_LIST_ATTRS:
+            value = d.get(attr)
+            if isinstance(value, list) and not journal.owns(value):
+                setattr(self, attr, journal.wrap(value))
+        if journal.stale:
+            for attr in delta_journal.JOURNALED_LIST_ATTRS:
+                value = d.get(attr)
+                if journal.owns(value):
+                    journal.adopt_children(value)
+            if not journal.frames:
+                journal.stale = False
+
+        mark = DeltaMark(
+            depth=len(journal.frames),
+            start=len(journal.entries),
+            copies={attr: delta_journal.copy_small(d[attr]) for attr in delta_journal.COPIED_ATTRS if attr in d},
+            unit_anchors=tuple(
+                tuple((int(c[0]), int(c[1])) for c in (u.showCoords() for u in (d.get(side) or [])))
+                for side in ("model", "enemy")
+            ),
+            random_state=random.getstate(),
+            np_random_state=np.random.get_state(),
+        )
+        if not journal.frames:
+            self.__class__ = delta_journal.journaling_class(type(self))
+        journal.frames.append(mark)
+        return mark
+
+    def undo_delta(self, mark: DeltaMark) -> None:
+        """Roll the env back to the state at ``begin_delta`` (closes the frame and any inner ones)."""
+        journal = self.__dict__.get("_delta_journal")
+        if journal is None or mark not in journal.frames:
+            raise ValueError("undo_delta: delta frame is not open on this env")
+        while journal.frames[-1] is not mark:
+            self.undo_delta(journal.frames[-1])
+        _sa = object.__setattr__
+        try:
+            journal.rewind(mark.start)
+            for attr, old in mark.rebinds.items():
+                if old is delta_journal.MISSING:
+                    self.__dict__.pop(attr, None)
+                else:
+                    _sa(self, attr, old)
+            for attr, saved in mark.copies.items():
+                _sa(self, attr, saved)
+            for side, anchors in zip(("model", "enemy"), mark.unit_anchors):
+                units = self.__dict__.get(side) or []
+                for unit, (x, y) in zip(units, anchors):
+                    c = unit.showCoords()
+                    if int(c[0]) != x or int(c[1]) != y:
+                        unit.set_anchor(x, y)
+            random.setstate(mark.random_state)
+            np.random.set_state(mark.np_random_state)
+
+            self._distance_cache.clear()
+            self._shoot_target_cache.clear()
+            self._shoot_target_reject_cache.clear()
+        finally:
+            # Фрейм закрыт даже при сбое отката: журнал не держит его записи, класс — базовый.
+            del journal.entries[mark.start:]
+            journal.frames.pop()
+            if not journal.frames:
+                _sa(self, "__class__", self._delta_base_class)
+
+    def commit_delta(self, mark: DeltaMark) -> None:
+        """Keep the changes made since ``begin_delta``; fold the frame into its parent."""
+        journal = self.__dict__.get("_delta_journal")
+        if journal is None or not journal.frames or journal.frames[-1] is not mark:
+            raise ValueError("commit_delta: mark is not the innermost open delta frame")
+        journal.frames.pop()
+        if journal.frames:
+            parent = journal.frames[-1]
+            for attr, old in mark.rebinds.items():
+                parent.rebinds.setdefault(attr, old)
+        else:
+            del journal.entries[mark.start:]
+            object.__setattr__(self, "__class__", self._delta_base_class)
+
     def simulate_step(
         self,
         action_dict,
@@ -1434,6 +1657,7 @@ class Warhammer40kEnv(gym.Env):
         self._distance_cache.clear()
         self._shoot_target_cache.clear()
         self._shoot_target_reject_cache.clear()
+        self.__dict__.pop("_board_threat_maps", None)
 
     def _shoot_range_epsilon(self) -> float:
         raw = os.getenv("SHOOT_RANGE_EPSILON", "0.10")
@@ -1494,7 +1718,7 @@ class Warhammer40kEnv(gym.Env):
             rejected.append(entry)
 
         def _log_target_filter(unit_side: str, src_idx: int, dst_side: str, dst_idx: int, reason: str) -> None:
-            if not _verbose_logs_enabled():
+            if not self._log_flags.verbose:
                 return
             src_label = self._format_unit_label(unit_side, int(src_idx))
             dst_label = self._format_unit_label(dst_side, int(dst_idx))
@@ -1641,20 +1865,104 @@ class Warhammer40kEnv(gym.Env):
             return []
         return targets
 
+    def _legal_mask_unit_signatures(self, side: str) -> tuple:
+        """Сигнатура каждого юнита стороны: всё, от чего зависят его маски/цели/overlay."""
+        if side == "model":
+            health, coords, in_attack, fell_back = self.unit_health, self.unit_coords, self.unitInAttack, self.unitFellBack
+            used, rolls, positions = self.model_used_advance, self.model_advance_roll, self.unit_model_positions
+            weapon, data = self.unit_weapon, self.unit_data
+        else:
+            health, coords, in_attack, fell_back = self.enemy_health, self.enemy_coords, self.enemyInAttack, self.enemyFellBack
+            used, rolls, positions = self.enemy_used_advance, self.enemy_advance_roll, self.enemy_model_positions
+            weapon, data = self.enemy_weapon, self.enemy_data
+        sigs = []
+        for i in range(len(health)):
+            pos = positions[i] if i < len(positions) else ()
+            sigs.append((
+                health[i] > 0,
+                tuple(coords[i]) if i < len(coords) else None,
+                in_attack[i][0] if i < len(in_attack) else None,
+                bool(fell_back[i]) if i < len(fell_back) else None,
+                bool(used[i]) if i < len(used) else None,
+                rolls[i] if i < len(rolls) else None,
+                tuple(tuple(p[:2]) for p in pos),
+                id(weapon[i]) if i < len(weapon) else None,
+                id(data[i]) if i < len(data) else None,
+            ))
+        return tuple(sigs)
+
     def get_legal_action_masks_by_head(self, side: str = "model") -> dict[str, np.ndarray]:
         """
         Phase-aware legal masks для factorized policy/MCTS.
         Возвращает маски в едином контракте голов.
+
+        Кэш по содержимому состояния (LEGAL_MASK_CACHE=0 — выключить): повторный запрос
+        для того же состояния (узлы MCTS, build_action_masks_by_head) отдаёт копии масок;
+        при изменениях пересчитываются только задетые головы — shoot/charge при любом
+        изменении юнитов или эпохи target-кэша, move_num_i при смене юнита i или занятости клеток.
         """
         side = str(side or "model").strip().lower()
         if side not in {"model", "enemy"}:
             side = "model"
+        if str(os.getenv("LEGAL_MASK_CACHE", "1")).strip() == "0":
+            return self._compute_legal_action_masks_by_head(side)
+
+        other = "enemy" if side == "model" else "model"
+        own_sigs = self._legal_mask_unit_signatures(side)
+        other_sigs = self._legal_mask_unit_signatures(other)
+        layout = (
+            id(self.action_space),
+            id(self.terrain_features),
+            id(self.terrain_opaque_cells),
+            self._terrain_version,
+            self.visibility_mode,
+            (self.b_len, self.b_hei),
+            os.getenv("SHOOT_RANGE_EPSILON", "0.10"),
+        )
+        targets_key = (layout, self._target_cache_epoch, own_sigs, other_sigs)
+        occupancy_key = tuple((sig[0], sig[1]) for sig in own_sigs + other_sigs)
+
+        cache = self.__dict__.get("_legal_mask_cache")
+        if cache is None:
+            cache = {}
+            self._legal_mask_cache = cache
+        entry = cache.get(side)
+        if entry is not None and entry["targets_key"] == targets_key:
+            return {k: v.copy() for k, v in entry["masks"].items()}
+
+        reuse_targets = None
+        reuse_moves: dict[str, np.ndarray] = {}
+        if entry is not None and entry["layout"] == layout:
+            if entry["targets_key"][1:] == targets_key[1:]:
+                reuse_targets = entry["masks"]
+            if entry["occupancy_key"] == occupancy_key:
+                for i, sig in enumerate(own_sigs):
+                    key = f"move_num_{i}"
+                    if i < len(entry["own_sigs"]) and entry["own_sigs"][i] == sig and key in entry["masks"]:
+                        reuse_moves[key] = entry["masks"][key]
+
+        masks = self._compute_legal_action_masks_by_head(side, reuse_targets=reuse_targets, reuse_moves=reuse_moves)
+        cache[side] = {
+            "layout": layout,
+            "targets_key": targets_key,
+            "occupancy_key": occupancy_key,
+            "own_sigs": own_sigs,
+            "masks": masks,
+        }
+        return {k: v.copy() for k, v in masks.items()}
+
+    def _compute_legal_action_masks_by_head(
+        self,
+        side: str,
+        *,
+        reuse_targets: dict[str, np.ndarray] | None = None,
+        reuse_moves: dict[str, np.ndarray] | None = None,
+    ) -> dict[str, np.ndarray]:
         is_model = side == "model"
         unit_health = self.unit_health if is_model else self.enemy_health
         enemy_health = self.enemy_health if is_model else self.unit_health
         in_attack = self.unitInAttack if is_model else self.enemyInAttack
         fell_back = self.unitFellBack if is_model else self.enemyFellBack
-        weapon = self.unit_weapon if is_model else self.enemy_weapon
         move_used_advance = (
             getattr(self, "model_used_advance", [False] * len(unit_health))
             if is_model
@@ -1672,10 +1980,7 @@ class Warhammer40kEnv(gym.Env):
 
         alive_units = [idx for idx, hp in enumerate(unit_health) if hp > 0]
         engaged_units = [idx for idx in alive_units if in_attack[idx][0] == 1]
-        can_shoot_units = [
-            idx for idx in alive_units
-            if (not fell_back[idx]) and in_attack[idx][0] == 0 and weapon[idx] != "None"
-        ]
+        can_shoot_units = self._legal_shoot_units(side)
         can_charge_units = [
             idx for idx in alive_units
             if (not fell_back[idx]) and in_attack[idx][0] == 0 and (not bool(move_used_advance[idx]))
@@ -1690,28 +1995,11 @@ class Warhammer40kEnv(gym.Env):
         masks["attack"] = attack_mask
 
         # shoot/charge -> глобальные id
-        shoot_n = int(spaces["shoot"].n)
-        shoot_mask = np.zeros(shoot_n, dtype=bool)
-        for u_idx in can_shoot_units:
-            for t_idx in self.get_shoot_targets_for_unit(side, u_idx):
-                if 0 <= int(t_idx) < shoot_n:
-                    shoot_mask[int(t_idx)] = True
-        if not shoot_mask.any():
-            # no-op semantics: при отсутствии валидных целей оставляем только индекс 0
-            # вместо all-true, чтобы policy не получала ложные альтернативы.
-            shoot_mask[0] = True
-        masks["shoot"] = shoot_mask
-
-        charge_n = int(spaces["charge"].n)
-        charge_mask = np.zeros(charge_n, dtype=bool)
-        for u_idx in can_charge_units:
-            for t_idx in self.get_charge_targets_for_unit(side, u_idx):
-                if 0 <= int(t_idx) < charge_n:
-                    charge_mask[int(t_idx)] = True
-        if not charge_mask.any():
-            # no-op semantics: при отсутствии валидных целей оставляем только индекс 0.
-            charge_mask[0] = True
-        masks["charge"] = charge_mask
+        if reuse_targets is not None:
+            masks["shoot"] = reuse_targets["shoot"]
+            masks["charge"] = reuse_targets["charge"]
+        else:
+            self._fill_target_masks(side, masks, spaces, can_shoot_units, can_charge_units)
 
         # cp_on: только живые юниты цели
         cp_n = int(spaces["cp_on"].n)
@@ -1728,6 +2016,9 @@ class Warhammer40kEnv(gym.Env):
             key = f"move_num_{i}"
             if key not in spaces:
                 continue
+            if reuse_moves and key in reuse_moves:
+                masks[key] = reuse_moves[key]
+                continue
             n = int(spaces[key].n)
             mmask = np.zeros(n, dtype=bool)
             if unit_health[i] > 0:
@@ -1745,6 +2036,50 @@ class Warhammer40kEnv(gym.Env):
 
         return masks
 
+    def _legal_shoot_units(self, side: str) -> list[int]:
+        is_model = side == "model"
+        unit_health = self.unit_health if is_model else self.enemy_health
+        in_attack = self.unitInAttack if is_model else self.enemyInAttack
+        fell_back = self.unitFellBack if is_model else self.enemyFellBack
+        weapon = self.unit_weapon if is_model else self.enemy_weapon
+        return [
+            idx for idx, hp in enumerate(unit_health)
+            if hp > 0 and (not fell_back[idx]) and in_attack[idx][0] == 0 and weapon[idx] != "None"
+        ]
+
+    def _shoot_target_mask(self, side: str, shoot_n: int, can_shoot_units: list[int]) -> np.ndarray:
+        shoot_mask = np.zeros(int(shoot_n), dtype=bool)
+        for u_idx in can_shoot_units:
+            for t_idx in self.get_shoot_targets_for_unit(side, u_idx):
+                if 0 <= int(t_idx) < shoot_n:
+                    shoot_mask[int(t_idx)] = True
+        if not shoot_mask.any():
+            # no-op semantics: при отсутствии валидных целей оставляем только индекс 0
+            # вместо all-true, чтобы policy не получала ложные альтернативы.
+            shoot_mask[0] = True
+        return shoot_mask
+
+    def get_legal_shoot_mask(self, side: str = "model") -> np.ndarray:
+        """Только голова shoot из get_legal_action_masks_by_head — без overlay движения."""
+        side = "enemy" if str(side or "model").strip().lower() == "enemy" else "model"
+        shoot_n = int(self.action_space.spaces["shoot"].n)
+        return self._shoot_target_mask(side, shoot_n, self._legal_shoot_units(side))
+
+    def _fill_target_masks(self, side: str, masks: dict, spaces, can_shoot_units: list[int], can_charge_units: list[int]) -> None:
+        masks["shoot"] = self._shoot_target_mask(side, int(spaces["shoot"].n), can_shoot_units)
+
+        charge_n = int(spaces["charge"].n)
+        charge_mask = np.zeros(charge_n, dtype=bool)
+        for u_idx in can_charge_units:
+            for t_idx in self.get_charge_targets_for_unit(side, u_idx):
+                if 0 <= int(t_idx) < charge_n:
+                    charge_mask[int(t_idx)] = True
+        if not charge_mask.any():
+            # no-op semantics: при отсутствии валидных целей оставляем только индекс 0.
+            charge_mask[0] = True
+        masks["charge"] = charge_mask
+
+
     def _action_signature(self, action) -> tuple[int, int, int, int, int, int]:
         if not isinstance(action, dict):
             return (-1, -1, -1, -1, -1, -1)
@@ -1760,9 +2095,31 @@ class Warhammer40kEnv(gym.Env):
     def _cell_from_coord(self, coord) -> tuple[int, int]:
         return int(round(float(coord[0]))), int(round(float(coord[1])))
 
+    @property
+    def terrain_opaque_cells(self) -> set[tuple[int, int]]:
+        cells = self.__dict__.get("_terrain_opaque_cells")
+        if cells is None:
+            # env из старого pickle: набор лежал в __dict__ под публичным именем.
+            cells = self.__dict__.get("terrain_opaque_cells") or set()
+            self.terrain_opaque_cells = cells
+        return cells
+
+    @terrain_opaque_cells.setter
+    def terrain_opaque_cells(self, cells) -> None:
+        # Набор заменяется целиком (не мутируется на месте): LOS-кэши сверяют только _terrain_version.
+        self._terrain_opaque_cells = cells
+        self._terrain_version = next(_TERRAIN_VERSIONS)
+        self.__dict__.pop("_los_matrix_cache", None)
+
     def get_terrain_obscuring_cells_set(self) -> set[tuple[int, int]]:
         return terrain_cells_from_features(getattr(self, "terrain_features", []))
 
+    @property
+    def terrain_obscuring_cells(self) -> set[tuple[int, int]]:
+        # Считается при чтении: LOS fast path (LosMatrix) не трогает террейн-сеты на каждом вызове,
+        # а значение всегда соответствует текущим terrain_features.
+        return self.get_terrain_obscuring_cells_set()
+
     def is_terrain_cell(self, x: int, y: int) -> bool:
         return (int(x), int(y)) in self.get_terrain_obscuring_cells_set()
 
@@ -1807,8 +2164,7 @@ class Warhammer40kEnv(gym.Env):
 
 
     def _los_debug_enabled(self) -> bool:
-        raw = str(os.getenv("LOS_DEBUG", "0")).strip().lower()
-        return raw not in {"0", "false", "off", "no"}
+        return self._log_flags.los
 
     def _log_los_debug(
         self,
@@ -1844,7 +2200,8 @@ class Warhammer40kEnv(gym.Env):
             f"target_cover_cells={report.get('target_cover_cells_count')} "
             f"obscured_cell={obscured_example if obscured_example is not None else '-'} "
             f"obscured_cell_dist={obscured_dist if obscured_dist is not None else '-'} "
-            f"blocked_by={report.get('blocked_by')}"
+            f"blocked_by={report.get('blocked_by')}",
+            category="los",
         )
 
     def _target_cover_cells_for_unit(self, target_side: str, target_idx: int, radius: int = 3) -> set[tuple[int, int]]:
@@ -1862,14 +2219,71 @@ class Warhammer40kEnv(gym.Env):
         }
         return cover_cells
 
+    def _los_matrix(self) -> LosMatrix:
+        """Кэш LOS клетка→клетка для текущего непрозрачного террейна (см. LosMatrix).
+
+        Ключ — visibility_mode и _terrain_version (новый номер при каждой замене terrain_opaque_cells),
+        без сравнения наборов клеток на каждом LOS-запросе.
+        """
+        opaque = self.terrain_opaque_cells
+        mode = self.visibility_mode
+        version = self._terrain_version
+        cached = self.__dict__.get("_los_matrix_cache")
+        if cached is None or cached[0] != mode or cached[1] != version:
+            cached = (mode, version, los_matrix_for(opaque, self.b_len, self.b_hei, mode))
+            self._los_matrix_cache = cached
+        return cached[2]
+
+    def _unit_status_side_signature(self, side: str) -> tuple:
+        coords = self.unit_coords if side == "model" else self.enemy_coords
+        hp = self.unit_health if side == "model" else self.enemy_health
+        weapons = self.unit_weapon if side == "model" else self.enemy_weapon
+        signature = []
+        for i, c in enumerate(coords):
+            weapon = weapons[i] if i < len(weapons) else None
+            signature.append((
+                tuple(self._unit_cells_for_los(side, i)),
+                (int(c[0]), int(c[1])) if isinstance(c, (list, tuple)) and len(c) >= 2 else None,
+                float(hp[i] or 0.0) if i < len(hp) else 0.0,
+                weapon.get("Range") if isinstance(weapon, dict) else None,
+            ))
+        return tuple(signature)
+
+    def unit_status_versions(self) -> dict:
+        """Версии входов статуса юнитов для экспорта состояния (см. cached_unit_status).
+
+        terrain — тот же ключ, что у LOS/барьерных кэшей (объект terrain_features + LosMatrix);
+        model/enemy — по юниту: клетки моделей, якорь, HP, дальность оружия.
+        """
+        return {
+            "terrain": (self.terrain_features, self.visibility_mode, self._los_matrix()),
+            "model": self._unit_status_side_signature("model"),
+            "enemy": self._unit_status_side_signature("enemy"),
+        }
+
+    def cached_unit_status(self, side: str, idx: int, part: str, version, build):
+        """Кусок статуса юнита из кэша env; пересчёт только при смене version."""
+        cache = self.__dict__.get("_unit_status_cache")
+        if cache is None:
+            cache = {}
+            self._unit_status_cache = cache
+        slot = (side, int(idx), part)
+        hit = cache.get(slot)
+        if hit is not None and hit[0] == version:
+            return hit[1]
+        value = build()
+        cache[slot] = (version, value)
+        return value
+
     def _has_line_of_sight(self, attacker_side: str, attacker_idx: int, target_side: str, target_idx: int) -> bool:
         attacker_coords = self.unit_coords if attacker_side == "model" else self.enemy_coords
         target_coords = self.unit_coords if target_side == "model" else self.enemy_coords
         attacker_cell = self._cell_from_coord(attacker_coords[int(attacker_idx)])
         target_cell = self._cell_from_coord(target_coords[int(target_idx)])
+        if not self._los_debug_enabled():
+            return self._los_matrix().has_los(attacker_cell, target_cell)
 
         obscuring_cells = self.get_terrain_obscuring_cells_set()
-        self.terrain_obscuring_cells = set(obscuring_cells)
         target_cover_cells = self._target_cover_cells_for_unit(target_side, int(target_idx), radius=3)
         report = visibility_report(
             attacker_cell,
@@ -1906,9 +2320,11 @@ class Warhammer40kEnv(gym.Env):
         target_cells = self._unit_cells_for_los(target_side, int(target_idx))
         if not attacker_cells or not target_cells:
             return False
+        if not self._los_debug_enabled():
+            los = self._los_matrix()
+            return any(los.has_los(a, b) for a in attacker_cells for b in target_cells)
 
         obscuring_cells = self.get_terrain_obscuring_cells_set()
-        self.terrain_obscuring_cells = set(obscuring_cells)
         target_cover_cells = self._target_cover_cells_for_unit(target_side, int(target_idx), radius=3)
         attacker_id = self._unit_id(attacker_side, int(attacker_idx)) if hasattr(self, "_unit_id") else None
         target_id = self._unit_id(target_side, int(target_idx)) if hasattr(self, "_unit_id") else None
@@ -1967,7 +2383,105 @@ class Warhammer40kEnv(gym.Env):
         bonus = int(roll) if used_advance and roll is not None else 0
         return max(0, int(base_move) + bonus)
 
+    def _barricade_grid(self) -> np.ndarray:
+        """Барьеры как bool-сетка [row, col]; пересобирается только при смене terrain_features."""
+        features = self.terrain_features
+        cached = self.__dict__.get("_barricade_grid_cache")
+        if cached is None or cached[0] is not features or cached[1].shape != (self.b_len, self.b_hei):
+            grid = np.zeros((self.b_len, self.b_hei), dtype=bool)
+            for r, c in self._barricade_cells():
+                if 0 <= r < self.b_len and 0 <= c < self.b_hei:
+                    grid[r, c] = True
+            cached = (features, grid)
+            self._barricade_grid_cache = cached
+        return cached[1]
+
+    def _occupancy_grid(self) -> np.ndarray:
+        """Счётчик живых юнитов по клеткам [row, col] (обе стороны).
+
+        Кэшируется по сигнатуре позиций/живости: все overlay'и одного шага
+        (маски по всем юнитам) делят одну сетку.
+        """
+        live: list[tuple[int, int]] = []
+        for coords, health in ((self.unit_coords, self.unit_health), (self.enemy_coords, self.enemy_health)):
+            for j, pos in enumerate(coords):
+                if j < len(health) and float(health[j] or 0.0) > 0 and isinstance(pos, (list, tuple)) and len(pos) >= 2:
+                    live.append((int(pos[0]), int(pos[1])))
+        key = (self.b_len, self.b_hei, tuple(live))
+        cached = self.__dict__.get("_occupancy_grid_cache")
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        grid = np.zeros((self.b_len, self.b_hei), dtype=np.int16)
+        for r, c in live:
+            if 0 <= r < self.b_len and 0 <= c < self.b_hei:
+                grid[r, c] += 1
+        self._occupancy_grid_cache = (key, grid)
+        return grid
+
+    def _reachable_window(self, side: str, idx: int, budget: int) -> tuple[np.ndarray, np.ndarray, np.ndarray] | None:
+        """Свободные клетки в квадрате Чебышёва ``budget``: (rows, cols, dist) в порядке строк.
+
+        Векторная версия цикла из _get_unit_reachable_cells_reference: блокируют
+        барьеры и другие живые юниты, собственная клетка (dist=0) исключена.
+        """
+        coords = self.unit_coords if side == "model" else self.enemy_coords
+        hp = self.unit_health if side == "model" else self.enemy_health
+        if not (0 <= int(idx) < len(coords)):
+            return None
+        if not (0 <= int(idx) < len(hp)) or float(hp[int(idx)] or 0.0) <= 0:
+            return None
+        row = int(coords[int(idx)][0])
+        col = int(coords[int(idx)][1])
+        budget = max(0, int(budget))
+        r0, r1 = max(0, row - budget), min(self.b_len - 1, row + budget) + 1
+        c0, c1 = max(0, col - budget), min(self.b_hei - 1, col + budget) + 1
+        if r0 >= r1 or c0 >= c1:
+            return None
+
+        occupied = self._occupancy_grid()[r0:r1, c0:c1].copy()
+        if r0 <= row < r1 and c0 <= col < c1 and isinstance(coords[int(idx)], (list, tuple)):
+            occupied[row - r0, col - c0] -= 1  # сам юнит себе не мешает
+        rr = np.arange(r0, r1)[:, None]
+        cc = np.arange(c0, c1)[None, :]
+        dist = np.maximum(np.abs(rr - row), np.abs(cc - col))
+        free = (occupied <= 0) & ~self._barricade_grid()[r0:r1, c0:c1] & (dist > 0) & (dist <= budget)
+        rows, cols = np.nonzero(free)
+        return rows + r0, cols + c0, dist[rows, cols]
+
+    def _log_reachable(self, side: str, idx: int, budget: int, reachable: list[tuple[int, int]]) -> None:
+        if self._log_flags.terrain:
+            if reachable:
+                xs = [int(x) for x, _y in reachable]
+                ys = [int(y) for _x, y in reachable]
+                self._append_agent_log(
+                    f"[MOVE][REACHABLE] side={side} unit={self._unit_id(side, int(idx)) if hasattr(self, '_unit_id') else int(idx)} "
+                    f"budget={int(budget)} count={len(reachable)} min_x={min(xs)} max_x={max(xs)} min_y={min(ys)} max_y={max(ys)}",
+                    category="terrain",
+                )
+            else:
+                self._append_agent_log(
+                    f"[MOVE][REACHABLE] side={side} unit={self._unit_id(side, int(idx)) if hasattr(self, '_unit_id') else int(idx)} "
+                    f"budget={int(budget)} count=0",
+                    category="terrain",
+                )
+
+    def _reachable_engine(self) -> str:
+        # grid (по умолчанию) — векторные маски по сеткам; python — эталонный цикл.
+        return str(os.getenv("MOVEMENT_REACHABLE_ENGINE", "grid") or "grid").strip().lower()
+
     def get_unit_reachable_cells(self, side: str, idx: int, budget: int | None = None) -> list[tuple[int, int]]:
+        if self._reachable_engine() == "python":
+            return self._get_unit_reachable_cells_reference(side, idx, budget=budget)
+        move_budget = self._movement_budget_for_unit(side, int(idx)) if budget is None else max(0, int(budget))
+        window = self._reachable_window(side, int(idx), move_budget)
+        if window is None:
+            return []
+        rows, cols, _dist = window
+        reachable = list(zip(cols.tolist(), rows.tolist()))  # state coords (x, y)
+        self._log_reachable(side, int(idx), move_budget, reachable)
+        return reachable
+
+    def _get_unit_reachable_cells_reference(self, side: str, idx: int, budget: int | None = None) -> list[tuple[int, int]]:
         coords = self.unit_coords if side == "model" else self.enemy_coords
         hp = self.unit_health if side == "model" else self.enemy_health
         if not (0 <= int(idx) < len(coords)):
@@ -2004,37 +2518,38 @@ class Warhammer40kEnv(gym.Env):
                     continue
                 reachable.append((c, r))  # state coords (x, y)
 
-        if (os.getenv("TERRAIN_DEBUG", "0") == "1" or os.getenv("VIEWER_DEBUG", "0") == "1") and hasattr(self, "_append_agent_log"):
-            if reachable:
-                xs = [int(x) for x, _y in reachable]
-                ys = [int(y) for _x, y in reachable]
-                self._append_agent_log(
-                    f"[MOVE][REACHABLE] side={side} unit={self._unit_id(side, int(idx)) if hasattr(self, '_unit_id') else int(idx)} "
-                    f"budget={int(move_budget)} count={len(reachable)} min_x={min(xs)} max_x={max(xs)} min_y={min(ys)} max_y={max(ys)}"
-                )
-            else:
-                self._append_agent_log(
-                    f"[MOVE][REACHABLE] side={side} unit={self._unit_id(side, int(idx)) if hasattr(self, '_unit_id') else int(idx)} "
-                    f"budget={int(move_budget)} count=0"
-                )
-
+        self._log_reachable(side, int(idx), move_budget, reachable)
         return reachable
 
     def get_unit_movement_overlay(self, side: str, idx: int) -> dict[str, list[tuple[int, int]]]:
         move_budget = self._movement_budget_for_unit(side, int(idx))
-        move_cells = self.get_unit_reachable_cells(side, idx, budget=move_budget)
         advance_budget = move_budget + 6
-        advance_all = self.get_unit_reachable_cells(side, idx, budget=advance_budget)
-        move_set = set((int(x), int(y)) for x, y in move_cells)
-        advance_cells = [
-            (int(x), int(y))
-            for x, y in advance_all
-            if (int(x), int(y)) not in move_set
-        ]
-        if (os.getenv("TERRAIN_DEBUG", "0") == "1" or os.getenv("VIEWER_DEBUG", "0") == "1") and hasattr(self, "_append_agent_log"):
+        if self._reachable_engine() == "python":
+            move_cells = self._get_unit_reachable_cells_reference(side, idx, budget=move_budget)
+            advance_all = self._get_unit_reachable_cells_reference(side, idx, budget=advance_budget)
+            move_set = set((int(x), int(y)) for x, y in move_cells)
+            advance_cells = [
+                (int(x), int(y))
+                for x, y in advance_all
+                if (int(x), int(y)) not in move_set
+            ]
+        else:
+            # Одна маска на advance-бюджет; move — её подмножество с dist <= M.
+            window = self._reachable_window(side, int(idx), advance_budget)
+            if window is None:
+                move_cells, advance_cells = [], []
+            else:
+                rows, cols, dist = window
+                in_move = dist <= move_budget
+                move_cells = list(zip(cols[in_move].tolist(), rows[in_move].tolist()))
+                advance_cells = list(zip(cols[~in_move].tolist(), rows[~in_move].tolist()))
+                self._log_reachable(side, int(idx), move_budget, move_cells)
+                self._log_reachable(side, int(idx), advance_budget, move_cells + advance_cells)
+        if self._log_flags.terrain:
             self._append_agent_log(
                 f"[MOVE] unit={self._unit_id(side, int(idx)) if hasattr(self, '_unit_id') else int(idx)} "
-                f"M={int(move_budget)} budget={int(advance_budget)} reachable_move={len(move_cells)} reachable_adv={len(advance_cells)}"
+                f"M={int(move_budget)} budget={int(advance_budget)} reachable_move={len(move_cells)} reachable_adv={len(advance_cells)}",
+                category="terrain",
             )
         return {
             "move_cells": [(int(x), int(y)) for x, y in move_cells],
@@ -2159,12 +2674,33 @@ class Warhammer40kEnv(gym.Env):
             best_mode = "stay"
         return (int(x), int(y)), best_mode, dist, int(choice), total
 
+    def _visibility_flags(self, attacker_cell, target_cell, target_cover_cells) -> dict:
+        """los/obscured/fully_visible между клетками через пакетный raytracer (без crossed_cells)."""
+        flags = batch_visibility(
+            [attacker_cell],
+            [target_cell],
+            target_cover_cells_set=target_cover_cells,
+            visibility_mode=self.visibility_mode,
+            opaque_grid=self._los_matrix().opaque_grid,
+        )
+        return {
+            "los": bool(flags["los"][0]),
+            "obscured": bool(flags["obscured"][0]),
+            "fully_visible": bool(flags["fully_visible"][0]),
+            "partially_visible": bool(flags["partially_visible"][0]),
+            "rays_total": int(flags["rays_total"]),
+            "rays_clear": int(flags["rays_clear"][0]),
+            "rays_obscured": int(flags["rays_obscured"][0]),
+        }
+
     def _visibility_report_between_units(self, attacker_side: str, attacker_idx: int, target_side: str, target_idx: int) -> dict:
         attacker_coords = self.unit_coords if attacker_side == "model" else self.enemy_coords
         target_coords = self.unit_coords if target_side == "model" else self.enemy_coords
         attacker_cell = self._cell_from_coord(attacker_coords[int(attacker_idx)])
         target_cell = self._cell_from_coord(target_coords[int(target_idx)])
         target_cover_cells = self._target_cover_cells_for_unit(target_side, int(target_idx), radius=3)
+        if not self._los_debug_enabled():
+            return self._visibility_flags(attacker_cell, target_cell, target_cover_cells)
         return visibility_report(
             attacker_cell,
             target_cell,
@@ -2201,13 +2737,13 @@ class Warhammer40kEnv(gym.Env):
                 "применён Benefit of Cover (причина: obscured=True по LOS_DEBUG)."
             )
             self._log(cover_msg)
-            self._append_agent_log(cover_msg)
-            if defender_side == "enemy" and _heuristic_debug_enabled():
+            self._append_agent_log(cover_msg, category="cover")
+            if defender_side == "enemy" and self._log_flags.heuristic:
                 heur_cover_msg = (
                     f"[ENEMY][HEUR][COVER] {self._format_unit_label('enemy', int(defender_idx))}: "
                     "получен защитный бонус Benefit of Cover при входящем выстреле."
                 )
-                self._append_agent_log(heur_cover_msg)
+                self._append_agent_log(heur_cover_msg, category="heur")
                 if self._should_log():
                     self._log(heur_cover_msg)
             return "benefit of cover"
@@ -2809,18 +3345,22 @@ class Warhammer40kEnv(gym.Env):
         return self.trunc is False
 
     def _is_verbose(self) -> bool:
-        return os.getenv("VERBOSE_LOGS", "0") == "1" or os.getenv("MANUAL_DICE", "0") == "1"
+        return self._log_flags.verbose
 
     def _ensure_io(self):
         if not hasattr(self, "io") or self.io is None:
             self.io = get_active_io()
         return self.io
 
-    def _log(self, msg: str, verbose_only: bool = False):
-        if verbose_only and not self._is_verbose():
+    def _log(self, msg: str | Callable[[], str], verbose_only: bool = False):
+        """Сообщение в IO; ``msg`` может быть lambda — форматируется только если лог включён."""
+        if verbose_only and not self._log_flags.verbose:
             return
         if not self._should_log():
             return
+        if callable(msg):
+            msg = msg()
+        get_io_profiler().incr("log lines[env]")
         self._ensure_io().log(msg)
         if self.active_side == "model" and self._looks_like_dice_log(msg):
             self._emit_event(
@@ -2871,24 +3411,23 @@ class Warhammer40kEnv(gym.Env):
         event.setdefault("verbosity", "normal")
         get_event_bus().emit(event)
 
-    def _append_agent_log(self, msg: str) -> None:
-        if self._in_simulation_mode():
-            return
-        if msg is None:
+    def _append_agent_log(self, msg: str | Callable[[], str], category: str = "agent") -> None:
+        """Строка в AGENT_LOG_FILE через общий буферизованный writer (core/engine/game_io.py).
+
+        ``msg`` может быть lambda (форматируется только здесь); ``category`` — счётчик в IOProfiler.
+        """
+        if msg is None or self._in_simulation_mode():
             return
+        if callable(msg):
+            msg = msg()
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        full_line = f"{timestamp} | {msg}"
-        try:
-            with open(self._agent_log_path, "a", encoding="utf-8") as log_file:
-                log_file.write(full_line + "\n")
-        except Exception:
-            return
+        append_log_line(f"{timestamp} | {msg}", self._agent_log_path, category=category)
 
     def _log_reward(self, msg: str, unit_id: int | None = None, unit_name: str | None = None) -> None:
-        if os.getenv("REWARD_DEBUG", "0") != "1":
+        if not self._log_flags.reward:
             return
         self._log(msg)
-        self._append_agent_log(msg)
+        self._append_agent_log(msg, category="reward")
         if self.active_side == "model":
             self._emit_event(
                 {
@@ -2903,6 +3442,8 @@ class Warhammer40kEnv(gym.Env):
             )
 
     def _log_reward_unit(self, side: str, unit_id: int, unit_idx: int, msg: str) -> None:
+        if not self._log_flags.reward:
+            return
         side_label = self._side_label(side)
         unit_label = self._format_unit_label(side, unit_idx, unit_id=unit_id)
         unit_side = "model" if self._normalize_event_side(side) == "enemy" else "enemy"
@@ -2910,15 +3451,15 @@ class Warhammer40kEnv(gym.Env):
         self._log_reward(f"[{side_label}] {unit_label}: {msg}", unit_id=unit_id, unit_name=unit_name)
 
     def _log_reward_warning(self, msg: str) -> None:
-        if os.getenv("REWARD_DEBUG", "0") != "1":
+        if not self._log_flags.reward:
             return
         self._log_reward(msg)
 
     def _heur_log(self, msg: str) -> None:
         """Пишет HEUR-диагностику в train log даже при trunc=True."""
-        if not _heuristic_debug_enabled():
+        if not self._log_flags.heuristic:
             return
-        self._append_agent_log(msg)
+        self._append_agent_log(msg, category="heur")
         if self._should_log():
             self._log(msg)
 
@@ -3238,7 +3779,7 @@ class Warhammer40kEnv(gym.Env):
         min_target_dist = float(getattr(reward_cfg, "ENEMY_HEUR_MODE_QUOTA_MIN_TARGET_DIST", 5.0))
         if dist_now < min_target_dist:
             return None, f"quota_target_too_close(dist={dist_now:.2f})"
-        risk_now = self._enemy_heur_exposure_risk(int(enemy_idx), int(enemy_pos[1]), int(enemy_pos[0]))
+        risk_now = self._enemy_exposure_at(int(enemy_idx), int(enemy_pos[1]), int(enemy_pos[0]))
         risk_now_norm = float(risk_now) / max(1.0, float(len(self.unit_health)))
         max_risk = float(getattr(reward_cfg, "ENEMY_HEUR_MODE_QUOTA_MAX_RISK", 0.60))
         if risk_now_norm > max_risk:
@@ -3289,22 +3830,27 @@ class Warhammer40kEnv(gym.Env):
         """
         if int(getattr(reward_cfg, "ENEMY_HEUR_METRICS_ENABLED", 1)) != 1:
             return
-        counters = getattr(self, "_heur_metric_counters", None)
-        if not isinstance(counters, dict) or int(counters.get("moves", 0)) <= 0:
+        rec = _pop_heur_metrics_record(self)
+        if rec is None:
             return
         try:
             override_dir = str(os.getenv("HEUR_METRICS_DECISIONS_DIR", "") or "").strip()
             out_dir = Path(override_dir) if override_dir else ARTIFACTS_METRICS_DIR / "heur_decisions"
             out_dir.mkdir(parents=True, exist_ok=True)
-            rec = dict(counters)
-            rec["winner"] = str(getattr(self, "last_winner", "") or "")
-            rec["end_reason"] = str(getattr(self, "last_end_reason", "") or "")
             path = out_dir / f"heur_dec_{os.getpid()}.jsonl"
             with open(path, "a", encoding="utf-8") as fh:
                 fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
         except Exception:
             return
 
+    def pop_heur_metrics_record(self) -> dict | None:
+        """Забрать запись решений эвристики за прошедшую партию (та же, что пишется в JSONL).
+
+        После вызова счётчиков нет — reset() уже ничего не сбросит в файл. Так
+        in-process калибровка получает метрики партии напрямую, без JSONL на диске.
+        """
+        return _pop_heur_metrics_record(self)
+
     def _enemy_heur_objective_distance(self, cell_x: int, cell_y: int) -> float:
         if not self._objective_positions_available():
             return 0.0
@@ -3389,6 +3935,9 @@ class Warhammer40kEnv(gym.Env):
         if not attacker_cells:
             return False
         target_cell = (int(cell_y), int(cell_x))
+        if not self._los_debug_enabled():
+            los = self._los_matrix()
+            return any(los.has_los(ac, target_cell) for ac in attacker_cells)
         obscuring = self.get_terrain_obscuring_cells_set()
         for ac in attacker_cells:
             report = visibility_report(
@@ -3455,14 +4004,13 @@ class Warhammer40kEnv(gym.Env):
             dist = float(self._grid_distance_euclid(attacker_cell, target_cell))
             if dist > range_limit:
                 continue
+            if not self._los_matrix().has_los(attacker_cell, target_cell):
+                continue
 
-            report = visibility_report(
+            report = self._visibility_flags(
                 attacker_cell,
                 target_cell,
-                opaque_cells_set=self.terrain_opaque_cells,
-                obscuring_cells_set=self.get_terrain_obscuring_cells_set(),
-                target_cover_cells_set=self._target_cover_cells_for_unit("enemy", int(enemy_idx), radius=3),
-                visibility_mode=self.visibility_mode,
+                self._target_cover_cells_for_unit("enemy", int(enemy_idx), radius=3),
             )
             if not bool(report.get("los", False)):
                 continue
@@ -3622,6 +4170,393 @@ class Warhammer40kEnv(gym.Env):
         }
         return float(score), explain
 
+    def _enemy_heur_scorer(self) -> str:
+        # batch (по умолчанию) — векторный скоринг всех клеток; python — эталонный поклеточный.
+        return str(os.getenv("ENEMY_HEUR_SCORER", "batch") or "batch").strip().lower()
+
+    def _enemy_heur_move_weights(self) -> dict:
+        """Веса/множители скоринга хода эвристики: читаются из reward_cfg один раз на ход."""
+        weights = {
+            "matchup": float(getattr(reward_cfg, "ENEMY_HEUR_MATCHUP_DIST_W", 0.35)),
+            "target": float(getattr(reward_cfg, "ENEMY_HEUR_TARGET_DIST_W", 0.30)),
+            "mode": float(getattr(reward_cfg, "ENEMY_HEUR_MODE_W", 0.10)),
+            "progress": float(getattr(reward_cfg, "ENEMY_HEUR_PROGRESS_W", 0.15)),
+            "obj": float(getattr(reward_cfg, "ENEMY_HEUR_OBJECTIVE_DIST_W", 0.20)),
+            "obj_control": float(getattr(reward_cfg, "ENEMY_HEUR_OBJECTIVE_CONTROL_W", 0.42)),
+            "risk": float(getattr(reward_cfg, "ENEMY_HEUR_RISK_W", 0.22)),
+            "cover": float(getattr(reward_cfg, "ENEMY_HEUR_COVER_W", 0.18)),
+            "threat": float(getattr(reward_cfg, "ENEMY_HEUR_THREAT_W", 0.20)),
+            "obj_press": float(getattr(reward_cfg, "ENEMY_HEUR_OBJECTIVE_PRESSURE_W", 0.18)),
+            "team": float(getattr(reward_cfg, "ENEMY_HEUR_TEAM_FOCUS_PENALTY_W", 0.12)),
+            "obj_control_enabled": int(getattr(reward_cfg, "ENEMY_HEUR_OBJECTIVE_CONTROL_ENABLED", 1)) == 1,
+            "los_gate": int(getattr(reward_cfg, "ENEMY_HEUR_LOS_GATE_ENABLED", 1)) == 1,
+            "cover_radius": float(getattr(reward_cfg, "TERRAIN_COVER_RADIUS", 3.0)),
+        }
+        phase_profile = self._enemy_phase_profile()
+        phase_risk_mult = 1.0
+        phase_obj_mult = 1.0
+        phase_mode_mult = 1.0
+        if phase_profile == "early":
+            phase_risk_mult = float(getattr(reward_cfg, "ENEMY_HEUR_EARLY_RISK_MULT", 1.20))
+            phase_obj_mult = float(getattr(reward_cfg, "ENEMY_HEUR_EARLY_OBJ_MULT", 0.90))
+            phase_mode_mult = float(getattr(reward_cfg, "ENEMY_HEUR_EARLY_MODE_MULT", 1.10))
+        elif phase_profile == "mid":
+            phase_risk_mult = float(getattr(reward_cfg, "ENEMY_HEUR_MID_RISK_MULT", 1.00))
+            phase_obj_mult = float(getattr(reward_cfg, "ENEMY_HEUR_MID_OBJ_MULT", 1.00))
+            phase_mode_mult = float(getattr(reward_cfg, "ENEMY_HEUR_MID_MODE_MULT", 1.00))
+        elif phase_profile == "late":
+            phase_risk_mult = float(getattr(reward_cfg, "ENEMY_HEUR_LATE_RISK_MULT", 0.85))
+            phase_obj_mult = float(getattr(reward_cfg, "ENEMY_HEUR_LATE_OBJ_MULT", 1.35))
+            phase_mode_mult = float(getattr(reward_cfg, "ENEMY_HEUR_LATE_MODE_MULT", 0.95))
+        weights.update(
+            phase_profile=phase_profile,
+            phase_risk_mult=phase_risk_mult,
+            phase_obj_mult=phase_obj_mult,
+            phase_mode_mult=phase_mode_mult,
+        )
+        return weights
+
+    def _model_los_to_cells(self, model_idx: int, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Векторный _model_has_los_to_cell: LOS model-юнита до каждой клетки (rows[k], cols[k])."""
+        out = np.zeros(len(rows), dtype=bool)
+        attacker_cells = self._unit_cells_for_los("model", int(model_idx))
+        if not attacker_cells or len(rows) == 0:
+            return out
+        los = self._los_matrix()
+        targets = np.stack([rows, cols], axis=1)
+        for ac in attacker_cells:
+            pending = ~out
+            if not pending.any():
+                break
+            out[pending] = los.has_los_from(ac, targets[pending])
+        return out
+
+    def _model_threat_fields(self, xs: np.ndarray, ys: np.ndarray, *, los_gate: bool) -> dict[str, np.ndarray]:
+        """Поля угрозы model-стороны по клеткам (cell_x=xs, cell_y=ys).
+
+        threat/shoot/charge — векторный _enemy_cell_threat_score (threat суммируется в том же
+        порядке, что и скалярно), exposure — _enemy_heur_exposure_risk, exposure_count —
+        сколько живых стрелков достают клетку с LOS. LOS считается один раз на стрелка.
+        """
+        n = len(xs)
+        fields = {name: np.zeros(n, dtype=np.float64) for name in ("threat", "shoot", "charge", "exposure")}
+        fields["exposure_count"] = np.zeros(n, dtype=np.int64)
+        for model_idx in range(len(self.unit_health)):
+            if self.unit_health[model_idx] <= 0:
+                continue
+            mdata = self.unit_data[model_idx] if 0 <= model_idx < len(self.unit_data) else {}
+            mweapon = self.unit_weapon[model_idx] if 0 <= model_idx < len(self.unit_weapon) else {}
+            range_limit = max(0.0, self._stat_float(mweapon, ["Range"], default=0.0))
+            # Угроза меряется от округлённой клетки, экспозиция — от int(coords), как в скалярных версиях.
+            model_cell = self._cell_from_coord(self.unit_coords[model_idx])
+            dist = np.sqrt((ys - float(model_cell[0])) ** 2 + (xs - float(model_cell[1])) ** 2)
+            mrow, mcol = int(self.unit_coords[model_idx][0]), int(self.unit_coords[model_idx][1])
+            exp_dist = np.sqrt((float(mrow) - ys) ** 2 + (float(mcol) - xs) ** 2)
+            shoot_in = dist <= range_limit if range_limit > 0 else np.zeros(n, dtype=bool)
+            exp_in = exp_dist <= range_limit if range_limit > 0 else np.zeros(n, dtype=bool)
+            if los_gate and range_limit > 0:
+                hits = np.nonzero(shoot_in | exp_in)[0]
+                los = np.zeros(n, dtype=bool)
+                los[hits] = self._model_los_to_cells(int(model_idx), ys[hits], xs[hits])
+                shoot_in &= los
+                exp_in &= los
+            shoot_term = np.where(shoot_in, np.maximum(0.0, 1.0 - (dist / max(1.0, range_limit))), 0.0)
+            model_move = max(0.0, self._stat_float(mdata, ["Movement", "M"], default=6.0))
+            charge_reach = model_move + 7.0
+            charge_term = np.where(dist <= charge_reach, np.maximum(0.0, 1.0 - (dist / max(1.0, charge_reach))), 0.0)
+            fields["threat"] += 0.70 * shoot_term + 0.30 * charge_term
+            fields["shoot"] += shoot_term
+            fields["charge"] += charge_term
+            fields["exposure"] += np.where(exp_in, np.maximum(0.0, 1.0 - (exp_dist / max(1.0, range_limit))), 0.0)
+            fields["exposure_count"] += exp_in
+        return fields
+
+    def _board_threat_maps_key(self, los_gate: bool) -> tuple:
+        per_model = tuple(
+            (
+                self._cell_from_coord(self.unit_coords[i]),
+                self._stat_float(self.unit_data[i] if i < len(self.unit_data) else {}, ["Movement", "M"], default=6.0),
+            )
+            for i in range(len(self.unit_coords))
+        )
+        return (
+            bool(los_gate),
+            int(self.b_len),
+            int(self.b_hei),
+            self._los_matrix(),
+            self._unit_status_side_signature("model"),
+            per_model,
+        )
+
+    def board_threat_maps(self) -> dict[str, np.ndarray]:
+        """Карты угрозы model-стороны на всё поле, индексы [row, col] (см. _model_threat_fields).
+
+        Считаются одним проходом и переиспользуются всеми enemy-юнитами и экспортом состояния,
+        пока не сменятся позиции/HP/оружие model-стороны или террейн; _invalidate_target_cache
+        сбрасывает их явно.
+        """
+        los_gate = int(getattr(reward_cfg, "ENEMY_HEUR_LOS_GATE_ENABLED", 1)) == 1
+        key = self._board_threat_maps_key(los_gate)
+        cached = self.__dict__.get("_board_threat_maps")
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        rows, cols = np.meshgrid(np.arange(int(self.b_len)), np.arange(int(self.b_hei)), indexing="ij")
+        fields = self._model_threat_fields(
+            cols.ravel().astype(np.float64), rows.ravel().astype(np.float64), los_gate=los_gate
+        )
+        maps = {name: values.reshape(rows.shape) for name, values in fields.items()}
+        self._board_threat_maps = (key, maps)
+        return maps
+
+    def _board_threat_lookup(self, name: str, xs: np.ndarray, ys: np.ndarray) -> np.ndarray | None:
+        """Значения карты name в клетках (xs, ys); None, если клетка за полем (тогда — прямой расчёт)."""
+        cols = np.asarray(xs).astype(np.int64)
+        rows = np.asarray(ys).astype(np.int64)
+        if len(rows) and (rows.min() < 0 or cols.min() < 0 or rows.max() >= int(self.b_len) or cols.max() >= int(self.b_hei)):
+            return None
+        return self.board_threat_maps()[name][rows, cols]
+
+    def _enemy_threat_at(self, cell_x: int, cell_y: int) -> float:
+        """_enemy_cell_threat_score через карту угрозы (ENEMY_HEUR_SCORER=python — напрямую)."""
+        if self._enemy_heur_scorer() != "python":
+            value = self._board_threat_lookup("threat", np.array([int(cell_x)]), np.array([int(cell_y)]))
+            if value is not None:
+                return float(value[0])
+        return self._enemy_cell_threat_score(int(cell_x), int(cell_y))
+
+    def _enemy_exposure_at(self, enemy_idx: int, cell_x: int, cell_y: int) -> float:
+        """_enemy_heur_exposure_risk через карту экспозиции (ENEMY_HEUR_SCORER=python — напрямую)."""
+        if self._enemy_heur_scorer() != "python":
+            value = self._board_threat_lookup("exposure", np.array([int(cell_x)]), np.array([int(cell_y)]))
+            if value is not None:
+                return float(value[0])
+        return self._enemy_heur_exposure_risk(int(enemy_idx), int(cell_x), int(cell_y))
+
+    def _enemy_objective_control_scores(self, enemy_idx: int, xs: np.ndarray, ys: np.ndarray) -> tuple[np.ndarray, np.ndarray, list[dict]]:
+        """_enemy_objective_control_score для массива клеток.
+
+        classify_objective_control зависит от клетки только через candidate_in_radius, поэтому
+        на каждый objective считаются два исхода, а клетка выбирает свой. Возвращает
+        (score, choice, options): options[choice[k]] — словарь-результат для клетки k.
+        """
+        base = {
+            "kind": "none",
+            "score": 0.0,
+            "before_owner": "none",
+            "after_owner": "none",
+            "enemy_oc_after": 0,
+            "model_oc": 0,
+            "objective_idx": -1,
+            "unit_oc": 0,
+        }
+        n = len(xs)
+        if not self._objective_positions_available():
+            return np.zeros(n, dtype=np.float64), np.zeros(n, dtype=np.int64), [dict(base)]
+        idx = int(enemy_idx)
+        unit_oc = self._enemy_effective_oc(idx)
+        if unit_oc <= 0 or not (0 <= idx < len(self.enemy_coords)):
+            out = dict(base)
+            out["unit_oc"] = int(unit_oc)
+            return np.zeros(n, dtype=np.float64), np.zeros(n, dtype=np.int64), [out]
+
+        model_totals = getattr(self, "model_obj_oc", None)
+        enemy_totals = getattr(self, "enemy_obj_oc", None)
+        if model_totals is None or enemy_totals is None:
+            self.refresh_objective_control()
+            model_totals = getattr(self, "model_obj_oc", [])
+            enemy_totals = getattr(self, "enemy_obj_oc", [])
+
+        old_pos = (int(self.enemy_coords[idx][0]), int(self.enemy_coords[idx][1]))
+        first = dict(base)
+        first["unit_oc"] = int(unit_oc)
+        options = [first]
+        best_score = np.zeros(n, dtype=np.float64)
+        choice = np.zeros(n, dtype=np.int64)
+        for j, obj in enumerate(self.coordsOfOM):
+            model_oc = int(model_totals[j]) if j < len(model_totals) else 0
+            enemy_current = int(enemy_totals[j]) if j < len(enemy_totals) else 0
+            old_in_radius = distance(obj, old_pos) <= 5
+            new_in_radius = np.sqrt((ys - obj[0]) ** 2 + (xs - obj[1]) ** 2) <= 5
+            enemy_without = max(0, enemy_current - (int(unit_oc) if old_in_radius else 0))
+            for in_radius in (True, False):
+                scored = classify_objective_control(
+                    model_oc=model_oc,
+                    enemy_oc_without_unit=enemy_without,
+                    unit_oc=int(unit_oc),
+                    candidate_in_radius=in_radius,
+                    enemy_oc_before=enemy_current,
+                )
+                scored["objective_idx"] = int(j)
+                scored["unit_oc"] = int(unit_oc)
+                mask = new_in_radius if in_radius else ~new_in_radius
+                better = mask & (float(scored.get("score", 0.0)) > best_score)
+                best_score = np.where(better, float(scored.get("score", 0.0)), best_score)
+                choice = np.where(better, len(options), choice)
+                options.append(scored)
+        return best_score, choice, options
+
+    def _enemy_heur_cover_soft_at_cells(self, enemy_idx: int, xs: np.ndarray, ys: np.ndarray, *, cover_radius: float) -> np.ndarray:
+        """_enemy_heur_cover_soft_at_cell для массива клеток: ранние отсечки векторно, точный расчёт — только у барьеров."""
+        out = np.zeros(len(xs), dtype=np.float64)
+        if not (0 <= int(enemy_idx) < len(self.enemy_health)) or self.enemy_health[int(enemy_idx)] <= 0:
+            return out
+        if not self._unit_has_keyword(self.enemy_data[int(enemy_idx)], "infantry"):
+            return out
+        barricades = self._barricade_cells()
+        if not barricades or len(xs) == 0:
+            return out
+        bar = np.asarray(barricades, dtype=np.int64)
+        min_dist = np.maximum(
+            np.abs(ys[:, None].astype(np.int64) - bar[None, :, 0]),
+            np.abs(xs[:, None].astype(np.int64) - bar[None, :, 1]),
+        ).min(axis=1)
+        for k in np.nonzero(min_dist <= cover_radius)[0]:
+            cover_soft, _reason = self._enemy_heur_cover_soft_at_cell(int(enemy_idx), int(xs[k]), int(ys[k]))
+            out[k] = cover_soft
+        return out
+
+    def _enemy_heur_movement_scores(
+        self,
+        *,
+        enemy_idx: int,
+        target_idx: int,
+        xs: np.ndarray,
+        ys: np.ndarray,
+        modes: list[str],
+        pos_before: tuple[int, int],
+        matchup: dict[str, float | str],
+        focus_count: int,
+        team_tactic: str,
+        weights: dict,
+    ) -> tuple[np.ndarray, Callable[[int], dict[str, float | str]]]:
+        """Пакетный _enemy_heur_movement_score по всем кандидатам хода.
+
+        Компоненты (угроза, риск, дистанции, контроль objective, cover) считаются
+        векторами за один проход; порядок арифметики повторяет скалярную версию, так что
+        оценки совпадают побитно. Возвращает (scores, explain): explain(k) собирает тот же
+        словарь деталей, что и скалярная версия, только для нужных кандидатов.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        n_models = max(1.0, float(len(self.unit_health)))
+        target_row = int(self.unit_coords[target_idx][0])
+        target_col = int(self.unit_coords[target_idx][1])
+        desired_dist = float(matchup.get("desired_dist", 6.0))
+        mode_pref = str(matchup.get("mode", "hold"))
+
+        dist_to_target = np.sqrt((float(target_row) - ys) ** 2 + (float(target_col) - xs) ** 2)
+        dist_from_start = np.maximum(np.abs(ys - int(pos_before[0])), np.abs(xs - int(pos_before[1])))
+        dist_pref_penalty = np.abs(dist_to_target - desired_dist) / max(1.0, desired_dist)
+        if self._objective_positions_available():
+            obj_dist = np.min(
+                np.stack([np.sqrt((float(int(obj[0])) - ys) ** 2 + (float(int(obj[1])) - xs) ** 2) for obj in self.coordsOfOM]),
+                axis=0,
+            )
+        else:
+            obj_dist = np.zeros(len(xs), dtype=np.float64)
+        obj_norm = obj_dist / max(1.0, float(max(self.b_len, self.b_hei)))
+        if weights["obj_control_enabled"]:
+            obj_control_score, obj_choice, obj_options = self._enemy_objective_control_scores(enemy_idx, xs, ys)
+        else:
+            obj_control_score = np.zeros(len(xs), dtype=np.float64)
+            obj_choice = np.zeros(len(xs), dtype=np.int64)
+            obj_options = [{"kind": "none", "score": 0.0, "objective_idx": -1, "model_oc": 0, "enemy_oc_after": 0, "unit_oc": 0}]
+        risk = self._board_threat_lookup("exposure", xs, ys)
+        threat = self._board_threat_lookup("threat", xs, ys)
+        if risk is None or threat is None:
+            fields = self._model_threat_fields(xs, ys, los_gate=weights["los_gate"])
+            risk, threat = fields["exposure"], fields["threat"]
+        risk_norm = risk / n_models
+        threat_norm = threat / n_models
+        cover_bonus = np.clip(
+            self._enemy_heur_cover_soft_at_cells(enemy_idx, xs, ys, cover_radius=weights["cover_radius"]), 0.0, 1.0
+        )
+        obj_pressure = 1.0 if self._is_position_near_objective(self.unit_coords[int(target_idx)]) else 0.0
+
+        # Роль зависит от клетки только через risk_norm — считаем по уникальным значениям.
+        base_role = str(matchup.get("enemy_role", "hybrid"))
+        role_of: dict[float, tuple[str, str]] = {}
+        for value in np.unique(risk_norm).tolist():
+            role_of[value] = self._enemy_effective_role(int(enemy_idx), int(target_idx), base_role, float(value))
+        roles = [role_of[value] for value in risk_norm.tolist()]
+
+        mode_penalty_of = {}
+        for mode in set(modes):
+            penalty = 0.0 if mode == "normal" else 0.10 if mode == "advance" else 0.25
+            if mode_pref == "commit":
+                penalty = 0.02 if mode == "advance" else penalty
+            if mode_pref == "kite":
+                penalty = 0.05 if mode == "normal" else penalty
+            mode_penalty_of[mode] = penalty
+        mode_penalty = np.array([mode_penalty_of[mode] for mode in modes], dtype=np.float64)
+
+        team_focus_penalty = max(0, int(focus_count) - 1) * weights["team"]
+        base_risk_mult = 1.0
+        base_obj_mult = 1.0
+        focus_mult = 1.0
+        if team_tactic == "focus_fire":
+            focus_mult = 0.35
+        elif team_tactic == "play_objective":
+            base_obj_mult = 1.35
+        elif team_tactic == "preserve_lead":
+            base_risk_mult = 1.35
+        elif team_tactic == "desperate_push":
+            base_risk_mult = 0.85
+            base_obj_mult = 1.45
+        _prof_cfg = getattr(self, "_enemy_profile_cfg", None)
+        if isinstance(_prof_cfg, dict):
+            base_risk_mult *= float(_prof_cfg.get("risk_mult", 1.0))
+            base_obj_mult *= float(_prof_cfg.get("obj_mult", 1.0))
+        survive = np.array([role == "survive" for role, _reason in roles], dtype=bool)
+        obj_press_role = np.array([role == "objective_pressure" for role, _reason in roles], dtype=bool)
+        risk_mult = np.where(survive, base_risk_mult * 1.35, base_risk_mult)
+        obj_mult = np.where(survive, base_obj_mult * 0.85, np.where(obj_press_role, base_obj_mult * 1.30, base_obj_mult))
+
+        phase_risk_mult = weights["phase_risk_mult"]
+        phase_obj_mult = weights["phase_obj_mult"]
+        score = (
+            weights["target"] * dist_to_target
+            + weights["matchup"] * dist_pref_penalty
+            + (weights["mode"] * weights["phase_mode_mult"]) * mode_penalty
+            + (weights["obj"] * obj_mult * phase_obj_mult) * obj_norm
+            - (weights["obj_control"] * obj_mult * phase_obj_mult) * obj_control_score
+            + (weights["risk"] * risk_mult * phase_risk_mult) * risk_norm
+            + (weights["threat"] * risk_mult * phase_risk_mult) * threat_norm
+            + ((team_focus_penalty) * focus_mult)
+            - (weights["obj_press"] * obj_mult * phase_obj_mult) * obj_pressure
+            - weights["cover"] * cover_bonus
+            - weights["progress"] * dist_from_start
+        )
+
+        def explain(k: int) -> dict[str, float | str]:
+            obj_control = obj_options[int(obj_choice[k])]
+            effective_role, role_reason = roles[k]
+            return {
+                "dist_to_target": float(dist_to_target[k]),
+                "dist_pref_penalty": float(dist_pref_penalty[k]),
+                "obj_norm": float(obj_norm[k]),
+                "obj_control_score": float(obj_control_score[k]),
+                "obj_control_kind": str(obj_control.get("kind", "none")),
+                "obj_control_idx": int(obj_control.get("objective_idx", -1)),
+                "obj_model_oc": int(obj_control.get("model_oc", 0)),
+                "obj_enemy_oc_after": int(obj_control.get("enemy_oc_after", 0)),
+                "obj_unit_oc": int(obj_control.get("unit_oc", 0)),
+                "risk_norm": float(risk_norm[k]),
+                "threat_norm": float(threat_norm[k]),
+                "mode_penalty": float(mode_penalty[k]),
+                "team_focus_penalty": team_focus_penalty,
+                "cover_bonus": float(cover_bonus[k]),
+                "obj_pressure": obj_pressure,
+                "team_tactic": team_tactic,
+                "effective_role": effective_role,
+                "role_reason": role_reason,
+                "score": float(score[k]),
+                "mode_pref": mode_pref,
+                "phase_profile": weights["phase_profile"],
+            }
+
+        return score, explain
+
     def _enemy_heur_pick_shoot_target(self, enemy_idx: int, target_ids: list[int]) -> tuple[int, list[tuple[int, float, dict[str, float]]]]:
         scored: list[tuple[int, float, dict[str, float]]] = []
         kill_w = float(getattr(reward_cfg, "ENEMY_HEUR_SHOOT_KILL_W", 0.45))
@@ -3640,7 +4575,7 @@ class Warhammer40kEnv(gym.Env):
             on_obj = 1.0 if self._is_position_near_objective(self.unit_coords[int(target_idx)]) else 0.0
             overkill = max(0.0, attacker_ranged - hp) / max(1.0, max_hp)
             # EV-like extension: ценность килла/урона минус риск ответного фокуса
-            return_risk = self._enemy_cell_threat_score(
+            return_risk = self._enemy_threat_at(
                 int(self.enemy_coords[int(enemy_idx)][1]), int(self.enemy_coords[int(enemy_idx)][0])
             ) / max(1.0, float(len(self.unit_health)))
             ev_value = (ev_kill_w * kill_pressure) + (ev_dmg_w * expected_damage) - (ev_return_w * return_risk)
@@ -3741,9 +4676,11 @@ class Warhammer40kEnv(gym.Env):
                 )
                 self._phase_event_emitted = True
 
-    def _log_unit(self, side: str, unit_id: int, unit_idx: int, msg: str):
+    def _log_unit(self, side: str, unit_id: int, unit_idx: int, msg: str | Callable[[], str]):
         if not self._should_log():
             return
+        if callable(msg):
+            msg = msg()
         side_label = self._side_label(side)
         unit_label = self._format_unit_label(side, unit_idx, unit_id=unit_id)
         self._log(f"[{side_label}] {unit_label}: {msg}")
@@ -3766,9 +4703,11 @@ class Warhammer40kEnv(gym.Env):
         self._log(f"[{side_label}][{phase.upper()}] {msg}")
         self._emit_unit_event(side_label, None, None, None, msg, phase, verbose_only=False)
 
-    def _log_unit_phase(self, side_label: str, phase: str, unit_id: int, unit_idx: int, msg: str):
+    def _log_unit_phase(self, side_label: str, phase: str, unit_id: int, unit_idx: int, msg: str | Callable[[], str]):
         if not self._should_log():
             return
+        if callable(msg):
+            msg = msg()
         unit_label = self._format_unit_label(
             "model" if side_label == "MODEL" else "enemy",
             unit_idx,
@@ -4194,7 +5133,7 @@ class Warhammer40kEnv(gym.Env):
             phase=phase,
         )
         _logger = None
-        if _verbose_logs_enabled():
+        if self._log_flags.verbose:
             _logger = RollLogger(auto_dice, agent_log_fn=self._append_agent_log)
             _logger.configure_for_weapon(attacker_weapon[chosen])
             dmg, modHealth = attack(
@@ -4625,9 +5564,9 @@ class Warhammer40kEnv(gym.Env):
 
     def movement_phase(self, side: str, action=None, manual: bool = False, battle_shock=None, decide_move=None):
         self.begin_phase(side, "movement")
-        if side == "enemy" and _heuristic_debug_enabled():
+        if side == "enemy" and self._log_flags.heuristic:
             action_mode = "policy_action" if action is not None and not manual else "heuristic_auto"
-            self._append_agent_log(f"[ENEMY][HEUR] movement phase active ({action_mode})")
+            self._append_agent_log(f"[ENEMY][HEUR] movement phase active ({action_mode})", category="heur")
         if side == "model":
             advanced_flags = [False] * len(self.unit_health)
             self.model_used_advance = [False] * len(self.unit_health)
@@ -4922,9 +5861,9 @@ class Warhammer40kEnv(gym.Env):
             attack_choice = action.get("attack", 1) if isinstance(action, dict) else 1
             for i in range(len(self.enemy_health)):
                 unit_id = i + 11
-                if _heuristic_debug_enabled():
+                if self._log_flags.heuristic:
                     self._log_unit("enemy", unit_id, i, "[ENEMY][HEUR] movement action-branch active")
-                    self._append_agent_log(f"[PLAYER] {self._format_unit_label('enemy', i, unit_id=unit_id)}: [ENEMY][HEUR] movement action-branch active")
+                    self._append_agent_log(f"[PLAYER] {self._format_unit_label('enemy', i, unit_id=unit_id)}: [ENEMY][HEUR] movement action-branch active", category="heur")
                 battleSh = battle_shock[i] if battle_shock else False
                 pos_before = tuple(self.enemy_coords[i])
                 if self.enemy_health[i] <= 0:
@@ -5201,7 +6140,8 @@ class Warhammer40kEnv(gym.Env):
                     self._append_agent_log(
                         f"[MOVE] unit={playerName} {move_mode} to=({int(dest[0])},{int(dest[1])}) "
                         f"dist={int(distance_cells)} M={int(base_move)}"
-                        + (f" adv={int(max(0, min(6, int(distance_cells) - int(base_move))))}" if advanced else "")
+                        + (f" adv={int(max(0, min(6, int(distance_cells) - int(base_move))))}" if advanced else ""),
+                        category="move",
                     )
                     self.enemy_coords[i] = [int(dest[1]), int(dest[0])]
 
@@ -5235,10 +6175,11 @@ class Warhammer40kEnv(gym.Env):
             use_cp = getattr(self, "_enemy_use_cp", None)
             focus_counter: dict[int, int] = {}
             mode_usage_counter = {"kite": 0, "hold": 0, "commit": 0}
+            move_weights = None
             mode_decisions = 0
             team_tactic, tactic_reason = self._enemy_team_tactic()
             self.refresh_objective_control()
-            if _heuristic_debug_enabled():
+            if self._log_flags.heuristic:
                 self._heur_log(f"[ENEMY][HEUR][TEAM] tactic={team_tactic} reason={tactic_reason}")
             for i in range(len(self.enemy_health)):
                 pos_before = tuple(self.enemy_coords[i])
@@ -5307,26 +6248,46 @@ class Warhammer40kEnv(gym.Env):
                     mode_pref = str(matchup.get("mode", "hold"))
                     mode_usage_counter[mode_pref] = int(mode_usage_counter.get(mode_pref, 0)) + 1
                     mode_decisions += 1
+                    base_top_k = max(1, int(getattr(reward_cfg, "ENEMY_HEUR_LOOKAHEAD_TOP_K", 4)))
+                    if int(getattr(reward_cfg, "ENEMY_HEUR_LOOK2_ENABLED", 1)) == 1:
+                        top_k = max(1, int(getattr(reward_cfg, "ENEMY_HEUR_LOOK2_TOP_K", base_top_k)))
+                    else:
+                        top_k = base_top_k
                     scored_candidates: list[tuple[float, int, int, str, dict[str, float | str]]] = []
-                    for x, y, mode in candidates:
-                        base_score, details = self._enemy_heur_movement_score(
+                    if self._enemy_heur_scorer() == "python":
+                        for x, y, mode in candidates:
+                            base_score, details = self._enemy_heur_movement_score(
+                                enemy_idx=i,
+                                target_idx=idOfM,
+                                cell_x=int(x),
+                                cell_y=int(y),
+                                mode=str(mode),
+                                pos_before=(int(self.enemy_coords[i][0]), int(self.enemy_coords[i][1])),
+                                matchup=matchup,
+                                focus_count=int(focus_counter.get(idOfM, 1)),
+                                team_tactic=team_tactic,
+                            )
+                            scored_candidates.append((float(base_score), int(x), int(y), str(mode), details))
+                        scored_candidates.sort(key=lambda item: item[0])
+                    else:
+                        if move_weights is None:
+                            move_weights = self._enemy_heur_move_weights()
+                        batch_scores, batch_explain = self._enemy_heur_movement_scores(
                             enemy_idx=i,
                             target_idx=idOfM,
-                            cell_x=int(x),
-                            cell_y=int(y),
-                            mode=str(mode),
+                            xs=np.array([c[0] for c in candidates], dtype=np.float64),
+                            ys=np.array([c[1] for c in candidates], dtype=np.float64),
+                            modes=[str(c[2]) for c in candidates],
                             pos_before=(int(self.enemy_coords[i][0]), int(self.enemy_coords[i][1])),
                             matchup=matchup,
                             focus_count=int(focus_counter.get(idOfM, 1)),
                             team_tactic=team_tactic,
+                            weights=move_weights,
                         )
-                        scored_candidates.append((float(base_score), int(x), int(y), str(mode), details))
-                    scored_candidates.sort(key=lambda item: item[0])
-                    base_top_k = max(1, int(getattr(reward_cfg, "ENEMY_HEUR_LOOKAHEAD_TOP_K", 4)))
-                    if int(getattr(reward_cfg, "ENEMY_HEUR_LOOK2_ENABLED", 1)) == 1:
-                        top_k = max(1, int(getattr(reward_cfg, "ENEMY_HEUR_LOOK2_TOP_K", base_top_k)))
-                    else:
-                        top_k = base_top_k
+                        # Детали нужны только top-k (lookahead) — остальным хватает оценки.
+                        for k in np.argsort(batch_scores, kind="stable")[:top_k].tolist():
+                            x, y, mode = candidates[k]
+                            scored_candidates.append((float(batch_scores[k]), int(x), int(y), str(mode), batch_explain(k)))
                     lookahead_w = float(getattr(reward_cfg, "ENEMY_HEUR_LOOKAHEAD_W", 0.30))
                     top_candidates = scored_candidates[:top_k]
                     best_eval = None
@@ -5342,14 +6303,14 @@ class Warhammer40kEnv(gym.Env):
                             dist_next = float(self._grid_distance_euclid((int(y), int(x)), (int(self.unit_coords[model_idx][0]), int(self.unit_coords[model_idx][1]))))
                             if range_limit > 0 and dist_next <= range_limit:
                                 future_shootable += 1
+                        # Контроль objective и угроза клетки уже посчитаны скорингом (то же состояние).
                         if int(getattr(reward_cfg, "ENEMY_HEUR_OBJECTIVE_CONTROL_ENABLED", 1)) == 1:
-                            future_obj = self._enemy_objective_control_score(i, int(x), int(y))
-                            future_obj_term = float(future_obj.get("score", 0.0))
-                            future_obj_kind = str(future_obj.get("kind", "none"))
+                            future_obj_term = float(details.get("obj_control_score", 0.0))
+                            future_obj_kind = str(details.get("obj_control_kind", "none"))
                         elif self._is_position_near_objective((int(y), int(x))):
                             future_obj_term = 1.0
                             future_obj_kind = "near"
-                        future_risk = self._enemy_cell_threat_score(int(x), int(y)) / max(1.0, float(len(self.unit_health)))
+                        future_risk = float(details.get("threat_norm", 0.0))
                         lookahead_bonus = -lookahead_w * min(2.0, float(future_shootable))
                         if int(getattr(reward_cfg, "ENEMY_HEUR_LOOK2_ENABLED", 1)) == 1:
                             w_future = float(getattr(reward_cfg, "ENEMY_HEUR_LOOK2_FUTURE_W", 0.30))
@@ -5401,7 +6362,7 @@ class Warhammer40kEnv(gym.Env):
                             float(best_details.get("risk_norm", 0.0)),
                             str(best_details.get("obj_control_kind", "none")),
                         )
-                    if _heuristic_debug_enabled():
+                    if self._log_flags.heuristic:
                         self._heur_log(
                             f"[ENEMY][HEUR][MOVE] unit={i + 11} target={idOfM + 21} mode={mode_pref} "
                             f"enemy_role={matchup.get('enemy_role')} target_role={matchup.get('model_role')} "
@@ -5460,9 +6421,9 @@ class Warhammer40kEnv(gym.Env):
 
     def shooting_phase(self, side: str, advanced_flags=None, action=None, manual: bool = False, decide_shoot=None):
         self.begin_phase(side, "shooting")
-        if side == "enemy" and _heuristic_debug_enabled():
+        if side == "enemy" and self._log_flags.heuristic:
             action_mode = "policy_action" if action is not None and not manual else "heuristic_auto"
-            self._append_agent_log(f"[ENEMY][HEUR] shooting phase active ({action_mode})")
+            self._append_agent_log(f"[ENEMY][HEUR] shooting phase active ({action_mode})", category="heur")
         if side == "model":
             reward_delta = 0
             for i in range(len(self.unit_health)):
@@ -5518,7 +6479,7 @@ class Warhammer40kEnv(gym.Env):
                         effect = self._resolve_cover_effect_for_shot("model", i, "enemy", idOfE, base_effect=effect, phase="shooting")
                         threat_count_before_shot, _, _ = self._count_real_threats_to_model_unit(i)
                         _logger = None
-                        if _verbose_logs_enabled():
+                        if self._log_flags.verbose:
                             _logger = RollLogger(auto_dice, agent_log_fn=self._append_agent_log)
                             _logger.configure_for_weapon(self.unit_weapon[i])
                             dmg, modHealth = attack(
@@ -5731,7 +6692,7 @@ class Warhammer40kEnv(gym.Env):
                             i,
                             f"Reward (стрельба): штраф за пропуск = -{penalty:.3f}",
                         )
-                        if _verbose_logs_enabled():
+                        if self._log_flags.verbose:
                             self._log(
                                 f"[MODEL][SHOOT] Невалидный выбор цели: raw={raw}, доступные={valid_target_ids} (ожидался индекс 0..{len(valid_target_ids) - 1}). Стрельба пропущена."
                             )
@@ -5755,9 +6716,9 @@ class Warhammer40kEnv(gym.Env):
         elif side == "enemy" and action is not None and not manual:
             for i in range(len(self.enemy_health)):
                 unit_id = i + 11
-                if _heuristic_debug_enabled():
+                if self._log_flags.heuristic:
                     self._log_unit("enemy", unit_id, i, "[ENEMY][HEUR] shooting action-branch active")
-                    self._append_agent_log(f"[PLAYER] {self._format_unit_label('enemy', i, unit_id=unit_id)}: [ENEMY][HEUR] shooting action-branch active")
+                    self._append_agent_log(f"[PLAYER] {self._format_unit_label('enemy', i, unit_id=unit_id)}: [ENEMY][HEUR] shooting action-branch active", category="heur")
                 advanced = advanced_flags[i] if advanced_flags else False
                 if self.enemy_health[i] <= 0:
                     self._log_unit("enemy", unit_id, i, "Юнит мертв, стрельба пропущена.")
@@ -5789,7 +6750,7 @@ class Warhammer40kEnv(gym.Env):
                             i,
                             f"Цели в дальности: {target_list}, выбрана: {self._format_unit_label('model', idOfM)} (причина: выбор политики)",
                         )
-                        if _heuristic_debug_enabled():
+                        if self._log_flags.heuristic:
                             top = scored_targets[:3]
                             rendered = ", ".join(
                                 f"{self._format_unit_label('model', tid)}={score:.3f}"
@@ -5805,7 +6766,7 @@ class Warhammer40kEnv(gym.Env):
                         )
                         effect = self._resolve_cover_effect_for_shot("enemy", i, "model", idOfM, base_effect=effect, phase="shooting")
                         _logger = None
-                        if _verbose_logs_enabled():
+                        if self._log_flags.verbose:
                             _logger = RollLogger(auto_dice, agent_log_fn=self._append_agent_log)
                             _logger.configure_for_weapon(self.enemy_weapon[i])
                             dmg, modHealth = attack(
@@ -5864,7 +6825,7 @@ class Warhammer40kEnv(gym.Env):
                             i,
                             f"Цели в дальности: {target_list}, невалидный raw={raw}. Fallback на эвристику: {self._format_unit_label('model', idOfM)}.",
                         )
-                        if _heuristic_debug_enabled():
+                        if self._log_flags.heuristic:
                             top = scored_targets[:3]
                             rendered = ", ".join(
                                 f"{self._format_unit_label('model', tid)}={score:.3f}"
@@ -6057,7 +7018,7 @@ class Warhammer40kEnv(gym.Env):
                                 _, scored_targets = self._enemy_heur_pick_shoot_target(i, shoot_ids)
                             else:
                                 idOfM, scored_targets = self._enemy_heur_pick_shoot_target(i, shoot_ids)
-                            if _heuristic_debug_enabled():
+                            if self._log_flags.heuristic:
                                 top = scored_targets[:3]
                                 rendered = ", ".join(
                                     f"{self._format_unit_label('model', tid)}={score:.3f}"
@@ -6090,9 +7051,9 @@ class Warhammer40kEnv(gym.Env):
 
     def charge_phase(self, side: str, advanced_flags=None, action=None, manual: bool = False, decide_charge=None):
         self.begin_phase(side, "charge")
-        if side == "enemy" and _heuristic_debug_enabled():
+        if side == "enemy" and self._log_flags.heuristic:
             action_mode = "policy_action" if action is not None and not manual else "heuristic_auto"
-            self._append_agent_log(f"[ENEMY][HEUR] charge phase active ({action_mode})")
+            self._append_agent_log(f"[ENEMY][HEUR] charge phase active ({action_mode})", category="heur")
         if side == "model":
             reward_delta = 0
             any_charge_targets = False
@@ -6167,7 +7128,7 @@ class Warhammer40kEnv(gym.Env):
                         idOfE = int(_charge_target) if decide_charge is not None else action["charge"]
                         target_list = self._format_unit_choices("enemy", chargeAble)
                         dist_to_target = distance(self.enemy_coords[idOfE], self.unit_coords[i]) if idOfE in chargeAble else None
-                        if _verbose_logs_enabled():
+                        if self._log_flags.verbose:
                             roll_text = f"бросок: {dice_vals[0]} + {dice_vals[1]} = {diceRoll}"
                         else:
                             roll_text = f"бросок total={diceRoll}"
@@ -6247,7 +7208,7 @@ class Warhammer40kEnv(gym.Env):
                     else:
                         if potential_targets:
                             target_list = self._format_unit_choices("enemy", potential_targets)
-                            if _verbose_logs_enabled():
+                            if self._log_flags.verbose:
                                 roll_text = f"бросок: {dice_vals[0]} + {dice_vals[1]} = {diceRoll}"
                             else:
                                 roll_text = f"бросок total={diceRoll}"
@@ -6278,9 +7239,9 @@ class Warhammer40kEnv(gym.Env):
             any_charge_targets = False
             for i in range(len(self.enemy_health)):
                 unit_id = i + 11
-                if _heuristic_debug_enabled():
+                if self._log_flags.heuristic:
                     self._log_unit("enemy", unit_id, i, "[ENEMY][HEUR] charge action-branch active")
-                    self._append_agent_log(f"[PLAYER] {self._format_unit_label('enemy', i, unit_id=unit_id)}: [ENEMY][HEUR] charge action-branch active")
+                    self._append_agent_log(f"[PLAYER] {self._format_unit_label('enemy', i, unit_id=unit_id)}: [ENEMY][HEUR] charge action-branch active", category="heur")
                 advanced = advanced_flags[i] if advanced_flags else False
                 pos_before = tuple(self.enemy_coords[i])
                 if self.enemy_health[i] <= 0:
@@ -6325,7 +7286,7 @@ class Warhammer40kEnv(gym.Env):
                         heur_charge_target, charge_scored = self._enemy_heur_pick_charge_target(i, [int(v) for v in chargeAble])
                         target_list = self._format_unit_choices("model", chargeAble)
                         dist_to_target = distance(self.unit_coords[idOfM], self.enemy_coords[i]) if idOfM in chargeAble else None
-                        if _verbose_logs_enabled():
+                        if self._log_flags.verbose:
                             roll_text = f"бросок: {dice_vals[0]} + {dice_vals[1]} = {diceRoll}"
                         else:
                             roll_text = f"бросок total={diceRoll}"
@@ -6386,7 +7347,7 @@ class Warhammer40kEnv(gym.Env):
                                 i,
                                 f"Невалидный выбор цели из policy. Fallback на эвристику -> {self._format_unit_label('model', idOfM)}. {roll_text}. Результат: провал ({reason}).",
                             )
-                            if _heuristic_debug_enabled():
+                            if self._log_flags.heuristic:
                                 top = charge_scored[:3]
                                 rendered = ", ".join(
                                     f"{self._format_unit_label('model', tid)}={score:.3f}"
@@ -6397,7 +7358,7 @@ class Warhammer40kEnv(gym.Env):
                     else:
                         if potential_targets:
                             target_list = self._format_unit_choices("model", potential_targets)
-                            if _verbose_logs_enabled():
+                            if self._log_flags.verbose:
                                 roll_text = f"бросок: {dice_vals[0]} + {dice_vals[1]} = {diceRoll}"
                             else:
                                 roll_text = f"бросок total={diceRoll}"
@@ -6526,7 +7487,7 @@ class Warhammer40kEnv(gym.Env):
                             and float(charge_scored[0][2].get("trade", 0.0))
                             < float(getattr(reward_cfg, "ENEMY_HEUR_CHARGE_SKIP_TRADE_MIN", -0.5))
                         ):
-                            if _heuristic_debug_enabled():
+                            if self._log_flags.heuristic:
                                 self._heur_log(
                                     f"[ENEMY][HEUR][CHARGE] unit={i + 11} skip_bad_trade "
                                     f"trade={float(charge_scored[0][2].get('trade', 0.0)):.3f}"
@@ -6534,7 +7495,7 @@ class Warhammer40kEnv(gym.Env):
                             continue
                         dist = distance(self.enemy_coords[i], self.unit_coords[idOfM])
                         required = max(0, dist - 1)
-                        if _heuristic_debug_enabled():
+                        if self._log_flags.heuristic:
                             top = charge_scored[:3]
                             rendered = ", ".join(
                                 f"{self._format_unit_label('model', tid)}={score:.3f}"
@@ -6788,6 +7749,8 @@ class Warhammer40kEnv(gym.Env):
 
     def reset(self, *, seed=None, options=None, **kwargs):
         super().reset(seed=seed)
+        # Хвост логов прошлой партии — на диск до новой (воркеры могут не дожить до atexit).
+        flush_log_writer()
         opts = options or {}
         opts.update(kwargs)
         m = opts.get("m", self.model)
@@ -6799,6 +7762,7 @@ class Warhammer40kEnv(gym.Env):
         # keep original references too
         self.model = m
         self.enemy = e
+        self._log_flags = _read_env_log_flags()
 
         self.iter = 0
         self.trunc = trunc
@@ -6920,6 +7884,9 @@ class Warhammer40kEnv(gym.Env):
         self.viewer_activation = {}
         self.viewer_awaiting_ack = False
 
+        self._obs_encoder = ObservationEncoder.for_env(
+            self, phase_features=os.getenv("PHASE_OBS_FEATURES", "0") == "1"
+        )
         info = self.get_info()
 
         if Type == "big":
@@ -6927,21 +7894,31 @@ class Warhammer40kEnv(gym.Env):
 
         return self._get_observation(), info
 
-    def enemyTurn(self, trunc=False, policy_fn=None):
+    def _enemy_turn_prologue(self, trunc=False) -> None:
         self._invalidate_target_cache("enemy_turn_start")
         self.unitCharged = [0] * len(self.unit_health)
         self.enemyCharged = [0] * len(self.enemy_health)
         if trunc is True:
             self.trunc = True
-
         self.active_side = "enemy"
-        action = None
-        if policy_fn is not None:
+
+    def begin_enemy_turn(self, trunc=False):
+        """Пролог хода enemy (идемпотентен) → observation стороны enemy для policy.
+
+        Позволяет собрать obs нескольких сред, посчитать действия одним батчем
+        и затем вызвать enemyTurn(action=...) в каждой.
+        """
+        self._enemy_turn_prologue(trunc)
+        return self.get_observation_for_side("enemy")
+
+    def enemyTurn(self, trunc=False, policy_fn=None, action=None):
+        self._enemy_turn_prologue(trunc)
+        if action is None and policy_fn is not None:
             obs = self.get_observation_for_side("enemy")
             action = policy_fn(obs)
-        if action is not None and _heuristic_debug_enabled():
+        if action is not None and self._log_flags.heuristic:
             self._log("[ENEMY][HEUR] enemyTurn: action policy branch active")
-            self._append_agent_log("[ENEMY][HEUR] enemyTurn: action policy branch active")
+            self._append_agent_log("[ENEMY][HEUR] enemyTurn: action policy branch active", category="heur")
         battle_shock = self.command_phase("enemy", action=action)
         advanced_flags = self.movement_phase("enemy", action=action, battle_shock=battle_shock)
         self._invalidate_target_cache("enemy_after_movement")
@@ -6971,12 +7948,12 @@ class Warhammer40kEnv(gym.Env):
         """
         quiet = self.trunc if trunc is None else trunc
         fight_report = _fight_report_enabled()
-        use_roll_logger = fight_report or _verbose_logs_enabled()
+        use_roll_logger = fight_report or self._log_flags.verbose
 
         # кто кидает кубы (если MANUAL_DICE=1 — спрашиваем руками)
         dice_fn = player_dice if os.getenv("MANUAL_DICE", "0") == "1" else auto_dice
 
-        def _log(msg: str):
+        def _log(msg: str | Callable[[], str]):
             if quiet is False:
                 self._log(msg)
 
@@ -7014,7 +7991,7 @@ class Warhammer40kEnv(gym.Env):
                     "fight",
                     att_idx + 21,
                     att_idx,
-                    f"Выбран для атаки. Цель: {self._format_unit_label('enemy', def_idx)}.",
+                    lambda: f"Выбран для атаки. Цель: {self._format_unit_label('enemy', def_idx)}.",
                 )
 
                 weapon = self.unit_melee[att_idx]
@@ -7054,7 +8031,7 @@ class Warhammer40kEnv(gym.Env):
 
                 wname = weapon.get("Name", "Melee") if isinstance(weapon, dict) else str(weapon)
                 _log(
-                    f"⚔️ {self._format_unit_label('model', att_idx)} атакует {self._format_unit_label('enemy', def_idx)} оружием {wname}: урон {float(np.sum(dmg))} | HP {hp_before} -> {modHealth}"
+                    lambda: f"⚔️ {self._format_unit_label('model', att_idx)} атакует {self._format_unit_label('enemy', def_idx)} оружием {wname}: урон {float(np.sum(dmg))} | HP {hp_before} -> {modHealth}"
                 )
                 self._log_unit_phase(
                     "MODEL",
@@ -7100,7 +8077,7 @@ class Warhammer40kEnv(gym.Env):
                     "fight",
                     att_idx + 11,
                     att_idx,
-                    f"Выбран для атаки. Цель: {self._format_unit_label('model', def_idx)}.",
+                    lambda: f"Выбран для атаки. Цель: {self._format_unit_label('model', def_idx)}.",
                 )
 
                 weapon = self.enemy_melee[att_idx]
@@ -7143,7 +8120,7 @@ class Warhammer40kEnv(gym.Env):
 
                 wname = weapon.get("Name", "Melee") if isinstance(weapon, dict) else str(weapon)
                 _log(
-                    f"⚔️ {self._format_unit_label('enemy', att_idx)} атакует {self._format_unit_label('model', def_idx)} оружием {wname}: урон {float(np.sum(dmg))} | HP {hp_before} -> {modHealth}"
+                    lambda: f"⚔️ {self._format_unit_label('enemy', att_idx)} атакует {self._format_unit_label('model', def_idx)} оружием {wname}: урон {float(np.sum(dmg))} | HP {hp_before} -> {modHealth}"
                 )
                 self._log_unit_phase(
                     enemy_label,
@@ -8002,87 +8979,21 @@ class Warhammer40kEnv(gym.Env):
             self.render(mode="play")
 
     def close(self):
-        pass
-
-    _PHASE_OBS_ORDER = ("command", "movement", "shooting", "charge", "fight", "scoring")
+        flush_log_writer()
 
-    def _phase_obs_block(self, side: str) -> list[float]:
-        """Доп. блок observation за флагом PHASE_OBS_FEATURES: фаза/timing/CP/стратагемы.
+    def get_observation_for_side(self, side: str, out: np.ndarray | None = None):
+        """Observation стороны через ObservationEncoder (собирается в reset).
 
-        Длина детерминирована: 6 (phase one-hot) + 1 (timing main) + 2 (cp self/enemy norm)
-        + K (стратагема доступна сейчас) + K (использована в этом раунде), K = len(REGISTRY).
+        out — опциональный float32-буфер нужной длины (например, строка батч-тензора):
+        observation пишется прямо в него без промежуточных копий.
         """
-        from core.engine.phases.stratagems import REGISTRY
-
-        cur_phase = str(getattr(self, "phase", "command") or "command")
-        phase_onehot = [1.0 if cur_phase == p else 0.0 for p in self._PHASE_OBS_ORDER]
-        # timing: считаем MAIN (1.0); reaction-окна пока вне obs-петли
-        timing_main = [1.0]
-
-        cp_norm = 12.0
-        cp_self = float(self.modelCP if side == "model" else self.enemyCP) / cp_norm
-        cp_enemy = float(self.enemyCP if side == "model" else self.modelCP) / cp_norm
-        cp_block = [cp_self, cp_enemy]
-
-        cp_have = float(self.modelCP if side == "model" else self.enemyCP)
-        avail = []
-        for d in REGISTRY:
-            ok = (cur_phase in tuple(p.value for p in d.phases)) and (cp_have >= d.cp_cost)
-            avail.append(1.0 if ok else 0.0)
-
-        cur_round = int(getattr(self, "battle_round", 1))
-        used_recs = list(getattr(self, "stratagem_used", []) or [])
-        used = []
-        for d in REGISTRY:
-            was_used = any(
-                rec[0] == side and rec[1] == d.id and (len(rec) < 3 or int(rec[2]) == cur_round)
-                for rec in used_recs
+        encoder = self.__dict__.get("_obs_encoder")
+        if encoder is None or not encoder.matches(self):
+            encoder = ObservationEncoder.for_env(
+                self, phase_features=os.getenv("PHASE_OBS_FEATURES", "0") == "1"
             )
-            used.append(1.0 if was_used else 0.0)
-
-        return phase_onehot + timing_main + cp_block + avail + used
-
-    def get_observation_for_side(self, side: str):
-        obs = []
-        if side == "enemy":
-            first_health = self.enemy_health
-            first_coords = self.enemy_coords
-            first_cp = self.enemyCP
-            second_health = self.unit_health
-            second_coords = self.unit_coords
-            second_cp = self.modelCP
-        else:
-            first_health = self.unit_health
-            first_coords = self.unit_coords
-            first_cp = self.modelCP
-            second_health = self.enemy_health
-            second_coords = self.enemy_coords
-            second_cp = self.enemyCP
-
-        for i in range(len(first_health)):
-            obs.append(first_health[i])
-            obs.append(first_coords[i][0])
-            obs.append(first_coords[i][1])
-
-        obs.append(first_cp)
-
-        for i in range(len(second_health)):
-            obs.append(second_health[i])
-            obs.append(second_coords[i][0])
-            obs.append(second_coords[i][1])
-
-        obs.append(second_cp)
-
-        for OM in self.coordsOfOM:
-            obs.append(OM[0])
-            obs.append(OM[1])
-
-        obs.append(int(self.game_over))
-
-        if os.getenv("PHASE_OBS_FEATURES", "0") == "1":
-            obs.extend(self._phase_obs_block(side))
-
-        return np.array(obs, dtype=np.float32)
+            self._obs_encoder = encoder
+        return encoder.encode(self, side, out=out)
 
     def _get_observation(self):
         return self.get_observation_for_side("model")
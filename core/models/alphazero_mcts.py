@@ -11,6 +11,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import torch
 
+from core.envs.delta_journal import DeltaMark
 from core.models.action_contract import action_tensor_to_dict, ordered_action_keys
 from core.models.utils import unwrap_env
 
@@ -41,6 +42,12 @@ class MCTSConfig:
     simulate_enemy_in_tree: bool = True
     # Sprint 5: parallel simulations via thread pool (0 or 1 = disabled)
     parallel_simulations: int = 0
+    # "thread" = EnvClonePool on a ThreadPoolExecutor (GIL-bound),
+    # "process" = EnvProcessPool: worker processes with private env replicas
+    parallel_backend: str = "thread"
+    # Env rollback per simulation: "full" = snapshot_state/restore_state,
+    # "delta" = begin_delta/undo_delta journal (O(changed fields), cheap for max_depth > 1)
+    snapshot_mode: str = "full"
 
 
 @dataclass
@@ -78,6 +85,16 @@ class EvalCache:
         self.misses = 0
         self._lock = threading.RLock()
 
+    # RLock не пиклится — кэш уезжает в воркеры EnvProcessPool без замка.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("_lock", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
     @staticmethod
     def _key(obs: np.ndarray, legal_masks_by_head: list[np.ndarray]) -> bytes:
         parts = [np.asarray(obs, dtype=np.float32).tobytes()]
@@ -211,6 +228,11 @@ def _joint_action_candidates(
     return out
 
 
+def _process_rollout(env, mcts: AlphaZeroFactorizedMCTS, **kwargs) -> dict:
+    """EnvProcessPool task: one simulation on the worker's env replica."""
+    return mcts._run_one_sim_on_clone(clone_env=env, **kwargs)
+
+
 class AlphaZeroFactorizedMCTS:
     """
     Factorized AlphaZero-style search:
@@ -237,6 +259,13 @@ class AlphaZeroFactorizedMCTS:
         cache_size = int(getattr(self.cfg, "eval_cache_size", 10000) or 10000)
         self._eval_cache = EvalCache(max_size=cache_size)
         self._evaluator = evaluator  # Optional[Evaluator]
+        self._process_pool = None
+        self._process_pool_key: tuple | None = None
+        self._process_payload_key: tuple | None = None
+        self._picklable_policy_ids: dict[int, bool] = {}
+        # Версия весов для payload воркеров: растёт в set_net(); владелец сети
+        # вызывает set_net() после загрузки новых весов in-place.
+        self.policy_version = 0
 
     def _masked_topk(self, prior: np.ndarray, legal: np.ndarray) -> np.ndarray:
         legal = np.asarray(legal, dtype=bool)
@@ -397,7 +426,7 @@ class AlphaZeroFactorizedMCTS:
             _np.random.seed(rng_seed)
 
         env_u = unwrap_env(clone_env)
-        snapshot = env_u.snapshot_state() if hasattr(env_u, "snapshot_state") else None
+        snapshot = self._env_checkpoint(env_u)
         current_obs = _np.asarray(obs, dtype=_np.float32)
         leaf_value: Optional[float] = None
         needs_net_eval = False
@@ -456,10 +485,20 @@ class AlphaZeroFactorizedMCTS:
             "depth_reached": depth_reached,
         }
 
+    def _env_checkpoint(self, env_u):
+        """Rollback token for one simulation: delta frame or full snapshot (cfg.snapshot_mode)."""
+        mode = str(getattr(self.cfg, "snapshot_mode", "full") or "full").strip().lower()
+        if mode == "delta" and hasattr(env_u, "begin_delta"):
+            return env_u.begin_delta()
+        return env_u.snapshot_state() if hasattr(env_u, "snapshot_state") else None
+
     def _restore_env_safe(self, env, snapshot, reset_options: dict | None = None) -> bool:
         if snapshot is None:
             return True
         try:
+            if isinstance(snapshot, DeltaMark):
+                env.undo_delta(snapshot)
+                return True
             if hasattr(env, "restore_state"):
                 env.restore_state(snapshot)
                 return True
@@ -473,6 +512,75 @@ class AlphaZeroFactorizedMCTS:
             pass
         return False
 
+    def _get_process_pool(self, env_u, n_parallel: int, max_depth: int, enemy_policy_fn):
+        """EnvProcessPool for cfg.parallel_backend == "process", or None to use threads.
+
+        Workers get a CPU copy of this search (net only when max_depth > 1 needs
+        in-rollout priors); it is re-sent when the weights change.
+        """
+        if enemy_policy_fn is not None:
+            key = id(enemy_policy_fn)
+            ok = self._picklable_policy_ids.get(key)
+            if ok is None:
+                try:
+                    import pickle
+
+                    pickle.dumps(enemy_policy_fn)
+                    ok = True
+                except Exception:
+                    ok = False
+                self._picklable_policy_ids[key] = ok
+            if not ok:
+                return None
+        need_net = int(max_depth) > 1
+        if need_net and self.net is None:
+            return None
+
+        # Env в ключ не входит: sync_root сам перешлёт воркерам новый env при смене ростера,
+        # так что один пул обслуживает все партии владельца поиска.
+        pool_key = (int(n_parallel),)
+        if self._process_pool is not None and (self._process_pool_key != pool_key or self._process_pool.closed):
+            self.close_process_pool()
+        if self._process_pool is None:
+            from core.envs.env_process_pool import EnvProcessPool
+
+            self._process_pool = EnvProcessPool(env_u, n_workers=n_parallel)
+            self._process_pool_key = pool_key
+            self._process_payload_key = None
+
+        payload_key = (id(self.net), int(self.policy_version)) if need_net else (None, None)
+        if payload_key != self._process_payload_key:
+            import copy
+
+            worker_net = None
+            if need_net:
+                worker_net = copy.deepcopy(self.net).to("cpu")
+                worker_net.eval()
+            worker_cfg = copy.copy(self.cfg)
+            worker_cfg.parallel_simulations = 0
+            self._process_pool.set_payload(
+                AlphaZeroFactorizedMCTS(worker_net, worker_cfg, device=torch.device("cpu"))
+            )
+            self._process_payload_key = payload_key
+        return self._process_pool
+
+    def close_process_pool(self) -> None:
+        if self._process_pool is not None:
+            self._process_pool.close()
+        self._process_pool = None
+        self._process_pool_key = None
+        self._process_payload_key = None
+
+    def set_net(self, policy_value_net) -> None:
+        """Сменить/обновить сеть поиска; воркеры process-бэкенда получат её на следующем run()."""
+        self.net = policy_value_net
+        self.policy_version += 1
+        self._eval_cache = EvalCache(max_size=int(getattr(self.cfg, "eval_cache_size", 10000) or 10000))
+
+    def close(self) -> None:
+        """Освободить ресурсы поиска (воркеры process-бэкенда). Вызывает владелец поиска."""
+        self.close_process_pool()
+
     def _expand_root_child(
         self,
         root: MCTSNode,
@@ -597,20 +705,31 @@ class AlphaZeroFactorizedMCTS:
         completed = 0
         snapshot_fallback = False
 
-        # --- Sprint 5: Parallel simulations via thread pool ---
+        # --- Sprint 5: Parallel simulations via thread pool (or worker processes) ---
+        _pool = None
+        _proc_pool = None
         if n_parallel > 1 and hasattr(env_u, "snapshot_state"):
-            try:
-                from core.envs.env_clone_pool import EnvClonePool
-                _pool = EnvClonePool(env_u, pool_size=n_parallel)
-            except Exception:
-                _pool = None
-        else:
-            _pool = None
-
-        if _pool is not None:
+            backend = str(getattr(self.cfg, "parallel_backend", "thread") or "thread").strip().lower()
+            if backend == "process":
+                try:
+                    _proc_pool = self._get_process_pool(env_u, n_parallel, max_depth, enemy_policy_fn)
+                    if _proc_pool is not None:
+                        _proc_pool.sync_root(env_u)
+                except Exception:
+                    self.close_process_pool()
+                    _proc_pool = None
+            if _proc_pool is None:
+                try:
+                    from core.envs.env_clone_pool import EnvClonePool
+                    _pool = EnvClonePool(env_u, pool_size=n_parallel)
+                except Exception:
+                    _pool = None
+
+        if _pool is not None or _proc_pool is not None:
             # Parallel path:
             # 1. Collect action lists via sequential PUCT (tree structure is not thread-safe)
             # 2. Dispatch env rollouts to threads (each grabs its own clone from pool)
+            #    or to worker processes (each rolls out a chunk on its own replica)
             # 3. Batch-eval deferred leaves, backpropagate
             all_action_lists: list[tuple[list[int], list[MCTSNode]]] = []
             for _ in range(sims):
@@ -649,19 +768,42 @@ class AlphaZeroFactorizedMCTS:
                     )
                 return sim_idx, result
 
-            # Submit all sims; pool semaphore limits concurrency to n_parallel
             sim_results_par: list[Optional[dict]] = [None] * sims
-            with ThreadPoolExecutor(max_workers=n_parallel) as executor:
-                futures_map = {
-                    executor.submit(_pool_worker, i, al): i
-                    for i, (al, _) in enumerate(all_action_lists)
-                }
-                for fut in as_completed(futures_map):
-                    try:
-                        idx, res = fut.result()
-                        sim_results_par[idx] = res
-                    except Exception:
-                        pass
+            if _proc_pool is not None:
+                try:
+                    sim_results_par = list(_proc_pool.map(
+                        _process_rollout,
+                        {
+                            "obs": obs,
+                            "len_model": len_model,
+                            "max_depth": max_depth,
+                            "ordered_keys": ordered_keys,
+                            "root_value": root_value,
+                            "enemy_policy_fn": enemy_policy_fn,
+                            "simulate_enemy": simulate_enemy,
+                            # Воркер не может пересоздать юниты родителя — без reset-фолбэка.
+                            "reset_options": None,
+                        },
+                        [{"action_list": al, "rng_seed": i} for i, (al, _) in enumerate(all_action_lists)],
+                    ))
+                except Exception:
+                    self.close_process_pool()
+                    from core.envs.env_clone_pool import EnvClonePool
+                    _pool = EnvClonePool(env_u, pool_size=n_parallel)
+
+            # Submit all sims; pool semaphore limits concurrency to n_parallel
+            if _pool is not None:
+                with ThreadPoolExecutor(max_workers=n_parallel) as executor:
+                    futures_map = {
+                        executor.submit(_pool_worker, i, al): i
+                        for i, (al, _) in enumerate(all_action_lists)
+                    }
+                    for fut in as_completed(futures_map):
+                        try:
+                            idx, res = fut.result()
+                            sim_results_par[idx] = res
+                        except Exception:
+                            pass
 
             # Batch-evaluate deferred leaves
             deferred_par = [r for r in sim_results_par if r is not None and r.get("needs_net_eval")]
@@ -709,7 +851,7 @@ class AlphaZeroFactorizedMCTS:
                 else:
                     action_list = list(child.action_tuple)
 
-                snapshot = env_u.snapshot_state() if hasattr(env_u, "snapshot_state") else None
+                snapshot = self._env_checkpoint(env_u)
                 current_obs = np.asarray(obs, dtype=np.float32)
                 leaf_value: Optional[float] = None
                 needs_net_eval = False
@@ -14,6 +14,7 @@ import torch
 from core.models.alphazero_mcts import EvalCache
 from core.models.alphazero_model import AlphaZeroPolicyValueNet, load_alphazero_state_dict
 from core.models.utils import normalize_state_dict
+from core.models.weight_broadcast import WeightSync
 
 
 def _append_log(msg: str) -> None:
@@ -68,34 +69,28 @@ class AZInferenceEngine:
         self._weight_thread.join(timeout=2.0)
 
     def _poll_weights(self) -> None:
-        last_mtime = -1.0
+        weights = WeightSync(self.sync_path)
         while self._running:
             try:
-                if os.path.isfile(self.sync_path):
-                    mtime = os.path.getmtime(self.sync_path)
-                    if mtime > last_mtime:
-                        payload = torch.load(
-                            self.sync_path, map_location="cpu", weights_only=False
+                payload = weights.poll()
+                sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                if isinstance(sd, dict):
+                    new_ver = int(
+                        payload.get("policy_version", self._weight_version)
+                        or self._weight_version
+                    )
+                    with self._weight_lock:
+                        load_alphazero_state_dict(
+                            self.net, normalize_state_dict(sd), log_fn=None
                         )
-                        sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                        if isinstance(sd, dict):
-                            new_ver = int(
-                                payload.get("policy_version", self._weight_version)
-                                or self._weight_version
-                            )
-                            with self._weight_lock:
-                                load_alphazero_state_dict(
-                                    self.net, normalize_state_dict(sd), log_fn=None
-                                )
-                                self.net.eval()
-                                self._weight_version = new_ver
-                                # Кэш привязан к версии весов — инвалидируем при смене
-                                self._cache = EvalCache(max_size=self._cache.max_size)
-                            last_mtime = float(mtime)
-                            _append_log(
-                                f"[AZ][INF_SERVER] weight_updated version={new_ver} "
-                                f"file={os.path.basename(self.sync_path)}"
-                            )
+                        self.net.eval()
+                        self._weight_version = new_ver
+                        # Кэш привязан к версии весов — инвалидируем при смене
+                        self._cache = EvalCache(max_size=self._cache.max_size)
+                    _append_log(
+                        f"[AZ][INF_SERVER] weight_updated version={new_ver} "
+                        f"file={os.path.basename(self.sync_path)}"
+                    )
             except Exception as exc:
                 _append_log(f"[AZ][INF_SERVER] weight_poll_error: {exc}")
             time.sleep(self.sync_check_interval)
@@ -2,7 +2,6 @@
 
 from __future__ import annotations
 
-import os
 import queue
 import threading
 import time
@@ -17,6 +16,7 @@ from core.models.gumbel_muzero_search import (
     GumbelMuZeroSearchConfig,
 )
 from core.models.utils import normalize_state_dict
+from core.models.weight_broadcast import WeightSync
 
 
 def _append_log(msg: str) -> None:
@@ -105,31 +105,25 @@ class GMZInferenceServer:
         self._weight_thread.join(timeout=2.0)
 
     def _poll_weights(self) -> None:
-        last_mtime = -1.0
+        weights = WeightSync(self.sync_path)
         while self._running:
             try:
-                if os.path.isfile(self.sync_path):
-                    mtime = os.path.getmtime(self.sync_path)
-                    if mtime > last_mtime:
-                        payload = torch.load(
-                            self.sync_path, map_location="cpu", weights_only=False
-                        )
-                        sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                        if isinstance(sd, dict):
-                            new_ver = int(
-                                payload.get("policy_version", self._weight_version)
-                                or self._weight_version
-                            )
-                            with self._weight_lock:
-                                self.net.load_state_dict(normalize_state_dict(sd), strict=False)
-                                self.net.eval()
-                                self._weight_version = new_ver
-                                if self._batched_search is not None:
-                                    self._batched_search.net = self.net
-                                    if self._clear_tree_on_weight_sync:
-                                        self._batched_search.clear_tree_state()
-                            last_mtime = float(mtime)
-                            _append_log(f"[GMZ][INF_SERVER] weight_updated version={new_ver}")
+                payload = weights.poll()
+                sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                if isinstance(sd, dict):
+                    new_ver = int(
+                        payload.get("policy_version", self._weight_version)
+                        or self._weight_version
+                    )
+                    with self._weight_lock:
+                        self.net.load_state_dict(normalize_state_dict(sd), strict=False)
+                        self.net.eval()
+                        self._weight_version = new_ver
+                        if self._batched_search is not None:
+                            self._batched_search.net = self.net
+                            if self._clear_tree_on_weight_sync:
+                                self._batched_search.clear_tree_state()
+                    _append_log(f"[GMZ][INF_SERVER] weight_updated version={new_ver}")
             except Exception as exc:
                 _append_log(f"[GMZ][INF_SERVER] weight_poll_error: {exc}")
             time.sleep(self.sync_check_interval)
@@ -1,11 +1,19 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
-from typing import Optional
+import copy
+import threading
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Optional
 
 import numpy as np
 import torch
 
+from core.engine.game_io import append_train_agent_log
+
+if TYPE_CHECKING:
+    from core.models.gumbel_muzero_search import GumbelMuZeroSearch
+
 
 @dataclass
 class GumbelMuZeroReanalysisConfig:
@@ -17,93 +25,205 @@ class GumbelMuZeroReanalysisConfig:
     """
     fast_sims: int = 16  # number of MCTS simulations for reanalysis (lighter than full search)
     batch_size: int = 64  # how many transitions to reanalysis per call
+    chunk_size: int = 256  # rows per batched search call
+    staleness_power: float = 1.0  # selector weight (age + 1) ** power; 0 = uniform
+    value_target_mix: float = 0.0  # 0 = keep outcome value targets; >0 blends in the search root value
+    background: bool = False  # run the search in a worker thread on an uncompiled snapshot of the net
+
+
+def _batched_runner(search) -> Optional[Callable[..., list[dict]]]:
+    """``run_batched`` of the search's module bound to its config/device, or None."""
+    from core.models import gumbel_muzero_search, sampled_muzero_search
+
+    if isinstance(search, sampled_muzero_search.SampledMuZeroSearch):
+        return partial(sampled_muzero_search.run_batched, cfg=search.cfg, device=search.device)
+    if isinstance(search, gumbel_muzero_search.GumbelMuZeroSearch):
+        return partial(gumbel_muzero_search.run_batched, cfg=search.cfg, device=search.device)
+    return None
 
 
 class GumbelMuZeroReanalyzer:
     """Reanalyzer that uses real search to update stale policy targets.
 
-    Every fraction of training steps, this samples old transitions from the
-    replay buffer and re-runs a lightweight search (fast_sims) on each state
-    to produce higher-quality policy targets than the original self-play visit counts.
+    Each call selects ``batch_size`` transitions with a staleness-prioritized
+    selector (targets computed by older network versions first), runs one
+    batched search per ``chunk_size`` rows and writes the refreshed policy
+    (and optionally value) targets back into the replay arrays.  Rows without
+    stored legal masks get the network prior instead of a search.
+
+    With ``background=True`` the search runs in a worker thread on a snapshot
+    of the network: a call applies the previous finished job (on the caller's
+    thread, so the replay is only mutated by the learner) and submits the next
+    one.  Rows overwritten by new pushes in the meantime are skipped.  The
+    snapshot is an eager copy of ``net._orig_mod`` for ``torch.compile``-d
+    nets: compiled (CUDA graph) modules must not run on another thread.
+
+    Chunks whose search raises keep their old targets; they are counted in
+    ``failed_chunks`` and reported through ``log`` on the caller's thread
+    (default: the training agent log, never stdout).
     """
 
     def __init__(
         self,
         config: Optional[GumbelMuZeroReanalysisConfig] = None,
-        search: Optional["GumbelMuZeroSearch"] = None,
+        search: Optional[GumbelMuZeroSearch] = None,
         device: Optional[torch.device] = None,
+        *,
+        log: Optional[Callable[[str], None]] = None,
     ):
         self._cfg = config or GumbelMuZeroReanalysisConfig()
-        self._search = search  # GumbelMuZeroSearch instance
+        self._log = log or append_train_agent_log
+        self.failed_chunks = 0
+        self._search = search  # GumbelMuZeroSearch / SampledMuZeroSearch instance
         self._device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self._runner = _batched_runner(search) if search is not None else None
+        self._snapshot = None
+        self._thread: Optional[threading.Thread] = None
+        self._job: Optional[dict] = None
 
     @property
     def config(self) -> GumbelMuZeroReanalysisConfig:
         return self._cfg
 
-    def update_replay_with_reanalysis(self, replay, net) -> int:
-        """Run reanalysis on a random sample of the replay buffer.
+    def update_replay_with_reanalysis(self, replay, net, policy_version: int = 0) -> int:
+        """Reanalyze a staleness-prioritized batch of the replay buffer.
 
         Args:
             replay: GumbelMuZeroReplayBuffer instance
-            net: current GMZ network (used as fallback when search is unavailable)
+            net: current GMZ network (search net, and prior fallback without legal masks)
+            policy_version: version of ``net``; stored as the targets' version
 
         Returns:
-            Number of transitions updated.
+            Number of transitions updated (in background mode: by the job applied in this call).
         """
-        if len(replay) == 0:
-            return 0
-
-        batch_size = max(1, int(self._cfg.batch_size))
-        transitions = replay.sample(batch_size)
+        if not self._cfg.background:
+            if len(replay) == 0:
+                return 0
+            job = self._select(replay, policy_version)
+            self._run_job(job, net)
+            self._report_errors(job)
+            return self._apply(replay, job)
 
         n_updated = 0
-        for tr in transitions:
-            updated = self._update_one(tr, net)
-            if updated:
-                n_updated += 1
-
+        if self._thread is not None:
+            if self._thread.is_alive():
+                return 0
+            self._thread = None
+            self._report_errors(self._job)
+            n_updated = self._apply(replay, self._job)
+            self._job = None
+        if len(replay) > 0:
+            self._submit(replay, net, policy_version)
         return n_updated
 
-    def _update_one(self, tr, net) -> bool:
-        """Update policy targets for a single transition using real search.
-
-        If self._search is available, runs a lightweight search using the stored
-        legal_masks_by_head to produce fresh policy targets. Otherwise falls back
-        to softmax(initial_inference logits).
-        """
-        # B2: Check for stored legal masks (needed for real search)
-        legal_masks = getattr(tr, "legal_masks_by_head", None)
-        obs_t = torch.as_tensor(
-            np.asarray(tr.state, dtype=np.float32),
-            device=self._device,
-        ).unsqueeze(0)
-
-        if legal_masks is not None and self._search is not None:
-            # Real search path: use stored legal masks to run lightweight search
+    def close(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._job = None
+
+    # -----------------------------------------------------------------------
+
+    def _select(self, replay, policy_version: int) -> dict:
+        slots = replay.select_stale(
+            max(1, int(self._cfg.batch_size)), int(policy_version), float(self._cfg.staleness_power)
+        )
+        job = replay.reanalysis_inputs(slots)
+        job["version"] = int(policy_version)
+        return job
+
+    def _submit(self, replay, net, policy_version: int) -> None:
+        # Снимок весов берётся на потоке learner'а: фоновый поиск не видит полузаписанный optimizer.step.
+        # torch.compile-обёртку не копируем: фоновый поток работает на eager-модуле.
+        base = getattr(net, "_orig_mod", net)
+        if self._snapshot is None:
+            self._snapshot = copy.deepcopy(base)
+            self._snapshot.eval()
+        else:
+            self._snapshot.load_state_dict(base.state_dict())
+        job = self._select(replay, policy_version)
+        self._job = job
+        self._thread = threading.Thread(target=self._run_job, args=(job, self._snapshot), daemon=True)
+        self._thread.start()
+
+    def _run_job(self, job: dict, net) -> None:
+        n = len(job["slots"])
+        chunk = max(1, int(self._cfg.chunk_size))
+        mix = float(self._cfg.value_target_mix)
+        policies: Optional[list[np.ndarray]] = None
+        values = np.asarray(job["value_targets"], dtype=np.float32).copy()
+        ok = np.zeros(n, dtype=bool)
+        errors: list[str] = []
+        job["errors"] = errors
+        for lo in range(0, n, chunk):
+            rows = np.arange(lo, min(n, lo + chunk))
             try:
-                obs_np = np.asarray(tr.state, dtype=np.float32)
-                legal_masks_np = [np.asarray(m, dtype=bool) for m in legal_masks]
-                pi_targets_new, _, _, _ = self._search.run(
-                    obs=obs_np,
-                    legal_masks_by_head=legal_masks_np,
-                    deterministic=True,
-                )
-                # Update transition in-place
-                tr.policy_targets = [np.asarray(p, dtype=np.float32) for p in pi_targets_new]
-                return True
-            except Exception:
-                # Fallback on search error
-                pass
-
-        # Fallback: use initial inference softmax (original behavior)
-        try:
-            logits_list, _, _, _, _, _ = net.initial_inference(obs_t)
-            new_policy_targets = []
-            for head_logits in logits_list:
-                probs = torch.softmax(head_logits.squeeze(0), dim=0).cpu().numpy().astype(np.float32)
-                new_policy_targets.append(probs)
-            tr.policy_targets = new_policy_targets
-            return True
-        except Exception:
-            return False
+                heads, root_values = self._reanalyze_rows(job, rows, net)
+            except Exception as exc:
+                # чанк остаётся со старыми таргетами; сообщение — в _report_errors на потоке learner'а
+                errors.append(f"{type(exc).__name__}: {exc}")
+                continue
+            if policies is None:
+                policies = [np.zeros((n, h.shape[1]), dtype=np.float32) for h in heads]
+            for h, head in enumerate(heads):
+                policies[h][rows] = head
+            if mix > 0.0:
+                values[rows] = (1.0 - mix) * values[rows] + mix * root_values
+            ok[rows] = True
+        job["policies"] = policies
+        job["values"] = values if mix > 0.0 else None
+        job["ok"] = ok
+
+    def _reanalyze_rows(self, job: dict, rows: np.ndarray, net) -> tuple[list[np.ndarray], np.ndarray]:
+        """Policy per head ``[n, A_h]`` and root value ``[n]`` for one chunk."""
+        states = job["states"][rows]
+        legal = [m[rows] for m in job["legal_masks"]]
+        heads, root_values = self._prior_targets(states, net)
+        if self._runner is None:
+            return heads, root_values
+        # Поиску нужны сохранённые маски, и в каждой голове хотя бы одно легальное действие.
+        has_legal = job["has_legal"][rows].copy()
+        for m in legal:
+            has_legal &= m.any(axis=1)
+        searched = np.flatnonzero(has_legal)
+        if searched.size:
+            requests = [
+                {"env_id": int(i), "obs": states[i], "legal_masks_by_head": [m[i] for m in legal]}
+                for i in searched
+            ]
+            results = self._runner(net=net, requests=requests, deterministic=True)
+            for i, res in zip(searched, results):
+                for h, p in enumerate(res["policy_targets"]):
+                    heads[h][i] = np.asarray(p, dtype=np.float32)
+                root_values[i] = float(res["value_est"])
+        return heads, root_values
+
+    @torch.no_grad()
+    def _prior_targets(self, states: np.ndarray, net) -> tuple[list[np.ndarray], np.ndarray]:
+        """Softmax of the network prior for a whole chunk (one initial_inference)."""
+        obs_t = torch.as_tensor(np.asarray(states, dtype=np.float32), device=self._device)
+        out = net.initial_inference(obs_t)
+        logits_list, value = out[0], out[1]
+        heads = [torch.softmax(l, dim=1).float().cpu().numpy() for l in logits_list]
+        return heads, value.reshape(-1).float().cpu().numpy().astype(np.float32)
+
+    def _report_errors(self, job: Optional[dict]) -> None:
+        errors = (job or {}).get("errors") or []
+        if not errors:
+            return
+        self.failed_chunks += len(errors)
+        self._log(
+            f"[REANALYZE][WARN] {len(errors)} chunk(s) failed, targets kept "
+            f"(total failed={self.failed_chunks}). Детали: {errors[0]}"
+        )
+
+    def _apply(self, replay, job: Optional[dict]) -> int:
+        if not job or job.get("policies") is None:
+            return 0
+        ok = job["ok"]
+        if not ok.any():
+            return 0
+        push_id = np.where(ok, job["push_id"], -1)  # невыполненные строки не пишем
+        return replay.write_reanalysis(
+            job["slots"], push_id, job["policies"], version=job["version"], value_targets=job["values"]
+        )
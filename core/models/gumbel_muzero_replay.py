@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-from collections import deque
 from dataclasses import dataclass
 import random
 from typing import Any
@@ -21,26 +20,295 @@ class GMZTransition:
     policy_version: int = 0
 
 
+@dataclass
+class GMZUnrollBatch:
+    """Unroll windows gathered straight from the replay arrays.
+
+    Per-step arrays are ``[B, U, ...]`` with ``U = unroll_steps``; per-head
+    arrays are lists with one ``[B, U, A_h]`` array per action head.  Steps
+    after a ``done`` and steps past the newest transition are padding:
+    ``valid`` is False and every field is zero there.
+    """
+
+    states: np.ndarray
+    actions: np.ndarray
+    rewards: np.ndarray
+    dones: np.ndarray
+    value_targets: np.ndarray
+    policy_targets: list[np.ndarray]
+    behavior_logits: list[np.ndarray]
+    behavior_avail: np.ndarray
+    legal_masks: list[np.ndarray]
+    legal_avail: np.ndarray
+    valid: np.ndarray
+    policy_version: np.ndarray
+    head_sizes: tuple[int, ...]
+
+    def __len__(self) -> int:
+        return int(self.states.shape[0])
+
+    @property
+    def lengths(self) -> np.ndarray:
+        return self.valid.sum(axis=1)
+
+
+def _fit_heads(heads, sizes: tuple[int, ...], dtype) -> np.ndarray | None:
+    """Concatenate per-head vectors into one row; ``None`` if the layout differs."""
+    if not heads or len(heads) < len(sizes):
+        return None
+    parts = []
+    for h, size in enumerate(sizes):
+        part = np.asarray(heads[h], dtype=dtype).reshape(-1)
+        if part.size != size:
+            return None
+        parts.append(part)
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+
+
 class GumbelMuZeroReplayBuffer:
+    """Ring replay of GMZ transitions stored column-wise in preallocated arrays.
+
+    Columns (one row per transition, allocated on the first push):
+    ``state [cap, obs_dim]``, ``action [cap, K]``, ``reward``/``value`` /
+    ``done``/``version`` ``[cap]`` and the per-head vectors
+    (policy targets, behavior logits, legal masks) concatenated into
+    ``[cap, sum(A_h)]`` with ``head_offsets``.  Behavior logits and legal
+    masks carry an availability flag per row; a row whose heads do not match
+    the buffer layout is stored as unavailable.
+
+    Logical index ``0`` is the oldest transition; ``done`` flags mark the
+    episode boundaries that stop an unroll window.  ``sample_unroll_batch``
+    returns a ready :class:`GMZUnrollBatch`; ``sample``/``sample_unroll``
+    keep the old per-transition API (they return copies).
+    """
+
     def __init__(self, capacity: int = 250_000):
         self.capacity = int(max(1, capacity))
-        self.buffer: deque[GMZTransition] = deque(maxlen=self.capacity)
+        self._clear()
+
+    def _clear(self) -> None:
+        self.size = 0
+        self.pos = 0
+        self._pushes = 0
+        self.head_sizes: tuple[int, ...] = ()
+        self.head_offsets: list[int] = [0]
+        self._state: np.ndarray | None = None
+
+    def _allocate(self, obs_dim: int, n_heads: int, head_sizes: tuple[int, ...]) -> None:
+        cap = self.capacity
+        width = int(sum(head_sizes))
+        self.head_sizes = tuple(int(x) for x in head_sizes)
+        self.head_offsets = [0] + np.cumsum(self.head_sizes, dtype=np.int64).tolist()
+        self._state = np.zeros((cap, int(obs_dim)), dtype=np.float32)
+        self._action = np.zeros((cap, int(n_heads)), dtype=np.int64)
+        self._reward = np.zeros(cap, dtype=np.float32)
+        self._value = np.zeros(cap, dtype=np.float32)
+        self._done = np.zeros(cap, dtype=bool)
+        self._version = np.zeros(cap, dtype=np.int64)
+        # версия сети, посчитавшей policy targets (растёт после reanalysis)
+        self._target_version = np.zeros(cap, dtype=np.int64)
+        # сквозной номер push: reanalysis по нему видит, что слот уже перезаписан
+        self._push_id = np.zeros(cap, dtype=np.int64)
+        self._policy = np.zeros((cap, width), dtype=np.float32)
+        self._behavior = np.zeros((cap, width), dtype=np.float32)
+        self._has_behavior = np.zeros(cap, dtype=bool)
+        self._legal = np.zeros((cap, width), dtype=bool)
+        self._has_legal = np.zeros(cap, dtype=bool)
 
     def __len__(self) -> int:
-        return len(self.buffer)
+        return self.size
+
+    def _slots(self, logical) -> np.ndarray:
+        start = self.pos if self.size == self.capacity else 0
+        return (start + np.asarray(logical, dtype=np.int64)) % self.capacity
+
+    def _split(self, row: np.ndarray) -> list[np.ndarray]:
+        return [row[self.head_offsets[h]:self.head_offsets[h + 1]] for h in range(len(self.head_sizes))]
 
     def push(self, transition: GMZTransition) -> None:
-        self.buffer.append(transition)
+        state = np.asarray(transition.state, dtype=np.float32).reshape(-1)
+        action = np.asarray(transition.action, dtype=np.int64).reshape(-1)
+        if self._state is None:
+            sizes = tuple(int(np.asarray(p).size) for p in (transition.policy_targets or []))
+            self._allocate(state.size, action.size, sizes)
+        policy = self._policy_row(transition.policy_targets)
+        slot = self.pos
+        self._state[slot] = state
+        self._action[slot] = action
+        self._reward[slot] = float(transition.reward)
+        self._value[slot] = float(transition.value_target)
+        self._done[slot] = bool(transition.done)
+        self._version[slot] = int(transition.policy_version)
+        self._target_version[slot] = int(transition.policy_version)
+        self._pushes += 1
+        self._push_id[slot] = self._pushes
+        self._policy[slot] = policy
+        behavior = _fit_heads(transition.behavior_logits, self.head_sizes, np.float32)
+        self._has_behavior[slot] = behavior is not None
+        self._behavior[slot] = 0.0 if behavior is None else behavior
+        legal = _fit_heads(transition.legal_masks_by_head, self.head_sizes, np.float32)
+        self._has_legal[slot] = legal is not None
+        self._legal[slot] = False if legal is None else legal > 0.0
+        self.pos = (self.pos + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def _policy_row(self, policy_targets) -> np.ndarray:
+        """Policy targets as one row; a head layout other than ``head_sizes`` is an error."""
+        heads = list(policy_targets or [])
+        sizes = tuple(int(np.asarray(p).size) for p in heads)
+        if sizes != self.head_sizes:
+            raise ValueError(f"policy targets head sizes {sizes} do not match replay head sizes {self.head_sizes}")
+        if not heads:
+            return np.zeros(0, dtype=np.float32)
+        return np.concatenate([np.asarray(p, dtype=np.float32).reshape(-1) for p in heads])
+
+    def _write_policy(self, slot: int, policy_targets) -> None:
+        self._policy[slot] = self._policy_row(policy_targets)
 
     def push_many(self, transitions: list[GMZTransition]) -> None:
         for t in transitions:
             self.push(t)
 
+    def transition_at(self, slot: int) -> GMZTransition:
+        """Copy of the transition stored in ring slot ``slot``."""
+        slot = int(slot)
+        return GMZTransition(
+            state=self._state[slot].copy(),
+            action=self._action[slot].copy(),
+            reward=float(self._reward[slot]),
+            done=bool(self._done[slot]),
+            policy_targets=[p.copy() for p in self._split(self._policy[slot])],
+            value_target=float(self._value[slot]),
+            behavior_logits=[b.copy() for b in self._split(self._behavior[slot])] if self._has_behavior[slot] else [],
+            legal_masks_by_head=(
+                [m.astype(np.float32) for m in self._split(self._legal[slot])] if self._has_legal[slot] else []
+            ),
+            policy_version=int(self._version[slot]),
+        )
+
+    def sample_with_slots(self, batch_size: int) -> tuple[np.ndarray, list[GMZTransition]]:
+        """Random transitions plus their ring slots (for in-place target updates)."""
+        n = min(self.size, max(1, int(batch_size)))
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64), []
+        slots = self._slots(random.sample(range(self.size), n))
+        return slots, [self.transition_at(s) for s in slots]
+
     def sample(self, batch_size: int) -> list[GMZTransition]:
-        n = min(len(self.buffer), max(1, int(batch_size)))
+        return self.sample_with_slots(batch_size)[1]
+
+    def set_policy_targets(self, slot: int, policy_targets) -> None:
+        self._write_policy(int(slot), policy_targets)
+
+    # --- reanalysis -------------------------------------------------------
+
+    def select_stale(self, n: int, current_version: int, staleness_power: float = 1.0) -> np.ndarray:
+        """Ring slots for reanalysis, drawn without replacement.
+
+        Weight of a row is ``(current_version - target_version + 1) ** power``:
+        rows whose targets came from older networks are picked more often;
+        ``power=0`` is a uniform draw.
+        """
+        n = min(self.size, max(0, int(n)))
         if n <= 0:
-            return []
-        return random.sample(list(self.buffer), n)
+            return np.zeros(0, dtype=np.int64)
+        slots = self._slots(np.arange(self.size))
+        age = np.maximum(int(current_version) - self._target_version[slots], 0).astype(np.float64)
+        weights = (age + 1.0) ** float(staleness_power)
+        picked = np.random.choice(self.size, size=n, replace=False, p=weights / weights.sum())
+        return slots[picked]
+
+    def reanalysis_inputs(self, slots) -> dict[str, Any]:
+        """Copies of what a batched search needs for ``slots`` (safe to hand to another thread)."""
+        slots = np.asarray(slots, dtype=np.int64)
+        legal = self._legal[slots]
+        return {
+            "slots": slots,
+            "push_id": self._push_id[slots].copy(),
+            "states": self._state[slots],
+            "legal_masks": [legal[:, lo:hi] for lo, hi in zip(self.head_offsets[:-1], self.head_offsets[1:])],
+            "has_legal": self._has_legal[slots],
+            "value_targets": self._value[slots],
+        }
+
+    def write_reanalysis(
+        self,
+        slots,
+        push_id,
+        policy_targets: list[np.ndarray],
+        *,
+        version: int,
+        value_targets: np.ndarray | None = None,
+    ) -> int:
+        """Write refreshed targets back in place; rows overwritten since selection are skipped."""
+        slots = np.asarray(slots, dtype=np.int64)
+        keep = self._push_id[slots] == np.asarray(push_id, dtype=np.int64)
+        if not keep.any():
+            return 0
+        rows = slots[keep]
+        self._policy[rows] = np.concatenate([np.asarray(p, dtype=np.float32)[keep] for p in policy_targets], axis=1)
+        if value_targets is not None:
+            self._value[rows] = np.asarray(value_targets, dtype=np.float32)[keep]
+        self._target_version[rows] = int(version)
+        return int(keep.sum())
+
+    def _unroll_starts(
+        self, batch_size: int, max_policy_staleness_updates: int, current_policy_version: int
+    ) -> np.ndarray:
+        n = min(self.size, max(1, int(batch_size)))
+        starts = np.asarray(random.sample(range(self.size), n), dtype=np.int64)
+        if int(max_policy_staleness_updates) >= 0:
+            min_ver = int(current_policy_version) - int(max_policy_staleness_updates)
+            starts = starts[self._version[self._slots(starts)] >= min_ver]
+        return starts
+
+    def sample_unroll_batch(
+        self,
+        batch_size: int,
+        unroll_steps: int,
+        max_policy_staleness_updates: int = -1,
+        current_policy_version: int = 0,
+    ) -> GMZUnrollBatch | None:
+        """Sample unroll windows as ``[B, U, ...]`` arrays with one gather per column."""
+        if self.size == 0:
+            return None
+        starts = self._unroll_starts(batch_size, max_policy_staleness_updates, current_policy_version)
+        if starts.size == 0:
+            return None
+        unroll = max(1, int(unroll_steps))
+        logical = starts[:, None] + np.arange(unroll)  # [B, U]
+        in_buffer = logical < self.size
+        slots = self._slots(np.minimum(logical, self.size - 1))
+        dones = self._done[slots] & in_buffer
+        # шаг t валиден, пока он не за write head и на шагах < t не было done (сам done-шаг входит в окно)
+        valid = in_buffer.copy()
+        valid[:, 1:] &= np.cumsum(dones, axis=1)[:, :-1] == 0
+
+        def _take(column: np.ndarray) -> np.ndarray:
+            out = column[slots]
+            out[~valid] = 0
+            return out
+
+        policy = _take(self._policy)
+        behavior = _take(self._behavior)
+        legal = _take(self._legal)
+        heads = list(zip(self.head_offsets[:-1], self.head_offsets[1:]))
+        return GMZUnrollBatch(
+            states=_take(self._state),
+            actions=_take(self._action),
+            rewards=_take(self._reward),
+            dones=dones & valid,
+            value_targets=_take(self._value),
+            policy_targets=[policy[:, :, lo:hi] for lo, hi in heads],
+            behavior_logits=[behavior[:, :, lo:hi] for lo, hi in heads],
+            behavior_avail=_take(self._has_behavior),
+            legal_masks=[legal[:, :, lo:hi] for lo, hi in heads],
+            legal_avail=_take(self._has_legal),
+            valid=valid,
+            policy_version=self._version[slots[:, 0]].copy(),
+            head_sizes=self.head_sizes,
+        )
 
     def sample_unroll(
         self,
@@ -49,89 +317,74 @@ class GumbelMuZeroReplayBuffer:
         max_policy_staleness_updates: int = -1,
         current_policy_version: int = 0,
     ) -> list[dict[str, Any]]:
-        if len(self.buffer) == 0:
+        batch = self.sample_unroll_batch(
+            batch_size, unroll_steps, max_policy_staleness_updates, current_policy_version
+        )
+        if batch is None:
             return []
-        n = min(len(self.buffer), max(1, int(batch_size)))
-        starts = random.sample(range(len(self.buffer)), n)
         out: list[dict[str, Any]] = []
-        min_ver = int(current_policy_version) - int(max_policy_staleness_updates)
-        for start in starts:
-            tr = self.buffer[start]
-            if int(max_policy_staleness_updates) >= 0 and int(tr.policy_version) < min_ver:
-                continue
-            seq_states: list[np.ndarray] = []
-            seq_actions: list[np.ndarray] = []
-            seq_rewards: list[float] = []
-            seq_dones: list[float] = []
-            seq_policies: list[list[np.ndarray]] = []
-            seq_values: list[float] = []
-            seq_behavior_logits: list[list[np.ndarray]] = []  # A3
-            for k in range(max(1, int(unroll_steps))):
-                idx = min(start + k, len(self.buffer) - 1)
-                cur = self.buffer[idx]
-                seq_states.append(np.asarray(cur.state, dtype=np.float32))
-                seq_actions.append(np.asarray(cur.action, dtype=np.int64))
-                seq_rewards.append(float(cur.reward))
-                seq_dones.append(float(bool(cur.done)))
-                seq_policies.append([np.asarray(x, dtype=np.float32) for x in cur.policy_targets])
-                seq_values.append(float(cur.value_target))
-                seq_behavior_logits.append(
-                    [np.asarray(x, dtype=np.float32) for x in (cur.behavior_logits or [])]
-                )
-                if bool(cur.done):
-                    break
+        n_heads = len(batch.head_sizes)
+        for b, length in enumerate(batch.lengths.tolist()):
+            steps = range(int(length))
             out.append(
                 {
-                    "states": seq_states,
-                    "actions": seq_actions,
-                    "rewards": seq_rewards,
-                    "dones": seq_dones,
-                    "policy_targets": seq_policies,
-                    "value_targets": seq_values,
-                    "behavior_logits": seq_behavior_logits,
+                    "states": [batch.states[b, t] for t in steps],
+                    "actions": [batch.actions[b, t] for t in steps],
+                    "rewards": [float(batch.rewards[b, t]) for t in steps],
+                    "dones": [float(batch.dones[b, t]) for t in steps],
+                    "policy_targets": [[batch.policy_targets[h][b, t] for h in range(n_heads)] for t in steps],
+                    "value_targets": [float(batch.value_targets[b, t]) for t in steps],
+                    "behavior_logits": [
+                        [batch.behavior_logits[h][b, t] for h in range(n_heads)] if batch.behavior_avail[b, t] else []
+                        for t in steps
+                    ],
                     "legal_masks_by_head": [
-                        [np.asarray(x, dtype=np.float32) for x in cur.legal_masks_by_head]
-                        if cur.legal_masks_by_head else []
-                        for _ in range(len(seq_states))
+                        [batch.legal_masks[h][b, t].astype(np.float32) for h in range(n_heads)]
+                        if batch.legal_avail[b, t] else []
+                        for t in steps
                     ],
-                    "policy_version": int(tr.policy_version),
+                    "policy_version": int(batch.policy_version[b]),
                 }
             )
         return out
 
     def state_dict(self) -> dict[str, Any]:
-        return {
-            "capacity": int(self.capacity),
-            "buffer": [
-                {
-                    "state": np.asarray(x.state, dtype=np.float32),
-                    "action": np.asarray(x.action, dtype=np.int64),
-                    "reward": float(x.reward),
-                    "done": bool(x.done),
-                    "policy_targets": [np.asarray(p, dtype=np.float32) for p in x.policy_targets],
-                    "behavior_logits": [
-                        np.asarray(b, dtype=np.float32) for b in (x.behavior_logits or [])
-                    ],
-                    "legal_masks_by_head": [
-                        np.asarray(m, dtype=np.float32) for m in (x.legal_masks_by_head or [])
-                    ],
-                    "value_target": float(x.value_target),
-                    "policy_version": int(x.policy_version),
-                }
-                for x in self.buffer
-            ],
+        payload: dict[str, Any] = {"capacity": int(self.capacity), "format": "arrays", "size": int(self.size)}
+        if self._state is None or self.size == 0:
+            payload["columns"] = {}
+            return payload
+        order = self._slots(np.arange(self.size))
+        payload["head_sizes"] = list(self.head_sizes)
+        payload["columns"] = {
+            "state": self._state[order],
+            "action": self._action[order],
+            "reward": self._reward[order],
+            "value_target": self._value[order],
+            "done": self._done[order],
+            "policy_version": self._version[order],
+            "target_version": self._target_version[order],
+            "policy_targets": self._policy[order],
+            "behavior_logits": self._behavior[order],
+            "has_behavior": self._has_behavior[order],
+            "legal_masks": self._legal[order],
+            "has_legal": self._has_legal[order],
         }
+        return payload
 
     def load_state_dict(self, payload: dict[str, Any]) -> None:
         self.capacity = int(payload.get("capacity", self.capacity) or self.capacity)
-        self.buffer = deque(maxlen=self.capacity)
+        self._clear()
+        columns = payload.get("columns") if isinstance(payload, dict) else None
+        if isinstance(columns, dict):
+            self._load_columns(columns, tuple(int(x) for x in payload.get("head_sizes") or ()))
+            return
         rows = payload.get("buffer") if isinstance(payload, dict) else None
         if not isinstance(rows, list):
             return
-        for row in rows:
+        for row in rows[-self.capacity:]:
             if not isinstance(row, dict):
                 continue
-            self.buffer.append(
+            self.push(
                 GMZTransition(
                     state=np.asarray(row.get("state"), dtype=np.float32),
                     action=np.asarray(row.get("action"), dtype=np.int64),
@@ -148,3 +401,29 @@ class GumbelMuZeroReplayBuffer:
                     policy_version=int(row.get("policy_version", 0) or 0),
                 )
             )
+
+    def _load_columns(self, columns: dict[str, Any], head_sizes: tuple[int, ...]) -> None:
+        state = columns.get("state")
+        if state is None or len(state) == 0:
+            return
+        n = min(len(state), self.capacity)
+        tail = slice(len(state) - n, len(state))
+        state = np.asarray(state, dtype=np.float32)[tail]
+        action = np.asarray(columns["action"], dtype=np.int64)[tail]
+        self._allocate(state.shape[1], action.shape[1], head_sizes)
+        self._state[:n] = state
+        self._action[:n] = action
+        self._reward[:n] = np.asarray(columns["reward"], dtype=np.float32)[tail]
+        self._value[:n] = np.asarray(columns["value_target"], dtype=np.float32)[tail]
+        self._done[:n] = np.asarray(columns["done"], dtype=bool)[tail]
+        self._version[:n] = np.asarray(columns["policy_version"], dtype=np.int64)[tail]
+        self._target_version[:n] = np.asarray(columns.get("target_version", columns["policy_version"]), dtype=np.int64)[tail]
+        self._push_id[:n] = np.arange(1, n + 1)
+        self._pushes = n
+        self._policy[:n] = np.asarray(columns["policy_targets"], dtype=np.float32)[tail]
+        self._behavior[:n] = np.asarray(columns["behavior_logits"], dtype=np.float32)[tail]
+        self._has_behavior[:n] = np.asarray(columns["has_behavior"], dtype=bool)[tail]
+        self._legal[:n] = np.asarray(columns["legal_masks"], dtype=bool)[tail]
+        self._has_legal[:n] = np.asarray(columns["has_legal"], dtype=bool)[tail]
+        self.size = n
+        self.pos = n % self.capacity
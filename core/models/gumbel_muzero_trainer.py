@@ -227,31 +227,30 @@ def make_gmz_lr_scheduler(optimizer, config: GumbelMuZeroTrainConfig):
     return None
 
 
-def train_gumbel_muzero_step(
-    *,
-    net,
-    optimizer,
-    replay: GumbelMuZeroReplayBuffer,
-    config: GumbelMuZeroTrainConfig,
-    device: torch.device,
-    current_policy_version: int = 0,
-    scheduler=None,
-    ema_target=None,
-):
-    batch = replay.sample_unroll(
-        batch_size=int(config.batch_size),
-        unroll_steps=max(1, int(config.unroll_steps)),
-        max_policy_staleness_updates=int(getattr(config, "max_policy_staleness_updates", -1)),
-        current_policy_version=int(current_policy_version),
-    )
-    if not batch:
+def _unroll_arrays_from_batch(batch, net):
+    """Padded learner arrays from a :class:`GMZUnrollBatch` (slices, no per-step loops)."""
+    if batch is None or len(batch) == 0:
         return None
+    K = int(batch.actions.shape[2])
+    A_sizes = [int(net.action_sizes[h]) for h in range(K)]
+    if list(batch.head_sizes[:K]) != A_sizes:
+        raise ValueError(f"GMZ replay head sizes {list(batch.head_sizes)} != net action sizes {A_sizes}")
+    T_max = int(batch.lengths.max())
+    valid = batch.valid[:, :T_max]
+    return (
+        batch.states[:, :T_max],
+        batch.actions[:, :T_max],
+        batch.value_targets[:, :T_max],
+        batch.rewards[:, :T_max],
+        valid,
+        [batch.policy_targets[h][:, 0] for h in range(K)],
+        [batch.behavior_logits[h][:, :T_max] for h in range(K)],
+        batch.behavior_avail[:, :T_max] & valid,
+    )
 
-    tbptt_k = max(1, int(getattr(config, "tbptt_truncate", config.unroll_steps)))
-
-    _consistency_w = float(getattr(config, "consistency_loss_weight", 0.0))
-    _target_enc = (ema_target.target if ema_target is not None else net) if _consistency_w > 0.0 else None
 
+def _unroll_arrays_from_samples(batch, net, unroll: int):
+    """Same arrays from the list-of-dicts ``sample_unroll`` format."""
     # -------------------------------------------------------------------
     # Vectorised batch assembly: all samples padded to a common unroll
     # length T_max with a validity mask. One batched forward per unroll
@@ -262,8 +261,6 @@ def train_gumbel_muzero_step(
     if B == 0:
         return None
 
-    unroll = max(1, int(config.unroll_steps))
-    vtrace_full = bool(getattr(config, "vtrace_full", True))
     obs_dim = int(np.asarray(samples[0]["states"][0], dtype=np.float32).reshape(-1).shape[0])
     K = int(len(samples[0]["actions"][0]))
     A_sizes = [int(net.action_sizes[h]) for h in range(K)]
@@ -295,17 +292,56 @@ def train_gumbel_muzero_step(
             valid_np[b, t] = True
         for h in range(K):
             target0_np[h][b] = np.asarray(s_policies[0][h], dtype=np.float32).reshape(-1)[:A_sizes[h]]
-        if vtrace_full and len(beh_seq) >= 1:
-            for t in range(min(n, len(beh_seq))):
-                beh = beh_seq[t]
-                if not isinstance(beh, (list, tuple)) or len(beh) < K:
-                    continue
-                heads = [np.asarray(beh[h], dtype=np.float32).reshape(-1) for h in range(K)]
-                if any(heads[h].size != A_sizes[h] for h in range(K)):
-                    continue
-                for h in range(K):
-                    beh_np[h][b, t] = heads[h]
-                beh_avail_np[b, t] = True
+        for t in range(min(n, len(beh_seq))):
+            beh = beh_seq[t]
+            if not isinstance(beh, (list, tuple)) or len(beh) < K:
+                continue
+            heads = [np.asarray(beh[h], dtype=np.float32).reshape(-1) for h in range(K)]
+            if any(heads[h].size != A_sizes[h] for h in range(K)):
+                continue
+            for h in range(K):
+                beh_np[h][b, t] = heads[h]
+            beh_avail_np[b, t] = True
+    return states_np, actions_np, value_tg_np, rewards_np, valid_np, target0_np, beh_np, beh_avail_np
+
+
+def train_gumbel_muzero_step(
+    *,
+    net,
+    optimizer,
+    replay: GumbelMuZeroReplayBuffer,
+    config: GumbelMuZeroTrainConfig,
+    device: torch.device,
+    current_policy_version: int = 0,
+    scheduler=None,
+    ema_target=None,
+):
+    unroll = max(1, int(config.unroll_steps))
+    sample_kwargs = dict(
+        batch_size=int(config.batch_size),
+        unroll_steps=unroll,
+        max_policy_staleness_updates=int(getattr(config, "max_policy_staleness_updates", -1)),
+        current_policy_version=int(current_policy_version),
+    )
+    if hasattr(replay, "sample_unroll_batch"):
+        arrays = _unroll_arrays_from_batch(replay.sample_unroll_batch(**sample_kwargs), net)
+    else:
+        arrays = _unroll_arrays_from_samples(replay.sample_unroll(**sample_kwargs), net, unroll)
+    if arrays is None:
+        return None
+
+    tbptt_k = max(1, int(getattr(config, "tbptt_truncate", config.unroll_steps)))
+
+    _consistency_w = float(getattr(config, "consistency_loss_weight", 0.0))
+    _target_enc = (ema_target.target if ema_target is not None else net) if _consistency_w > 0.0 else None
+
+    vtrace_full = bool(getattr(config, "vtrace_full", True))
+    states_np, actions_np, value_tg_np, rewards_np, valid_np, target0_np, beh_np, beh_avail_np = arrays
+    if not vtrace_full:
+        beh_np = [np.zeros_like(x) for x in beh_np]
+        beh_avail_np = np.zeros_like(beh_avail_np)
+    B, T_max = valid_np.shape
+    K = len(target0_np)
 
     states_t = torch.as_tensor(states_np, device=device)
     actions_t = torch.as_tensor(actions_np, device=device)
@@ -2,8 +2,13 @@ from collections import namedtuple, deque
 import random
 import numpy as np
 import threading
+import torch
 
 Transition = namedtuple('Transition', ('state', 'action', 'next_state', 'reward', 'n_step', 'next_shoot_mask'))
+# Уже собранный батч для optimize_model: next_state/next_shoot_mask — только для non-final строк.
+TransitionBatch = namedtuple(
+    'TransitionBatch', ('state', 'action', 'reward', 'n_step', 'non_final_mask', 'next_state', 'next_shoot_mask')
+)
 
 
 def _to_cpu_if_tensor(value):
@@ -73,9 +78,7 @@ class ReplayMemory(object):
             }
 
     def load_state_dict(self, state):
-        if not isinstance(state, dict):
-            return 0
-        items = state.get("items")
+        items = replay_items_from_state(state)
         if not isinstance(items, list):
             return 0
         with self._lock:
@@ -87,174 +90,519 @@ class ReplayMemory(object):
         return len(self.memory)
 
 
+def _as_numpy(value, dtype):
+    if value is None:
+        return None
+    if hasattr(value, "detach") and hasattr(value, "cpu"):
+        value = value.detach().cpu().numpy()
+    return np.asarray(value, dtype=dtype).reshape(-1)
+
+
+def _put_row(column, slot, value):
+    # CPU-тензор отдаёт numpy-view без копии; запись в строку колонки — одна memcpy.
+    if isinstance(value, torch.Tensor):
+        value = value.detach()
+        if value.device.type != "cpu":
+            value = value.cpu()
+        value = value.numpy()
+    column[slot] = np.reshape(value, -1)
+
+
+class TransitionArrays(object):
+    """Preallocated column storage for DQN transitions (one row per slot).
+
+    Columns: state/next_state float32 ``[capacity, n_obs]``, action int64
+    ``[capacity, n_heads]``, reward/n_step float32, next_shoot_mask bool
+    ``[capacity, width]`` plus ``has_next``/``has_mask`` flags for ``None``.
+    Shapes are taken from the first pushed transition; the mask column is
+    allocated on the first non-None mask.  A mask of another width is stored
+    as ``None`` (optimize_model treats ``None`` as all-legal anyway).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.state = None
+        self.next_state = None
+        self.action = None
+        self.reward = np.zeros(self.capacity, dtype=np.float32)
+        self.n_step = np.zeros(self.capacity, dtype=np.float32)
+        self.has_next = np.zeros(self.capacity, dtype=bool)
+        self.mask = None
+        self.has_mask = np.zeros(self.capacity, dtype=bool)
+
+    @property
+    def allocated(self):
+        return self.state is not None
+
+    def _allocate(self, n_obs, n_heads):
+        self.state = np.zeros((self.capacity, int(n_obs)), dtype=np.float32)
+        self.next_state = np.zeros((self.capacity, int(n_obs)), dtype=np.float32)
+        self.action = np.zeros((self.capacity, int(n_heads)), dtype=np.int64)
+
+    def _allocate_mask(self, width):
+        self.mask = np.ones((self.capacity, int(width)), dtype=bool)
+
+    def write(self, slot, state, action, next_state, reward, n_step, next_shoot_mask):
+        if not self.allocated:
+            if state is None:
+                raise ValueError("TransitionArrays: первый transition без state — не из чего взять n_obs")
+            self._allocate(_as_numpy(state, np.float32).size, _as_numpy(action, np.int64).size)
+        if state is None:
+            self.state[slot] = 0.0
+        else:
+            _put_row(self.state, slot, state)
+        _put_row(self.action, slot, action)
+        self.has_next[slot] = next_state is not None
+        if next_state is not None:
+            _put_row(self.next_state, slot, next_state)
+        self.reward[slot] = float(reward.reshape(-1)[0]) if hasattr(reward, "reshape") else float(np.ravel(reward)[0])
+        self.n_step[slot] = float(n_step)
+        if next_shoot_mask is not None and self.mask is None:
+            self._allocate_mask(_as_numpy(next_shoot_mask, bool).size)
+        ok = next_shoot_mask is not None and int(np.prod(np.shape(next_shoot_mask))) == self.mask.shape[1]
+        self.has_mask[slot] = ok
+        if ok:
+            _put_row(self.mask, slot, next_shoot_mask)
+
+    def gather(self, indices):
+        """Batch of rows ``indices`` as CPU tensors (one fancy-index copy per column)."""
+        idx = np.asarray(indices, dtype=np.int64)
+        non_final = self.has_next[idx]
+        next_idx = idx[non_final]
+        next_mask = None
+        if self.mask is not None and next_idx.size:
+            mask = self.mask[next_idx]
+            mask[~self.has_mask[next_idx]] = True
+            next_mask = torch.from_numpy(mask)
+        return TransitionBatch(
+            state=torch.from_numpy(self.state[idx]),
+            action=torch.from_numpy(self.action[idx]),
+            reward=torch.from_numpy(self.reward[idx]),
+            n_step=torch.from_numpy(self.n_step[idx]),
+            non_final_mask=torch.from_numpy(non_final),
+            next_state=torch.from_numpy(self.next_state[next_idx]),
+            next_shoot_mask=next_mask,
+        )
+
+    def transition(self, slot):
+        """Row ``slot`` in the legacy ``Transition`` form (tensors shaped like push())."""
+        next_state = None
+        if self.has_next[slot]:
+            next_state = torch.from_numpy(self.next_state[slot].copy()).unsqueeze(0)
+        mask = None
+        if self.mask is not None and self.has_mask[slot]:
+            mask = torch.from_numpy(self.mask[slot].copy())
+        return Transition(
+            torch.from_numpy(self.state[slot].copy()).unsqueeze(0),
+            torch.from_numpy(self.action[slot].copy()).unsqueeze(0),
+            next_state,
+            torch.tensor([float(self.reward[slot])], dtype=torch.float32),
+            int(self.n_step[slot]),
+            mask,
+        )
+
+    def columns(self, order):
+        """Copies of all columns for rows ``order`` (for state_dict)."""
+        if not self.allocated:
+            return {}
+        out = {
+            "state": self.state[order],
+            "action": self.action[order],
+            "next_state": self.next_state[order],
+            "has_next": self.has_next[order],
+            "reward": self.reward[order],
+            "n_step": self.n_step[order],
+            "has_mask": self.has_mask[order],
+        }
+        if self.mask is not None:
+            out["mask"] = self.mask[order]
+        return out
+
+    def load_columns(self, cols):
+        """Fill rows ``0..n-1`` from ``columns()`` output; returns n."""
+        state = cols.get("state")
+        if state is None:
+            return 0
+        state = np.asarray(state, dtype=np.float32)
+        action = np.asarray(cols["action"], dtype=np.int64)
+        n = min(len(state), self.capacity)
+        state, action = state[-n:], action[-n:]
+        self._allocate(state.shape[1], action.shape[1])
+        self.state[:n] = state
+        self.action[:n] = action
+        self.next_state[:n] = np.asarray(cols["next_state"], dtype=np.float32)[-n:]
+        self.has_next[:n] = np.asarray(cols["has_next"], dtype=bool)[-n:]
+        self.reward[:n] = np.asarray(cols["reward"], dtype=np.float32)[-n:]
+        self.n_step[:n] = np.asarray(cols["n_step"], dtype=np.float32)[-n:]
+        self.has_mask[:n] = np.asarray(cols["has_mask"], dtype=bool)[-n:]
+        mask = cols.get("mask")
+        if mask is not None:
+            mask = np.asarray(mask, dtype=bool)[-n:]
+            self._allocate_mask(mask.shape[1])
+            self.mask[:n] = mask
+        return n
+
+
+class ArrayReplayMemory(object):
+    """Uniform replay over a ring of preallocated arrays (``ReplayMemory`` API).
+
+    ``push`` writes one row in place, ``sample_batch`` draws integer indices
+    and gathers ready-made batch tensors (``TransitionBatch``) for
+    ``optimize_model``; ``sample`` still returns ``Transition`` lists for
+    other callers.  ``state_dict`` stores the columns as arrays in insertion
+    order instead of a list of namedtuples; ``load_state_dict`` also accepts
+    the legacy ``{"items": [...]}`` format.  ``pushed`` counts every push
+    ever made, so ``replay_delta`` can hand out only rows added since a
+    given point (incremental checkpoints).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.data = TransitionArrays(self.capacity)
+        self.size = 0
+        self.pos = 0
+        self.pushed = 0
+        self._rng = np.random.default_rng()
+        self._lock = threading.Lock()
+        self._prefetch_thread = None
+        self._prefetch_result = None
+
+    def push(self, *args):
+        with self._lock:
+            self.data.write(self.pos, *args)
+            self.pos = (self.pos + 1) % self.capacity
+            self.pushed += 1
+            if self.size < self.capacity:
+                self.size += 1
+
+    def _sample_indices(self, batch_size):
+        batch_size = min(int(batch_size), self.size)
+        return self._rng.choice(self.size, size=batch_size, replace=False)
+
+    def _sample_batch_impl(self, batch_size):
+        with self._lock:
+            return self.data.gather(self._sample_indices(batch_size))
+
+    def sample_batch(self, batch_size, prefetch=False):
+        if not prefetch:
+            return self._sample_batch_impl(batch_size)
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            result = self._prefetch_result
+        else:
+            result = self._sample_batch_impl(batch_size)
+
+        def _worker():
+            self._prefetch_result = self._sample_batch_impl(batch_size)
+
+        self._prefetch_thread = threading.Thread(target=_worker, daemon=True)
+        self._prefetch_thread.start()
+        return result
+
+    def sample(self, batch_size, prefetch=False):
+        with self._lock:
+            return [self.data.transition(int(i)) for i in self._sample_indices(batch_size)]
+
+    def _ordered_slots(self):
+        # Хронологический порядок: от самой старой записи к самой новой.
+        if self.size < self.capacity:
+            return np.arange(self.size)
+        return (np.arange(self.size) + self.pos) % self.capacity
+
+    def __len__(self):
+        return self.size
+
+    def state_dict(self):
+        with self._lock:
+            return {
+                "type": "replay_arrays",
+                "capacity": int(self.capacity),
+                "pushed": int(self.pushed),
+                "columns": self.data.columns(self._ordered_slots()),
+            }
+
+    def replay_delta(self, since):
+        with self._lock:
+            return _replay_delta(self, since, {"type": "replay_arrays"})
+
+    def load_state_dict(self, state):
+        if not isinstance(state, dict):
+            return 0
+        columns = state.get("columns")
+        if isinstance(columns, dict):
+            with self._lock:
+                self.data = TransitionArrays(self.capacity)
+                self.size = self.data.load_columns(columns)
+                self.pos = self.size % self.capacity
+                self.pushed = _restored_pushed(state, self.size)
+            return self.size
+        items = state.get("items")
+        if not isinstance(items, list):
+            return 0
+        with self._lock:
+            self.data = TransitionArrays(self.capacity)
+            self.size = 0
+            self.pos = 0
+            self.pushed = 0
+        for item in items[-self.capacity:]:
+            transition = _normalize_transition_cpu(item)
+            if transition is not None:
+                self.push(*transition)
+        return self.size
+
+
+def _restored_pushed(state, size):
+    try:
+        return max(int(state.get("pushed", size)), int(size))
+    except (TypeError, ValueError):
+        return int(size)
+
+
+def _replay_delta(memory, since, meta):
+    """Body of ``replay_delta`` for ring memories (caller holds ``memory._lock``).
+
+    Rows pushed at or after ``since`` that are still in the ring, oldest
+    first, as ``(first_seq, columns, meta)``; ``meta`` gets ``pushed`` and
+    ``size`` (the ring holds sequence numbers ``pushed - size .. pushed - 1``).
+    """
+    count = max(0, min(int(memory.pushed) - int(since), int(memory.size)))
+    order = memory._ordered_slots()[memory.size - count:]
+    meta = dict(meta, capacity=int(memory.capacity), pushed=int(memory.pushed), size=int(memory.size))
+    return int(memory.pushed) - count, memory.data.columns(order) if count else {}, meta
+
+
+def replay_items_from_state(state):
+    """Legacy ``Transition`` list from either replay state_dict format."""
+    if not isinstance(state, dict):
+        return None
+    if isinstance(state.get("items"), list):
+        return state["items"]
+    columns = state.get("columns")
+    if not isinstance(columns, dict) or "state" not in columns:
+        return None
+    data = TransitionArrays(len(columns["state"]))
+    n = data.load_columns(columns)
+    return [data.transition(i) for i in range(n)]
+
+
 class PrioritizedReplayMemory(object):
+    """Proportional PER: sum-tree over ``alpha``-priorities, array-backed storage.
+
+    Transitions live in ``TransitionArrays`` (same columns as
+    ``ArrayReplayMemory``).  ``sample_batch`` descends the sum-tree for the
+    whole batch at once (one vectorized step per tree level) and returns
+    ``(TransitionBatch, indices, weights)``; ``sample`` keeps the old
+    ``(transitions, indices, weights)`` contract.  ``update_priorities``
+    writes all leaves of a batch and recomputes the touched parents level by
+    level.
+    """
+
     def __init__(self, capacity, alpha=0.6, eps=1e-6):
         self.capacity = capacity
         self.alpha = alpha
         self.eps = eps
-        self.memory = [None] * capacity
+        self.data = TransitionArrays(capacity)
         self.size = 0
         self.pos = 0
+        self.pushed = 0
         self.max_priority = 1.0
+        self._rng = np.random.default_rng()
         self._lock = threading.Lock()
         self._prefetch_thread = None
         self._prefetch_result = None
         self.tree_size = 1
+        self.tree_depth = 0
         while self.tree_size < capacity:
             self.tree_size <<= 1
+            self.tree_depth += 1
         self.sum_tree = np.zeros(2 * self.tree_size, dtype=np.float32)
-        self.min_tree = np.full(2 * self.tree_size, np.inf, dtype=np.float32)
 
-    def _start_async_prefetch(self, batch_size, beta):
+    def _start_async_prefetch(self, fn, *args):
+        key = (fn.__name__,) + args
+
         def _worker():
-            self._prefetch_result = self._sample_impl(batch_size, beta=beta)
+            self._prefetch_result = (key, fn(*args))
 
         self._prefetch_thread = threading.Thread(target=_worker, daemon=True)
         self._prefetch_thread.start()
 
+    def _prefetched(self, fn, *args):
+        result = None
+        if self._prefetch_thread is not None:
+            self._prefetch_thread.join()
+            key, ready = self._prefetch_result
+            # предвыборка годится только для того же метода и тех же аргументов
+            if key == (fn.__name__,) + args:
+                result = ready
+        if result is None:
+            result = fn(*args)
+        self._start_async_prefetch(fn, *args)
+        return result
+
     def _set_leaf(self, data_idx, priority_alpha):
-        leaf = data_idx + self.tree_size
-        self.sum_tree[leaf] = priority_alpha
-        self.min_tree[leaf] = priority_alpha
-        leaf //= 2
-        while leaf >= 1:
-            left = leaf * 2
-            right = left + 1
-            self.sum_tree[leaf] = self.sum_tree[left] + self.sum_tree[right]
-            self.min_tree[leaf] = min(self.min_tree[left], self.min_tree[right])
-            leaf //= 2
-
-    def _prefix_search(self, mass):
-        idx = 1
-        while idx < self.tree_size:
+        tree = self.sum_tree
+        node = data_idx + self.tree_size
+        tree[node] = priority_alpha
+        node >>= 1
+        while node >= 1:
+            tree[node] = tree[2 * node] + tree[2 * node + 1]
+            node >>= 1
+
+    def _set_leaves(self, data_indices, priorities_alpha):
+        """Batch leaf write; parents are recomputed once per level for unique nodes."""
+        tree = self.sum_tree
+        nodes = np.asarray(data_indices, dtype=np.int64) + self.tree_size
+        # при повторах индекса остаётся последнее значение — как в поэлементном цикле
+        tree[nodes] = priorities_alpha
+        nodes = np.unique(nodes >> 1)
+        for _ in range(self.tree_depth):
+            tree[nodes] = tree[2 * nodes] + tree[2 * nodes + 1]
+            nodes = np.unique(nodes >> 1)
+
+    def _prefix_search(self, masses):
+        """Leaf data-indices for an array of prefix masses (vectorized descent)."""
+        tree = self.sum_tree
+        masses = np.array(masses, dtype=np.float64, copy=True).reshape(-1)
+        idx = np.ones(masses.shape[0], dtype=np.int64)
+        for _ in range(self.tree_depth):
             left = idx * 2
-            if self.sum_tree[left] >= mass:
-                idx = left
-            else:
-                mass -= self.sum_tree[left]
-                idx = left + 1
+            left_sum = tree[left]
+            go_right = masses > left_sum
+            masses -= np.where(go_right, left_sum, 0.0)
+            idx = left + go_right
         return idx - self.tree_size
 
     def push(self, *args):
-        transition = Transition(*args)
         with self._lock:
-            self.memory[self.pos] = transition
+            self.data.write(self.pos, *args)
             priority_alpha = float(max(self.max_priority, self.eps)) ** self.alpha
             self._set_leaf(self.pos, priority_alpha)
             if self.size < self.capacity:
                 self.size += 1
             self.pos = (self.pos + 1) % self.capacity
+            self.pushed += 1
+
+    def _sample_indices(self, batch_size, beta):
+        """Stratified draw: one uniform mass per segment of the total priority."""
+        total = float(self.sum_tree[1])
+        if self.size == 0 or total <= 0.0:
+            return None, None
+        actual_batch = int(batch_size)
+        segment = total / actual_batch
+        masses = (np.arange(actual_batch) + self._rng.random(actual_batch)) * segment
+        indices = np.minimum(self._prefix_search(masses), self.size - 1)
+        probs = self.sum_tree[indices + self.tree_size].astype(np.float32) / total
+        probs = np.clip(probs, 1e-12, None)
+        weights = (self.size * probs) ** (-beta)
+        weights /= weights.max()
+        return indices, weights.astype(np.float32)
+
+    def _sample_batch_impl(self, batch_size, beta=0.4):
+        with self._lock:
+            indices, weights = self._sample_indices(batch_size, beta)
+            if indices is None:
+                return None, None, None
+            return self.data.gather(indices), indices, weights
 
     def _sample_impl(self, batch_size, beta=0.4):
         with self._lock:
-            if self.size == 0:
-                return [], [], []
-            total = float(self.sum_tree[1])
-            if total <= 0.0:
+            indices, weights = self._sample_indices(batch_size, beta)
+            if indices is None:
                 return [], [], []
+            samples = [self.data.transition(int(i)) for i in indices]
+            return samples, indices, weights
 
-            actual_batch = int(batch_size)
-            segment = total / actual_batch
-            indices = []
-            priorities_alpha = []
-            samples = []
-            for i in range(actual_batch):
-                a = segment * i
-                b = segment * (i + 1)
-                mass = random.uniform(a, b)
-                idx = self._prefix_search(mass)
-                if idx >= self.size:
-                    idx = self.size - 1
-                indices.append(idx)
-                p_alpha = float(self.sum_tree[idx + self.tree_size])
-                priorities_alpha.append(p_alpha)
-                samples.append(self.memory[idx])
-
-            probs = np.asarray(priorities_alpha, dtype=np.float32) / total
-            probs = np.clip(probs, 1e-12, None)
-            weights = (self.size * probs) ** (-beta)
-            weights /= weights.max()
-            return samples, np.asarray(indices, dtype=np.int64), weights.astype(np.float32)
+    def sample_batch(self, batch_size, beta=0.4, prefetch=False):
+        if not prefetch:
+            return self._sample_batch_impl(batch_size, beta)
+        return self._prefetched(self._sample_batch_impl, batch_size, beta)
 
     def sample(self, batch_size, beta=0.4, prefetch=False):
         if not prefetch:
             return self._sample_impl(batch_size, beta=beta)
-        if self._prefetch_thread is not None:
-            self._prefetch_thread.join()
-            result = self._prefetch_result
-        else:
-            result = self._sample_impl(batch_size, beta=beta)
-        self._start_async_prefetch(batch_size, beta=beta)
-        return result
+        return self._prefetched(self._sample_impl, batch_size, beta)
 
     def update_priorities(self, indices, priorities):
+        values = np.maximum(np.asarray(priorities, dtype=np.float64).reshape(-1), self.eps)
+        if values.size == 0:
+            return
         with self._lock:
-            for idx, priority in zip(indices, priorities):
-                value = float(priority)
-                if value < self.eps:
-                    value = self.eps
-                p_alpha = value ** self.alpha
-                self._set_leaf(int(idx), p_alpha)
-                if value > self.max_priority:
-                    self.max_priority = value
+            self._set_leaves(indices, (values ** self.alpha).astype(np.float32))
+            self.max_priority = max(self.max_priority, float(values.max()))
 
     def __len__(self):
         return self.size
 
+    def _ordered_slots(self):
+        if self.size < self.capacity:
+            return np.arange(self.size)
+        return (np.arange(self.size) + self.pos) % self.capacity
+
     def state_dict(self):
         with self._lock:
-            ordered_items = []
-            for idx in range(self.size):
-                item = self.memory[idx]
-                if item is not None:
-                    ordered_items.append(item)
-            priorities = []
-            for idx in range(self.size):
-                priorities.append(float(self.sum_tree[idx + self.tree_size]))
+            order = self._ordered_slots()
             return {
                 "type": "prioritized",
                 "capacity": int(self.capacity),
+                "pushed": int(self.pushed),
                 "alpha": float(self.alpha),
                 "eps": float(self.eps),
-                "items": ordered_items,
-                "priorities_alpha": priorities,
+                "columns": self.data.columns(order),
+                "priorities_alpha": self.sum_tree[order + self.tree_size].copy(),
                 "max_priority": float(self.max_priority),
             }
 
+    def replay_delta(self, since):
+        with self._lock:
+            meta = {
+                "type": "prioritized",
+                "alpha": float(self.alpha),
+                "eps": float(self.eps),
+                "priorities_alpha": self.sum_tree[self._ordered_slots() + self.tree_size].copy(),
+                "max_priority": float(self.max_priority),
+            }
+            return _replay_delta(self, since, meta)
+
     def load_state_dict(self, state):
         if not isinstance(state, dict):
             return 0
-        items = state.get("items")
-        priorities_alpha = state.get("priorities_alpha")
-        if not isinstance(items, list):
+        columns = state.get("columns")
+        items = None if isinstance(columns, dict) else replay_items_from_state(state)
+        if not isinstance(columns, dict) and not isinstance(items, list):
             return 0
         with self._lock:
-            self.memory = [None] * self.capacity
+            self.data = TransitionArrays(self.capacity)
             self.size = 0
             self.pos = 0
+            self.pushed = 0
             self.max_priority = 1.0
             self.sum_tree.fill(0.0)
-            self.min_tree.fill(np.inf)
 
-            max_items = min(len(items), self.capacity)
-            for idx in range(max_items):
-                item = items[idx]
-                transition = _normalize_transition_cpu(item)
-                if transition is None:
-                    continue
-                self.memory[idx] = transition
-                p_alpha = 1.0
-                if isinstance(priorities_alpha, list) and idx < len(priorities_alpha):
-                    try:
-                        p_alpha = float(priorities_alpha[idx])
-                    except (TypeError, ValueError):
-                        p_alpha = 1.0
-                if p_alpha <= 0.0:
-                    p_alpha = float(self.eps) ** float(self.alpha)
-                self._set_leaf(idx, p_alpha)
-                self.size += 1
+            if isinstance(columns, dict):
+                self.size = self.data.load_columns(columns)
+            else:
+                for item in items[:self.capacity]:
+                    transition = _normalize_transition_cpu(item)
+                    if transition is None:
+                        continue
+                    self.data.write(self.size, *transition)
+                    self.size += 1
+
+            p_alpha = np.ones(self.size, dtype=np.float32)
+            try:
+                saved = np.asarray(state.get("priorities_alpha", []), dtype=np.float32).reshape(-1)
+            except (TypeError, ValueError):
+                saved = np.zeros(0, dtype=np.float32)
+            if isinstance(columns, dict):
+                saved = saved[-self.size:] if self.size else saved[:0]
+            n_saved = min(saved.size, self.size)
+            p_alpha[:n_saved] = saved[:n_saved]
+            p_alpha[~(p_alpha > 0.0)] = float(self.eps) ** float(self.alpha)
+            if self.size:
+                self._set_leaves(np.arange(self.size), p_alpha)
 
             self.pos = self.size % self.capacity if self.capacity > 0 else 0
+            self.pushed = _restored_pushed(state, self.size)
             try:
                 self.max_priority = float(state.get("max_priority", 1.0))
             except (TypeError, ValueError):
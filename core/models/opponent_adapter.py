@@ -16,9 +16,9 @@ from core.models.alphazero_mcts import AlphaZeroFactorizedMCTS, MCTSConfig
 from core.models.alphazero_model import load_alphazero_state_dict, make_alphazero_net
 from core.models.gumbel_alphazero_search import build_gumbel_inference_search
 from core.models.gumbel_muzero_model import GumbelMuZeroNet
-from core.models.gumbel_muzero_search import GumbelMuZeroSearch, GumbelMuZeroSearchConfig
+from core.models.gumbel_muzero_search import BatchedGumbelMuZeroSearch, GumbelMuZeroSearch, GumbelMuZeroSearchConfig
 from core.models.PPO import load_actor_critic_state_dict, make_actor_critic, ppo_kwargs_from_env
-from core.models.utils import build_action_masks_by_head, build_shoot_action_mask, convertToDict, normalize_state_dict
+from core.models.utils import build_action_masks_by_head, build_shoot_action_mask, normalize_state_dict
 
 
 @dataclass(frozen=True)
@@ -88,80 +88,296 @@ def load_agent_opponent(*, agent_id: str, expected_contract: dict[str, Any] | No
     )
 
 
-def build_policy_fn(
+def _load_dqn_opponent_net(opponent: OpponentSpec, n_obs: int, n_actions: list[int]):
+    from core.models.DQN import infer_dqn_arch_from_state_dict, make_dqn
+
+    policy_state = normalize_state_dict(opponent.policy_state)
+    # Восстанавливаем арх (ensemble/dueling/слои/iqn/noisy) из самих весов —
+    # иначе ensemble>1 или dueling не совпадут и load_state_dict упадёт.
+    arch = infer_dqn_arch_from_state_dict(policy_state)
+    net = make_dqn(n_obs, n_actions, **arch).to(torch.device("cpu"))
+    net.load_state_dict(policy_state)
+    return net.eval()
+
+
+def _load_ppo_opponent_net(opponent: OpponentSpec, n_obs: int, n_actions: list[int]):
+    net = make_actor_critic(n_obs, n_actions, **ppo_kwargs_from_env()).to(torch.device("cpu"))
+    load_actor_critic_state_dict(net, normalize_state_dict(opponent.policy_state))
+    return net.eval()
+
+
+def _load_az_opponent_net(opponent: OpponentSpec, n_obs: int, n_actions: list[int]):
+    net = make_alphazero_net(n_obs, n_actions).to(torch.device("cpu"))
+    load_alphazero_state_dict(net, normalize_state_dict(opponent.policy_state))
+    return net.eval()
+
+
+def _load_gmz_opponent_net(opponent: OpponentSpec, n_obs: int, n_actions: list[int]):
+    net = GumbelMuZeroNet(
+        obs_dim=int(n_obs),
+        action_sizes=[int(x) for x in n_actions],
+        latent_dim=int(os.getenv("GMZ_LATENT_DIM", "256")),
+        hidden_dim=int(os.getenv("GMZ_HIDDEN_DIM", "256")),
+        action_embed_dim=int(os.getenv("GMZ_ACTION_EMBED_DIM", "64")),
+    ).to(torch.device("cpu"))
+    net.load_state_dict(normalize_state_dict(opponent.policy_state))
+    return net.eval()
+
+
+def _load_smz_opponent_net(opponent: OpponentSpec, n_obs: int, n_actions: list[int]):
+    from core.models.sampled_muzero_model import make_sampled_muzero_net
+
+    net = make_sampled_muzero_net(
+        obs_dim=int(n_obs),
+        action_sizes=[int(x) for x in n_actions],
+        latent_dim=int(os.getenv("SMZ_LATENT_DIM", "256")),
+        hidden_dim=int(os.getenv("SMZ_HIDDEN_DIM", "256")),
+        action_embed_dim=int(os.getenv("SMZ_ACTION_EMBED_DIM", "64")),
+    ).to(torch.device("cpu"))
+    net.load_state_dict(normalize_state_dict(opponent.policy_state))
+    return net.eval()
+
+
+def _muzero_opponent_mode(env_key: str) -> str:
+    mode = str(os.getenv(env_key, "search")).strip().lower() or "search"
+    return mode if mode in {"search", "greedy"} else "search"
+
+
+def _gmz_opponent_search_config() -> GumbelMuZeroSearchConfig:
+    return GumbelMuZeroSearchConfig(
+        num_simulations=max(1, int(os.getenv("GMZ_EVAL_OPPONENT_SIMS", os.getenv("GMZ_EVAL_SIMS", "32")))),
+        root_top_k=max(1, int(os.getenv("GMZ_EVAL_ROOT_TOP_K", "8"))),
+        temperature=float(os.getenv("GMZ_EVAL_OPPONENT_TEMPERATURE", os.getenv("GMZ_EVAL_TEMPERATURE", "0.10"))),
+    )
+
+
+def _smz_opponent_search_config():
+    from core.models.sampled_muzero_search import SampledMuZeroSearchConfig
+
+    return SampledMuZeroSearchConfig(
+        num_samples=max(
+            1, int(os.getenv("SMZ_EVAL_OPPONENT_NUM_SAMPLES", os.getenv("SMZ_EVAL_NUM_SAMPLES", "24")))
+        ),
+        temperature=float(os.getenv("SMZ_EVAL_OPPONENT_TEMPERATURE", os.getenv("SMZ_EVAL_TEMPERATURE", "0.10"))),
+        sample_temperature=float(
+            os.getenv("SMZ_EVAL_OPPONENT_SAMPLE_TEMPERATURE", os.getenv("SMZ_EVAL_SAMPLE_TEMPERATURE", "1.0"))
+        ),
+        prior_weight=0.0,
+        dedup=True,
+        discount=float(os.getenv("SMZ_DISCOUNT", "0.997")),
+    )
+
+
+def _az_opponent_is_greedy(algo: str) -> bool:
+    """AZ-оппонент без поиска (только net.infer) — как решает ветка AZ в build_policy_fn."""
+    if is_gumbel_az_algo(algo):
+        gaz_mode = str(os.getenv("GAZ_EVAL_OPPONENT_MODE", "gumbel")).strip().lower() or "gumbel"
+        return gaz_mode == "greedy"
+    az_mode = str(os.getenv("AZ_EVAL_OPPONENT_MODE", "mcts")).strip().lower() or "mcts"
+    return az_mode == "greedy"
+
+
+def _opponent_inference_dtype(dtype: str | None = None) -> torch.dtype:
+    key = str(dtype if dtype is not None else os.getenv("OPPONENT_INFERENCE_DTYPE", "float32")).strip().lower()
+    return torch.bfloat16 if key in {"bf16", "bfloat16"} else torch.float32
+
+
+def _stack_head_mask(masks_list: list, head_idx: int, size: int, *, require_any: bool) -> torch.Tensor:
+    """[N, size] bool; строка без маски (None / не тот размер / все False при require_any) = все True."""
+    out = torch.ones((len(masks_list), int(size)), dtype=torch.bool)
+    for row, masks in enumerate(masks_list):
+        if masks is None or head_idx >= len(masks) or masks[head_idx] is None:
+            continue
+        mask = torch.as_tensor(masks[head_idx], dtype=torch.bool).reshape(-1)
+        if mask.numel() != int(size) or (require_any and not bool(mask.any())):
+            continue
+        out[row] = mask
+    return out
+
+
+class OpponentBatchPolicy:
+    """Батч-инференс замороженного registry-оппонента сразу по нескольким средам.
+
+    ``policy(obs_list, masks_list) -> list[action_dict]`` — один forward (или один
+    батч-поиск для GMZ/SMZ) на все среды шага вместо N вызовов batch-of-one.
+    ``masks_list[i]`` — маски по головам для среды i в том же формате, что отдаёт
+    ``masks_for(env)`` (DQN смотрит только на shoot-маску, как прежний policy_fn).
+
+    ``dtype=bfloat16`` держит CPU-копию сети в bf16 (только сети без поиска);
+    задаётся аргументом или ``OPPONENT_INFERENCE_DTYPE``.
+    """
+
+    def __init__(self, *, algo: str, len_model: int, decide: Callable, mask_mode: str):
+        self.algo = str(algo)
+        self.len_model = int(len_model)
+        self._decide = decide
+        self._mask_mode = mask_mode
+
+    def masks_for(self, env) -> list:
+        if self._mask_mode == "shoot":
+            shoot_mask = build_shoot_action_mask(env, log_fn=None, debug=False)
+            return [None, None, shoot_mask]
+        return build_action_masks_by_head(env, self.len_model, log_fn=None, debug=False)
+
+    def __call__(self, obs_list: list, masks_list: list | None = None) -> list[dict]:
+        if not obs_list:
+            return []
+        if masks_list is None:
+            masks_list = [None] * len(obs_list)
+        obs_np = np.stack([_to_np_state(obs) for obs in obs_list], axis=0)
+        actions = np.asarray(self._decide(obs_np, list(masks_list)), dtype=np.int64)
+        return [action_tensor_to_dict(row[None, :], len_model=self.len_model) for row in actions]
+
+
+def build_policy_batch_fn(
     *,
-    env,
     len_model: int,
     opponent: OpponentSpec,
     deterministic: bool = True,
-) -> Callable[[Any], dict]:
+    dtype: str | None = None,
+) -> OpponentBatchPolicy:
     """
-    Возвращает policy_fn(obs)->action_dict для enemyTurn(..., policy_fn=...).
-    Делает кеширование сети в замыкании (CPU).
+    Батч-версия build_policy_fn для нескольких сред одного процесса (см. OpponentBatchPolicy).
+    AZ-оппонент с MCTS/Gumbel-поиском требует env на каждый вызов и не батчится — ValueError.
     """
     n_obs, n_actions = _parse_contract_sizes(opponent.contract)
     if n_obs <= 0 or not n_actions:
         raise ValueError(f"agent '{opponent.agent_id}' has invalid env_contract signatures.")
+    algo = str(opponent.algo)
+    cpu = torch.device("cpu")
+    net_dtype = _opponent_inference_dtype(dtype)
 
-    if opponent.algo == "dqn":
-        policy_state = normalize_state_dict(opponent.policy_state)
-        from core.models.DQN import infer_dqn_arch_from_state_dict, make_dqn
+    def _obs_tensor(obs_np: np.ndarray, target_dtype: torch.dtype = torch.float32) -> torch.Tensor:
+        return torch.as_tensor(obs_np, dtype=torch.float32, device=cpu).to(target_dtype)
 
-        # Восстанавливаем арх (ensemble/dueling/слои/iqn/noisy) из самих весов —
-        # иначе ensemble>1 или dueling не совпадут и load_state_dict упадёт.
-        arch = infer_dqn_arch_from_state_dict(policy_state)
-        net = make_dqn(n_obs, n_actions, **arch).to(torch.device("cpu"))
-        net.load_state_dict(policy_state)
-        net.eval()
+    if algo == "dqn":
+        net = _load_dqn_opponent_net(opponent, n_obs, n_actions).to(net_dtype)
 
-        def _policy_fn(obs_any) -> dict:
-            obs_np = _to_np_state(obs_any)
-            obs_t = torch.tensor(obs_np, dtype=torch.float32, device=torch.device("cpu")).unsqueeze(0)
-            with torch.no_grad():
-                decision = net(obs_t)
-            shoot_mask = build_shoot_action_mask(env, log_fn=None, debug=False)
-            action = []
+        @torch.inference_mode()
+        def _decide(obs_np, masks_list):
+            decision = net(_obs_tensor(obs_np, net_dtype))
+            heads = []
             for head_idx, head in enumerate(decision):
-                head_row = head.squeeze(0)
-                if head_idx == 2 and shoot_mask is not None:
-                    mask = torch.as_tensor(shoot_mask, dtype=torch.bool, device=head_row.device)
-                    if mask.numel() == head_row.numel() and bool(mask.any()):
-                        masked = head_row.clone()
-                        masked[~mask] = -1e9
-                        action.append(int(masked.argmax().item()))
-                        continue
-                action.append(int(head_row.argmax().item()))
-            action_dict = convertToDict(torch.tensor([action], device="cpu"))
-            for i_u in range(int(len_model)):
-                action_dict[f"move_num_{i_u}"] = int(action[6 + i_u])
-            return action_dict
+                logits = head.float()
+                mask = _stack_head_mask(masks_list, head_idx, logits.shape[1], require_any=True)
+                heads.append(logits.masked_fill(~mask, -1e9).argmax(dim=1))
+            return torch.stack(heads, dim=1).numpy()
 
-        return _policy_fn
+        return OpponentBatchPolicy(algo=algo, len_model=len_model, decide=_decide, mask_mode="shoot")
+
+    if algo == "ppo":
+        net = _load_ppo_opponent_net(opponent, n_obs, n_actions).to(net_dtype)
+
+        @torch.inference_mode()
+        def _decide(obs_np, masks_list):
+            masks = [_stack_head_mask(masks_list, h, size, require_any=False) for h, size in enumerate(n_actions)]
+            action_t, _logp_t, _val_t = net.act(
+                _obs_tensor(obs_np, net_dtype), masks_by_head=masks, deterministic=bool(deterministic)
+            )
+            return action_t.numpy()
+
+        return OpponentBatchPolicy(algo=algo, len_model=len_model, decide=_decide, mask_mode="heads")
+
+    greedy_net = None
+    if is_alphazero_net_algo(algo):
+        if not _az_opponent_is_greedy(algo):
+            raise ValueError(f"opponent algo '{algo}' in search mode needs env per call; use build_policy_fn.")
+        greedy_net = _load_az_opponent_net(opponent, n_obs, n_actions)
+    elif algo == "gumbel_muzero":
+        net = _load_gmz_opponent_net(opponent, n_obs, n_actions)
+        if _muzero_opponent_mode("GMZ_OPPONENT_MODE") == "greedy":
+            greedy_net = net
+        else:
+            search = BatchedGumbelMuZeroSearch(net=net, config=_gmz_opponent_search_config(), device=cpu)
+    elif algo == "sampled_muzero":
+        from core.models.sampled_muzero_search import BatchedSampledMuZeroSearch
+
+        net = _load_smz_opponent_net(opponent, n_obs, n_actions)
+        if _muzero_opponent_mode("SMZ_OPPONENT_MODE") == "greedy":
+            greedy_net = net
+        else:
+            search = BatchedSampledMuZeroSearch(net=net, config=_smz_opponent_search_config(), device=cpu)
+    else:
+        raise ValueError(f"Unsupported opponent algo: {algo}")
+
+    if greedy_net is not None:
+        greedy_net = greedy_net.to(net_dtype)
+        stochastic_eps = max(0.0, min(1.0, float(os.getenv("AZ_OPPONENT_STOCHASTIC_EPS", "0.10"))))
+        az_sampling = is_alphazero_net_algo(algo) and not bool(deterministic)
+
+        @torch.inference_mode()
+        def _decide(obs_np, masks_list):
+            masks = [_stack_head_mask(masks_list, h, size, require_any=False) for h, size in enumerate(n_actions)]
+            probs, _value = greedy_net.infer(_obs_tensor(obs_np, net_dtype), masks_by_head=masks)
+            probs = [p.float() for p in probs]
+            actions = torch.stack([p.argmax(dim=1) for p in probs], dim=1)
+            if az_sampling:
+                # Как в build_policy_fn: с вероятностью eps голова сэмплится из policy.
+                for row in range(actions.shape[0]):
+                    for h, p in enumerate(probs):
+                        if np.random.rand() < stochastic_eps:
+                            try:
+                                actions[row, h] = int(torch.multinomial(p[row], num_samples=1).item())
+                            except Exception:
+                                pass
+            return actions.numpy()
+
+        return OpponentBatchPolicy(algo=algo, len_model=len_model, decide=_decide, mask_mode="heads")
+
+    def _decide(obs_np, masks_list):
+        requests = []
+        for i, obs in enumerate(obs_np):
+            legal = [
+                _stack_head_mask([masks_list[i]], h, size, require_any=False)[0].numpy()
+                for h, size in enumerate(n_actions)
+            ]
+            requests.append({"env_id": i, "obs": obs, "legal_masks_by_head": legal})
+        results = search.run_batched_stateful(requests, deterministic=bool(deterministic))
+        if bool(deterministic):
+            return [[int(np.argmax(pi)) for pi in res["policy_targets"]] for res in results]
+        return [[int(x) for x in res["selected_actions"]] for res in results]
+
+    return OpponentBatchPolicy(algo=algo, len_model=len_model, decide=_decide, mask_mode="heads")
+
+
+def enemy_turns_batched(envs: list, policy_batch_fn: OpponentBatchPolicy, *, trunc: bool = True) -> None:
+    """enemyTurn по всем средам шага с одним батч-вызовом оппонента.
+
+    Пролог хода (begin_enemy_turn) идемпотентен, поэтому obs/маски собираются заранее,
+    а enemyTurn получает готовое действие своей среды.
+    """
+    obs_list = [env.begin_enemy_turn(trunc=trunc) for env in envs]
+    masks_list = [policy_batch_fn.masks_for(env) for env in envs]
+    actions = policy_batch_fn(obs_list, masks_list)
+    for env, action in zip(envs, actions):
+        env.enemyTurn(trunc=trunc, action=action)
+
+
+def build_policy_fn(
+    *,
+    env,
+    len_model: int,
+    opponent: OpponentSpec,
+    deterministic: bool = True,
+) -> Callable[[Any], dict]:
+    """
+    Возвращает policy_fn(obs)->action_dict для enemyTurn(..., policy_fn=...).
+    Делает кеширование сети в замыкании (CPU).
+    """
+    n_obs, n_actions = _parse_contract_sizes(opponent.contract)
+    if n_obs <= 0 or not n_actions:
+        raise ValueError(f"agent '{opponent.agent_id}' has invalid env_contract signatures.")
 
-    if opponent.algo == "ppo":
-        net = make_actor_critic(n_obs, n_actions, **ppo_kwargs_from_env()).to(torch.device("cpu"))
-        load_actor_critic_state_dict(net, normalize_state_dict(opponent.policy_state))
-        net.eval()
+    if opponent.algo in {"dqn", "ppo"}:
+        batch_policy = build_policy_batch_fn(len_model=int(len_model), opponent=opponent, deterministic=deterministic)
 
         def _policy_fn(obs_any) -> dict:
-            obs_np = _to_np_state(obs_any)
-            obs_t = torch.tensor(obs_np, dtype=torch.float32, device=torch.device("cpu")).unsqueeze(0)
-            masks_cpu = build_action_masks_by_head(env, int(len_model), log_fn=None, debug=False)
-            masks = [m.to(torch.device("cpu")).unsqueeze(0) for m in masks_cpu]
-            with torch.no_grad():
-                action_t, _logp_t, _val_t = net.act(obs_t, masks_by_head=masks, deterministic=bool(deterministic))
-            action_np = action_t.squeeze(0).detach().cpu().numpy().tolist()
-            action_dict = convertToDict(torch.tensor([action_np], device="cpu"))
-            for i_u in range(int(len_model)):
-                action_dict[f"move_num_{i_u}"] = int(action_np[6 + i_u])
-            return action_dict
+            return batch_policy([obs_any], [batch_policy.masks_for(env)])[0]
 
         return _policy_fn
 
     if is_alphazero_net_algo(opponent.algo):
-        net = make_alphazero_net(n_obs, n_actions).to(torch.device("cpu"))
-        load_alphazero_state_dict(net, normalize_state_dict(opponent.policy_state))
-        net.eval()
+        net = _load_az_opponent_net(opponent, n_obs, n_actions)
         az_eval_mode = str(os.getenv("AZ_EVAL_OPPONENT_MODE", "mcts")).strip().lower() or "mcts"
         if az_eval_mode not in {"greedy", "mcts"}:
             az_eval_mode = "mcts"
@@ -253,40 +469,9 @@ def build_policy_fn(
         return _policy_fn
 
     if opponent.algo == "gumbel_muzero":
-        net = GumbelMuZeroNet(
-            obs_dim=int(n_obs),
-            action_sizes=[int(x) for x in n_actions],
-            latent_dim=int(os.getenv("GMZ_LATENT_DIM", "256")),
-            hidden_dim=int(os.getenv("GMZ_HIDDEN_DIM", "256")),
-            action_embed_dim=int(os.getenv("GMZ_ACTION_EMBED_DIM", "64")),
-        ).to(torch.device("cpu"))
-        net.load_state_dict(normalize_state_dict(opponent.policy_state))
-        net.eval()
-        gmz_mode = str(os.getenv("GMZ_OPPONENT_MODE", "search")).strip().lower() or "search"
-        if gmz_mode not in {"search", "greedy"}:
-            gmz_mode = "search"
-        search = GumbelMuZeroSearch(
-            net=net,
-            config=GumbelMuZeroSearchConfig(
-                num_simulations=max(
-                    1,
-                    int(
-                        os.getenv(
-                            "GMZ_EVAL_OPPONENT_SIMS",
-                            os.getenv("GMZ_EVAL_SIMS", "32"),
-                        )
-                    ),
-                ),
-                root_top_k=max(1, int(os.getenv("GMZ_EVAL_ROOT_TOP_K", "8"))),
-                temperature=float(
-                    os.getenv(
-                        "GMZ_EVAL_OPPONENT_TEMPERATURE",
-                        os.getenv("GMZ_EVAL_TEMPERATURE", "0.10"),
-                    )
-                ),
-            ),
-            device=torch.device("cpu"),
-        )
+        net = _load_gmz_opponent_net(opponent, n_obs, n_actions)
+        gmz_mode = _muzero_opponent_mode("GMZ_OPPONENT_MODE")
+        search = GumbelMuZeroSearch(net=net, config=_gmz_opponent_search_config(), device=torch.device("cpu"))
 
         def _policy_fn(obs_any) -> dict:
             obs_np = _to_np_state(obs_any)
@@ -312,51 +497,11 @@ def build_policy_fn(
         return _policy_fn
 
     if opponent.algo == "sampled_muzero":
-        from core.models.sampled_muzero_model import make_sampled_muzero_net
-        from core.models.sampled_muzero_search import SampledMuZeroSearch, SampledMuZeroSearchConfig
-
-        net = make_sampled_muzero_net(
-            obs_dim=int(n_obs),
-            action_sizes=[int(x) for x in n_actions],
-            latent_dim=int(os.getenv("SMZ_LATENT_DIM", "256")),
-            hidden_dim=int(os.getenv("SMZ_HIDDEN_DIM", "256")),
-            action_embed_dim=int(os.getenv("SMZ_ACTION_EMBED_DIM", "64")),
-        ).to(torch.device("cpu"))
-        net.load_state_dict(normalize_state_dict(opponent.policy_state))
-        net.eval()
-        smz_mode = str(os.getenv("SMZ_OPPONENT_MODE", "search")).strip().lower() or "search"
-        if smz_mode not in {"search", "greedy"}:
-            smz_mode = "search"
-        search = SampledMuZeroSearch(
-            net=net,
-            config=SampledMuZeroSearchConfig(
-                num_samples=max(
-                    1,
-                    int(
-                        os.getenv(
-                            "SMZ_EVAL_OPPONENT_NUM_SAMPLES",
-                            os.getenv("SMZ_EVAL_NUM_SAMPLES", "24"),
-                        )
-                    ),
-                ),
-                temperature=float(
-                    os.getenv(
-                        "SMZ_EVAL_OPPONENT_TEMPERATURE",
-                        os.getenv("SMZ_EVAL_TEMPERATURE", "0.10"),
-                    )
-                ),
-                sample_temperature=float(
-                    os.getenv(
-                        "SMZ_EVAL_OPPONENT_SAMPLE_TEMPERATURE",
-                        os.getenv("SMZ_EVAL_SAMPLE_TEMPERATURE", "1.0"),
-                    )
-                ),
-                prior_weight=0.0,
-                dedup=True,
-                discount=float(os.getenv("SMZ_DISCOUNT", "0.997")),
-            ),
-            device=torch.device("cpu"),
-        )
+        from core.models.sampled_muzero_search import SampledMuZeroSearch
+
+        net = _load_smz_opponent_net(opponent, n_obs, n_actions)
+        smz_mode = _muzero_opponent_mode("SMZ_OPPONENT_MODE")
+        search = SampledMuZeroSearch(net=net, config=_smz_opponent_search_config(), device=torch.device("cpu"))
 
         def _policy_fn(obs_any) -> dict:
             obs_np = _to_np_state(obs_any)
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import json
+import os
+import queue
+import threading
+import uuid
+from typing import Any, Callable
+
+import numpy as np
+
+from core.engine.game_io import append_train_agent_log
+
+# Инкрементальный чекпойнт replay buffer DQN.
+#
+# Сети/оптимизатор по-прежнему пишутся в checkpoint_*.pth синхронно, а replay — отдельно:
+#   <run>/replay/chunk-<session>-<start>-<end>.npz  строки, добавленные с прошлого чекпойнта
+#                                                   (колонки TransitionArrays, без сжатия)
+#   <run>/replay/prio-<session>-<pushed>.npy        приоритеты всего кольца (только PER)
+#   checkpoint_*.replay.json                        manifest: из каких чанков состоит буфер
+# В .pth вместо "replay_memory" кладётся "replay_manifest" — имя manifest относительно папки
+# чекпойнта (resolve_replay_manifest), так что run-папку можно переносить целиком.
+# Номер строки — значение счётчика memory.pushed в момент push; чанк покрывает [start, end).
+# На потоке обучения остаётся только копия новых строк под локом буфера (replay_delta);
+# файлы пишет фоновый поток строго по очереди, manifest — последним и атомарно, поэтому
+# существующий manifest всегда ссылается на уже записанные чанки.
+# Чанки, целиком вытесненные из кольца, удаляются только когда на них не ссылается ни один
+# *.replay.json в папках чекпойнтов этого writer (best_eval_checkpoint, старые checkpoint_ep*):
+# manifest живёт, пока лежит рядом со своим .pth — удаляйте их вместе.
+# DQN_REPLAY_CHECKPOINT=inline возвращает весь буфер внутрь .pth.
+
+REPLAY_MANIFEST_FORMAT = "replay_chunks"
+REPLAY_MANIFEST_VERSION = 1
+_KEEP_PRIORITY_SNAPSHOTS = 4
+
+
+def replay_checkpoint_mode() -> str:
+    """incremental — чанки + manifest в фоне (по умолчанию); inline — весь буфер в .pth (как раньше)."""
+    mode = str(os.getenv("DQN_REPLAY_CHECKPOINT", "incremental")).strip().lower()
+    return mode if mode in {"incremental", "inline"} else "incremental"
+
+
+def replay_manifest_path_for(checkpoint_path: str) -> str:
+    return os.path.splitext(str(checkpoint_path))[0] + ".replay.json"
+
+
+def resolve_replay_manifest(checkpoint_path: str, stored: str) -> str:
+    """Путь manifest из поля .pth: относительный — от папки чекпойнта.
+
+    Старые чекпойнты хранят путь как есть (от cwd обучения); если по нему ничего нет —
+    берём manifest рядом с самим чекпойнтом.
+    """
+    checkpoint_dir = os.path.dirname(os.path.abspath(checkpoint_path))
+    candidates = [_resolve(str(stored), checkpoint_dir), str(stored), replay_manifest_path_for(checkpoint_path)]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return candidates[0]
+
+
+def _replace_atomic(tmp_path: str, final_path: str) -> None:
+    try:
+        os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_npz(path: str, arrays: dict[str, np.ndarray]) -> None:
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as fh:
+        np.savez(fh, **arrays)
+    _replace_atomic(tmp_path, path)
+
+
+def _write_npy(path: str, array: np.ndarray) -> None:
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as fh:
+        np.save(fh, array)
+    _replace_atomic(tmp_path, path)
+
+
+def _write_json(path: str, payload: dict) -> None:
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(payload, fh, ensure_ascii=False, indent=1)
+        fh.flush()
+        os.fsync(fh.fileno())
+    _replace_atomic(tmp_path, path)
+
+
+def _rel(path: str, start_dir: str) -> str:
+    try:
+        return os.path.relpath(path, start_dir).replace("\\", "/")
+    except ValueError:
+        # Windows: другой диск — относительного пути нет.
+        return os.path.abspath(path).replace("\\", "/")
+
+
+def _resolve(path: str, manifest_dir: str) -> str:
+    return path if os.path.isabs(path) else os.path.normpath(os.path.join(manifest_dir, path))
+
+
+def read_replay_manifest(manifest_path: str) -> dict:
+    with open(manifest_path, encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if not isinstance(manifest, dict) or manifest.get("format") != REPLAY_MANIFEST_FORMAT:
+        raise ValueError(f"не replay manifest: {manifest_path}")
+    return manifest
+
+
+class ReplayCheckpointWriter:
+    """Background writer of replay chunks + manifests for one run directory.
+
+    ``snapshot(memory, checkpoint_path)`` is called on the training thread
+    next to ``torch.save``: it copies the rows pushed since the previous
+    snapshot and queues the chunk/manifest write; the returned dict goes into
+    the checkpoint payload.  ``flush()`` waits for the queue (call it before
+    exiting), ``adopt()`` continues the chunk chain of a resumed manifest.
+    Chunks that left the ring are removed once no manifest next to this
+    writer's checkpoints references them.
+    """
+
+    def __init__(self, chunk_dir: str, *, log: Callable[[str], None] | None = None) -> None:
+        self.chunk_dir = str(chunk_dir)
+        self._session = uuid.uuid4().hex[:8]
+        self._log = log or append_train_agent_log
+        self._since = 0
+        self._chunks: list[dict] = []  # {"path": абсолютный, "start", "end"}
+        self._priority_files: list[str] = []
+        # только поток записи: вытесненные файлы, которые ещё держит какой-нибудь manifest
+        self._pending_delete: set[str] = set()
+        self._manifest_dirs: set[str] = set()
+        self._jobs: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self.errors = 0
+
+    def adopt(self, manifest_path: str) -> None:
+        manifest = read_replay_manifest(manifest_path)
+        manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+        self._chunks = [
+            {"path": _resolve(str(c["file"]), manifest_dir), "start": int(c["start"]), "end": int(c["end"])}
+            for c in manifest.get("chunks", [])
+        ]
+        self._since = int(manifest.get("pushed", 0))
+
+    def snapshot(self, memory: Any, checkpoint_path: str) -> dict:
+        if replay_checkpoint_mode() == "inline" or not hasattr(memory, "replay_delta"):
+            return {"replay_memory": memory.state_dict()}
+        if int(getattr(memory, "pushed", 0)) < self._since:
+            # буфер перезагрузили/очистили — старая цепочка чанков к нему не относится
+            self._since = 0
+            self._chunks = []
+        first, columns, meta = memory.replay_delta(self._since)
+        pushed = int(meta.pop("pushed"))
+        window_start = pushed - int(meta["size"])
+        new_chunk = None
+        if columns:
+            name = f"chunk-{self._session}-{first}-{pushed}.npz"
+            new_chunk = {"path": os.path.join(self.chunk_dir, name), "start": int(first), "end": pushed}
+            self._chunks.append(new_chunk)
+        stale = [c["path"] for c in self._chunks if c["end"] <= window_start]
+        self._chunks = [c for c in self._chunks if c["end"] > window_start]
+        self._since = pushed
+
+        priorities = meta.pop("priorities_alpha", None)
+        priority_path = None
+        if priorities is not None:
+            priority_path = os.path.join(self.chunk_dir, f"prio-{self._session}-{pushed}.npy")
+            self._priority_files.append(priority_path)
+            while len(self._priority_files) > _KEEP_PRIORITY_SNAPSHOTS:
+                stale.append(self._priority_files.pop(0))
+
+        manifest_path = replay_manifest_path_for(checkpoint_path)
+        manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+        manifest = {
+            "format": REPLAY_MANIFEST_FORMAT,
+            "version": REPLAY_MANIFEST_VERSION,
+            **meta,
+            "pushed": pushed,
+            "chunks": [{"file": _rel(c["path"], manifest_dir), "start": c["start"], "end": c["end"]} for c in self._chunks],
+            "priorities": _rel(priority_path, manifest_dir) if priority_path else None,
+        }
+        self._submit((new_chunk, columns, priority_path, priorities, manifest_path, manifest, stale))
+        return {"replay_manifest": os.path.basename(manifest_path), "replay_pushed": pushed}
+
+    def _submit(self, job: tuple) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="replay-ckpt", daemon=True)
+            self._thread.start()
+        self._jobs.put(job)
+
+    def _run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            try:
+                if job is None:
+                    return
+                self._write(*job)
+            except Exception as exc:
+                self.errors += 1
+                self._log(f"[REPLAY][CKPT][WARN] не удалось записать replay чекпойнт. Детали: {exc}")
+            finally:
+                self._jobs.task_done()
+
+    def _write(self, chunk, columns, priority_path, priorities, manifest_path, manifest, stale) -> None:
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        if chunk is not None:
+            _write_npz(chunk["path"], columns)
+        if priority_path is not None:
+            _write_npy(priority_path, priorities)
+        manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        _write_json(manifest_path, manifest)
+        self._manifest_dirs.add(manifest_dir)
+        own_dir = os.path.abspath(self.chunk_dir)
+        # чужие чанки (унаследованные через adopt из другого run) не трогаем
+        self._pending_delete.update(
+            os.path.abspath(path) for path in stale if os.path.dirname(os.path.abspath(path)) == own_dir
+        )
+        if not self._pending_delete:
+            return
+        referenced: set[str] = set()
+        for directory in self._manifest_dirs:
+            refs = _referenced_replay_files(directory)
+            if refs is None:
+                return
+            referenced |= refs
+        for path in sorted(self._pending_delete - referenced):
+            if os.path.exists(path):
+                os.remove(path)
+            self._pending_delete.discard(path)
+
+    def flush(self) -> None:
+        self._jobs.join()
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._jobs.put(None)
+            self._thread.join()
+        self._thread = None
+
+
+def _referenced_replay_files(manifest_dir: str) -> set[str] | None:
+    """Чанки/priority-файлы, на которые ссылаются manifest в папке; None — manifest не читается."""
+    referenced: set[str] = set()
+    for name in os.listdir(manifest_dir):
+        if not name.endswith(".replay.json"):
+            continue
+        try:
+            manifest = read_replay_manifest(os.path.join(manifest_dir, name))
+            files = [str(c["file"]) for c in manifest.get("chunks", [])]
+        except (OSError, ValueError, KeyError, TypeError):
+            # лучше подержать лишний чанк, чем сломать чекпойнт, который не удалось прочитать
+            return None
+        if manifest.get("priorities"):
+            files.append(str(manifest["priorities"]))
+        referenced.update(os.path.abspath(_resolve(f, manifest_dir)) for f in files)
+    return referenced
+
+
+def _concat_columns(parts: list[dict]) -> dict[str, np.ndarray]:
+    mask_width = next((p["mask"].shape[1] for p in parts if "mask" in p), None)
+    out: dict[str, np.ndarray] = {}
+    for name in parts[0]:
+        if name != "mask":
+            out[name] = np.concatenate([p[name] for p in parts])
+    if mask_width is not None:
+        # маска выделяется на первом не-None push: в ранних чанках её может не быть (has_mask=False)
+        out["mask"] = np.concatenate([
+            p["mask"] if "mask" in p else np.ones((len(p["state"]), mask_width), dtype=bool) for p in parts
+        ])
+    return out
+
+
+def load_replay_manifest(manifest_path: str, memory: Any) -> tuple[int, list[str]]:
+    """Fill ``memory`` from a manifest; returns ``(rows loaded, missing chunk files)``."""
+    manifest = read_replay_manifest(manifest_path)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    pushed = int(manifest.get("pushed", 0))
+    window_start = pushed - int(manifest.get("size", 0))
+    parts: list[dict] = []
+    seqs: list[np.ndarray] = []
+    missing: list[str] = []
+    for chunk in manifest.get("chunks", []):
+        path = _resolve(str(chunk["file"]), manifest_dir)
+        if not os.path.isfile(path):
+            missing.append(path)
+            continue
+        start, end = int(chunk["start"]), int(chunk["end"])
+        keep = slice(max(0, window_start - start), end - start)
+        with np.load(path) as data:
+            parts.append({name: data[name][keep] for name in data.files})
+        seqs.append(np.arange(start, end)[keep])
+    if not parts:
+        return 0, missing
+
+    state: dict[str, Any] = {
+        "type": manifest.get("type"),
+        "capacity": manifest.get("capacity"),
+        "pushed": pushed,
+        "columns": _concat_columns(parts),
+    }
+    priorities_file = manifest.get("priorities")
+    if priorities_file:
+        path = _resolve(str(priorities_file), manifest_dir)
+        if os.path.isfile(path):
+            saved = np.load(path)
+            state["priorities_alpha"] = saved[np.concatenate(seqs) - window_start]
+        else:
+            missing.append(path)
+        state["max_priority"] = manifest.get("max_priority", 1.0)
+    return int(memory.load_state_dict(state) or 0), missing
@@ -367,50 +367,72 @@ def optimize_model(
         return torch.as_tensor(value, dtype=dtype)
 
     sample_start = perf_counter()
-    if per_enabled:
+    array_batch = None
+    if per_enabled and hasattr(memory, "sample_batch"):
+        array_batch, indices, weights = memory.sample_batch(BATCH_SIZE, beta=per_beta, prefetch=prefetch)
+        if array_batch is None:
+            return None
+    elif per_enabled:
         transitions, indices, weights = memory.sample(BATCH_SIZE, beta=per_beta, prefetch=prefetch)
         if not transitions:
             return None
+    elif hasattr(memory, "sample_batch"):
+        # Array-backed replay: батч уже собран из непрерывных массивов.
+        array_batch = memory.sample_batch(BATCH_SIZE, prefetch=prefetch)
+        indices = None
+        weights = None
     else:
         transitions = memory.sample(BATCH_SIZE, prefetch=prefetch)
         indices = None
         weights = None
     sample_time = perf_counter() - sample_start
-    batch = Transition(*zip(*transitions))
+    if array_batch is not None:
+        state_batch = _to_device_batch(array_batch.state)  # [B, n_obs]
+        action_batch = _to_device_batch(array_batch.action).long()
+        reward_batch = _to_device_batch(array_batch.reward).float().view(-1)  # [B]
+        n_step_batch = _to_device_batch(array_batch.n_step)  # [B]
+        non_final_mask = _to_device_batch(array_batch.non_final_mask)
+        non_final_next_states = None
+        non_final_next_shoot_masks = None
+        if non_final_mask.any():
+            non_final_next_states = _to_device_batch(array_batch.next_state)
+            non_final_next_shoot_masks = array_batch.next_shoot_mask
+    else:
+        batch = Transition(*zip(*transitions))
 
-    desired_shape = (1, n_obs)
+        desired_shape = (1, n_obs)
 
-    # ---- state_batch ----
-    state_tensors_cpu = []
-    for s in batch.state:
-        if s is None:
-            state_tensors_cpu.append(torch.zeros(desired_shape, device="cpu", dtype=torch.float32))
-        else:
-            state_tensors_cpu.append(_as_cpu_tensor(s, dtype=torch.float32).reshape(desired_shape))
-    state_batch = _to_device_batch(torch.cat(state_tensors_cpu, dim=0))  # [B, n_obs]
-
-    # ---- action_batch / reward_batch (на тот же dev!) ----
-    action_tensors_cpu = [_as_cpu_tensor(a, dtype=torch.long).reshape(1, -1) for a in batch.action]
-    reward_tensors_cpu = [_as_cpu_tensor(r, dtype=torch.float32).reshape(-1) for r in batch.reward]
-    action_batch = _to_device_batch(torch.cat(action_tensors_cpu, dim=0)).long()  # индексы ОБЯЗАТЕЛЬНО long и на dev
-    reward_batch = _to_device_batch(torch.cat(reward_tensors_cpu, dim=0)).float().view(-1)  # [B]
-    n_step_batch = _to_device_batch(torch.as_tensor(batch.n_step, dtype=torch.float32))  # [B]
-
-    # ---- next states ----
-    non_final_mask = _to_device_batch(torch.as_tensor([s is not None for s in batch.next_state], dtype=torch.bool))
-
-    non_final_next_states = None
-    non_final_next_shoot_masks = None
-    if non_final_mask.any():
-        non_final_next_states = _to_device_batch(
-            torch.cat(
-                [_as_cpu_tensor(s, dtype=torch.float32).reshape(desired_shape) for s in batch.next_state if s is not None],
-                dim=0,
+        # ---- state_batch ----
+        state_tensors_cpu = []
+        for s in batch.state:
+            if s is None:
+                state_tensors_cpu.append(torch.zeros(desired_shape, device="cpu", dtype=torch.float32))
+            else:
+                state_tensors_cpu.append(_as_cpu_tensor(s, dtype=torch.float32).reshape(desired_shape))
+        state_batch = _to_device_batch(torch.cat(state_tensors_cpu, dim=0))  # [B, n_obs]
+
+        # ---- action_batch / reward_batch (на тот же dev!) ----
+        action_tensors_cpu = [_as_cpu_tensor(a, dtype=torch.long).reshape(1, -1) for a in batch.action]
+        reward_tensors_cpu = [_as_cpu_tensor(r, dtype=torch.float32).reshape(-1) for r in batch.reward]
+        action_batch = _to_device_batch(torch.cat(action_tensors_cpu, dim=0)).long()  # индексы ОБЯЗАТЕЛЬНО long и на dev
+        reward_batch = _to_device_batch(torch.cat(reward_tensors_cpu, dim=0)).float().view(-1)  # [B]
+        n_step_batch = _to_device_batch(torch.as_tensor(batch.n_step, dtype=torch.float32))  # [B]
+
+        # ---- next states ----
+        non_final_mask = _to_device_batch(torch.as_tensor([s is not None for s in batch.next_state], dtype=torch.bool))
+
+        non_final_next_states = None
+        non_final_next_shoot_masks = None
+        if non_final_mask.any():
+            non_final_next_states = _to_device_batch(
+                torch.cat(
+                    [_as_cpu_tensor(s, dtype=torch.float32).reshape(desired_shape) for s in batch.next_state if s is not None],
+                    dim=0,
+                )
             )
-        )
-        non_final_next_shoot_masks = [
-            m for m, s in zip(batch.next_shoot_mask, batch.next_state) if s is not None
-        ]
+            non_final_next_shoot_masks = [
+                m for m, s in zip(batch.next_shoot_mask, batch.next_state) if s is not None
+            ]
 
     def _gather_selected_q(head_outputs, actions):
         arr_local = []
@@ -421,6 +443,8 @@ def optimize_model(
     def _build_shoot_mask(mask_source, width):
         if mask_source is None:
             return None
+        if torch.is_tensor(mask_source):
+            return mask_source.to(device=dev, dtype=torch.bool)
         mask_list = []
         for m in mask_source:
             if m is None:
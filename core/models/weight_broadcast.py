@@ -0,0 +1,338 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import socket
+import struct
+import threading
+import time
+from typing import Any, Callable
+
+import numpy as np
+import torch
+
+# Канал весов learner → акторы / inference-серверы без torch.save/torch.load.
+#
+# Рядом с latest_*.pth лежит latest_*.wbuf — плоский буфер параметров, который learner
+# отображает в память (mmap) и переписывает на месте. Формат (little-endian):
+#   заголовок  MAGIC(4) | version:u16 | pad:u16 | seq:u64 | manifest_len:u32 | meta_cap:u32 | data_offset:u64 | data_len:u64
+#   manifest   json: host, layout (name, dtype, shape, offset, nbytes)
+#   meta       u32 длина + json (optimize_steps / policy_version / ...), внутри seqlock
+#   data       сырые байты тензоров, выровненные на 64
+# Seqlock: писатель делает seq нечётным, копирует meta+data, делает seq чётным. Читатель копирует
+# meta+data в свой буфер и принимает снимок, только если seq до и после совпал и чётный.
+# Смена раскладки (другие формы/dtype) — новый файл через os.replace; читатель замечает по inode.
+#
+# .pth остаётся запасным каналом: для ПК2/удалённого inference (SMB — mmap между машинами не
+# когерентен) и для WEIGHT_BROADCAST_MODE=file. Читатель на другой машине (host в manifest)
+# всегда идёт в .pth.
+
+WBUF_MAGIC = b"WBUF"
+WBUF_VERSION = 1
+_HEADER = struct.Struct("<4sHHQIIQQ")
+_SEQ_OFFSET = 8
+_SEQ = struct.Struct("<Q")
+_META_LEN = struct.Struct("<I")
+_ALIGN = 64
+_META_CAP = 4096
+
+
+def broadcast_path_for(sync_path: str) -> str:
+    return os.path.splitext(str(sync_path))[0] + ".wbuf"
+
+
+def weight_broadcast_mode() -> str:
+    """auto — mmap + .pth (каждый раз при удалённых потребителях, иначе не чаще WEIGHT_BROADCAST_FILE_EVERY_S);
+    mmap — только mmap; file — только .pth (как раньше)."""
+    mode = str(os.getenv("WEIGHT_BROADCAST_MODE", "auto")).strip().lower()
+    return mode if mode in {"auto", "mmap", "file"} else "auto"
+
+
+def _align(value: int) -> int:
+    return (int(value) + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+
+def _layout_for(state_dict: dict) -> list[dict]:
+    layout = []
+    offset = 0
+    for name, tensor in state_dict.items():
+        nbytes = int(tensor.numel()) * int(tensor.element_size())
+        layout.append({
+            "name": str(name),
+            "dtype": _dtype_name(tensor.dtype),
+            "shape": [int(v) for v in tensor.shape],
+            "offset": offset,
+            "nbytes": nbytes,
+        })
+        offset = _align(offset + nbytes)
+    return layout
+
+
+def _byte_view(tensor: torch.Tensor) -> torch.Tensor:
+    return tensor.detach().contiguous().reshape(-1).view(torch.uint8)
+
+
+class WeightBroadcaster:
+    """Писатель канала: publish() копирует state_dict в отображённый файл под seqlock."""
+
+    def __init__(self, path: str) -> None:
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._mm: mmap.mmap | None = None
+        self._file = None
+        self._layout: list[dict] | None = None
+        self._data_offset = 0
+        self._meta_offset = 0
+        self._data: torch.Tensor | None = None
+        self._seq = 0
+
+    def _create(self, layout: list[dict]) -> None:
+        manifest = json.dumps({"host": socket.gethostname(), "layout": layout}, separators=(",", ":")).encode("utf-8")
+        meta_offset = _align(_HEADER.size + len(manifest))
+        data_offset = _align(meta_offset + _META_CAP)
+        data_len = (layout[-1]["offset"] + layout[-1]["nbytes"]) if layout else 0
+        total = max(data_offset + data_len, data_offset + 1)
+        self.close()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as handle:
+            handle.write(_HEADER.pack(WBUF_MAGIC, WBUF_VERSION, 0, 0, len(manifest), _META_CAP, data_offset, data_len))
+            handle.write(manifest)
+            handle.truncate(total)
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "r+b")
+        self._mm = mmap.mmap(self._file.fileno(), total)
+        self._layout = layout
+        self._meta_offset = meta_offset
+        self._data_offset = data_offset
+        self._data = torch.frombuffer(self._mm, dtype=torch.uint8)
+        self._seq = 0
+
+    def publish(self, state_dict: dict, meta: dict | None = None) -> int:
+        """Опубликовать веса; возвращает seq снимка (чётный)."""
+        layout = _layout_for(state_dict)
+        meta_blob = json.dumps(meta or {}, separators=(",", ":")).encode("utf-8")
+        if len(meta_blob) > _META_CAP - _META_LEN.size:
+            raise ValueError(f"weight broadcast meta too large: {len(meta_blob)} bytes")
+        with self._lock:
+            if self._mm is None or layout != self._layout:
+                self._create(layout)
+            mm = self._mm
+            data = self._data
+            self._seq += 1
+            _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+            _META_LEN.pack_into(mm, self._meta_offset, len(meta_blob))
+            mm[self._meta_offset + _META_LEN.size:self._meta_offset + _META_LEN.size + len(meta_blob)] = meta_blob
+            base = self._data_offset
+            for entry, tensor in zip(layout, state_dict.values()):
+                if entry["nbytes"]:
+                    start = base + entry["offset"]
+                    data[start:start + entry["nbytes"]].copy_(_byte_view(tensor))
+            self._seq += 1
+            _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+            # Запись через mmap не обязана обновлять mtime — а по нему WeightSync сравнивает с .pth.
+            os.utime(self.path)
+            return self._seq
+
+    def close(self) -> None:
+        self._data = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._layout = None
+
+
+class WeightSubscriber:
+    """Читатель канала: poll() отдаёт новый снимок ({"state_dict": ..., **meta, "weights_seq": seq}) или None.
+
+    Тензоры state_dict — view на внутренний буфер подписчика: их нужно сразу загрузить в сеть
+    (load_state_dict копирует), следующий poll() перезапишет буфер.
+    """
+
+    def __init__(self, path: str, *, retries: int = 50) -> None:
+        self.path = str(path)
+        self.retries = max(1, int(retries))
+        self._file = None
+        self._mm: mmap.mmap | None = None
+        self._inode = None
+        self._last_seq = 0
+        self._tensors: dict[str, torch.Tensor] = {}
+        self._staging: bytearray | None = None
+        self._staging_np: np.ndarray | None = None
+        self._meta_offset = 0
+        self._data_offset = 0
+        self._data_len = 0
+        self.local = True
+
+    def available(self) -> bool:
+        """Файл канала есть и написан на этой машине (mmap между машинами не используем)."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        if self._mm is None or st.st_ino != self._inode:
+            try:
+                self._open(st)
+            except (OSError, ValueError):
+                self.close()
+                return False
+        return self.local
+
+    def _open(self, st: os.stat_result) -> None:
+        self.close()
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _pad, _seq, manifest_len, _meta_cap, data_offset, data_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != WBUF_MAGIC or version != WBUF_VERSION:
+            raise ValueError(f"not a weight broadcast file: {self.path}")
+        manifest = json.loads(bytes(self._mm[_HEADER.size:_HEADER.size + manifest_len]).decode("utf-8"))
+        self.local = str(manifest.get("host", "")) == socket.gethostname()
+        self._meta_offset = _align(_HEADER.size + manifest_len)
+        self._data_offset = int(data_offset)
+        self._data_len = int(data_len)
+        self._staging = bytearray(max(1, self._data_len))
+        self._staging_np = np.frombuffer(self._staging, dtype=np.uint8, count=self._data_len)
+        tensors = {}
+        for entry in manifest.get("layout", []):
+            dtype = getattr(torch, str(entry["dtype"]))
+            count = int(entry["nbytes"]) // max(1, torch.empty((), dtype=dtype).element_size())
+            flat = (
+                torch.frombuffer(self._staging, dtype=dtype, count=count, offset=int(entry["offset"]))
+                if count
+                else torch.empty(0, dtype=dtype)
+            )
+            tensors[str(entry["name"])] = flat.view(entry["shape"])
+        self._tensors = tensors
+        self._inode = st.st_ino
+        self._last_seq = 0
+
+    def poll(self) -> dict | None:
+        if not self.available():
+            return None
+        mm = self._mm
+        for attempt in range(self.retries):
+            seq_before = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if seq_before == 0 or seq_before == self._last_seq:
+                return None
+            if seq_before % 2:
+                time.sleep(0.0005 * (attempt + 1))
+                continue
+            (meta_len,) = _META_LEN.unpack_from(mm, self._meta_offset)
+            meta_start = self._meta_offset + _META_LEN.size
+            meta_blob = bytes(mm[meta_start:meta_start + min(int(meta_len), _META_CAP - _META_LEN.size)])
+            np.copyto(self._staging_np, np.frombuffer(mm, dtype=np.uint8, count=self._data_len, offset=self._data_offset))
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] != seq_before:
+                continue
+            try:
+                meta = json.loads(meta_blob.decode("utf-8")) if meta_blob else {}
+            except ValueError:
+                continue
+            self._last_seq = int(seq_before)
+            payload: dict[str, Any] = dict(meta) if isinstance(meta, dict) else {}
+            payload["state_dict"] = dict(self._tensors)
+            payload["weights_seq"] = int(seq_before)
+            return payload
+        return None
+
+    def close(self) -> None:
+        self._tensors = {}
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._inode = None
+
+
+class WeightSync:
+    """Опрос весов для актора/inference-сервера: mmap-канал, если он локальный, иначе .pth по mtime."""
+
+    def __init__(self, sync_path: str) -> None:
+        self.sync_path = str(sync_path)
+        self._subscriber = WeightSubscriber(broadcast_path_for(self.sync_path)) if weight_broadcast_mode() != "file" else None
+        self._last_mtime = -1.0
+
+    def poll(self) -> dict | None:
+        try:
+            mtime = os.path.getmtime(self.sync_path)
+        except OSError:
+            mtime = None
+        if self._subscriber is not None and self._subscriber.available():
+            try:
+                stale = mtime is not None and mtime > os.path.getmtime(self._subscriber.path)
+            except OSError:
+                stale = False
+            if not stale:
+                return self._subscriber.poll()
+        if mtime is None:
+            return None
+        if mtime <= self._last_mtime:
+            return None
+        payload = torch.load(self.sync_path, map_location="cpu", weights_only=False)
+        self._last_mtime = float(mtime)
+        return payload if isinstance(payload, dict) else None
+
+
+_BROADCASTERS: dict[str, WeightBroadcaster] = {}
+_FILE_WRITTEN_AT: dict[str, float] = {}
+_BROADCASTERS_LOCK = threading.Lock()
+
+
+def get_weight_broadcaster(path: str) -> WeightBroadcaster:
+    key = os.path.abspath(str(path))
+    with _BROADCASTERS_LOCK:
+        broadcaster = _BROADCASTERS.get(key)
+        if broadcaster is None:
+            broadcaster = WeightBroadcaster(key)
+            _BROADCASTERS[key] = broadcaster
+        return broadcaster
+
+
+def publish_weights(
+    sync_path: str,
+    state_dict: dict,
+    meta: dict | None = None,
+    *,
+    file_fallback: bool = False,
+    save_file: Callable[[dict, str], None] | None = None,
+) -> None:
+    """Опубликовать веса learner'а для акторов.
+
+    file_fallback — есть потребители на других машинах (ПК2, удалённый inference): .pth пишется
+    на каждую публикацию. Иначе в режиме auto .pth обновляется не чаще WEIGHT_BROADCAST_FILE_EVERY_S
+    (для внешних читателей/GUI), а акторы берут веса из mmap.
+    """
+    mode = weight_broadcast_mode()
+    save_file = save_file or torch.save
+    sync_path = str(sync_path)
+
+    def _write_file() -> None:
+        payload = dict(meta or {})
+        payload["state_dict"] = {k: v.detach().cpu() for k, v in state_dict.items()}
+        save_file(payload, sync_path)
+        _FILE_WRITTEN_AT[sync_path] = time.monotonic()
+
+    if mode == "file":
+        _write_file()
+        return
+    # .pth — до mmap: читатель берёт .pth, только если он новее .wbuf (т.е. mmap не обновился).
+    every_s = max(0.0, float(os.getenv("WEIGHT_BROADCAST_FILE_EVERY_S", "30")))
+    last = _FILE_WRITTEN_AT.get(sync_path)
+    if mode == "auto" and (file_fallback or last is None or (time.monotonic() - last) >= every_s):
+        _write_file()
+    try:
+        get_weight_broadcaster(broadcast_path_for(sync_path)).publish(state_dict, meta)
+    except (OSError, ValueError, RuntimeError):
+        # Например, Windows не даёт подменить файл, пока его держит читатель — уходим в .pth.
+        _write_file()
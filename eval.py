@@ -13,6 +13,7 @@ from statistics import median
 from typing import Optional
 
 import gymnasium as gym
+import numpy as np
 import torch
 
 import core.envs  # noqa: F401 (регистрация '40kAI-v0')
@@ -23,6 +24,7 @@ from core.engine.agent_registry import (
     resolve_agent_algo,
 )
 from core.engine.game_controller import n_actions_from_env
+from core.engine.game_io import flush_log_writer
 from core.engine.mission import (
     check_end_of_battle,
     deploy_for_mission,
@@ -981,54 +983,38 @@ def run_episode(
     )
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--games", type=int, default=50)
-    parser.add_argument("--model", type=str, default=None)
-    parser.add_argument("--learner-agent-id", type=str, default="")
-    parser.add_argument("--opponent-agent-id", type=str, default="")
-    parser.add_argument("--opponent-policy", type=str, default="mirror")
-    args = parser.parse_args()
-
-    games = args.games
-    if games < 1:
-        log("Некорректное значение N. Укажите число >= 1.")
-        return 0
-
-    if os.getenv("FORCE_GREEDY", "0") == "1":
-        epsilon = 0.0
-    else:
-        epsilon_raw = os.getenv("EVAL_EPSILON", "0")
-        epsilon = float(epsilon_raw) if epsilon_raw else 0.0
-
-    os.environ.setdefault("MANUAL_DICE", "0")
-
+def _prepare_eval(args, *, device: Optional[torch.device] = None, log_fn=log):
+    """
+    Окружение, сеть learner'а и оппонент для оценки.
+    Общая подготовка для main() и воркеров параллельной оценки.
+    Возвращает (setup, 0) или (None, код выхода) при ошибке.
+    """
     env, model_units, enemy_units, checkpoint, pickle_path, checkpoint_path = load_latest_model(args.model)
     if env is None:
         # Fallback: если указаны agent-id, можем построить env без legacy pickle.
         if (args.learner_agent_id or "").strip():
             env, model_units, enemy_units, err = _build_env_from_train_roster()
             if env is None:
-                log(
+                log_fn(
                     "[ERROR] Не удалось собрать окружение без .pickle. "
                     "Где: eval.py (_build_env_from_train_roster). "
                     f"Детали: {err}"
                 )
-                return 0
+                return None, 0
             checkpoint = {}
             pickle_path = "generated_from_roster"
             checkpoint_path = "registry_only"
-            log("[EVAL] legacy .pickle не найден: использую roster_config из train.py.")
+            log_fn("[EVAL] legacy .pickle не найден: использую roster_config из train.py.")
         else:
             if pickle_path and checkpoint_path is None:
-                log(
+                log_fn(
                     "[ERROR] Не найден checkpoint для выбранной модели. "
                     "Где: eval.py (load_latest_model/_find_checkpoint_for_pickle). "
                     f"Что делать: проверьте .pth рядом с .pickle. model={pickle_path}"
                 )
             else:
-                log("[ERROR] Модель не найдена. Проверьте папку artifacts/models/ и наличие файлов .pickle/.pth.")
-            return 0
+                log_fn("[ERROR] Модель не найдена. Проверьте папку artifacts/models/ и наличие файлов .pickle/.pth.")
+            return None, 0
 
     attacker_side, defender_side = roll_off_attacker_defender(
         manual_roll_allowed=False,
@@ -1061,7 +1047,8 @@ def main():
         ruleset_version=str(os.getenv("RULESET_VERSION", "only_war_v1")),
     )
 
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if device is None:
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     policy_state = None
     learner_algo_override = ""
     learner_registry_target_state = None
@@ -1070,18 +1057,18 @@ def main():
         try:
             payload = load_agent_by_id(selected_agent_id)
         except Exception as exc:
-            log(
+            log_fn(
                 f"[ERROR] Не удалось загрузить learner-agent-id={selected_agent_id}: {exc}. "
                 "Что делать: обновите список агентов в GUI или выберите существующий agent_id из artifacts/models/agents."
             )
-            return 0
+            return None, 0
         ok, reason = compatible_contracts(eval_contract, payload.get("contract", {}))
         if not ok:
-            log(
+            log_fn(
                 f"[ERROR] Несовместимый learner-agent-id={selected_agent_id}: {reason}. "
                 "Где: eval.py (compatible_contracts). Что делать: выберите агента с тем же контрактом окружения."
             )
-            return 1
+            return None, 1
         policy_state = payload.get("policy_state")
         meta = payload.get("meta") if isinstance(payload, dict) else {}
         try:
@@ -1092,14 +1079,14 @@ def main():
                 agent_id=selected_agent_id,
             )
         except ValueError as exc:
-            log(
+            log_fn(
                 f"[ERROR] Не удалось определить algo learner-agent-id={selected_agent_id}: {exc}. "
                 "Где: eval.py (resolve_agent_algo). Что делать: переобучите/пересохраните агента."
             )
-            return 1
+            return None, 1
         target_guess = payload.get("target_state") if isinstance(payload, dict) else None
         learner_registry_target_state = target_guess if isinstance(target_guess, dict) and target_guess else None
-        log(f"Используется learner-agent-id={selected_agent_id} (policy из registry, algo={learner_algo_override}).")
+        log_fn(f"Используется learner-agent-id={selected_agent_id} (policy из registry, algo={learner_algo_override}).")
     else:
         policy_state = _extract_policy_state_dict(checkpoint)
 
@@ -1111,23 +1098,23 @@ def main():
             opp = load_agent_opponent(agent_id=opponent_agent_id, expected_contract=eval_contract)
             opponent_algo_label = str(getattr(opp, "algo", "") or "").strip().lower() or "unknown"
             opponent_policy_fn = build_policy_fn(env=env, len_model=len(enemy_units), opponent=opp, deterministic=True)
-            log(
+            log_fn(
                 f"Оппонент через registry: opponent-agent-id={opponent_agent_id}, algo={opp.algo} (deterministic)."
             )
         except Exception as exc:
-            log(
+            log_fn(
                 f"[ERROR] Не удалось загрузить opponent-agent-id={opponent_agent_id}: {exc}. "
                 "Что делать: выберите оппонента с тем же контрактом."
             )
-            return 1
+            return None, 1
 
     if not isinstance(policy_state, dict):
-        log(
+        log_fn(
             "[ERROR] В checkpoint отсутствует policy state_dict. "
             "Где: eval.py (_extract_policy_state_dict). "
             "Что делать: укажите корректный .pth, сохранённый train.py."
         )
-        return 0
+        return None, 0
 
     algo = learner_algo_override or (
         str(checkpoint.get("algo", "dqn")).strip().lower() if isinstance(checkpoint, dict) else "dqn"
@@ -1192,6 +1179,148 @@ def main():
         policy_net.eval()
         target_net.eval()
 
+    return {
+        "env": env,
+        "model_units": model_units,
+        "enemy_units": enemy_units,
+        "policy_net": policy_net,
+        "algo": algo,
+        "device": device,
+        "opponent_policy_fn": opponent_policy_fn,
+        "opponent_algo_label": opponent_algo_label,
+        "pickle_path": pickle_path,
+        "checkpoint_path": checkpoint_path,
+    }, 0
+
+
+def _eval_epsilon() -> float:
+    if os.getenv("FORCE_GREEDY", "0") == "1":
+        return 0.0
+    epsilon_raw = os.getenv("EVAL_EPSILON", "0")
+    return float(epsilon_raw) if epsilon_raw else 0.0
+
+
+def _seed_game(seed: int) -> None:
+    # Кубы, roll-off и epsilon-выбор идут через глобальные RNG — сида хватает на всю игру.
+    random.seed(int(seed))
+    np.random.seed(int(seed) % (2**32))
+    torch.manual_seed(int(seed))
+
+
+def _play_game(setup: dict, epsilon: float, learner_side: str, seed: Optional[int]):
+    if seed is not None:
+        _seed_game(seed)
+    return run_episode(
+        setup["env"],
+        setup["model_units"],
+        setup["enemy_units"],
+        setup["policy_net"],
+        epsilon,
+        setup["device"],
+        setup["algo"],
+        opponent_policy_fn=setup["opponent_policy_fn"],
+        learner_side=learner_side,
+    )
+
+
+# Состояние процесса-воркера параллельной оценки (заполняется в _eval_worker_init).
+_EVAL_WORKER: dict = {}
+
+
+def _eval_worker_init(args, epsilon: float, learner_side: str) -> None:
+    torch.set_num_threads(1)
+    _EVAL_WORKER.clear()
+    _EVAL_WORKER.update(epsilon=float(epsilon), learner_side=str(learner_side))
+    try:
+        setup, exit_code = _prepare_eval(args, device=torch.device("cpu"), log_fn=_append_eval_log)
+    except Exception as exc:
+        setup, exit_code = None, f"{type(exc).__name__}: {exc}"
+    _EVAL_WORKER["setup"] = setup
+    _EVAL_WORKER["error"] = None if setup is not None else f"_prepare_eval failed (code={exit_code})"
+
+
+def _eval_worker_play(task: tuple[int, int]):
+    idx, seed = task
+    if _EVAL_WORKER.get("setup") is None:
+        raise RuntimeError(str(_EVAL_WORKER.get("error") or "eval worker is not initialized"))
+    try:
+        return idx, _play_game(_EVAL_WORKER["setup"], _EVAL_WORKER["epsilon"], _EVAL_WORKER["learner_side"], seed)
+    finally:
+        # Пул может завершить воркер без atexit — хвост логов партии пишем сразу.
+        flush_log_writer()
+
+
+def _game_seed(base_seed: Optional[int], idx: int) -> Optional[int]:
+    return None if base_seed is None else int(base_seed) + int(idx)
+
+
+def _iter_games_sequential(setup: dict, games: int, epsilon: float, learner_side: str, base_seed: Optional[int]):
+    for idx in range(1, games + 1):
+        if eval_stop_requested():
+            log(f"Остановка по запросу пользователя после {idx - 1}/{games} игр.")
+            break
+        yield idx, _play_game(setup, epsilon, learner_side, _game_seed(base_seed, idx))
+
+
+def _iter_games_parallel(args, games: int, epsilon: float, learner_side: str, base_seed: int, workers: int):
+    """
+    Игры раздаются пулу spawn-процессов; каждый воркер один раз собирает env/сеть
+    через _prepare_eval (на CPU, 1 поток torch) и играет игры по (idx, seed).
+    Результаты отдаются строго в порядке idx, поэтому лог и сводка совпадают
+    с последовательным прогоном с тем же --seed.
+    """
+    import multiprocessing as mp
+
+    ctx = mp.get_context("spawn")
+    tasks = [(idx, _game_seed(base_seed, idx)) for idx in range(1, games + 1)]
+    with ctx.Pool(processes=workers, initializer=_eval_worker_init, initargs=(args, epsilon, learner_side)) as pool:
+        results = pool.imap(_eval_worker_play, tasks)
+        while True:
+            try:
+                idx, result = next(results)
+            except StopIteration:
+                break
+            except Exception as exc:
+                log(
+                    "[ERROR] Воркер параллельной оценки завершился с ошибкой. "
+                    "Где: eval.py (_iter_games_parallel). "
+                    f"Детали: {exc}"
+                )
+                break
+            yield idx, result
+            if idx < games and eval_stop_requested():
+                log(f"Остановка по запросу пользователя после {idx}/{games} игр.")
+                break
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=50)
+    parser.add_argument("--model", type=str, default=None)
+    parser.add_argument("--learner-agent-id", type=str, default="")
+    parser.add_argument("--opponent-agent-id", type=str, default="")
+    parser.add_argument("--opponent-policy", type=str, default="mirror")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("EVAL_WORKERS", "1") or 1))
+    parser.add_argument("--seed", type=int, default=int(os.environ["EVAL_SEED"]) if os.getenv("EVAL_SEED") else None)
+    args = parser.parse_args()
+
+    games = args.games
+    if games < 1:
+        log("Некорректное значение N. Укажите число >= 1.")
+        return 0
+
+    epsilon = _eval_epsilon()
+
+    os.environ.setdefault("MANUAL_DICE", "0")
+
+    setup, exit_code = _prepare_eval(args)
+    if setup is None:
+        return exit_code
+    algo = setup["algo"]
+    opponent_algo_label = setup["opponent_algo_label"]
+    pickle_path = setup["pickle_path"]
+    checkpoint_path = setup["checkpoint_path"]
+
     az_eval_mode = str(os.getenv("AZ_EVAL_MODE", "mcts")).strip().lower() or "mcts"
     az_opp_mode = str(os.getenv("AZ_EVAL_OPPONENT_MODE", "mcts")).strip().lower() or "mcts"
     gmz_eval_mode = str(os.getenv("GMZ_EVAL_MODE", "search")).strip().lower() or "search"
@@ -1297,32 +1426,32 @@ def main():
 
     clear_eval_stop_flag()
 
-    for idx in range(1, games + 1):
-        if eval_stop_requested():
-            log(f"Остановка по запросу пользователя после {idx - 1}/{games} игр.")
-            break
-        (
-            winner,
-            end_reason,
-            vp_diff,
-            model_vp,
-            enemy_vp,
-            episode_len,
-            total_reward,
-            hp_diff_model_minus_enemy,
-            kill_diff_model_minus_enemy,
-            trace_lines,
-        ) = run_episode(
-            env,
-            model_units,
-            enemy_units,
-            policy_net,
-            epsilon,
-            device,
-            algo,
-            opponent_policy_fn=opponent_policy_fn,
-            learner_side=learner_side,
-        )
+    workers = max(1, min(int(args.workers), games))
+    base_seed = args.seed
+    if workers > 1:
+        if base_seed is None:
+            base_seed = random.randrange(2**31)
+        log(f"Параллельная оценка: workers={workers}, seed={base_seed} (seed игры = seed + номер игры).")
+        # Воркеры грузят ровно ту модель, что выбрал родитель (а не «последнюю» на момент старта воркера).
+        worker_args = argparse.Namespace(**vars(args))
+        if pickle_path != "generated_from_roster":
+            worker_args.model = pickle_path
+        game_results = _iter_games_parallel(worker_args, games, epsilon, learner_side, base_seed, workers)
+    else:
+        game_results = _iter_games_sequential(setup, games, epsilon, learner_side, base_seed)
+
+    for idx, (
+        winner,
+        end_reason,
+        vp_diff,
+        model_vp,
+        enemy_vp,
+        episode_len,
+        total_reward,
+        hp_diff_model_minus_enemy,
+        kill_diff_model_minus_enemy,
+        trace_lines,
+    ) in game_results:
         for line in trace_lines:
             _append_eval_log(f"[TRACE][GAME {idx}] {line}")
             if line.startswith("[TRACE][MODEL_ACTION_HUMAN]"):
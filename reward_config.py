@@ -379,14 +379,21 @@ def apply_heur_calibration_overrides(raw_json: str | None = None) -> dict[str, f
         raise ValueError("HEUR_CALIBRATION_OVERRIDES_JSON: invalid JSON object.") from exc
     if not isinstance(payload, dict):
         raise ValueError("HEUR_CALIBRATION_OVERRIDES_JSON: expected JSON object.")
+    return apply_heur_calibration_weights(payload)
 
-    applied: dict[str, float] = {}
-    for key, value in payload.items():
-        parsed = _validate_heur_calibration_override(str(key), value)
-        current = globals()[str(key)]
-        globals()[str(key)] = int(parsed) if isinstance(current, int) and float(parsed).is_integer() else float(parsed)
-        applied[str(key)] = float(parsed)
-    return applied
+
+def apply_heur_calibration_weights(weights: dict) -> dict[str, float]:
+    """Применить веса эвристики в текущем процессе (без JSON/env).
+
+    Те же правила, что у HEUR_CALIBRATION_OVERRIDES_JSON; все ключи проверяются
+    до записи, так что при ошибке глобалы не меняются частично. Воркеры калибровки
+    вызывают это между партиями: веса читаются через getattr(reward_cfg, ...) в момент хода.
+    """
+    parsed = {str(key): _validate_heur_calibration_override(str(key), value) for key, value in weights.items()}
+    for key, value in parsed.items():
+        current = globals()[key]
+        globals()[key] = int(value) if isinstance(current, int) and float(value).is_integer() else float(value)
+    return parsed
 
 
 _HEUR_CALIBRATION_APPLIED_OVERRIDES = apply_heur_calibration_overrides()
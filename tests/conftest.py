@@ -1,4 +1,12 @@
 import os
 
+import pytest
+
 os.environ.setdefault("TORCHDYNAMO_DISABLE", "1")
 os.environ.setdefault("TORCH_COMPILE_DISABLE", "1")
+
+
+@pytest.fixture(autouse=True)
+def _heur_decisions_in_tmp(tmp_path, monkeypatch):
+    # Env пишет heur_dec_<pid>.jsonl по завершении партии — не в artifacts/ рабочего дерева.
+    monkeypatch.setenv("HEUR_METRICS_DECISIONS_DIR", str(tmp_path / "heur_decisions"))
@@ -0,0 +1,21 @@
+import random
+
+import numpy as np
+
+from core.envs.warhamEnv import Warhammer40kEnv
+from tests.engine.phases._helpers import make_unit
+
+
+def build_reset_env(seed: int | None = 7, *, enemies: int = 2) -> Warhammer40kEnv:
+    """Две model-единицы против ``enemies`` stub-юнитов на поле 30×30 после reset.
+
+    seed фиксирует random/np.random до сборки (расстановка в reset), None — не трогать.
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    model = [make_unit("ModelA"), make_unit("ModelB")]
+    enemy = [make_unit(f"Enemy{chr(ord('A') + i)}") for i in range(enemies)]
+    env = Warhammer40kEnv(enemy=enemy, model=model, b_len=30, b_hei=30)
+    env.reset(options={"m": model, "e": enemy, "trunc": True})
+    return env
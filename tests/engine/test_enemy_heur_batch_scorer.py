@@ -0,0 +1,95 @@
+import random
+
+import numpy as np
+
+from core.engine.unit import Unit
+from core.envs.warhamEnv import Warhammer40kEnv
+
+
+def _mk(name: str, movement: int, rng_in: int) -> Unit:
+    data = {"Name": name, "Movement": movement, "M": movement, "W": 2, "#OfModels": 2, "OC": 2, "T": 4, "Sv": 3,
+            "Keywords": ["Infantry"]}
+    weapon = {"Name": "Stub gun", "Range": rng_in, "A": 1, "BS": 4, "S": 4, "AP": 0, "Damage": 1}
+    melee = {"Name": "Stub blade", "A": 1, "WS": 4, "S": 4, "AP": 0, "Damage": 1}
+    return Unit(data=data, weapon=weapon, melee=melee, b_len=24, b_hei=18, GUI=False)
+
+
+def _build_env(seed: int) -> Warhammer40kEnv:
+    rng = random.Random(seed)
+    model = [_mk(f"Model{i}", rng.choice([4, 6, 8]), rng.choice([0, 12, 24])) for i in range(3)]
+    enemy = [_mk(f"Enemy{i}", rng.choice([4, 6, 8]), 18) for i in range(2)]
+    env = Warhammer40kEnv(enemy=enemy, model=model, b_len=24, b_hei=18)
+    for coords in (env.unit_coords, env.enemy_coords):
+        for i in range(len(coords)):
+            coords[i] = [rng.randrange(24), rng.randrange(18)]
+    env.unit_health[2] = 0 if seed % 2 else env.unit_health[2]
+    env.battle_round = rng.choice([1, 3, 5])
+    env.coordsOfOM = [[rng.randrange(24), rng.randrange(18)] for _ in range(3)]
+    env.terrain_features = [
+        {"kind": "barricade", "cells": [[rng.randrange(24), rng.randrange(18)] for _ in range(10)]},
+    ]
+    env.terrain_opaque_cells = {(rng.randrange(24), rng.randrange(18)) for _ in range(30)}
+    env.refresh_objective_control()
+    return env
+
+
+def test_batch_scorer_matches_per_cell_reference():
+    for seed in range(6):
+        env = _build_env(seed)
+        weights = env._enemy_heur_move_weights()
+        for enemy_idx in range(2):
+            pos_before = (int(env.enemy_coords[enemy_idx][0]), int(env.enemy_coords[enemy_idx][1]))
+            cells = [(x, y, mode) for x in range(24) for y in range(18) for mode in ("normal", "advance", "stay")
+                     if (x + y) % 3 == ("normal", "advance", "stay").index(mode)]
+            for target_idx, tactic in ((0, "balanced"), (1, "desperate_push")):
+                matchup = env._enemy_matchup_distance_plan(enemy_idx, target_idx)
+                kwargs = dict(enemy_idx=enemy_idx, target_idx=target_idx, pos_before=pos_before,
+                              matchup=matchup, focus_count=2, team_tactic=tactic)
+                scores, explain = env._enemy_heur_movement_scores(
+                    xs=np.array([c[0] for c in cells], dtype=np.float64),
+                    ys=np.array([c[1] for c in cells], dtype=np.float64),
+                    modes=[c[2] for c in cells],
+                    weights=weights,
+                    **kwargs,
+                )
+                for k, (x, y, mode) in enumerate(cells):
+                    ref_score, ref_details = env._enemy_heur_movement_score(cell_x=x, cell_y=y, mode=mode, **kwargs)
+                    assert float(scores[k]) == ref_score, (seed, enemy_idx, x, y, mode)
+                    assert explain(k) == ref_details, (seed, enemy_idx, x, y, mode)
+
+
+def test_enemy_turn_is_identical_with_reference_scorer(monkeypatch):
+    traces = {}
+    for scorer in ("python", "batch"):
+        monkeypatch.setenv("ENEMY_HEUR_SCORER", scorer)
+        env = _build_env(3)
+        random.seed(11)
+        np.random.seed(11)
+        env.enemyTurn(trunc=True)
+        traces[scorer] = ([list(map(int, c)) for c in env.enemy_coords], list(env.unit_health), list(env.enemy_health))
+    assert traces["batch"] == traces["python"]
+
+
+def test_board_threat_maps_match_per_cell_scores():
+    for seed in range(3):
+        env = _build_env(seed)
+        maps = env.board_threat_maps()
+        assert maps["threat"].shape == (env.b_len, env.b_hei)
+        for row in range(env.b_len):
+            for col in range(env.b_hei):
+                assert maps["threat"][row, col] == env._enemy_cell_threat_score(col, row), (seed, row, col)
+                assert maps["exposure"][row, col] == env._enemy_heur_exposure_risk(0, col, row), (seed, row, col)
+        assert env.board_threat_maps() is maps
+
+
+def test_board_threat_maps_follow_model_moves_and_invalidation():
+    env = _build_env(2)
+    maps = env.board_threat_maps()
+    env._invalidate_target_cache("test")
+    rebuilt = env.board_threat_maps()
+    assert rebuilt is not maps
+    np.testing.assert_array_equal(rebuilt["threat"], maps["threat"])
+    env.unit_coords[0] = [(int(env.unit_coords[0][0]) + 7) % 24, int(env.unit_coords[0][1])]
+    moved = env.board_threat_maps()
+    assert moved is not rebuilt
+    assert moved["threat"][5, 5] == env._enemy_cell_threat_score(5, 5)
@@ -2,34 +2,48 @@
 import types
 import unittest
 
+from core.engine.visibility import los_matrix_for
 from core.envs.warhamEnv import Warhammer40kEnv
+from tests.engine._helpers import build_reset_env
 
 
-def _stub(opaque_cells):
-    """Минимальный self для _model_has_los_to_cell: model-стрелок в клетке (row0,col0)."""
+def _stub(opaque_cells, *, los_debug=True):
+    """Минимальный self для _model_has_los_to_cell: model-стрелок в клетке (row0,col0).
+
+    los_debug=True — путь через visibility_report, False — fast path через LosMatrix.
+    """
     stub = types.SimpleNamespace()
     stub.terrain_opaque_cells = set(opaque_cells)
     stub.visibility_mode = "single_ray"
     stub.get_terrain_obscuring_cells_set = lambda: set()
     stub._unit_cells_for_los = lambda side, idx: [(0, 0)]
+    stub._los_debug_enabled = lambda: los_debug
+    stub._los_matrix = lambda: los_matrix_for(stub.terrain_opaque_cells, 8, 8, stub.visibility_mode)
     return stub
 
 
 class TestModelHasLosToCell(unittest.TestCase):
     def test_clear_los_to_cell(self):
-        stub = _stub(opaque_cells=set())
-        # цель: cell_x=4, cell_y=0 -> target_cell (row0,col4), чистая линия
-        self.assertTrue(Warhammer40kEnv._model_has_los_to_cell(stub, 0, 4, 0))
+        for los_debug in (True, False):
+            stub = _stub(opaque_cells=set(), los_debug=los_debug)
+            # цель: cell_x=4, cell_y=0 -> target_cell (row0,col4), чистая линия
+            self.assertTrue(Warhammer40kEnv._model_has_los_to_cell(stub, 0, 4, 0))
 
     def test_wall_blocks_los_to_cell(self):
-        stub = _stub(opaque_cells={(0, 2)})  # стена в (row0,col2) между (0,0) и (0,4)
-        self.assertFalse(Warhammer40kEnv._model_has_los_to_cell(stub, 0, 4, 0))
+        for los_debug in (True, False):
+            stub = _stub(opaque_cells={(0, 2)}, los_debug=los_debug)  # стена в (row0,col2) между (0,0) и (0,4)
+            self.assertFalse(Warhammer40kEnv._model_has_los_to_cell(stub, 0, 4, 0))
 
     def test_no_attacker_cells_means_no_los(self):
         stub = _stub(opaque_cells=set())
         stub._unit_cells_for_los = lambda side, idx: []
         self.assertFalse(Warhammer40kEnv._model_has_los_to_cell(stub, 0, 4, 0))
 
+    def test_debug_mode_uses_visibility_report(self):
+        stub = _stub(opaque_cells=set(), los_debug=True)
+        stub._los_matrix = lambda: self.fail("LOS debug идёт через visibility_report, не через LosMatrix")
+        self.assertTrue(Warhammer40kEnv._model_has_los_to_cell(stub, 0, 4, 0))
+
 
 def _stat_float_stub(data, keys, default=0.0):
     if isinstance(data, dict):
@@ -111,5 +125,23 @@ class TestLosGateWiringContract(unittest.TestCase):
         self.assertTrue(hasattr(reward_config, "ENEMY_HEUR_LOS_GATE_ENABLED"))
 
 
+class TestLosMatrixCacheKey(unittest.TestCase):
+    def test_matrix_follows_terrain_replacement_and_undo(self):
+        env = build_reset_env()
+        env.terrain_opaque_cells = {(3, 3)}
+        first = env._los_matrix()
+        self.assertIs(env._los_matrix(), first)
+        self.assertEqual(first.opaque, frozenset({(3, 3)}))
+
+        mark = env.begin_delta()
+        env.terrain_opaque_cells = {(4, 4)}
+        self.assertEqual(env._los_matrix().opaque, frozenset({(4, 4)}))
+        env.undo_delta(mark)
+        self.assertEqual(env._los_matrix().opaque, frozenset({(3, 3)}))
+
+        env.terrain_opaque_cells = {(5, 5)}
+        self.assertEqual(env._los_matrix().opaque, frozenset({(5, 5)}))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,169 @@
+import copy
+import pickle
+
+import numpy as np
+import pytest
+
+from core.engine.phases import compile_options_to_action_dict
+from core.envs.warhamEnv import Warhammer40kEnv
+from tests.engine._helpers import build_reset_env
+
+_FIELDS = (
+    "unit_health", "enemy_health", "unit_coords", "enemy_coords",
+    "unit_anchor_coords", "enemy_anchor_coords", "unit_model_wounds", "enemy_model_wounds",
+    "unit_model_positions", "enemy_model_positions", "unitInAttack", "enemyInAttack",
+    "unitFellBack", "enemyFellBack", "unitCharged", "enemyCharged",
+    "modelCP", "enemyCP", "modelVP", "enemyVP", "battle_round", "numTurns",
+    "phase", "active_side", "game_over", "modelStrat", "enemyStrat", "stratagem_used",
+)
+
+
+def _play(env, steps: int) -> None:
+    action = compile_options_to_action_dict([], len(env.unit_health))
+    with env.simulation_mode():
+        for _ in range(steps):
+            env.step(dict(action))
+            if env.game_over:
+                break
+            env.enemyTurn(trunc=True)
+
+
+def _state(env) -> dict:
+    out = copy.deepcopy({k: getattr(env, k) for k in _FIELDS})
+    out["_unit_objs"] = [list(map(int, u.showCoords())) for u in env.model + env.enemy]
+    return out
+
+
+def test_undo_delta_restores_state_after_real_steps():
+    env = build_reset_env()
+    _play(env, 1)
+    before = _state(env)
+
+    mark = env.begin_delta()
+    _play(env, 3)
+    assert _state(env) != before
+    env.undo_delta(mark)
+
+    assert _state(env) == before
+    assert type(env) is Warhammer40kEnv
+
+
+def test_undo_delta_restores_rng_so_rollouts_repeat():
+    env = build_reset_env()
+    mark = env.begin_delta()
+    _play(env, 2)
+    first = _state(env)
+    env.undo_delta(mark)
+
+    mark = env.begin_delta()
+    _play(env, 2)
+    assert _state(env) == first
+    env.undo_delta(mark)
+
+
+def test_delta_rollouts_do_not_change_real_trajectory():
+    reference = build_reset_env()
+    _play(reference, 4)
+
+    env = build_reset_env()
+    for _ in range(4):
+        mark = env.begin_delta()
+        _play(env, 2)
+        env.undo_delta(mark)
+        _play(env, 1)
+    assert _state(env) == _state(reference)
+
+
+def test_nested_frames_and_commit():
+    env = build_reset_env()
+    before = _state(env)
+    outer = env.begin_delta()
+    inner = env.begin_delta()
+    _play(env, 1)
+    env.commit_delta(inner)
+    after_one = _state(env)
+    assert after_one != before
+
+    inner = env.begin_delta()
+    _play(env, 1)
+    env.undo_delta(inner)
+    assert _state(env) == after_one
+
+    env.undo_delta(outer)
+    assert _state(env) == before
+
+
+def test_exception_mid_step_undo_restores_state_and_class():
+    env = build_reset_env()
+    _play(env, 1)
+    before = _state(env)
+    board = env.board.copy()
+
+    def _broken_enemy_turn(trunc=False, **_kw):
+        env.unit_health[0] = 0
+        env.phase = "broken"
+        env.board = np.ones_like(env.board)
+        raise RuntimeError("boom")
+
+    env.enemyTurn = _broken_enemy_turn
+    mark = env.begin_delta()
+    try:
+        with pytest.raises(RuntimeError, match="boom"):
+            _play(env, 3)
+    finally:
+        env.undo_delta(mark)
+    del env.enemyTurn
+
+    assert type(env) is Warhammer40kEnv
+    assert _state(env) == before
+    assert np.array_equal(env.board, board)
+
+
+def test_failed_undo_still_closes_frame():
+    env = build_reset_env()
+    mark = env.begin_delta()
+    _play(env, 1)
+    unit = env.model[0]
+    x, y = map(int, unit.showCoords())
+    unit.set_anchor(x, y + 1)
+    unit.set_anchor = lambda *_a: (_ for _ in ()).throw(RuntimeError("anchor"))
+    with pytest.raises(RuntimeError, match="anchor"):
+        env.undo_delta(mark)
+    assert type(env) is Warhammer40kEnv
+    assert not env._delta_journal.frames and not env._delta_journal.entries
+
+
+def test_env_pickles_as_base_class_inside_frame():
+    env = build_reset_env()
+    mark = env.begin_delta()
+    _play(env, 1)
+    inside = _state(env)
+    clone = pickle.loads(pickle.dumps(env))
+    assert type(clone) is Warhammer40kEnv
+    assert "_delta_journal" not in clone.__dict__
+    assert _state(clone) == inside
+    assert type(copy.deepcopy(env)) is Warhammer40kEnv
+    env.undo_delta(mark)
+    assert _state(clone) == inside
+
+
+def test_undo_delta_rejects_unknown_mark():
+    env = build_reset_env()
+    mark = env.begin_delta()
+    env.undo_delta(mark)
+    with pytest.raises(ValueError):
+        env.undo_delta(mark)
+
+
+def test_mcts_delta_checkpoint_round_trip():
+    from core.models.alphazero_mcts import AlphaZeroFactorizedMCTS, MCTSConfig
+    from core.models.alphazero_model import AlphaZeroPolicyValueNet
+
+    env = build_reset_env()
+    net = AlphaZeroPolicyValueNet(4, [2])
+    mcts = AlphaZeroFactorizedMCTS(net, config=MCTSConfig(snapshot_mode="delta"))
+    before = _state(env)
+    token = mcts._env_checkpoint(env)
+    _play(env, 2)
+    assert mcts._restore_env_safe(env, token) is True
+    assert _state(env) == before
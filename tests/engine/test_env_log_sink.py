@@ -0,0 +1,81 @@
+import builtins
+import threading
+
+import pytest
+
+from core.engine import game_io
+from core.engine.io_profiler import get_io_profiler
+from tests.engine._helpers import build_reset_env
+
+
+def test_agent_log_is_batched_through_shared_writer(tmp_path, monkeypatch):
+    env = build_reset_env()
+    env._agent_log_path = str(tmp_path / "agent.md")
+    before = get_io_profiler().counters().get("log lines[los]", 0)
+
+    real_open = builtins.open
+
+    def _no_open_on_env_thread(path, *args, **kwargs):
+        if threading.current_thread() is threading.main_thread():
+            assert str(path) != env._agent_log_path, "агентский лог открыт на потоке среды"
+        return real_open(path, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", _no_open_on_env_thread)
+    for i in range(50):
+        env._append_agent_log(lambda i=i: f"LOS_DEBUG | line={i}", category="los")
+    monkeypatch.setattr(builtins, "open", real_open)
+    game_io.flush_log_writer()
+
+    lines = (tmp_path / "agent.md").read_text(encoding="utf-8").splitlines()
+    assert [line.split(" | ", 1)[1] for line in lines] == [f"LOS_DEBUG | line={i}" for i in range(50)]
+    if get_io_profiler().enabled:
+        assert get_io_profiler().counters()["log lines[los]"] == before + 50
+
+
+def test_disabled_categories_do_not_format(monkeypatch):
+    env = build_reset_env()
+
+    def _boom():
+        pytest.fail("сообщение выключенной категории не должно форматироваться")
+
+    env._log(_boom)
+    env._log_unit_phase("MODEL", "fight", 21, 0, _boom)
+    monkeypatch.setattr(env, "_format_unit_label", lambda *a, **k: _boom())
+    env._log_reward_unit("model", 21, 0, "x")
+    with env.simulation_mode():
+        env._append_agent_log(_boom)
+
+
+def test_log_flags_are_snapshotted_on_reset(monkeypatch):
+    env = build_reset_env()
+    assert not env._log_flags.terrain and not env._is_verbose()
+    monkeypatch.setenv("TERRAIN_DEBUG", "1")
+    monkeypatch.setenv("VERBOSE_LOGS", "1")
+    assert not env._log_flags.terrain
+    env.reset(options={"m": env.model, "e": env.enemy, "trunc": True})
+    assert env._log_flags.terrain and env._is_verbose() and env._should_log()
+
+
+def test_full_buffer_drops_are_reported_on_shutdown(tmp_path, monkeypatch):
+    monkeypatch.setenv("GUI_LOG_MAX_PENDING", "3")
+    writer = game_io._AsyncLogWriter()
+    path = str(tmp_path / "agent.md")
+    # Держим лок записи, чтобы фоновый поток не успел разгрузить очередь между submit().
+    with writer._write_lock:
+        for i in range(5):
+            writer.submit(path, f"line={i}")
+        assert writer.dropped_lines() == {path: 2}
+    writer.shutdown()
+
+    lines = (tmp_path / "agent.md").read_text(encoding="utf-8").splitlines()
+    assert lines[:3] == ["line=0", "line=1", "line=2"]
+    assert lines[3:] == ["[LOG] log writer dropped 2 line(s): buffer full"]
+
+
+def test_reset_flushes_previous_episode_log(tmp_path):
+    env = build_reset_env()
+    env._agent_log_path = str(tmp_path / "agent.md")
+    with game_io._ASYNC_LOG_WRITER._write_lock:
+        env._append_agent_log("LOS_DEBUG | last line", category="los")
+    env.reset(options={"m": env.model, "e": env.enemy, "trunc": True})
+    assert (tmp_path / "agent.md").read_text(encoding="utf-8").splitlines()[-1].endswith("LOS_DEBUG | last line")
@@ -0,0 +1,94 @@
+
+import numpy as np
+import torch
+
+from core.engine.phases import compile_options_to_action_dict
+from core.envs.env_process_pool import EnvProcessPool
+from tests.engine._helpers import build_reset_env
+
+
+def _play(env, steps: int) -> None:
+    action = compile_options_to_action_dict([], len(env.unit_health))
+    with env.simulation_mode():
+        for _ in range(steps):
+            env.step(dict(action))
+            if env.game_over:
+                break
+            env.enemyTurn(trunc=True)
+
+
+def _state(env, payload=None, tag=None) -> dict:
+    return {
+        "tag": tag,
+        "unit_health": list(env.unit_health),
+        "enemy_health": list(env.enemy_health),
+        "unit_coords": [list(map(int, c)) for c in env.unit_coords],
+        "enemy_coords": [list(map(int, c)) for c in env.enemy_coords],
+        "units": [list(map(int, u.showCoords())) for u in env.model + env.enemy],
+        "battle_round": env.battle_round,
+        "phase": env.phase,
+    }
+
+
+def test_workers_follow_synced_root_and_keep_task_order():
+    env = build_reset_env()
+    with EnvProcessPool(env, n_workers=2) as pool:
+        pool.sync_root(env)
+        out = pool.map(_state, {}, [{"tag": i} for i in range(5)])
+        assert [o["tag"] for o in out] == list(range(5))
+        expected = _state(env)
+        assert all({**o, "tag": None} == expected for o in out)
+
+        _play(env, 2)
+        pool.sync_root(env)
+        out = pool.map(_state, {}, [{"tag": 0}, {"tag": 1}])
+        assert all({**o, "tag": None} == _state(env) for o in out)
+
+
+def test_mcts_process_backend_runs_tree_search():
+    from core.models.action_contract import ordered_action_keys
+    from core.models.alphazero_mcts import AlphaZeroFactorizedMCTS, MCTSConfig
+    from core.models.alphazero_model import AlphaZeroPolicyValueNet
+
+    env = build_reset_env()
+    len_model = len(env.unit_health)
+    keys = ordered_action_keys(len_model)
+    legal = env.get_legal_action_masks_by_head(side="model")
+    masks = [np.asarray(legal[k], dtype=bool) for k in keys]
+    obs = np.asarray(env._get_observation(), dtype=np.float32)
+    net = AlphaZeroPolicyValueNet(int(obs.size), [int(m.size) for m in masks])
+    cfg = MCTSConfig(mode="tree", simulations=6, parallel_simulations=2, parallel_backend="process")
+    mcts = AlphaZeroFactorizedMCTS(net, config=cfg, device=None)
+    before = _state(env)
+    try:
+        targets, actions, _value = mcts.run(
+            obs=obs, legal_masks_by_head=masks, temperature=1.0, env=env, len_model=len_model
+        )
+        assert mcts._process_pool is not None
+    finally:
+        mcts.close_process_pool()
+    assert len(targets) == len(masks) and len(actions) == len(masks)
+    assert mcts.last_run_stats["simulations"] == 6.0
+    assert _state(env) == before
+
+
+def test_mcts_process_pool_is_reused_across_games_and_resent_on_set_net():
+    from core.models.alphazero_mcts import AlphaZeroFactorizedMCTS, MCTSConfig
+
+    cfg = MCTSConfig(mode="tree", max_depth=2, simulations=4, parallel_simulations=2, parallel_backend="process")
+    net = torch.nn.Linear(1, 1)
+    mcts = AlphaZeroFactorizedMCTS(net, config=cfg, device=None)
+    try:
+        first = mcts._get_process_pool(build_reset_env(1), 2, 2, None)
+        payload = mcts._process_payload_key
+        # новая партия — новый env, тот же пул и тот же payload
+        assert mcts._get_process_pool(build_reset_env(2), 2, 2, None) is first
+        assert mcts._process_payload_key == payload
+        with torch.no_grad():
+            net.weight.add_(1.0)
+        mcts.set_net(net)
+        assert mcts._get_process_pool(build_reset_env(2), 2, 2, None) is first
+        assert mcts._process_payload_key != payload
+    finally:
+        mcts.close()
+    assert mcts._process_pool is None and first.closed
@@ -0,0 +1,115 @@
+import copy
+
+import numpy as np
+
+from core.envs.env_clone_pool import EnvClonePool
+from core.envs.warhamEnv import Warhammer40kEnv
+from tests.engine.phases._helpers import build_env
+
+_FIELDS = (
+    "unit_health", "enemy_health", "unit_coords", "enemy_coords",
+    "unit_anchor_coords", "enemy_anchor_coords", "unit_model_wounds", "enemy_model_wounds",
+    "unit_model_positions", "enemy_model_positions", "unitInAttack", "enemyInAttack",
+    "unitFellBack", "enemyFellBack", "model_advance_roll", "enemy_advance_roll",
+    "modelCP", "enemyCP", "modelVP", "enemyVP", "battle_round", "phase", "active_side",
+    "game_over", "_objective_hold_streaks",
+)
+
+
+def _build_env(state_mode: str = "array") -> Warhammer40kEnv:
+    env = build_env()
+    env.state_mode = state_mode
+    return env
+
+
+def _state(env) -> dict:
+    return copy.deepcopy({k: getattr(env, k) for k in _FIELDS})
+
+
+def test_array_snapshot_is_single_buffer_and_round_trips():
+    env = _build_env()
+    env._apply_health_update("model", 0, 3.0, reason="test")
+    env.model_advance_roll[1] = 4
+    env.modelCP = 2
+    env.enemyVP = 5
+    env.phase = "shooting"
+    before = _state(env)
+
+    snap = env.snapshot_state()
+    assert isinstance(snap["_state_buffer"], np.ndarray)
+    assert snap["_state_buffer"].dtype == np.float64
+
+    env._apply_health_update("enemy", 1, 0.0, reason="test")
+    env.unit_coords[0] = [0, 0]
+    env.model_advance_roll[1] = None
+    env.modelCP = 0
+    env.enemyVP = 0
+    env.phase = "fight"
+
+    env.restore_state(snap)
+    assert _state(env) == before
+
+
+def test_array_snapshot_keeps_ragged_rows_and_number_types():
+    env = _build_env()
+    env.unit_model_wounds[0] = [2, 1.5]
+    env.enemy_model_wounds[1] = []
+    env.unit_model_positions[1] = [[1, 2, 0], [3.5, 4, 1]]
+    env.unit_health[1] = 2.5
+    before = _state(env)
+
+    snap = env.snapshot_state()
+    env.unit_model_wounds[0] = [2, 2, 2]
+    env.enemy_model_wounds[1] = [1, 1, 1]
+    env.unit_model_positions[1] = [[0, 0, 0]]
+    env.unit_health[1] = 6
+    env.restore_state(snap)
+
+    after = _state(env)
+    assert after == before
+    assert [type(w) for w in after["unit_model_wounds"][0]] == [int, float]
+    assert [type(v) for v in after["unit_model_positions"][1][1]] == [float, int, int]
+    assert type(after["unit_health"][0]) is type(before["unit_health"][0])
+    assert type(after["unit_health"][1]) is float
+
+
+def test_array_snapshot_matches_dict_snapshot_fields():
+    env_arr = _build_env("array")
+    env_dict = _build_env("dict")
+    for env in (env_arr, env_dict):
+        env._apply_health_update("model", 1, 1.0, reason="test")
+        env.restore_state(env.snapshot_state())
+    assert env_arr.unit_model_wounds == env_dict.unit_model_wounds
+    assert env_arr.unit_health == env_dict.unit_health
+
+
+def test_array_restore_moves_unit_objects_back():
+    env = _build_env()
+    start = [list(u.showCoords()) for u in env.model]
+    snap = env.snapshot_state()
+    env.model[0].set_anchor(start[0][0] + 1, start[0][1])
+    env.restore_state(snap)
+    assert [list(u.showCoords()) for u in env.model] == start
+
+
+def test_clone_pool_units_are_isolated():
+    env = _build_env()
+    pool = EnvClonePool(env, pool_size=2)
+    before = list(env.model[0].showCoords())
+    with pool.acquire() as clone:
+        assert clone.model[0] is not env.model[0]
+        assert clone.board is not env.board
+        clone.model[0].set_anchor(before[0] + 1, before[1])
+    assert list(env.model[0].showCoords()) == before
+
+
+def test_unpickled_env_restores_array_snapshot():
+    import pickle
+
+    env = _build_env()
+    env.snapshot_state()  # buffer + views created before pickling
+    clone = pickle.loads(pickle.dumps(env))
+    env._apply_health_update("model", 0, 1.0, reason="test")
+    env.modelCP = 3
+    clone.restore_state(env.snapshot_state())
+    assert _state(clone) == _state(env)
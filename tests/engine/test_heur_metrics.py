@@ -91,6 +91,7 @@ def test_flush_skips_empty_and_writes_nonempty(monkeypatch, tmp_path):
     from core.envs.warhamEnv import Warhammer40kEnv
 
     monkeypatch.setattr(we, "ARTIFACTS_METRICS_DIR", tmp_path)
+    monkeypatch.delenv("HEUR_METRICS_DECISIONS_DIR", raising=False)
     out_dir = tmp_path / "heur_decisions"
 
     # 1) пустые счётчики (moves==0) -> ничего не пишется
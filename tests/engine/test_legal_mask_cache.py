@@ -0,0 +1,44 @@
+
+import numpy as np
+
+from core.engine.phases import compile_options_to_action_dict
+from tests.engine._helpers import build_reset_env
+
+
+def _uncached(env, side, monkeypatch):
+    monkeypatch.setenv("LEGAL_MASK_CACHE", "0")
+    out = env.get_legal_action_masks_by_head(side=side)
+    monkeypatch.delenv("LEGAL_MASK_CACHE")
+    return out
+
+
+def _assert_same(a: dict, b: dict) -> None:
+    assert a.keys() == b.keys()
+    for key in a:
+        assert np.array_equal(a[key], b[key]), key
+
+
+def test_cached_masks_match_full_recompute_along_a_game(monkeypatch):
+    monkeypatch.delenv("LEGAL_MASK_CACHE", raising=False)
+    env = build_reset_env()
+    action = compile_options_to_action_dict([], len(env.unit_health))
+    with env.simulation_mode():
+        for _ in range(4):
+            for side in ("model", "enemy"):
+                _assert_same(env.get_legal_action_masks_by_head(side=side), _uncached(env, side, monkeypatch))
+            env.step(dict(action))
+            if env.game_over:
+                break
+            env.enemyTurn(trunc=True)
+
+
+def test_cache_hit_returns_independent_copies_and_tracks_moves(monkeypatch):
+    monkeypatch.delenv("LEGAL_MASK_CACHE", raising=False)
+    env = build_reset_env()
+    first = env.get_legal_action_masks_by_head(side="model")
+    first["move_num_0"][:] = False
+    again = env.get_legal_action_masks_by_head(side="model")
+    assert again["move_num_0"].any()
+
+    env.unit_coords[1] = [env.unit_coords[1][0] + 1, env.unit_coords[1][1]]
+    _assert_same(env.get_legal_action_masks_by_head(side="model"), _uncached(env, "model", monkeypatch))
@@ -0,0 +1,62 @@
+import random
+
+import numpy as np
+
+from core.engine.unit import Unit
+from core.envs.warhamEnv import Warhammer40kEnv
+
+
+def _mk(name: str, movement: int) -> Unit:
+    data = {"Name": name, "Movement": movement, "M": movement, "W": 2, "#OfModels": 1, "OC": 1, "T": 4, "Sv": 3}
+    weapon = {"Name": "Stub gun", "Range": 12, "A": 1, "BS": 4, "S": 4, "AP": 0, "Damage": 1}
+    melee = {"Name": "Stub blade", "A": 1, "WS": 4, "S": 4, "AP": 0, "Damage": 1}
+    return Unit(data=data, weapon=weapon, melee=melee, b_len=24, b_hei=18, GUI=False)
+
+
+def _build_env(seed: int) -> Warhammer40kEnv:
+    rng = random.Random(seed)
+    model = [_mk(f"Model{i}", rng.choice([4, 5, 6, 8])) for i in range(3)]
+    enemy = [_mk(f"Enemy{i}", rng.choice([4, 5, 6, 8])) for i in range(3)]
+    env = Warhammer40kEnv(enemy=enemy, model=model, b_len=24, b_hei=18)
+    for coords in (env.unit_coords, env.enemy_coords):
+        for i in range(len(coords)):
+            coords[i] = [rng.randrange(24), rng.randrange(18)]
+    env.enemy_coords[1] = list(env.unit_coords[0])  # stacked units
+    env.enemy_health[2] = 0
+    env.model_used_advance[1] = True
+    env.model_advance_roll[1] = 3
+    env.terrain_features = [
+        {"kind": "barricade", "cells": [[rng.randrange(24), rng.randrange(18)] for _ in range(25)]},
+        {"kind": "ruin", "tags": ["barricade-line"], "cells": [[2, 3], [2, 4], [30, 1]]},
+    ]
+    return env
+
+
+def test_grid_engine_matches_reference_loop(monkeypatch):
+    for seed in range(6):
+        env = _build_env(seed)
+        for side, n in (("model", 3), ("enemy", 3)):
+            for idx in range(n):
+                for budget in (None, 0, 3, 14):
+                    monkeypatch.setenv("MOVEMENT_REACHABLE_ENGINE", "grid")
+                    fast = env.get_unit_reachable_cells(side, idx, budget=budget)
+                    monkeypatch.setenv("MOVEMENT_REACHABLE_ENGINE", "python")
+                    ref = env.get_unit_reachable_cells(side, idx, budget=budget)
+                    assert fast == ref, (seed, side, idx, budget)
+                monkeypatch.setenv("MOVEMENT_REACHABLE_ENGINE", "grid")
+                fast = env.get_unit_movement_overlay(side, idx)
+                monkeypatch.setenv("MOVEMENT_REACHABLE_ENGINE", "python")
+                assert fast == env.get_unit_movement_overlay(side, idx), (seed, side, idx)
+
+
+def test_occupancy_grid_follows_unit_moves(monkeypatch):
+    monkeypatch.setenv("MOVEMENT_REACHABLE_ENGINE", "grid")
+    env = _build_env(1)
+    env.terrain_features = []
+    env.unit_coords[0] = [5, 5]
+    env.unit_coords[1] = [5, 6]
+    assert (6, 5) not in env.get_unit_reachable_cells("model", 0, budget=1)
+    env.unit_coords[1] = [10, 10]
+    assert (6, 5) in env.get_unit_reachable_cells("model", 0, budget=1)
+    assert env._occupancy_grid()[10, 10] >= 1
+    assert isinstance(env._barricade_grid(), np.ndarray)
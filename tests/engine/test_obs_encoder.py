@@ -0,0 +1,86 @@
+
+import numpy as np
+import pytest
+
+from core.engine.phases import compile_options_to_action_dict
+from tests.engine._helpers import build_reset_env
+
+
+def _reference_phase_block(env, side: str) -> list[float]:
+    """Прежний list-based блок PHASE_OBS_FEATURES (phase/timing/CP/стратагемы)."""
+    from core.engine.phases.stratagems import REGISTRY
+
+    cur_phase = str(getattr(env, "phase", "command") or "command")
+    block = [1.0 if cur_phase == p else 0.0 for p in ("command", "movement", "shooting", "charge", "fight", "scoring")]
+    block.append(1.0)
+    cp_self = float(env.modelCP if side == "model" else env.enemyCP)
+    cp_enemy = float(env.enemyCP if side == "model" else env.modelCP)
+    block += [cp_self / 12.0, cp_enemy / 12.0]
+    for d in REGISTRY:
+        ok = (cur_phase in tuple(p.value for p in d.phases)) and (cp_self >= d.cp_cost)
+        block.append(1.0 if ok else 0.0)
+    cur_round = int(getattr(env, "battle_round", 1))
+    used_recs = list(getattr(env, "stratagem_used", []) or [])
+    for d in REGISTRY:
+        was_used = any(
+            rec[0] == side and rec[1] == d.id and (len(rec) < 3 or int(rec[2]) == cur_round)
+            for rec in used_recs
+        )
+        block.append(1.0 if was_used else 0.0)
+    return block
+
+
+def _reference_obs(env, side: str, phase_features: bool) -> np.ndarray:
+    """Прежняя list-based сборка observation."""
+    if side == "enemy":
+        first = (env.enemy_health, env.enemy_coords, env.enemyCP)
+        second = (env.unit_health, env.unit_coords, env.modelCP)
+    else:
+        first = (env.unit_health, env.unit_coords, env.modelCP)
+        second = (env.enemy_health, env.enemy_coords, env.enemyCP)
+    obs = []
+    for health, coords, cp in (first, second):
+        for i in range(len(health)):
+            obs += [health[i], coords[i][0], coords[i][1]]
+        obs.append(cp)
+    for om in env.coordsOfOM:
+        obs += [om[0], om[1]]
+    obs.append(int(env.game_over))
+    if phase_features:
+        obs.extend(_reference_phase_block(env, side))
+    return np.array(obs, dtype=np.float32)
+
+
+@pytest.mark.parametrize("phase_features", ["0", "1"])
+def test_encoder_matches_list_observation_along_a_game(monkeypatch, phase_features):
+    monkeypatch.setenv("PHASE_OBS_FEATURES", phase_features)
+    env = build_reset_env(enemies=3)
+    action = compile_options_to_action_dict([], len(env.unit_health))
+    with env.simulation_mode():
+        for _ in range(3):
+            for side in ("model", "enemy"):
+                obs = env.get_observation_for_side(side)
+                assert obs.dtype == np.float32
+                assert np.array_equal(obs, _reference_obs(env, side, phase_features == "1"))
+            env.step(dict(action))
+            if env.game_over:
+                break
+            env.enemyTurn(trunc=True)
+
+
+def test_encoder_writes_into_caller_buffer(monkeypatch):
+    monkeypatch.setenv("PHASE_OBS_FEATURES", "0")
+    env = build_reset_env(enemies=3)
+    size = env._obs_encoder.size("model")
+    batch = np.zeros((2, size), dtype=np.float32)
+    out = env.get_observation_for_side("model", out=batch[1])
+    assert np.shares_memory(out, batch)
+    assert np.array_equal(batch[1], _reference_obs(env, "model", False))
+    assert not batch[0].any()
+
+    first = env.get_observation_for_side("model")
+    env.unit_health[0] = 0
+    assert first[0] != 0  # возвращается копия, а не внутренний буфер
+
+    with pytest.raises(ValueError):
+        env.get_observation_for_side("model", out=np.zeros(size + 1, dtype=np.float32))
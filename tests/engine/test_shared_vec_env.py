@@ -0,0 +1,177 @@
+import multiprocessing as mp
+import threading
+
+import numpy as np
+import pytest
+
+from core.engine.phases import compile_options_to_action_dict
+from core.envs.shared_vec_env import SharedEnvSlot, SharedMemoryVecEnv, SharedVecSpec, serve_slot
+from core.models.action_contract import ordered_action_keys
+from tests.engine._helpers import build_reset_env
+
+# Ключи _lean_train_info (train.py) сверх здоровья/VP: нужны таймлайну раундов и учёту end reason.
+_LEAN_EXTRA_KEYS = (
+    "turn", "battle round", "end reason", "winner",
+    "model controlled objectives", "player controlled objectives",
+)
+
+
+def _worker(conn, seed: int) -> None:
+    env = build_reset_env(seed)
+
+    def _step(action):
+        obs, reward, done, _res, info = env.step(action)
+        return obs, reward, done, info, env.get_legal_action_masks_by_head(side="model")
+
+    while True:
+        cmd, payload = conn.recv()
+        if cmd == "attach_shm":
+            slot = SharedEnvSlot(*payload)
+            conn.send(True)
+            serve_slot(
+                conn,
+                slot,
+                step_fn=_step,
+                reset_fn=lambda: (env._get_observation(), env.get_info(), None),
+                enemy_turn_fn=lambda: env.enemyTurn(trunc=True),
+            )
+        elif cmd == "ping":
+            conn.send("pong")
+        elif cmd == "close":
+            break
+
+
+def test_step_all_matches_in_process_env_and_detaches():
+    # Оба воркера с одним seed: каждый обязан повторять траекторию эталонного env в этом процессе.
+    seeds = [7, 7]
+    ctx = mp.get_context("spawn")
+    conns, procs = [], []
+    for seed in seeds:
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(target=_worker, args=(child, seed), daemon=True)
+        proc.start()
+        conns.append(parent)
+        procs.append(proc)
+
+    ref = build_reset_env(seeds[0])
+    len_model = len(ref.unit_health)
+    keys = ordered_action_keys(len_model)
+    sizes = [int(ref.action_space.spaces[k].n) for k in keys]
+    spec = SharedVecSpec(
+        n_envs=len(seeds),
+        obs_dim=int(ref._get_observation().size),
+        keys=tuple(keys),
+        head_sizes=tuple(sizes),
+        n_model=len_model,
+        n_enemy=len(ref.enemy_health),
+        mission=ref.mission_name,
+    )
+    vec = SharedMemoryVecEnv(conns, spec)
+    try:
+        action = compile_options_to_action_dict([], len_model)
+        row = [int(action[k]) for k in keys]
+        for _ in range(3):
+            vec.enemy_turn_all()
+            ref.enemyTurn(trunc=True)
+            obs, rewards, dones, infos = vec.step_all([row] * len(seeds))
+            ref_obs, ref_reward, ref_done, _res, ref_info = ref.step(dict(action))
+            legal = ref.get_legal_action_masks_by_head(side="model")
+            assert np.array_equal(ref.get_legal_shoot_mask(side="model"), legal["shoot"])
+            for i in range(len(seeds)):
+                assert np.array_equal(obs[i], ref_obs)
+                assert rewards[i] == float(ref_reward)
+                assert bool(dones[i]) == bool(ref_done)
+                assert infos[i]["model health"] == list(ref_info["model health"])
+                assert infos[i]["model VP"] == ref_info["model VP"]
+                for key in _LEAN_EXTRA_KEYS:
+                    assert infos[i][key] == ref_info[key], key
+                if not ref_done:
+                    assert np.array_equal(vec.head_mask(i, "shoot"), legal["shoot"])
+            if ref_done:
+                break
+    finally:
+        vec.close()
+
+    for conn in conns:
+        conn.send(("ping", None))
+        assert conn.recv() == "pong"
+        conn.send(("close", None))
+    for proc in procs:
+        proc.join(timeout=10)
+
+
+def _flaky_worker(conn, fail: bool) -> None:
+    def _step(action):
+        if fail:
+            raise ValueError("boom")
+        return np.full(2, action["shoot"], dtype=np.float32), 1.0, False, {}, None
+
+    cmd, payload = conn.recv()
+    assert cmd == "attach_shm"
+    slot = SharedEnvSlot(*payload)
+    conn.send(True)
+    serve_slot(
+        conn,
+        slot,
+        step_fn=_step,
+        reset_fn=lambda: (np.zeros(2, dtype=np.float32), {}, None),
+        enemy_turn_fn=lambda: None,
+    )
+
+
+def test_worker_error_drains_every_reply_before_raising():
+    spec = SharedVecSpec(n_envs=3, obs_dim=2, keys=("shoot",), head_sizes=(3,), n_model=1, n_enemy=1)
+    conns, threads = [], []
+    for idx in range(spec.n_envs):
+        parent, child = mp.Pipe()
+        thread = threading.Thread(target=_flaky_worker, args=(child, idx == 0), daemon=True)
+        thread.start()
+        conns.append(parent)
+        threads.append(thread)
+    vec = SharedMemoryVecEnv(conns, spec)
+    try:
+        with pytest.raises(RuntimeError, match="worker 0 failed: ValueError: boom"):
+            vec.step_all([[2]] * spec.n_envs)
+        # ответы воркеров 1 и 2 уже прочитаны: следующая команда не получает их ACK
+        assert not any(conn.poll() for conn in conns)
+        vec.enemy_turn_all()
+        # masks=None -> голова считается all_true
+        assert vec.head_mask(1, "shoot").tolist() == [True, True, True]
+        assert vec.obs(1).tolist() == [2.0, 2.0]
+    finally:
+        vec.close()
+    for thread in threads:
+        thread.join(timeout=10)
+
+
+def _info_worker(conn, info: dict) -> None:
+    cmd, payload = conn.recv()
+    assert cmd == "attach_shm"
+    slot = SharedEnvSlot(*payload)
+    conn.send(True)
+    serve_slot(
+        conn,
+        slot,
+        step_fn=lambda action: (np.zeros(2, dtype=np.float32), 0.0, False, info, None),
+        reset_fn=lambda: (np.zeros(2, dtype=np.float32), {}, None),
+        enemy_turn_fn=lambda: None,
+    )
+
+
+def test_lean_info_carries_round_objectives_and_labels():
+    spec = SharedVecSpec(n_envs=1, obs_dim=2, keys=("shoot",), head_sizes=(3,), n_model=1, n_enemy=1, mission="m")
+    info = {
+        "model health": [3.0], "player health": [1.5], "in attack": [[0, 0]], "model VP": 5, "player VP": 2,
+        "turn": 4, "battle round": 3, "end reason": "turn_limit", "winner": "model",
+        "model controlled objectives": [0, 2], "player controlled objectives": [],
+    }
+    parent, child = mp.Pipe()
+    thread = threading.Thread(target=_info_worker, args=(child, info), daemon=True)
+    thread.start()
+    vec = SharedMemoryVecEnv([parent], spec)
+    try:
+        _obs, _rewards, _dones, infos = vec.step_all([[0]])
+    finally:
+        vec.close()
+    thread.join(timeout=10)
+    assert infos[0] == {**info, "mission": "m", "model health": [3], "player health": [1.5]}
@@ -0,0 +1,66 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from core.engine import state_export
+from core.engine.state_export import subscribe_state_written, unsubscribe_state_written, write_state_json
+from tests.engine._helpers import build_reset_env
+
+
+class TestStatePushNotify(unittest.TestCase):
+    def test_listeners_get_increasing_seq_after_write(self):
+        env = build_reset_env(3)
+        seen = []
+
+        def _listener(path, seq):
+            # Файл уже на месте к моменту уведомления.
+            self.assertTrue(os.path.exists(path))
+            seen.append((path, seq))
+
+        def _broken(_path, _seq):
+            raise RuntimeError("listener failure must not break export")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "state.json")
+            subscribe_state_written(_broken)
+            subscribe_state_written(_listener)
+            try:
+                for mode in ("off", "stream", "stream"):
+                    with patch.dict(os.environ, {"STATE_STREAM_MODE": mode, "STATE_PAYLOAD_MODE": "light"}):
+                        payload = write_state_json(env, path=state_path)
+                    self.assertEqual(seen[-1], (state_path, payload["state_seq"]))
+            finally:
+                unsubscribe_state_written(_listener)
+                unsubscribe_state_written(_broken)
+        seqs = [seq for _path, seq in seen]
+        self.assertEqual(len(seqs), 3)
+        self.assertEqual(seqs, sorted(set(seqs)))
+
+    def test_stream_write_failure_falls_back_to_state_json(self):
+        env = build_reset_env(4)
+        logged = []
+        env._append_agent_log = lambda msg, category="agent": logged.append(msg)
+
+        class _BrokenWriter:
+            def write(self, _payload):
+                raise PermissionError("state.stream is locked by the viewer")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "state.json")
+            with open(state_path, "w", encoding="utf-8") as handle:
+                handle.write("{}")
+            env_vars = {"STATE_STREAM_MODE": "stream", "STATE_PAYLOAD_MODE": "light"}
+            with patch.dict(os.environ, env_vars), patch.object(
+                state_export, "get_state_stream_writer", lambda _path: _BrokenWriter()
+            ):
+                payload = write_state_json(env, path=state_path)
+            with open(state_path, encoding="utf-8") as handle:
+                self.assertEqual(json.load(handle)["state_seq"], payload["state_seq"])
+        self.assertEqual(len(logged), 1)
+        self.assertIn("[STATE][STREAM][WARN]", logged[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+from unittest.mock import patch
+
+from core.engine import state_export
+from tests.engine._helpers import build_reset_env
+
+
+def _statuses(env) -> list:
+    versions = env.unit_status_versions()
+    return [state_export._unit_status_payload(env, side, idx, versions) for side in ("model", "enemy") for idx in range(2)]
+
+
+def _fresh_statuses(env) -> list:
+    env.__dict__.pop("_unit_status_cache", None)
+    return _statuses(env)
+
+
+class TestStateStatusCache(unittest.TestCase):
+    def test_unchanged_board_reuses_cached_status(self):
+        env = build_reset_env(7)
+        env.phase = "movement"
+        first = _statuses(env)
+        with patch.object(state_export, "_status_visibility", side_effect=AssertionError("recomputed")), \
+                patch.object(state_export, "_status_reachable", side_effect=AssertionError("recomputed")):
+            self.assertEqual(_statuses(env), first)
+
+    def test_moved_unit_invalidates_dependent_entries(self):
+        env = build_reset_env(8)
+        env.phase = "movement"
+        _statuses(env)
+        env.enemy_coords[0][0] = max(0, int(env.enemy_coords[0][0]) - 3)
+        env._sync_model_positions_to_anchors()
+        cached = _statuses(env)
+        self.assertEqual(cached, _fresh_statuses(env))
+
+        env.phase = "shooting"
+        self.assertEqual(_statuses(env), _fresh_statuses(env))
+        self.assertEqual(_statuses(env)[0]["reachable_cells"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import copy
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from app.viewer.state import StateWatcher, merge_with_defaults
+from core.engine.state_stream import StateStreamReader, StateStreamWriter, apply_patch, diff_dict
+
+
+def _payload(step: int, terrain_kind: str = "ruin") -> dict:
+    return {
+        "turn": step,
+        "phase": "movement" if step % 2 else "shooting",
+        "units": [
+            {"side": "model", "id": 1, "hp": 10 - step, "unit_status": {"in_cover": step % 3 == 0, "exposed_to": [2]}},
+            {"side": "player", "id": 2, "hp": 8, "unit_status": {"in_cover": False, "exposed_to": []}},
+        ][: 2 if step < 4 else 1],
+        "terrain_features": [
+            {"id": "t1", "kind": terrain_kind, "cells": [[1, 2], [1, 3]], "covering_unit_ids": [1] if step % 3 == 0 else []},
+        ],
+        "log_tail": ["x"] if step % 2 else None,
+        "viewer": {"step_seq": step},
+    }
+
+
+class TestStateStream(unittest.TestCase):
+    def test_patch_roundtrip_nested_and_removed_keys(self):
+        prev = {"a": 1, "b": {"c": {"d": 1, "e": 2}}, "gone": True}
+        cur = {"a": 1, "b": {"c": {"d": 3}}, "new": [1]}
+        patch = diff_dict(prev, cur)
+        self.assertNotIn("a", patch.get("s", {}))
+        self.assertEqual(apply_patch(copy.deepcopy(prev), patch), cur)
+
+    def test_reader_tracks_writer_across_deltas_layout_change_and_rotation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "state.stream")
+            with patch.dict(os.environ, {"STATE_STREAM_MAX_BYTES": "4096", "STATE_STREAM_KEYFRAME_EVERY": "5"}):
+                writer = StateStreamWriter(path)
+            reader = StateStreamReader(path)
+            try:
+                for step in range(40):
+                    payload = _payload(step, terrain_kind="ruin" if step < 20 else "forest")
+                    writer.write(payload)
+                    if step % 3 == 0:
+                        self.assertEqual(reader.poll(), payload)
+                self.assertIsNone(reader.poll())
+                # Поздно подключившийся читатель стартует с последнего keyframe.
+                self.assertEqual(StateStreamReader(path).poll(), payload)
+                self.assertLess(os.path.getsize(path), 4096 + 1024)
+            finally:
+                writer.close()
+
+    def test_unchanged_state_appends_nothing(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = StateStreamWriter(os.path.join(tmp, "state.stream"))
+            try:
+                writer.write(_payload(1))
+                self.assertEqual(writer.write(_payload(1)), 0)
+            finally:
+                writer.close()
+
+    def test_state_watcher_prefers_fresh_stream(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            state_path = os.path.join(tmp, "state.json")
+            with open(state_path, "w", encoding="utf-8") as handle:
+                handle.write('{"turn": 0}')
+            os.utime(state_path, ns=(1, 1))
+            writer = StateStreamWriter(os.path.join(tmp, "state.stream"))
+            watcher = StateWatcher(state_path)
+            try:
+                writer.write(_payload(2))
+                self.assertTrue(watcher.load_if_changed())
+                self.assertEqual(watcher.state, merge_with_defaults(_payload(2)))
+                self.assertFalse(watcher.load_if_changed())
+            finally:
+                writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from core.engine.state_export import write_state_json
+from tests.engine._helpers import build_reset_env
+
+
+class TestStateThreatOverlay(unittest.TestCase):
+    def test_overlay_is_opt_in(self):
+        env = build_reset_env(5)
+        env.phase = "movement"
+        env.active_side = "enemy"
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict(os.environ, {"STATE_STREAM_MODE": "off", "STATE_PAYLOAD_MODE": "light"}):
+            os.environ.pop("STATE_THREAT_OVERLAY", None)
+            self.assertIsNone(write_state_json(env, path=os.path.join(tmp, "state.json"))["threat_overlay"])
+
+    def test_player_movement_exports_model_threat_maps(self):
+        env = build_reset_env(5)
+        env.phase = "movement"
+        env.active_side = "enemy"
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict(
+                    os.environ,
+                    {"STATE_STREAM_MODE": "off", "STATE_PAYLOAD_MODE": "light", "STATE_THREAT_OVERLAY": "1"},
+                ):
+            payload = write_state_json(env, path=os.path.join(tmp, "state.json"))
+            overlay = payload["threat_overlay"]
+            maps = env.board_threat_maps()
+            self.assertEqual(overlay["exposure_count"], maps["exposure_count"].tolist())
+            self.assertEqual(len(overlay["shoot"]), env.b_len)
+            self.assertEqual(len(overlay["charge"][0]), env.b_hei)
+
+            env.active_side = "model"
+            self.assertIsNone(write_state_json(env, path=os.path.join(tmp, "state.json"))["threat_overlay"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import unittest
+
+from core.engine.unitData import _UNIT_DATA_PATH, unit_catalog, unitData, weaponData
+
+
+def _reference_weapon(data: dict, name: str):
+    for record in data["WeaponData"]:
+        if record["Name"][0:len(name)].lower() == name.lower():
+            return record
+    return {}
+
+
+class TestUnitCatalog(unittest.TestCase):
+    def test_lookups_match_linear_scan(self):
+        with open(_UNIT_DATA_PATH, encoding="utf-8") as handle:
+            data = json.load(handle)
+        for record in data["UnitData"]:
+            self.assertEqual(unitData(record["Army"].upper(), record["Name"].lower()), record)
+        for record in data["WeaponData"]:
+            for cut in (1, 3, len(record["Name"])):
+                prefix = record["Name"][:cut]
+                self.assertEqual(weaponData(prefix), _reference_weapon(data, prefix))
+        self.assertEqual(weaponData("None"), "None")
+        self.assertEqual(weaponData("no such weapon"), {})
+        self.assertEqual(unitData("Necrons", "no such unit"), {})
+
+    def test_returned_records_do_not_alias_catalog(self):
+        record = unitData("Necrons", "Necron Warriors")
+        record["#OfModels"] = 999
+        record["Weapons"].append("Extra")
+        fresh = unitData("Necrons", "Necron Warriors")
+        self.assertNotEqual(fresh["#OfModels"], 999)
+        self.assertNotIn("Extra", fresh["Weapons"])
+        with self.assertRaises(TypeError):
+            unit_catalog().unit("Necrons", "Necron Warriors")["Name"] = "x"
+
+    def test_catalog_reloads_when_file_changes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "unitData.json")
+            payload = {"UnitData": [{"Army": "A", "Name": "U", "W": 1}], "WeaponData": [{"Name": "Gun", "Type": "Ranged"}]}
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle)
+            first = unit_catalog(path)
+            self.assertIs(unit_catalog(path), first)
+            payload["UnitData"][0]["W"] = 22
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump(payload, handle)
+            os.utime(path, ns=(1, 1))
+            self.assertEqual(unit_catalog(path).unit("a", "u")["W"], 22)
+            unit_catalog()  # вернуть общий каталог на штатный файл
+
+
+if __name__ == "__main__":
+    unittest.main()
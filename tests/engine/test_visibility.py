@@ -53,6 +53,89 @@ class TestVisibility(unittest.TestCase):
         self.assertLess(report["rays_clear"], report["rays_total"])
 
 
+class TestLosMatrix(unittest.TestCase):
+    def test_matches_visibility_report_for_every_pair(self):
+        opaque = {(2, 1), (2, 2), (3, 4), (5, 0)}
+        for mode in ("single_ray", "multi_ray_5", "multi_ray_9"):
+            matrix = visibility.LosMatrix(opaque, 7, 6, mode)
+            cells = [(x, y) for x in range(7) for y in range(6)]
+            for a in cells:
+                for b in cells:
+                    expected = visibility.visibility_report(a, b, opaque_cells_set=opaque, visibility_mode=mode)["los"]
+                    self.assertEqual(matrix.has_los(a, b), expected, (mode, a, b))
+            # second pass is served from the table
+            self.assertTrue(all(matrix.has_los(a, a) for a in cells))
+
+    def test_empty_layout_needs_no_table(self):
+        matrix = visibility.LosMatrix(set(), 40, 60, "multi_ray_5")
+        self.assertEqual(matrix.nbytes, 0)
+        self.assertTrue(matrix.has_los((0, 0), (39, 59)))
+
+    def test_cache_is_keyed_by_layout(self):
+        a = visibility.los_matrix_for({(1, 1)}, 10, 10, "single_ray")
+        self.assertIs(visibility.los_matrix_for([(1, 1)], 10, 10, "single_ray"), a)
+        self.assertIsNot(visibility.los_matrix_for({(1, 2)}, 10, 10, "single_ray"), a)
+        self.assertIsNot(visibility.los_matrix_for({(1, 1)}, 10, 10, "multi_ray_5"), a)
+
+
+class TestBatchVisibility(unittest.TestCase):
+    def _random_layout(self, seed):
+        import random
+
+        rng = random.Random(seed)
+        opaque = {(rng.randrange(12), rng.randrange(10)) for _ in range(14)}
+        obscuring = {(rng.randrange(12), rng.randrange(10)) for _ in range(20)}
+        pairs = [((rng.randrange(12), rng.randrange(10)), (rng.randrange(12), rng.randrange(10))) for _ in range(150)]
+        pairs += [((1, 1), (6, 6)), ((0, 0), (11, 0)), ((3, 3), (3, 3)), ((9, 2), (2, 9))]
+        return opaque, obscuring, pairs
+
+    def test_batch_visibility_matches_reference_report(self):
+        for seed, mode in enumerate(("single_ray", "multi_ray_5", "multi_ray_9")):
+            opaque, obscuring, pairs = self._random_layout(seed)
+            flags = visibility.batch_visibility(
+                [a for a, _ in pairs], [b for _, b in pairs],
+                opaque_cells_set=opaque, target_cover_cells_set=obscuring,
+                visibility_mode=mode, grid_shape=(12, 10),
+            )
+            for i, (a, b) in enumerate(pairs):
+                ref = visibility.visibility_report(
+                    a, b, opaque_cells_set=opaque, target_cover_cells_set=obscuring, visibility_mode=mode,
+                )
+                for key in ("los", "obscured", "fully_visible", "partially_visible", "rays_clear", "rays_obscured"):
+                    self.assertEqual(flags[key][i], ref[key], (mode, a, b, key))
+
+    def test_numpy_kernel_matches_python_raytrace(self):
+        import numpy as np
+
+        from core.engine import hotloops
+
+        opaque, obscuring, pairs = self._random_layout(5)
+        opaque_grid = visibility.cells_to_grid(opaque, (12, 10))
+        obscuring_grid = visibility.cells_to_grid(obscuring, (12, 10))
+        a_pts, b_pts = [], []
+        for a, b in pairs:
+            for pa, pb in zip(visibility.get_cell_sample_points(a, "multi_ray_9"), visibility.get_cell_sample_points(b, "multi_ray_9")):
+                a_pts.append(pa)
+                b_pts.append(pb)
+        blocked, obscured = hotloops._numpy_batch_raytrace(
+            np.asarray(a_pts), np.asarray(b_pts), opaque_grid, obscuring_grid,
+        )
+        for i, (pa, pb) in enumerate(zip(a_pts, b_pts)):
+            middle = visibility.raytrace(pa, pb)[1:-1]
+            self.assertEqual(bool(blocked[i]), any(c in opaque for c in middle), (pa, pb))
+            self.assertEqual(bool(obscured[i]), any(c in obscuring for c in middle), (pa, pb))
+
+    def test_los_matrix_fill_matches_lazy_lookup(self):
+        opaque = {(2, 1), (2, 2), (3, 4)}
+        filled = visibility.LosMatrix(opaque, 6, 5, "multi_ray_5")
+        filled.fill()
+        lazy = visibility.LosMatrix(opaque, 6, 5, "multi_ray_5")
+        cells = [(x, y) for x in range(6) for y in range(5)]
+        for a in cells:
+            for b in cells:
+                self.assertEqual(filled.has_los(a, b), lazy.has_los(a, b), (a, b))
+
+
 if __name__ == "__main__":
     unittest.main()
 
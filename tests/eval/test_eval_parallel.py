@@ -0,0 +1,42 @@
+import argparse
+import random
+import unittest
+from unittest.mock import patch
+
+import eval as eval_mod
+
+
+def _fake_episode(*_args, **_kwargs):
+    return ("model", "turn_limit", random.randint(-5, 5), 0, 0, 1, random.random(), 0.0, 0.0, [])
+
+
+class TestEvalParallel(unittest.TestCase):
+    def test_game_seed_makes_results_independent_of_schedule(self) -> None:
+        setup = {
+            "env": None, "model_units": [], "enemy_units": [], "policy_net": None,
+            "device": None, "algo": "dqn", "opponent_policy_fn": None,
+        }
+        with patch.object(eval_mod, "run_episode", _fake_episode), \
+                patch.object(eval_mod, "eval_stop_requested", return_value=False):
+            forward = dict(eval_mod._iter_games_sequential(setup, 4, 0.0, "P1", base_seed=11))
+            # Воркер играет игру 3 «первой» — сид зависит только от номера игры.
+            again = eval_mod._play_game(setup, 0.0, "P1", eval_mod._game_seed(11, 3))
+        self.assertEqual(list(forward), [1, 2, 3, 4])
+        self.assertEqual(forward[3], again)
+        self.assertNotEqual(forward[1], forward[2])
+        self.assertIsNone(eval_mod._game_seed(None, 3))
+
+    def test_worker_setup_failure_stops_iteration_with_error(self) -> None:
+        args = argparse.Namespace(
+            model="missing_model_for_parallel_eval.pickle", learner_agent_id="", opponent_agent_id="",
+            opponent_policy="mirror", workers=2, seed=0,
+        )
+        messages: list[str] = []
+        with patch.object(eval_mod, "log", messages.append):
+            results = list(eval_mod._iter_games_parallel(args, 3, 0.0, "P1", base_seed=0, workers=2))
+        self.assertEqual(results, [])
+        self.assertTrue(any("_iter_games_parallel" in m for m in messages))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import copy
+
+import numpy as np
+import pytest
+import torch
+
+import core.models.utils as model_utils
+from core.models.DQN import DQN
+from core.models.memory import ArrayReplayMemory, ReplayMemory
+
+
+def _transitions(n, n_obs=6, mask_every=2):
+    gen = torch.Generator().manual_seed(3)
+    out = []
+    for i in range(n):
+        state = torch.randn(1, n_obs, generator=gen)
+        action = torch.tensor([[i % 3, 1, i % 4, 0, 1, 0]], dtype=torch.long)
+        next_state = None if i % 5 == 4 else torch.randn(1, n_obs, generator=gen)
+        reward = torch.tensor([0.1 * i], dtype=torch.float32)
+        mask = torch.tensor([True, i % 2 == 0, False, True]) if i % mask_every == 0 else None
+        out.append((state, action, next_state, reward, 1 + i % 3, mask))
+    return out
+
+
+def test_ring_keeps_latest_and_gathers_batch_tensors():
+    memory = ArrayReplayMemory(8)
+    items = _transitions(13)
+    for item in items:
+        memory.push(*item)
+    assert len(memory) == 8
+
+    batch = memory.sample_batch(8)
+    assert batch.state.shape == (8, 6) and batch.action.shape == (8, 6)
+    rewards = sorted(round(float(r), 4) for r in batch.reward)
+    assert rewards == [round(0.1 * i, 4) for i in range(5, 13)]
+    assert int(batch.non_final_mask.sum()) == batch.next_state.shape[0]
+    assert batch.next_shoot_mask.shape == (batch.next_state.shape[0], 4)
+
+    legacy = memory.sample(3)
+    assert len(legacy) == 3 and legacy[0].state.shape == (1, 6)
+
+
+def test_state_dict_round_trip_and_legacy_formats():
+    items = _transitions(11)
+    memory = ArrayReplayMemory(16)
+    for item in items:
+        memory.push(*item)
+    state = memory.state_dict()
+    assert isinstance(state["columns"]["state"], np.ndarray)
+
+    restored = ArrayReplayMemory(16)
+    assert restored.load_state_dict(copy.deepcopy(state)) == 11
+    for name, col in state["columns"].items():
+        assert np.array_equal(restored.state_dict()["columns"][name], col)
+
+    # deque-бэкенд читает array-формат, array-бэкенд — старый список namedtuple
+    legacy = ReplayMemory(16)
+    assert legacy.load_state_dict(state) == 11
+    back = ArrayReplayMemory(16)
+    assert back.load_state_dict(legacy.state_dict()) == 11
+    assert np.array_equal(back.state_dict()["columns"]["state"], state["columns"]["state"])
+
+
+def test_optimize_model_step_matches_deque_replay():
+    n_obs = 6
+    n_actions = [3, 2, 4, 2, 2, 2]
+    items = _transitions(8, n_obs=n_obs, mask_every=1)
+    items = [(s, a, ns, r, n, torch.tensor([True, True, True, bool(k % 2)])) for k, (s, a, ns, r, n, _m) in enumerate(items)]
+
+    torch.manual_seed(0)
+    base = DQN(n_obs, n_actions, noisy=False, distributional=None)
+    results = []
+    old_batch = model_utils.BATCH_SIZE
+    model_utils.BATCH_SIZE = len(items)
+    try:
+        for memory in (ReplayMemory(16), ArrayReplayMemory(16)):
+            for item in items:
+                memory.push(*item)
+            policy = copy.deepcopy(base)
+            target = copy.deepcopy(base)
+            try:
+                optimizer = torch.optim.SGD(policy.parameters(), lr=0.1)
+            except Exception as exc:
+                pytest.skip(f"torch.optim недоступен в этой среде: {exc}")
+            model_utils.optimize_model(policy, target, optimizer, memory, n_obs, double_dqn_enabled=True)
+            results.append(torch.cat([p.detach().flatten() for p in policy.parameters()]))
+    finally:
+        model_utils.BATCH_SIZE = old_batch
+    torch.testing.assert_close(results[0], results[1], rtol=1e-5, atol=1e-6)
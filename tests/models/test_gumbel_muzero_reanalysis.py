@@ -0,0 +1,137 @@
+import numpy as np
+import torch
+
+from core.models.gumbel_muzero_model import GumbelMuZeroNet
+from core.models.gumbel_muzero_reanalysis import GumbelMuZeroReanalysisConfig, GumbelMuZeroReanalyzer
+from core.models.gumbel_muzero_replay import GMZTransition, GumbelMuZeroReplayBuffer
+from core.models.gumbel_muzero_search import GumbelMuZeroSearch, GumbelMuZeroSearchConfig, run_batched
+
+N_OBS = 8
+SIZES = [4, 3]
+
+
+def _net():
+    torch.manual_seed(0)
+    return GumbelMuZeroNet(
+        obs_dim=N_OBS, action_sizes=SIZES, latent_dim=32, hidden_dim=32, num_layers=1, action_embed_dim=8,
+    )
+
+
+def _search(net):
+    # gumbel_scale≈0: корневой выбор без шума, результат не зависит от разбиения на чанки
+    cfg = GumbelMuZeroSearchConfig(
+        num_simulations=8, root_top_k=2, temperature=0.2, gumbel_scale=0.0, prior_weight=0.25, tree_reuse=False,
+    )
+    return GumbelMuZeroSearch(net=net, config=cfg, device=torch.device("cpu"))
+
+
+def _replay(n=12, capacity=32, version=0):
+    rng = np.random.default_rng(3)
+    replay = GumbelMuZeroReplayBuffer(capacity=capacity)
+    for i in range(n):
+        masks = [rng.integers(0, 2, size=a).astype(np.float32) for a in SIZES]
+        for m in masks:
+            m[0] = 1.0
+        replay.push(
+            GMZTransition(
+                state=rng.standard_normal(N_OBS).astype(np.float32),
+                action=np.zeros(len(SIZES), dtype=np.int64),
+                reward=0.0,
+                done=False,
+                policy_targets=[np.full(a, 1.0 / a, dtype=np.float32) for a in SIZES],
+                value_target=0.5,
+                legal_masks_by_head=masks if i % 3 else None,
+                policy_version=version,
+            )
+        )
+    return replay
+
+
+def test_batched_reanalysis_writes_search_targets_in_place():
+    net = _net()
+    replay = _replay()
+    cfg = GumbelMuZeroReanalysisConfig(batch_size=12, chunk_size=5, value_target_mix=0.5)
+    reanalyzer = GumbelMuZeroReanalyzer(config=cfg, search=_search(net), device=torch.device("cpu"))
+
+    inputs = replay.reanalysis_inputs(np.arange(12))
+    searched = [i for i in range(12) if i % 3]
+    assert reanalyzer.update_replay_with_reanalysis(replay, net, policy_version=4) == 12
+
+    # Тот же run_batched по строкам с масками, одним вызовом.
+    expected = run_batched(
+        net=net, cfg=reanalyzer._search.cfg, device=torch.device("cpu"), deterministic=True,
+        requests=[
+            {"env_id": i, "obs": inputs["states"][i], "legal_masks_by_head": [m[i] for m in inputs["legal_masks"]]}
+            for i in searched
+        ],
+    )
+    for i, res in zip(searched, expected):
+        tr = replay.transition_at(i)
+        for h in range(len(SIZES)):
+            np.testing.assert_allclose(tr.policy_targets[h], res["policy_targets"][h], atol=1e-5)
+        assert abs(tr.value_target - (0.25 + 0.5 * res["value_est"])) < 1e-5
+
+    with torch.no_grad():
+        logits, _value, _r, _l = net.initial_inference(torch.as_tensor(inputs["states"][[0]]))
+    np.testing.assert_allclose(replay.transition_at(0).policy_targets[0], torch.softmax(logits[0], 1)[0].numpy(), atol=1e-6)
+    assert (replay.state_dict()["columns"]["target_version"] == 4).all()
+
+
+def test_staleness_selector_prefers_old_targets():
+    replay = _replay(n=20)
+    fresh = np.arange(10, 20)
+    replay.write_reanalysis(
+        fresh, replay.reanalysis_inputs(fresh)["push_id"],
+        [np.full((10, a), 1.0 / a, dtype=np.float32) for a in SIZES], version=50,
+    )
+    np.random.seed(0)
+    picks = np.concatenate([replay.select_stale(5, current_version=50, staleness_power=2.0) for _ in range(40)])
+    assert (picks < 10).mean() > 0.95
+    assert len(set(replay.select_stale(20, 50).tolist())) == 20
+
+
+def test_background_job_applies_on_next_call_and_skips_overwritten_rows():
+    net = _net()
+    replay = _replay(n=8, capacity=8)
+    cfg = GumbelMuZeroReanalysisConfig(batch_size=8, background=True)
+    reanalyzer = GumbelMuZeroReanalyzer(config=cfg, search=_search(net), device=torch.device("cpu"))
+
+    assert reanalyzer.update_replay_with_reanalysis(replay, net, policy_version=1) == 0
+    reanalyzer._thread.join()
+    # Пока job считался, два слота перезаписаны новыми переходами.
+    extra = _replay(n=2, version=7)
+    replay.push_many([extra.transition_at(0), extra.transition_at(1)])
+    assert reanalyzer.update_replay_with_reanalysis(replay, net, policy_version=2) == 6
+    reanalyzer.close()
+    versions = replay.state_dict()["columns"]["target_version"]
+    assert sorted(versions.tolist()) == [1, 1, 1, 1, 1, 1, 7, 7]
+
+
+def test_background_snapshot_unwraps_compiled_net_and_failures_are_reported():
+    net = _net()
+    wrapper = torch.nn.Module()
+    wrapper._orig_mod = net  # как у torch.compile: фоновый поток должен получить eager-модуль
+    replay = _replay(n=6, capacity=8)
+    messages: list[str] = []
+    cfg = GumbelMuZeroReanalysisConfig(batch_size=6, chunk_size=3, background=True)
+    reanalyzer = GumbelMuZeroReanalyzer(config=cfg, search=_search(net), device=torch.device("cpu"), log=messages.append)
+
+    reanalyzer.update_replay_with_reanalysis(replay, wrapper, policy_version=1)
+    reanalyzer._thread.join()
+    assert type(reanalyzer._snapshot) is GumbelMuZeroNet and reanalyzer._snapshot is not net
+
+    calls = {"n": 0}
+    real = reanalyzer._reanalyze_rows
+
+    def _flaky(job, rows, snap):
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise RuntimeError("boom")
+        return real(job, rows, snap)
+
+    reanalyzer._reanalyze_rows = _flaky
+    reanalyzer._cfg.background = False
+    assert reanalyzer.update_replay_with_reanalysis(replay, net, policy_version=2) == 3
+    assert reanalyzer.failed_chunks == 1
+    assert len(messages) == 1 and "boom" in messages[0]
+    reanalyzer.close()
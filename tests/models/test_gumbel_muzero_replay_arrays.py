@@ -0,0 +1,152 @@
+import random
+
+import numpy as np
+import pytest
+
+from core.models.gumbel_muzero_replay import GMZTransition, GumbelMuZeroReplayBuffer
+from core.models.gumbel_muzero_trainer import _unroll_arrays_from_batch, _unroll_arrays_from_samples
+
+SIZES = [2, 3]
+
+
+class _Net:
+    action_sizes = SIZES
+
+
+def _tr(idx: int, done: bool, ver: int = 1, behavior: bool = True) -> GMZTransition:
+    rng = np.random.RandomState(idx)
+    return GMZTransition(
+        state=np.array([idx, idx + 0.5, -idx], dtype=np.float32),
+        action=np.array([idx % 2, idx % 3], dtype=np.int64),
+        reward=0.1 * idx,
+        done=done,
+        policy_targets=[rng.rand(a).astype(np.float32) for a in SIZES],
+        value_target=float(idx % 4) - 1.5,
+        behavior_logits=[rng.randn(a).astype(np.float32) for a in SIZES] if behavior else None,
+        legal_masks_by_head=[np.ones(a, dtype=np.float32) for a in SIZES] if idx % 2 else None,
+        policy_version=ver,
+    )
+
+
+def _reference_windows(items: list[GMZTransition], starts, unroll: int) -> list[list[int]]:
+    """Индексы окон deque-unroll: до done включительно, обрыв на самом новом переходе."""
+    out = []
+    for start in starts:
+        window = []
+        for k in range(unroll):
+            idx = start + k
+            if idx >= len(items):
+                break
+            window.append(idx)
+            if items[idx].done:
+                break
+        out.append(window)
+    return out
+
+
+def test_unroll_batch_matches_deque_semantics_after_wraparound():
+    replay = GumbelMuZeroReplayBuffer(capacity=10)
+    items = [_tr(i, done=i in {3, 8, 12}, behavior=i != 11) for i in range(15)]
+    replay.push_many(items)
+    kept = items[-10:]
+
+    random.seed(5)
+    batch = replay.sample_unroll_batch(batch_size=6, unroll_steps=4)
+    random.seed(5)
+    starts = random.sample(range(10), 6)
+    windows = _reference_windows(kept, starts, 4)
+
+    assert batch.states.shape == (6, 4, 3) and batch.policy_targets[1].shape == (6, 4, 3)
+    assert batch.lengths.tolist() == [len(w) for w in windows]
+    for b, window in enumerate(windows):
+        for t, idx in enumerate(window):
+            item = kept[idx]
+            assert np.array_equal(batch.states[b, t], item.state)
+            assert np.array_equal(batch.actions[b, t], item.action)
+            assert batch.rewards[b, t] == np.float32(item.reward)
+            assert np.array_equal(batch.policy_targets[0][b, t], item.policy_targets[0])
+            assert batch.behavior_avail[b, t] == (item.behavior_logits is not None)
+            assert batch.legal_avail[b, t] == (item.legal_masks_by_head is not None)
+        assert not batch.states[b, len(window):].any()
+
+
+def test_trainer_arrays_match_list_unroll_path():
+    replay = GumbelMuZeroReplayBuffer(capacity=32)
+    replay.push_many([_tr(i, done=i in {4, 9}, behavior=i % 3 != 0) for i in range(14)])
+
+    random.seed(11)
+    fast = _unroll_arrays_from_batch(replay.sample_unroll_batch(8, 5), _Net())
+    random.seed(11)
+    slow = _unroll_arrays_from_samples(replay.sample_unroll(8, 5), _Net(), 5)
+    for a, b in zip(fast, slow):
+        if isinstance(a, list):
+            for x, y in zip(a, b):
+                np.testing.assert_array_equal(x, y)
+        else:
+            np.testing.assert_array_equal(a, b)
+
+
+def test_staleness_filter_and_state_dict_formats():
+    replay = GumbelMuZeroReplayBuffer(capacity=8)
+    replay.push_many([_tr(i, done=False, ver=i) for i in range(8)])
+    random.seed(0)
+    batch = replay.sample_unroll_batch(8, 2, max_policy_staleness_updates=2, current_policy_version=7)
+    assert sorted(batch.policy_version.tolist()) == [5, 6, 7]
+
+    payload = replay.state_dict()
+    clone = GumbelMuZeroReplayBuffer(capacity=1)
+    clone.load_state_dict(payload)
+    assert len(clone) == 8 and clone.capacity == 8
+    for name, col in payload["columns"].items():
+        np.testing.assert_array_equal(clone.state_dict()["columns"][name], col)
+
+    legacy_rows = [
+        {
+            "state": t.state, "action": t.action, "reward": t.reward, "done": t.done,
+            "policy_targets": t.policy_targets, "behavior_logits": t.behavior_logits or [],
+            "legal_masks_by_head": t.legal_masks_by_head or [], "value_target": t.value_target,
+            "policy_version": t.policy_version,
+        }
+        for t in (_tr(i, done=i == 2) for i in range(5))
+    ]
+    legacy = GumbelMuZeroReplayBuffer()
+    legacy.load_state_dict({"capacity": 16, "buffer": legacy_rows})
+    assert len(legacy) == 5
+    restored = legacy.transition_at(3)
+    assert restored.reward == pytest.approx(0.3)
+    assert [m.dtype for m in restored.legal_masks_by_head] == [np.float32, np.float32]
+
+
+def test_policy_targets_written_back_by_slot():
+    replay = GumbelMuZeroReplayBuffer(capacity=4)
+    replay.push_many([_tr(i, done=False) for i in range(6)])
+    slots, transitions = replay.sample_with_slots(4)
+    new = [np.full(a, 0.25, dtype=np.float32) for a in SIZES]
+    replay.set_policy_targets(slots[0], new)
+    assert np.array_equal(replay.transition_at(slots[0]).policy_targets[1], new[1])
+    assert transitions[0].policy_targets[1][0] != 0.25
+
+
+def test_window_stops_at_write_head():
+    replay = GumbelMuZeroReplayBuffer(capacity=8)
+    replay.push_many([_tr(i, done=False) for i in range(5)])
+    random.seed(1)
+    batch = replay.sample_unroll_batch(batch_size=5, unroll_steps=4)
+    starts = batch.states[:, 0, 0].astype(int)
+    # последний переход не повторяется: окно кончается на самом новом
+    assert batch.lengths.tolist() == [min(4, 5 - s) for s in starts]
+    assert not batch.dones.any()
+    tail = [item["states"][-1][0] for item in replay.sample_unroll(batch_size=5, unroll_steps=4)]
+    assert max(tail) == 4
+
+
+def test_policy_targets_with_wrong_head_size_are_rejected():
+    replay = GumbelMuZeroReplayBuffer(capacity=4)
+    replay.push(_tr(0, done=False))
+    bad = _tr(1, done=False)
+    bad.policy_targets = [np.ones(2, dtype=np.float32), np.ones(4, dtype=np.float32)]
+    with pytest.raises(ValueError, match="head sizes"):
+        replay.push(bad)
+    assert len(replay) == 1 and replay.pos == 1
+    with pytest.raises(ValueError, match="head sizes"):
+        replay.set_policy_targets(0, [np.ones(2, dtype=np.float32)])
@@ -0,0 +1,66 @@
+import copy
+import random
+
+import numpy as np
+import torch
+
+from core.engine.game_controller import n_actions_from_env
+from core.models.DQN import make_dqn
+from core.models.opponent_adapter import (
+    OpponentSpec,
+    build_policy_batch_fn,
+    build_policy_fn,
+    enemy_turns_batched,
+)
+from core.models.PPO import make_actor_critic
+from tests.engine._helpers import build_reset_env
+
+
+def _spec(algo: str, env) -> OpponentSpec:
+    torch.manual_seed(0)
+    n_obs = len(env.get_observation_for_side("enemy"))
+    n_actions = n_actions_from_env(env, len(env.enemy))
+    if algo == "dqn":
+        net = make_dqn(n_obs, n_actions, noisy=False, distributional="c51")  # IQN сэмплит tau на каждый forward
+    else:
+        net = make_actor_critic(n_obs, n_actions)
+    contract = {
+        "obs_space_signature": f"vec:{n_obs}",
+        "action_space_signature": "heads:" + ",".join(str(a) for a in n_actions),
+    }
+    return OpponentSpec(agent_id=f"test_{algo}", algo=algo, contract=contract, policy_state=net.state_dict())
+
+
+def _state(env) -> tuple:
+    return (list(env.unit_health), list(env.enemy_health), [list(map(int, c)) for c in env.enemy_coords])
+
+
+def test_batch_matches_single_env_policy_fn():
+    envs = [build_reset_env(seed) for seed in (1, 2, 3)]
+    for algo in ("dqn", "ppo"):
+        spec = _spec(algo, envs[0])
+        batch = build_policy_batch_fn(len_model=len(envs[0].enemy), opponent=spec)
+        obs = [env.begin_enemy_turn(trunc=True) for env in envs]
+        batched = batch(obs, [batch.masks_for(env) for env in envs])
+        single = [
+            build_policy_fn(env=env, len_model=len(env.enemy), opponent=spec)(o) for env, o in zip(envs, obs)
+        ]
+        assert batched == single
+        assert set(batched[0]) >= {"move", "shoot", "move_num_0", "move_num_1"}
+
+
+def test_enemy_turns_batched_matches_sequential_enemy_turns():
+    envs_a = [build_reset_env(seed) for seed in (4, 5)]
+    envs_b = copy.deepcopy(envs_a)
+    spec = _spec("dqn", envs_a[0])
+    batch = build_policy_batch_fn(len_model=2, opponent=spec)
+
+    random.seed(9)
+    np.random.seed(9)
+    enemy_turns_batched(envs_a, batch, trunc=True)
+    random.seed(9)
+    np.random.seed(9)
+    for env in envs_b:
+        env.enemyTurn(trunc=True, policy_fn=build_policy_fn(env=env, len_model=2, opponent=spec))
+
+    assert [_state(e) for e in envs_a] == [_state(e) for e in envs_b]
@@ -0,0 +1,83 @@
+import numpy as np
+import torch
+
+from core.models.memory import PrioritizedReplayMemory, ReplayMemory, Transition
+
+
+def _push_n(memory, n, n_obs=5):
+    for i in range(n):
+        state = torch.full((1, n_obs), float(i))
+        action = torch.tensor([[i % 3, 1, i % 4]], dtype=torch.long)
+        next_state = None if i % 4 == 3 else torch.full((1, n_obs), float(i) + 0.5)
+        memory.push(state, action, next_state, torch.tensor([float(i)]), 1, np.array([True, i % 2 == 0, True, False]))
+
+
+def _scalar_prefix_search(tree, tree_size, mass):
+    idx = 1
+    while idx < tree_size:
+        left = idx * 2
+        if tree[left] >= mass:
+            idx = left
+        else:
+            mass -= tree[left]
+            idx = left + 1
+    return idx - tree_size
+
+
+def test_batched_tree_ops_match_scalar_reference():
+    memory = PrioritizedReplayMemory(37, alpha=0.7)
+    _push_n(memory, 37)
+    rng = np.random.default_rng(0)
+    indices = rng.integers(0, 37, size=64)  # с повторами
+    priorities = rng.random(64) * 3.0
+    memory.update_priorities(indices, priorities)
+
+    reference = np.zeros_like(memory.sum_tree)
+    for i in range(37):
+        reference[i + memory.tree_size] = 1.0
+    for idx, value in zip(indices, priorities):
+        reference[idx + memory.tree_size] = np.float32(max(value, memory.eps) ** 0.7)
+    for node in range(memory.tree_size - 1, 0, -1):
+        reference[node] = reference[2 * node] + reference[2 * node + 1]
+    np.testing.assert_allclose(memory.sum_tree, reference, rtol=1e-5)
+    assert memory.max_priority == max(1.0, float(priorities.max()))
+
+    masses = rng.random(200) * float(memory.sum_tree[1])
+    expected = [_scalar_prefix_search(memory.sum_tree, memory.tree_size, m) for m in masses]
+    assert memory._prefix_search(masses).tolist() == expected
+
+
+def test_sample_batch_follows_priorities_and_returns_weights():
+    memory = PrioritizedReplayMemory(16, alpha=1.0)
+    _push_n(memory, 16)
+    memory.update_priorities(np.arange(16), np.r_[np.full(15, 1e-6), 100.0])
+
+    batch, indices, weights = memory.sample_batch(32)
+    assert batch.state.shape == (32, 5)
+    assert (indices == 15).mean() > 0.9
+    assert weights.dtype == np.float32 and float(weights.max()) == 1.0
+    torch.testing.assert_close(batch.reward, torch.tensor([float(i) for i in indices]))
+
+    samples, legacy_idx, _w = memory.sample(4)
+    assert isinstance(samples[0], Transition) and len(legacy_idx) == 4
+
+
+def test_state_dict_round_trip_and_legacy_items():
+    memory = PrioritizedReplayMemory(8)
+    _push_n(memory, 11)
+    memory.update_priorities([1, 2], [5.0, 0.5])
+    state = memory.state_dict()
+
+    restored = PrioritizedReplayMemory(8)
+    assert restored.load_state_dict(state) == 8
+    np.testing.assert_array_equal(restored.state_dict()["priorities_alpha"], state["priorities_alpha"])
+    np.testing.assert_array_equal(restored.state_dict()["columns"]["state"], state["columns"]["state"])
+    assert restored.max_priority == memory.max_priority
+
+    legacy = ReplayMemory(8)
+    assert legacy.load_state_dict(state) == 8
+    legacy_state = dict(legacy.state_dict(), priorities_alpha=[0.0, 2.0])
+    from_items = PrioritizedReplayMemory(8)
+    assert from_items.load_state_dict(legacy_state) == 8
+    leaves = from_items.sum_tree[from_items.tree_size:from_items.tree_size + 8]
+    assert leaves[1] == 2.0 and leaves[0] > 0.0 and leaves[2] == 1.0
@@ -0,0 +1,133 @@
+import os
+
+import numpy as np
+import torch
+
+from core.models.memory import ArrayReplayMemory, PrioritizedReplayMemory, ReplayMemory
+from core.models.replay_checkpoint import (
+    ReplayCheckpointWriter,
+    load_replay_manifest,
+    read_replay_manifest,
+    resolve_replay_manifest,
+)
+
+
+def _push(memory, start, n, n_obs=5):
+    for i in range(start, start + n):
+        state = torch.full((1, n_obs), float(i))
+        next_state = None if i % 4 == 3 else state + 0.5
+        # маска появляется не с первой строки — в ранних чанках колонки mask нет
+        mask = torch.tensor([i % 2 == 0, True, False]) if i >= 3 else None
+        memory.push(state, torch.tensor([[i % 3, 1]]), next_state, torch.tensor([0.1 * i]), 1 + i % 2, mask)
+
+
+def _assert_same_buffer(restored, memory):
+    expected, got = memory.state_dict(), restored.state_dict()
+    assert got["pushed"] == expected["pushed"]
+    assert set(got["columns"]) == set(expected["columns"])
+    for name, column in expected["columns"].items():
+        assert np.array_equal(got["columns"][name], column), name
+
+
+def _manifest(fields, checkpoint_path):
+    return resolve_replay_manifest(str(checkpoint_path), fields["replay_manifest"])
+
+
+def test_checkpoints_append_only_new_rows_and_restore_ring(tmp_path):
+    memory = ArrayReplayMemory(8)
+    writer = ReplayCheckpointWriter(str(tmp_path / "replay"))
+    ckpts = [tmp_path / f"checkpoint_ep{i}.pth" for i in range(1, 5)]
+    _push(memory, 0, 5)
+    first = writer.snapshot(memory, str(ckpts[0]))
+    _push(memory, 5, 6)
+    second = writer.snapshot(memory, str(ckpts[1]))
+    writer.flush()
+
+    assert "replay_memory" not in second and second["replay_pushed"] == 11
+    assert second["replay_manifest"] == "checkpoint_ep2.replay.json"
+    manifest = read_replay_manifest(_manifest(second, ckpts[1]))
+    assert [(c["start"], c["end"]) for c in manifest["chunks"]] == [(0, 5), (5, 11)]
+    restored = ArrayReplayMemory(8)
+    assert load_replay_manifest(_manifest(second, ckpts[1]), restored) == (8, [])
+    _assert_same_buffer(restored, memory)
+
+    # оба чанка вытеснены из кольца, но на них ссылаются manifest ep1/ep2 — остаются на диске
+    _push(memory, 11, 8)
+    third = writer.snapshot(memory, str(ckpts[2]))
+    writer.flush()
+    assert len(os.listdir(tmp_path / "replay")) == 3
+    restored_first = ArrayReplayMemory(8)
+    assert load_replay_manifest(_manifest(first, ckpts[0]), restored_first) == (5, [])
+    restored = ArrayReplayMemory(8)
+    load_replay_manifest(_manifest(third, ckpts[2]), restored)
+    _assert_same_buffer(restored, memory)
+
+    # старые чекпойнты удалены вместе с manifest — на следующем снапшоте уходят и их чанки
+    for fields, ckpt in ((first, ckpts[0]), (second, ckpts[1])):
+        os.remove(ckpt.parent / fields["replay_manifest"])
+    writer.snapshot(memory, str(ckpts[3]))
+    writer.flush()
+    assert sorted(os.listdir(tmp_path / "replay")) == ["chunk-%s-11-19.npz" % writer._session]
+    assert writer.errors == 0
+    writer.close()
+
+
+def test_manifest_resolves_relative_to_moved_checkpoint(tmp_path):
+    memory = ArrayReplayMemory(8)
+    _push(memory, 0, 5)
+    run = tmp_path / "run"
+    writer = ReplayCheckpointWriter(str(run / "replay"))
+    fields = writer.snapshot(memory, str(run / "best_eval_checkpoint.pth"))
+    writer.close()
+    moved = tmp_path / "elsewhere" / "run"
+    os.makedirs(moved.parent)
+    os.rename(run, moved)
+
+    path = resolve_replay_manifest(str(moved / "best_eval_checkpoint.pth"), fields["replay_manifest"])
+    restored = ArrayReplayMemory(8)
+    assert load_replay_manifest(path, restored) == (5, [])
+    _assert_same_buffer(restored, memory)
+    # старые .pth: путь от cwd обучения, которого больше нет — берём manifest рядом с чекпойнтом
+    legacy = resolve_replay_manifest(str(moved / "best_eval_checkpoint.pth"), str(run / "best_eval_checkpoint.replay.json"))
+    assert legacy == str(moved / "best_eval_checkpoint.replay.json")
+
+
+def test_prioritized_resume_continues_chunk_chain(tmp_path):
+    memory = PrioritizedReplayMemory(16, alpha=0.7)
+    writer = ReplayCheckpointWriter(str(tmp_path / "run1" / "replay"))
+    _push(memory, 0, 10)
+    memory.update_priorities(np.arange(10), np.linspace(0.5, 3.0, 10))
+    fields = writer.snapshot(memory, str(tmp_path / "run1" / "checkpoint_ep1.pth"))
+    writer.flush()
+    manifest_path = _manifest(fields, tmp_path / "run1" / "checkpoint_ep1.pth")
+
+    resumed = PrioritizedReplayMemory(16, alpha=0.7)
+    assert load_replay_manifest(manifest_path, resumed) == (10, [])
+    _assert_same_buffer(resumed, memory)
+    assert np.allclose(resumed.state_dict()["priorities_alpha"], memory.state_dict()["priorities_alpha"])
+
+    writer2 = ReplayCheckpointWriter(str(tmp_path / "run2" / "replay"))
+    writer2.adopt(manifest_path)
+    _push(memory, 10, 3)
+    _push(resumed, 10, 3)
+    fields2 = writer2.snapshot(resumed, str(tmp_path / "run2" / "checkpoint_ep2.pth"))
+    writer2.flush()
+    manifest2_path = _manifest(fields2, tmp_path / "run2" / "checkpoint_ep2.pth")
+    manifest = read_replay_manifest(manifest2_path)
+    assert [(c["start"], c["end"]) for c in manifest["chunks"]] == [(0, 10), (10, 13)]
+    final = PrioritizedReplayMemory(16, alpha=0.7)
+    assert load_replay_manifest(manifest2_path, final)[0] == 13
+    _assert_same_buffer(final, resumed)
+
+
+def test_inline_mode_and_deque_backend_keep_full_state(tmp_path, monkeypatch):
+    writer = ReplayCheckpointWriter(str(tmp_path / "replay"))
+    deque_memory = ReplayMemory(8)
+    _push(deque_memory, 0, 3)
+    assert len(writer.snapshot(deque_memory, str(tmp_path / "a.pth"))["replay_memory"]["items"]) == 3
+    monkeypatch.setenv("DQN_REPLAY_CHECKPOINT", "inline")
+    memory = ArrayReplayMemory(8)
+    _push(memory, 0, 3)
+    assert writer.snapshot(memory, str(tmp_path / "b.pth"))["replay_memory"]["pushed"] == 3
+    writer.flush()
+    assert not os.path.exists(tmp_path / "replay")
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import torch
+
+from core.models import weight_broadcast
+from core.models.weight_broadcast import (
+    WeightSubscriber,
+    WeightSync,
+    broadcast_path_for,
+    get_weight_broadcaster,
+    publish_weights,
+)
+
+
+def _net() -> torch.nn.Module:
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.BatchNorm1d(8), torch.nn.Linear(8, 2))
+
+
+class TestWeightBroadcast(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.sync_path = os.path.join(self._tmp.name, "latest_policy.pth")
+
+    def tearDown(self):
+        get_weight_broadcaster(broadcast_path_for(self.sync_path)).close()
+        weight_broadcast._FILE_WRITTEN_AT.pop(self.sync_path, None)
+        self._tmp.cleanup()
+
+    def test_actor_receives_every_publish_without_unpickling(self):
+        learner, actor = _net(), _net()
+        with torch.no_grad():
+            actor[0].weight.zero_()
+        with patch.dict(os.environ, {"WEIGHT_BROADCAST_MODE": "mmap"}):
+            sync = WeightSync(self.sync_path)
+            self.assertIsNone(sync.poll())
+            for step in (1, 2):
+                with torch.no_grad():
+                    learner[0].weight.add_(step)
+                publish_weights(self.sync_path, learner.state_dict(), {"optimize_steps": step})
+                with patch.object(torch, "load", side_effect=AssertionError("unpickled")):
+                    payload = sync.poll()
+                    self.assertIsNone(sync.poll())
+                self.assertEqual(payload["optimize_steps"], step)
+                actor.load_state_dict(payload["state_dict"])
+                for name, value in learner.state_dict().items():
+                    self.assertTrue(torch.equal(actor.state_dict()[name], value), name)
+        self.assertFalse(os.path.exists(self.sync_path))
+
+    def test_torn_snapshot_is_rejected_and_layout_change_reopens(self):
+        with patch.dict(os.environ, {"WEIGHT_BROADCAST_MODE": "mmap"}):
+            publish_weights(self.sync_path, _net().state_dict(), {"optimize_steps": 1})
+            subscriber = WeightSubscriber(broadcast_path_for(self.sync_path), retries=2)
+            broadcaster = get_weight_broadcaster(broadcast_path_for(self.sync_path))
+            weight_broadcast._SEQ.pack_into(broadcaster._mm, weight_broadcast._SEQ_OFFSET, 3)  # писатель «посередине»
+            self.assertIsNone(subscriber.poll())
+            weight_broadcast._SEQ.pack_into(broadcaster._mm, weight_broadcast._SEQ_OFFSET, broadcaster._seq)
+            self.assertEqual(subscriber.poll()["optimize_steps"], 1)
+
+            wider = torch.nn.Linear(4, 16)
+            publish_weights(self.sync_path, wider.state_dict(), {"optimize_steps": 2})
+            payload = subscriber.poll()
+            self.assertEqual(payload["optimize_steps"], 2)
+            self.assertTrue(torch.equal(payload["state_dict"]["weight"], wider.weight))
+
+    def test_file_channel_for_file_mode_remote_writer_and_stale_mmap(self):
+        net = _net()
+        with patch.dict(os.environ, {"WEIGHT_BROADCAST_MODE": "file"}):
+            publish_weights(self.sync_path, net.state_dict(), {"optimize_steps": 7})
+            self.assertFalse(os.path.exists(broadcast_path_for(self.sync_path)))
+            self.assertEqual(WeightSync(self.sync_path).poll()["optimize_steps"], 7)
+
+        with patch.dict(os.environ, {"WEIGHT_BROADCAST_MODE": "auto", "WEIGHT_BROADCAST_FILE_EVERY_S": "3600"}):
+            publish_weights(self.sync_path, net.state_dict(), {"optimize_steps": 8})
+            with patch.object(weight_broadcast.socket, "gethostname", return_value="other-pc"):
+                # .wbuf записан на другой машине — читаем только .pth.
+                self.assertFalse(WeightSubscriber(broadcast_path_for(self.sync_path)).available())
+            sync = WeightSync(self.sync_path)
+            self.assertEqual(sync.poll()["optimize_steps"], 8)
+            with patch.object(weight_broadcast.WeightBroadcaster, "publish", side_effect=OSError("locked")):
+                publish_weights(self.sync_path, net.state_dict(), {"optimize_steps": 9})
+            # Публикации в тесте идут в пределах одного тика mtime ФС — разводим их явно.
+            later = os.stat(broadcast_path_for(self.sync_path)).st_mtime_ns + 10**9
+            os.utime(self.sync_path, ns=(later, later))
+            self.assertEqual(sync.poll()["optimize_steps"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
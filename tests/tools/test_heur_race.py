@@ -0,0 +1,191 @@
+import argparse
+import json
+import types
+
+import pytest
+
+import reward_config
+import tools.heur_calibrate as hc
+import tools.heur_race as hr
+from tools.heur_race import RacePool, candidate_metrics, halving_rungs, race_candidates
+
+
+def _rec(mode: str) -> dict:
+    return {
+        "profile": "balanced",
+        "mode": {"kite": int(mode == "kite"), "hold": int(mode == "hold"), "commit": int(mode == "commit")},
+        "role": {"ranged": 1},
+        "obj_kind": {"none": 1},
+        "risk_sum": 0.2,
+        "risk_n": 1,
+        "charge_attempts": 0,
+        "charge_success": 0,
+        "moves": 1,
+    }
+
+
+def _fake_play(strength: dict[int, float], calls: list):
+    """Кандидат idx выигрывает партию g за эвристику, если (g * 7) % 10 < strength*10."""
+
+    def play(tasks):
+        for idx, _weights, numbers, seed in tasks:
+            calls.append((idx, tuple(numbers), seed))
+            games = []
+            for g in numbers:
+                winner = "enemy" if (g * 7) % 10 < strength[idx] * 10 else "model"
+                games.append((g, winner, _rec(("kite", "hold", "commit")[g % 3])))
+            yield idx, games, 0.01, None
+
+    return play
+
+
+def test_halving_rungs():
+    assert halving_rungs(1000, 32, 2) == [32, 64, 128, 256, 512, 1000]
+    assert halving_rungs(50, 32, 3) == [32, 50]
+    assert halving_rungs(20, 32, 2) == [20]
+    assert halving_rungs(20, 0, 2) == [20]
+
+
+def test_race_drops_weak_candidates_and_reuses_played_games():
+    strength = {0: 0.5, 1: 0.1, 2: 0.9, 3: 0.5, 4: 0.2}
+    calls: list = []
+    done: list[int] = []
+    states = race_candidates(
+        [{} for _ in strength],
+        rungs=[4, 8, 16],
+        eta=2,
+        seed=100,
+        play=_fake_play(strength, calls),
+        score=lambda games: -abs(candidate_metrics(games, learner_side="P1")["heur_winrate"] - 0.5),
+        chunk_games=3,
+        on_done=lambda state: done.append(state["candidate_idx"]),
+    )
+
+    assert sorted(done) == [0, 1, 2, 3, 4]
+    # 5 -> ceil(5/2)=3 после 4 партий -> 2 после 8; слабые (0.1/0.9 и 0.2) отсеяны
+    assert [s["candidate_idx"] for s in states if not s["eliminated"]] == [0, 3]
+    assert [len(s["games"]) for s in states] == [16, 4, 4, 16, 8]
+    # партии не переигрываются, все кандидаты играют с одним базовым seed
+    played = [(idx, g) for idx, numbers, _ in calls for g in numbers]
+    assert len(played) == len(set(played)) == 16 + 4 + 4 + 16 + 8
+    assert {seed for _, _, seed in calls} == {100}
+    assert max(len(numbers) for _, numbers, _ in calls) == 3
+    assert [g for g, _, _ in states[0]["games"]] == list(range(1, 17))
+
+
+def test_candidate_metrics_match_learner_side():
+    games = [(1, "enemy", _rec("kite")), (2, "model", _rec("hold")), (3, "", _rec("commit"))]
+    p1 = candidate_metrics(games, learner_side="P1")
+    assert (p1["p1_wins"], p1["p2_wins"], p1["draws"]) == (1, 1, 1)
+    assert p1["actual_games"] == 3 and p1["metrics_source"] == "inproc"
+    assert p1["style_entropy_norm"] == pytest.approx(1.0)
+    p2 = candidate_metrics(games[:1], learner_side="P2")
+    assert (p2["p1_wins"], p2["heur_winrate_all"], p2["heuristic_side"]) == (1, 1.0, "p1")
+
+
+def test_apply_weights_validates_before_writing():
+    before = reward_config.ENEMY_HEUR_RISK_W
+    with pytest.raises(ValueError, match="unknown"):
+        reward_config.apply_heur_calibration_weights({"ENEMY_HEUR_RISK_W": 0.5, "ENEMY_HEUR_NOPE_W": 1.0})
+    assert reward_config.ENEMY_HEUR_RISK_W == before
+
+
+def test_pool_engine_writes_eliminated_and_full_rows(monkeypatch, tmp_path):
+    strength = {0: 0.5, 1: 0.1, 2: 0.9, 3: 0.5}
+    calls: list = []
+
+    class _FakePool:
+        def __init__(self, eval_args, *, workers, learner_side, epsilon):
+            assert learner_side == "P1" and workers == 2
+            self.play = _fake_play(strength, calls)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return None
+
+    monkeypatch.setattr(hc, "ARTIFACTS_METRICS_DIR", tmp_path)
+    monkeypatch.setattr(hc, "RacePool", _FakePool)
+    monkeypatch.setattr(hc, "run_benchmark", lambda *a, **k: pytest.fail("pool engine не запускает eval.py"))
+    monkeypatch.setattr(hc, "score_candidate", lambda m, t=0.5: -abs(float(m.get("heur_winrate", 0.0)) - 0.5))
+    args = argparse.Namespace(
+        candidates=4, games=16, seed=7, model="", learner_agent_id="", learner_side="P1", target_winrate=0.5,
+        opponent_agent_id="", opponent_policy="heuristic_auto", run_id="race", top_k=3, dry_run=False,
+        engine="pool", workers=2, rung_games=4, eta=2, chunk_games=8,
+    )
+
+    summary = hc.run_calibration(args)
+
+    assert summary["engine"] == "pool" and summary["rungs"] == [4, 8, 16]
+    assert summary["games_played"] == 16 + 4 + 4 + 8 < summary["games_full_budget"] == 64
+    rows = [json.loads(line) for line in (tmp_path / "heur_calibration" / "race" / "candidates.jsonl").read_text().splitlines()]
+    by_idx = {row["candidate_idx"]: row for row in rows}
+    assert {row["status"] for idx, row in by_idx.items() if idx != 0} == {"eliminated"}
+    assert by_idx[0]["games_played"] == by_idx[0]["actual_games"] == 16
+    assert by_idx[0]["status"] in {"ok", "rejected"}
+    assert summary["top_candidates"][0]["candidate_idx"] == 0
+    assert (tmp_path / "heur_calibration" / "race" / "candidate_000" / "heur_decisions" / "heur_dec_race.jsonl").exists()
+
+
+def test_worker_keeps_games_played_before_a_failing_game(monkeypatch):
+    played = []
+
+    def _play_game(setup, epsilon, learner_side, seed):
+        played.append(seed)
+        if seed == 13:
+            raise RuntimeError("boom")
+        return ("model",)
+
+    env = types.SimpleNamespace(pop_heur_metrics_record=lambda: None)
+    eval_stub = types.SimpleNamespace(unwrap_env=lambda e: e, _play_game=_play_game, _game_seed=lambda s, g: s + g)
+    monkeypatch.setattr(hr, "_RACE_WORKER", {"setup": {"env": env}, "eval": eval_stub, "epsilon": 0.0, "learner_side": "P1"})
+    monkeypatch.setattr(reward_config, "apply_heur_calibration_weights", lambda weights: None)
+
+    idx, games, _elapsed, error = hr._race_worker_play((2, {}, [1, 2, 3, 4], 10))
+
+    assert idx == 2 and played == [11, 12, 13]
+    assert [g for g, _, _ in games] == [1, 2]
+    assert error == "game 3: RuntimeError: boom"
+
+
+def test_race_counts_games_finished_before_an_error():
+    def play(tasks):
+        for idx, _weights, numbers, _seed in tasks:
+            if idx == 1:
+                yield idx, [(numbers[0], "model", None)], 0.0, f"game {numbers[1]}: RuntimeError: boom"
+            else:
+                yield idx, [(g, "model", None) for g in numbers], 0.0, None
+
+    states = race_candidates([{}, {}], rungs=[4], eta=2, seed=1, play=play, score=lambda games: 0.0)
+
+    assert [g for g, _, _ in states[1]["games"]] == [1]
+    assert states[1]["error"] == "game 2: RuntimeError: boom"
+    assert len(states[0]["games"]) == 4 and states[0]["error"] is None
+
+
+def test_race_pool_closes_gracefully_and_terminates_only_on_error():
+    class _Pool:
+        def __init__(self):
+            self.calls = []
+
+        def close(self):
+            self.calls.append("close")
+
+        def terminate(self):
+            self.calls.append("terminate")
+
+        def join(self):
+            self.calls.append("join")
+
+    pool = RacePool.__new__(RacePool)
+    pool._pool = _Pool()
+    with pool:
+        pass
+    assert pool._pool.calls == ["close", "join"]
+
+    pool._pool = _Pool()
+    with pytest.raises(RuntimeError):
+        with pool:
+            raise RuntimeError("boom")
+    assert pool._pool.calls == ["terminate", "join"]
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import argparse
 import json
+import os
 import random
 import sys
 import time
@@ -16,6 +17,7 @@ import reward_config as reward_cfg
 from core.engine.agent_registry import collect_registered_agents_meta
 from project_paths import ARTIFACTS_METRICS_DIR
 from tools.heur_benchmark import BenchmarkError, run_benchmark
+from tools.heur_race import RacePool, candidate_metrics, halving_rungs, race_candidates
 
 WEIGHT_NAMES = [
     "ENEMY_HEUR_MATCHUP_DIST_W",
@@ -221,24 +223,52 @@ def make_reward_config_patch(best: dict[str, Any] | None, baseline: dict[str, fl
     return "\n".join(lines) + "\n"
 
 
-def run_calibration(args: argparse.Namespace) -> dict[str, Any]:
-    run_id = str(args.run_id or time.strftime("phase8_%Y%m%d_%H%M%S"))
-    run_dir = ARTIFACTS_METRICS_DIR / "heur_calibration" / run_id
-    run_dir.mkdir(parents=True, exist_ok=True)
-    candidates_path = run_dir / "candidates.jsonl"
-    if candidates_path.exists():
-        candidates_path.unlink()
-
-    learner_agent_id = resolve_learner_agent_id(args.learner_agent_id)
-    learner_side = resolve_learner_side(learner_agent_id, getattr(args, "learner_side", ""))
-    target_winrate = float(getattr(args, "target_winrate", DEFAULT_TARGET_WINRATE) or DEFAULT_TARGET_WINRATE)
-    baseline_weights = current_weight_vector()
-    baseline_score = score_candidate(BASELINE, target_winrate)
-    candidates = generate_candidates(args.candidates, seed=args.seed, baseline=baseline_weights)
-
+def calibration_engine(args: argparse.Namespace) -> str:
+    """pool — in-process гонка кандидатов (tools/heur_race.py); subprocess — eval.py на кандидата."""
+    raw = getattr(args, "engine", "") or os.getenv("HEUR_CALIBRATE_ENGINE", "pool")
+    engine = str(raw).strip().lower()
+    return engine if engine in {"pool", "subprocess"} else "pool"
+
+
+def default_workers() -> int:
+    raw = str(os.getenv("HEUR_CALIBRATE_WORKERS", "") or "").strip()
+    if raw:
+        return max(1, int(raw))
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _judge_row(
+    row: dict[str, Any], summary: dict[str, Any], *, requested_games: int, baseline_score: float, target_winrate: float
+) -> float:
+    score = score_candidate(summary, target_winrate)
+    summary["score"] = score
+    rejects = reject_reasons(summary, requested_games=requested_games, target_winrate=target_winrate)
+    accepts = acceptance_reasons(summary, baseline_score=baseline_score, target_winrate=target_winrate)
+    row.update(summary)
+    row.update({"status": "ok" if not rejects else "rejected", "reject_reasons": rejects, "acceptance_reasons": accepts})
+    return score
+
+
+def _is_better(row: dict[str, Any], best: dict[str, Any] | None) -> bool:
+    if row.get("status") != "ok" or row.get("acceptance_reasons"):
+        return False
+    return best is None or float(row.get("score", -1e9)) > float(best.get("score", -1e9))
+
+
+def _run_subprocess_candidates(
+    args: argparse.Namespace,
+    candidates: list[dict[str, float]],
+    *,
+    run_id: str,
+    run_dir: Path,
+    candidates_path: Path,
+    learner_agent_id: str,
+    learner_side: str,
+    target_winrate: float,
+    baseline_score: float,
+) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
     rows: list[dict[str, Any]] = []
     best: dict[str, Any] | None = None
-    t_all = time.perf_counter()
     for idx, weights in enumerate(candidates):
         validate_overrides(weights)
         candidate_dir = run_dir / f"candidate_{idx:03d}"
@@ -270,14 +300,8 @@ def run_calibration(args: argparse.Namespace) -> dict[str, Any]:
                 logs_dir.mkdir(parents=True, exist_ok=True)
                 (logs_dir / "stdout.txt").write_text(stdout, encoding="utf-8")
                 (logs_dir / "stderr.txt").write_text(stderr, encoding="utf-8")
-                score = score_candidate(summary, target_winrate)
-                summary["score"] = score
-                rejects = reject_reasons(summary, requested_games=args.games, target_winrate=target_winrate)
-                accepts = acceptance_reasons(summary, baseline_score=baseline_score, target_winrate=target_winrate)
-                status = "ok" if not rejects else "rejected"
-                row.update(summary)
-                row.update({"status": status, "reject_reasons": rejects, "acceptance_reasons": accepts})
-                if status == "ok" and not accepts and (best is None or score > float(best.get("score", -1e9))):
+                _judge_row(row, summary, requested_games=args.games, baseline_score=baseline_score, target_winrate=target_winrate)
+                if _is_better(row, best):
                     best = row
             except (BenchmarkError, RuntimeError, OSError) as exc:
                 if idx == 0:
@@ -287,17 +311,152 @@ def run_calibration(args: argparse.Namespace) -> dict[str, Any]:
         row["sec_per_game"] = float(row["elapsed_sec"] / max(1, int(args.games))) if not args.dry_run else 0.0
         rows.append(row)
         _append_jsonl(candidates_path, row)
+    return rows, best
+
+
+def _run_race_candidates(
+    args: argparse.Namespace,
+    candidates: list[dict[str, float]],
+    *,
+    run_dir: Path,
+    candidates_path: Path,
+    learner_agent_id: str,
+    learner_side: str,
+    target_winrate: float,
+    baseline_score: float,
+    rungs: list[int],
+    eta: int,
+    workers: int,
+) -> tuple[list[dict[str, Any]], dict[str, Any] | None]:
+    """Successive halving в пуле воркеров: слабые кандидаты выбывают после первых ступеней.
+
+    Строка candidates.jsonl пишется, как только судьба кандидата решена: eliminated (метрики
+    на момент выбывания), failed, либо ok/rejected после полных --games партий.
+    """
+    for weights in candidates:
+        validate_overrides(weights)
+    rows: list[dict[str, Any]] = []
+    best: dict[str, Any] | None = None
+
+    def _score(games: list) -> float:
+        return score_candidate(candidate_metrics(games, learner_side=learner_side), target_winrate)
+
+    def _on_done(state: dict[str, Any]) -> None:
+        nonlocal best
+        idx = int(state["candidate_idx"])
+        games = list(state["games"])
+        candidate_dir = run_dir / f"candidate_{idx:03d}"
+        row: dict[str, Any] = {
+            "candidate_idx": idx,
+            "weights": candidates[idx],
+            "overrides_json": overrides_json(candidates[idx]),
+            "run_dir": str(candidate_dir),
+            "requested_games": int(args.games),
+            "rung": int(state["rung"]),
+            "rung_games": int(rungs[int(state["rung"])]),
+        }
+        if state["error"]:
+            if idx == 0:
+                raise BenchmarkError(f"baseline-кандидат не отыгран в пуле: {state['error']}")
+            row.update({"status": "failed", "error": str(state["error"]), "reject_reasons": [str(state["error"])]})
+        else:
+            summary = candidate_metrics(games, learner_side=learner_side)
+            _judge_row(row, summary, requested_games=args.games, baseline_score=baseline_score, target_winrate=target_winrate)
+            if state["eliminated"]:
+                row["status"] = "eliminated"
+                row["reject_reasons"] = [f"eliminated at rung {int(state['rung']) + 1}/{len(rungs)} after {len(games)} games"]
+            elif _is_better(row, best):
+                best = row
+            records = [rec for _, _, rec in games if rec]
+            if records:
+                decisions_dir = candidate_dir / "heur_decisions"
+                decisions_dir.mkdir(parents=True, exist_ok=True)
+                (decisions_dir / "heur_dec_race.jsonl").write_text(
+                    "".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records), encoding="utf-8"
+                )
+        row["games_played"] = len(games)
+        row["elapsed_sec"] = float(state["worker_sec"])
+        row["sec_per_game"] = float(state["worker_sec"] / max(1, len(games)))
+        rows.append(row)
+        _append_jsonl(candidates_path, row)
+
+    eval_args = argparse.Namespace(
+        model=args.model or None,
+        learner_agent_id=learner_agent_id,
+        opponent_agent_id=args.opponent_agent_id,
+        opponent_policy=args.opponent_policy,
+    )
+    from eval import _eval_epsilon
+
+    with RacePool(eval_args, workers=workers, learner_side=learner_side, epsilon=_eval_epsilon()) as pool:
+        race_candidates(
+            candidates,
+            rungs=rungs,
+            eta=eta,
+            seed=int(args.seed),
+            play=pool.play,
+            score=_score,
+            chunk_games=int(getattr(args, "chunk_games", 8) or 8),
+            on_done=_on_done,
+        )
+    return rows, best
+
+
+def run_calibration(args: argparse.Namespace) -> dict[str, Any]:
+    run_id = str(args.run_id or time.strftime("phase8_%Y%m%d_%H%M%S"))
+    run_dir = ARTIFACTS_METRICS_DIR / "heur_calibration" / run_id
+    run_dir.mkdir(parents=True, exist_ok=True)
+    candidates_path = run_dir / "candidates.jsonl"
+    if candidates_path.exists():
+        candidates_path.unlink()
+
+    learner_agent_id = resolve_learner_agent_id(args.learner_agent_id)
+    learner_side = resolve_learner_side(learner_agent_id, getattr(args, "learner_side", ""))
+    target_winrate = float(getattr(args, "target_winrate", DEFAULT_TARGET_WINRATE) or DEFAULT_TARGET_WINRATE)
+    baseline_weights = current_weight_vector()
+    baseline_score = score_candidate(BASELINE, target_winrate)
+    candidates = generate_candidates(args.candidates, seed=args.seed, baseline=baseline_weights)
+
+    engine = calibration_engine(args)
+    common = dict(
+        run_dir=run_dir,
+        candidates_path=candidates_path,
+        learner_agent_id=learner_agent_id,
+        learner_side=learner_side,
+        target_winrate=target_winrate,
+        baseline_score=baseline_score,
+    )
+    race_info: dict[str, Any] = {}
+    t_all = time.perf_counter()
+    if engine == "pool" and not args.dry_run:
+        rungs = halving_rungs(args.games, int(getattr(args, "rung_games", 32)), int(getattr(args, "eta", 2)))
+        workers = int(getattr(args, "workers", 0) or 0) or default_workers()
+        eta = int(getattr(args, "eta", 2))
+        rows, best = _run_race_candidates(args, candidates, rungs=rungs, eta=eta, workers=workers, **common)
+        rows.sort(key=lambda r: int(r["candidate_idx"]))
+        played = sum(int(r.get("games_played", 0)) for r in rows)
+        race_info = {
+            "workers": workers,
+            "rungs": rungs,
+            "eta": eta,
+            "games_played": played,
+            "games_full_budget": int(args.games) * len(candidates),
+        }
+    else:
+        rows, best = _run_subprocess_candidates(args, candidates, run_id=run_id, **common)
 
     elapsed_all = time.perf_counter() - t_all
     ranked = sorted(
         [r for r in rows if isinstance(r.get("score"), (int, float))],
-        key=lambda r: float(r.get("score", -1e9)),
+        # выбывшие сыграли меньше партий — их score менее надёжен, ранжируем после доигравших
+        key=lambda r: (r.get("status") != "eliminated", float(r.get("score", -1e9))),
         reverse=True,
     )
     summary_payload = {
         "run_id": run_id,
         "run_dir": str(run_dir),
         "dry_run": bool(args.dry_run),
+        "engine": engine,
         "games_per_candidate": int(args.games),
         "candidates": int(args.candidates),
         "seed": int(args.seed),
@@ -313,6 +472,7 @@ def run_calibration(args: argparse.Namespace) -> dict[str, Any]:
         "sec_per_candidate": float(elapsed_all / max(1, len(rows))),
         "top_candidates": ranked[: max(1, int(args.top_k))],
         "status_counts": {status: sum(1 for r in rows if r.get("status") == status) for status in sorted({str(r.get("status")) for r in rows})},
+        **race_info,
     }
     _write_json(run_dir / "summary.json", summary_payload)
     (run_dir / "best_reward_config_patch.md").write_text(
@@ -346,6 +506,18 @@ def main() -> None:
     ap.add_argument("--run-id", type=str, default="")
     ap.add_argument("--top-k", type=int, default=5)
     ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument(
+        "--engine",
+        type=str,
+        default="",
+        choices=["", "pool", "subprocess"],
+        help="pool — in-process гонка кандидатов в пуле воркеров (по умолчанию, env HEUR_CALIBRATE_ENGINE); "
+        "subprocess — eval.py на каждого кандидата.",
+    )
+    ap.add_argument("--workers", type=int, default=0, help="Воркеры пула (0 = HEUR_CALIBRATE_WORKERS или cpu-1).")
+    ap.add_argument("--rung-games", type=int, default=32, help="Партий на первой ступени successive halving (0 = без отсева).")
+    ap.add_argument("--eta", type=int, default=2, help="На каждой ступени остаётся 1/eta кандидатов, партий — в eta раз больше.")
+    ap.add_argument("--chunk-games", type=int, default=8, help="Партий в одной задаче воркера.")
     args = ap.parse_args()
 
     try:
@@ -358,6 +530,7 @@ def main() -> None:
         f"run_id={summary['run_id']} "
         f"candidates={summary['candidates']} "
         f"games={summary['games_per_candidate']} "
+        f"engine={summary['engine']} "
         f"dry_run={int(bool(summary['dry_run']))} "
         f"best={summary['best_candidate_idx']} "
         f"run_dir={summary['run_dir']}"
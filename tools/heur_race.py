@@ -0,0 +1,231 @@
+# tools/heur_race.py
+"""Successive-halving race of enemy heuristic weight candidates in a warm worker pool."""
+from __future__ import annotations
+
+import math
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import reward_config as reward_cfg
+from core.engine.game_io import flush_log_writer
+from tools.heur_benchmark import heuristic_side_for_learner, summarize
+from tools.heur_metrics_report import build_heur_metrics_summary
+
+# In-process движок калибровки (вместо «кандидат = подпроцесс eval.py на --games партий»):
+#   * пул spawn-воркеров; каждый один раз собирает env/сеть через eval._prepare_eval (как
+#     eval.py --workers) и дальше только переключает веса reward_config между задачами;
+#   * задача = (кандидат, веса, номера партий, seed); воркер возвращает исход и запись решений
+#     эвристики каждой партии (env.pop_heur_metrics_record) — без stdout/regex и JSONL;
+#   * successive halving: живые кандидаты доигрывают до порога ступени (rung), дальше проходит
+#     лучшая 1/eta по score; ступени растут в eta раз, последняя = --games. Сыгранные партии
+#     не переигрываются. Партия g у всех кандидатов играется с одним сидом (seed + g), так что
+#     кандидаты сравниваются на одних и тех же раскладах/кубах.
+
+# Результат партии: (номер партии, winner env — "model"/"enemy"/иное = ничья, запись решений или None).
+GameResult = tuple[int, str, "dict | None"]
+# Ответ воркера: (кандидат, партии, секунды воркера, ошибка или None).
+TaskResult = tuple[int, list, float, "str | None"]
+
+
+def halving_rungs(games: int, rung_games: int, eta: int) -> list[int]:
+    """Пороги ступеней (кумулятивное число партий на кандидата); последняя = games."""
+    total = max(1, int(games))
+    first = int(rung_games)
+    factor = max(2, int(eta))
+    if first <= 0 or first >= total:
+        return [total]
+    rungs: list[int] = []
+    n = first
+    while n < total:
+        rungs.append(n)
+        n *= factor
+    rungs.append(total)
+    return rungs
+
+
+def outcome_counts(games: Iterable[GameResult], learner_side: str) -> dict[str, int]:
+    """P1/P2/draw в терминах eval.py (winner env — относительно learner)."""
+    learner_p1 = str(learner_side).upper() != "P2"
+    p1 = p2 = draws = 0
+    for _, winner, _ in games:
+        if winner == "model":
+            p1, p2 = (p1 + 1, p2) if learner_p1 else (p1, p2 + 1)
+        elif winner == "enemy":
+            p1, p2 = (p1, p2 + 1) if learner_p1 else (p1 + 1, p2)
+        else:
+            draws += 1
+    return {"p1_wins": p1, "p2_wins": p2, "draws": draws}
+
+
+def candidate_metrics(games: list[GameResult], *, learner_side: str) -> dict[str, Any]:
+    """Та же сводка, что run_benchmark, но из структурированных результатов партий."""
+    parsed = outcome_counts(games, learner_side)
+    records = [rec for _, _, rec in games if rec]
+    metrics = build_heur_metrics_summary(records, outcome=parsed) if records else {}
+    heuristic_side = heuristic_side_for_learner(learner_side)
+    summary = summarize(parsed, heuristic_side=heuristic_side, metrics=metrics)
+    summary.update(
+        {
+            "actual_games": int(summary.get("games", 0)),
+            "learner_side": "P2" if str(learner_side).upper() == "P2" else "P1",
+            "heuristic_side": heuristic_side,
+            "metrics_source": "inproc" if records else "none",
+        }
+    )
+    return summary
+
+
+def race_candidates(
+    candidates: list[dict[str, float]],
+    *,
+    rungs: list[int],
+    eta: int,
+    seed: int,
+    play: Callable[[list[tuple]], Iterable[TaskResult]],
+    score: Callable[[list[GameResult]], float],
+    chunk_games: int = 8,
+    on_done: Callable[[dict[str, Any]], None] | None = None,
+) -> list[dict[str, Any]]:
+    """Прогнать кандидатов по ступеням; вернуть состояние каждого кандидата.
+
+    play(tasks) получает задачи (idx, веса, номера партий, seed) и отдаёт TaskResult в любом
+    порядке; при ошибке TaskResult несёт партии, сыгранные до неё, и они засчитываются.
+    on_done вызывается один раз на кандидата, как только его судьба решена
+    (выбыл, упал или доиграл последнюю ступень).
+    """
+    chunk = max(1, int(chunk_games))
+    states = [
+        {"candidate_idx": idx, "games": [], "worker_sec": 0.0, "rung": 0, "eliminated": False, "error": None}
+        for idx in range(len(candidates))
+    ]
+    alive = list(range(len(candidates)))
+
+    def _done(idx: int) -> None:
+        if on_done is not None:
+            on_done(states[idx])
+
+    last = len(rungs) - 1
+    for rung, target in enumerate(rungs):
+        tasks = []
+        for idx in alive:
+            numbers = list(range(len(states[idx]["games"]) + 1, int(target) + 1))
+            for start in range(0, len(numbers), chunk):
+                tasks.append((idx, candidates[idx], numbers[start : start + chunk], int(seed)))
+        for idx, games, elapsed, error in play(tasks):
+            state = states[idx]
+            state["worker_sec"] += float(elapsed)
+            # Партии, доигранные до ошибки, остаются в статистике кандидата.
+            state["games"].extend(games)
+            if error:
+                state["error"] = state["error"] or str(error)
+        for idx in alive:
+            states[idx]["rung"] = rung
+            states[idx]["games"].sort(key=lambda g: g[0])
+            if states[idx]["error"]:
+                _done(idx)
+        alive = [idx for idx in alive if not states[idx]["error"]]
+        if rung == last or not alive:
+            break
+        keep = max(1, math.ceil(len(alive) / max(2, int(eta))))
+        # sorted стабилен: при равном score проходит кандидат с меньшим индексом (baseline = 0).
+        ranked = sorted(alive, key=lambda i: score(states[i]["games"]), reverse=True)
+        for idx in ranked[keep:]:
+            states[idx]["eliminated"] = True
+            _done(idx)
+        alive = sorted(ranked[:keep])
+    for idx in alive:
+        _done(idx)
+    return states
+
+
+# Состояние процесса-воркера (заполняется в _race_worker_init).
+_RACE_WORKER: dict = {}
+
+
+def _race_worker_init(eval_args, learner_side: str, epsilon: float) -> None:
+    import torch
+
+    import eval as eval_mod
+
+    torch.set_num_threads(1)
+    os.environ["LEARNER_SIDE"] = str(learner_side)
+    os.environ.setdefault("MANUAL_DICE", "0")
+    _RACE_WORKER.clear()
+    _RACE_WORKER.update(eval=eval_mod, learner_side=str(learner_side), epsilon=float(epsilon))
+    try:
+        setup, exit_code = eval_mod._prepare_eval(eval_args, device=torch.device("cpu"), log_fn=eval_mod._append_eval_log)
+    except Exception as exc:
+        setup, exit_code = None, f"{type(exc).__name__}: {exc}"
+    _RACE_WORKER["setup"] = setup
+    _RACE_WORKER["error"] = None if setup is not None else f"_prepare_eval failed (code={exit_code})"
+
+
+def _race_worker_play(task: tuple) -> TaskResult:
+    idx, weights, numbers, seed = task
+    setup = _RACE_WORKER.get("setup")
+    if setup is None:
+        return idx, [], 0.0, str(_RACE_WORKER.get("error") or "race worker is not initialized")
+    eval_mod = _RACE_WORKER["eval"]
+    t0 = time.perf_counter()
+    games: list[GameResult] = []
+    try:
+        try:
+            reward_cfg.apply_heur_calibration_weights(weights)
+            env = eval_mod.unwrap_env(setup["env"])
+        except Exception as exc:
+            return idx, [], time.perf_counter() - t0, f"weights: {type(exc).__name__}: {exc}"
+        # Ошибка партии не выбрасывает уже сыгранные партии чанка; остаток чанка не играем —
+        # кандидат всё равно снимается с гонки.
+        for game_no in numbers:
+            try:
+                result = eval_mod._play_game(
+                    setup, _RACE_WORKER["epsilon"], _RACE_WORKER["learner_side"], eval_mod._game_seed(seed, game_no)
+                )
+                games.append((int(game_no), str(result[0] or ""), env.pop_heur_metrics_record()))
+            except Exception as exc:
+                return idx, games, time.perf_counter() - t0, f"game {int(game_no)}: {type(exc).__name__}: {exc}"
+    finally:
+        # Воркеры пула завершаются без atexit — хвост логов задачи пишем сразу.
+        flush_log_writer()
+    return idx, games, time.perf_counter() - t0, None
+
+
+class RacePool:
+    """spawn-пул воркеров с прогретым env; play(tasks) отдаёт результаты по мере готовности."""
+
+    def __init__(self, eval_args, *, workers: int, learner_side: str, epsilon: float = 0.0) -> None:
+        import multiprocessing as mp
+
+        self.workers = max(1, int(workers))
+        ctx = mp.get_context("spawn")
+        self._pool = ctx.Pool(
+            processes=self.workers,
+            initializer=_race_worker_init,
+            initargs=(eval_args, str(learner_side), float(epsilon)),
+        )
+
+    def play(self, tasks: list[tuple]) -> Iterator[TaskResult]:
+        yield from self._pool.imap_unordered(_race_worker_play, tasks)
+
+    def close(self) -> None:
+        """Штатное завершение: воркеры доигрывают задачи и выходят сами (с flush логов)."""
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self) -> None:
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self) -> RacePool:
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
@@ -31,7 +31,7 @@ from core.engine.agent_registry import (
     make_env_contract,
     save_agent_artifact,
 )
-from core.engine.game_io import ConsoleIO, set_active_io
+from core.engine.game_io import ConsoleIO, flush_log_writer, set_active_io
 from core.engine.io_profiler import get_io_profiler
 from core.engine.matchmaker import choose_opponent, record_matchup
 from core.engine.mission import (
@@ -40,6 +40,7 @@ from core.engine.mission import (
     normalize_mission_name,
     post_deploy_setup,
 )
+from core.envs.shared_vec_env import SharedEnvSlot, SharedMemoryVecEnv, SharedVecSpec, serve_slot
 from core.envs.warhamEnv import *
 from project_paths import (
     AGENT_TRAIN_LOG_PATH,
@@ -130,7 +131,13 @@ from core.models.gumbel_muzero_search import GumbelMuZeroSearch, GumbelMuZeroSea
 from core.models.gumbel_muzero_selfplay import GumbelSelfPlayConfig, play_episode_with_gumbel_muzero
 from core.models.gumbel_muzero_trainer import GumbelMuZeroTrainConfig, make_gmz_lr_scheduler, train_gumbel_muzero_step
 from core.models.memory import *
-from core.models.opponent_adapter import OpponentSpec, build_policy_fn, load_agent_opponent
+from core.models.opponent_adapter import (
+    OpponentSpec,
+    build_policy_batch_fn,
+    build_policy_fn,
+    enemy_turns_batched,
+    load_agent_opponent,
+)
 from core.models.PPO import (
     ActorCriticMultiHead,
     load_actor_critic_state_dict,
@@ -155,6 +162,8 @@ from core.models.sampled_muzero_trainer import (
     train_sampled_muzero_step,
 )
 from core.models.smz_inference_server import smz_inference_server_entry
+from core.models.replay_checkpoint import ReplayCheckpointWriter, load_replay_manifest, resolve_replay_manifest
+from core.models.weight_broadcast import WeightSync, publish_weights
 from core.models.smz_remote_search_cfg_builder import publish_smz_remote_search_cfg
 from core.models.utils import *
 
@@ -346,6 +355,9 @@ if SAVE_EVERY > 0 and SAVE_EVERY < SAVE_EVERY_MIN and not SAVE_EVERY_ALLOW_LOW:
 RESUME_CHECKPOINT = os.getenv("RESUME_CHECKPOINT", "").strip()
 # Параллелизм через subprocess (только без self-play, маски считаются в воркерах).
 USE_SUBPROC_ENVS = os.getenv("USE_SUBPROC_ENVS", "0") == "1"
+# Subprocess env: obs/reward/done/маски через shared memory, по pipe — только командные байты.
+# Opt-in (SHM_VEC_ENV=1): по умолчанию остаётся проверенный pickle-путь.
+SHM_VEC_ENV = os.getenv("SHM_VEC_ENV", "0") == "1"
 # Рекомендации (включать вручную при наличии GPU/CPU): NUM_ENVS=8..16, BATCH_ACT=1,
 # USE_AMP=1, USE_COMPILE=1, PREFETCH=1, PIN_MEMORY=1, LOG_EVERY=200.
 # ======================
@@ -531,6 +543,14 @@ RULESET_VERSION = str(os.getenv("RULESET_VERSION", "only_war_v1")).strip() or "o
 HEURISTIC_MODE = str(os.getenv("HEURISTIC_MODE", "v2")).strip().lower() or "v2"
 IO_PROFILER = get_io_profiler()
 
+def _make_uniform_replay(capacity: int):
+    """Uniform DQN replay: REPLAY_BACKEND=arrays (кольцо numpy-массивов, по умолчанию) или deque."""
+    backend = os.getenv("REPLAY_BACKEND", "arrays").strip().lower()
+    if backend == "deque":
+        return ReplayMemory(capacity)
+    return ArrayReplayMemory(capacity)
+
+
 def to_np_state(s):
     if isinstance(s, (dict, collections.OrderedDict)):
         return np.array(list(s.values()), dtype=np.float32)
@@ -711,6 +731,19 @@ def _build_dqn_lr_scheduler(optimizer, total_steps_hint=None):
     return None
 
 
+def _make_replay_checkpoint_writer(chunk_dir: str, resume_meta: dict) -> ReplayCheckpointWriter:
+    """Replay в чекпойнтах DQN: чанки новых строк + manifest в фоне (см. core/models/replay_checkpoint.py)."""
+    writer = ReplayCheckpointWriter(chunk_dir, log=append_agent_log)
+    manifest_path = str(resume_meta.get("replay_manifest") or "")
+    if manifest_path:
+        # продолжаем цепочку чанков резюмированного буфера, а не пишем его заново
+        try:
+            writer.adopt(manifest_path)
+        except (OSError, ValueError, KeyError) as exc:
+            append_agent_log(f"[RESUME][WARN] replay manifest не подхвачен для дозаписи: {exc}")
+    return writer
+
+
 def _dqn_checkpoint_extra(policy_net, target_net, optimizer, lr_scheduler=None):
     extra = {
         "target_net": target_net.state_dict(),
@@ -917,8 +950,33 @@ def _resume_from_checkpoint(policy_net, target_net, optimizer, memory, checkpoin
         restored_episode = int(checkpoint.get("episode", 0) or 0)
 
     replay_loaded = 0
+    replay_manifest = checkpoint.get("replay_manifest") if isinstance(checkpoint, dict) else None
     replay_state = checkpoint.get("replay_memory") if isinstance(checkpoint, dict) else None
-    if replay_state is not None:
+    if replay_manifest:
+        try:
+            # в .pth лежит имя manifest относительно папки чекпойнта (старые — путь от cwd обучения)
+            replay_manifest = resolve_replay_manifest(checkpoint_path, str(replay_manifest))
+            replay_loaded, replay_missing = load_replay_manifest(replay_manifest, memory)
+            if replay_missing:
+                warn_msg = (
+                    "[RESUME][WARN] Часть replay чанков не найдена — буфер восстановлен частично. "
+                    "Где: train.py (_resume_from_checkpoint/load_replay_manifest). "
+                    "Что делать: проверьте, что папка replay/ переносилась вместе с чекпойнтом и чанки "
+                    f"не удалялись вручную. missing={len(replay_missing)}"
+                )
+                print(warn_msg)
+                append_agent_log(warn_msg)
+        except Exception as exc:
+            replay_manifest = None
+            warn_msg = (
+                "[RESUME][WARN] Не удалось загрузить replay manifest. "
+                "Где: train.py (_resume_from_checkpoint/load_replay_manifest). "
+                "Что делать: обучение продолжится с пустым буфером; проверьте, что рядом с чекпойнтом "
+                f"лежит *.replay.json и папка replay/. Детали: {exc}"
+            )
+            print(warn_msg)
+            append_agent_log(warn_msg)
+    elif replay_state is not None:
         try:
             replay_loaded = int(memory.load_state_dict(replay_state) or 0)
         except Exception as exc:
@@ -961,6 +1019,7 @@ def _resume_from_checkpoint(policy_net, target_net, optimizer, memory, checkpoin
         "optimize_steps": restored_optimize_steps,
         "episode": restored_episode,
         "replay_size": replay_loaded,
+        "replay_manifest": str(replay_manifest) if replay_manifest else "",
         "epsilon": float(eps_at_resume),
         "lr_scheduler_state": scheduler_state,
         "scheduler_loaded": scheduler_loaded,
@@ -1563,6 +1622,13 @@ def _run_az_honest_eval(
     az_net.eval()
     eval_rows: list[dict] = []
     mission_name = normalize_mission_name(roster_config.get("mission", DEFAULT_MISSION_NAME))
+    # Один поиск на весь прогон eval: воркеры process-бэкенда поднимаются один раз
+    # и освобождаются в finally (env каждой партии синхронизируется в run()).
+    mcts = AlphaZeroFactorizedMCTS(
+        az_net,
+        config=_az_honest_eval_mcts_config(mcts_mode=str(mcts_mode)),
+        device=device,
+    )
     try:
         with torch.no_grad():
             for _ in range(max(1, int(n_eval))):
@@ -1599,11 +1665,6 @@ def _run_az_honest_eval(
                         )
                     except Exception:
                         opponent_policy_fn = None
-                mcts = AlphaZeroFactorizedMCTS(
-                    az_net,
-                    config=_az_honest_eval_mcts_config(mcts_mode=str(mcts_mode)),
-                    device=device,
-                )
                 _transitions, info = play_episode_with_mcts(
                     env=env_e,
                     mcts=mcts,
@@ -1628,6 +1689,7 @@ def _run_az_honest_eval(
                 except Exception:
                     pass
     finally:
+        mcts.close()
         if was_training:
             az_net.train()
     return eval_rows
@@ -2139,6 +2201,9 @@ def _env_worker(conn, roster_config, b_len, b_hei, trunc):
         include_masks = os.getenv("TRAIN_IPC_INCLUDE_MASKS", "1") == "1"
 
         def _to_np_state(state):
+            if isinstance(state, np.ndarray) and state.dtype == np.float32:
+                # ObservationEncoder уже отдаёт свежий float32-буфер — без повторной копии.
+                return state
             if isinstance(state, (dict, collections.OrderedDict)):
                 return np.array(list(state.values()), dtype=np.float32)
             return np.array(state, dtype=np.float32)
@@ -2195,6 +2260,61 @@ def _env_worker(conn, roster_config, b_len, b_hei, trunc):
             }
         )
 
+        def _reset_episode():
+            mission_name = normalize_mission_name(roster_config.get("mission", DEFAULT_MISSION_NAME))
+            attacker_side, defender_side = roll_off_attacker_defender(
+                manual_roll_allowed=False,
+                log_fn=None,
+            )
+            deployment_mode = str(os.getenv("DEPLOYMENT_MODE", "auto")).strip().lower() or "auto"
+            deployment_strategy = str(os.getenv("DEPLOYMENT_STRATEGY", "template_jitter")).strip().lower() or "template_jitter"
+            deployment_seed_raw = os.getenv("DEPLOYMENT_SEED", "").strip()
+            deployment_seed = None
+            if deployment_seed_raw:
+                try:
+                    deployment_seed = int(deployment_seed_raw)
+                except ValueError:
+                    deployment_seed = None
+            deploy_stats = deploy_for_mission(
+                mission_name,
+                model_units=model,
+                enemy_units=enemy,
+                b_len=b_len,
+                b_hei=b_hei,
+                attacker_side=attacker_side,
+                log_fn=None,
+                deployment_seed=deployment_seed,
+                deployment_strategy=deployment_strategy,
+                deployment_mode=deployment_mode,
+            )
+            post_deploy_setup(log_fn=None)
+            env.attacker_side = attacker_side
+            env.defender_side = defender_side
+            env.deployment_mode = deployment_mode
+            env.deployment_rl_stats = deploy_stats if isinstance(deploy_stats, dict) else None
+            state, info = env.reset(
+                options={"m": model, "e": enemy, "Type": "small", "trunc": True}
+            )
+            return _to_np_state(state), info
+
+        def _shm_masks():
+            # Родитель читает из shared memory только голову shoot (остальные = all_true),
+            # поэтому считаем ровно её и только при TRAIN_IPC_INCLUDE_MASKS=1 — как в pickle-пути.
+            if not include_masks:
+                return None
+            return {"shoot": unwrap_env(env).get_legal_shoot_mask(side="model")}
+
+        def _shm_step(action_dict):
+            next_observation, reward, done, _res, info = env.step(action_dict)
+            if lean_info_enabled:
+                info = _lean_train_info(info)
+            masks = None if done else _shm_masks()
+            return _to_np_state(next_observation), reward, done, info, masks
+
+        def _shm_reset():
+            state, info = _reset_episode()
+            return state, info, _shm_masks()
+
         while True:
             cmd, payload = conn.recv()
             if cmd == "enemy_turn":
@@ -2211,43 +2331,21 @@ def _env_worker(conn, roster_config, b_len, b_hei, trunc):
                     next_mask = build_shoot_action_mask(env, log_fn=None, debug=False)
                 conn.send((next_observation, reward, done, res, info, next_mask))
             elif cmd == "reset":
-                mission_name = normalize_mission_name(roster_config.get("mission", DEFAULT_MISSION_NAME))
-                attacker_side, defender_side = roll_off_attacker_defender(
-                    manual_roll_allowed=False,
-                    log_fn=None,
-                )
-                deployment_mode = str(os.getenv("DEPLOYMENT_MODE", "auto")).strip().lower() or "auto"
-                deployment_strategy = str(os.getenv("DEPLOYMENT_STRATEGY", "template_jitter")).strip().lower() or "template_jitter"
-                deployment_seed_raw = os.getenv("DEPLOYMENT_SEED", "").strip()
-                deployment_seed = None
-                if deployment_seed_raw:
-                    try:
-                        deployment_seed = int(deployment_seed_raw)
-                    except ValueError:
-                        deployment_seed = None
-                deploy_stats = deploy_for_mission(
-                    mission_name,
-                    model_units=model,
-                    enemy_units=enemy,
-                    b_len=b_len,
-                    b_hei=b_hei,
-                    attacker_side=attacker_side,
-                    log_fn=None,
-                    deployment_seed=deployment_seed,
-                    deployment_strategy=deployment_strategy,
-                    deployment_mode=deployment_mode,
-                )
-                post_deploy_setup(log_fn=None)
-                env.attacker_side = attacker_side
-                env.defender_side = defender_side
-                env.deployment_mode = deployment_mode
-                env.deployment_rl_stats = deploy_stats if isinstance(deploy_stats, dict) else None
-                state, info = env.reset(
-                    options={"m": model, "e": enemy, "Type": "small", "trunc": True}
-                )
-                state = _to_np_state(state)
+                state, info = _reset_episode()
                 mask = build_shoot_action_mask(env, log_fn=None, debug=False) if include_masks else None
                 conn.send((state, info, mask))
+            elif cmd == "attach_shm":
+                # Shared-memory режим: до detach по pipe идут только командные байты (см. shared_vec_env).
+                spec, slot_idx = payload
+                slot = SharedEnvSlot(spec, slot_idx)
+                conn.send(True)
+                serve_slot(
+                    conn,
+                    slot,
+                    step_fn=_shm_step,
+                    reset_fn=_shm_reset,
+                    enemy_turn_fn=lambda: unwrap_env(env).enemyTurn(trunc=trunc),
+                )
             elif cmd == "get_shoot_mask":
                 mask = build_shoot_action_mask(env, log_fn=None, debug=False)
                 conn.send(mask)
@@ -2290,6 +2388,9 @@ def _env_worker(conn, roster_config, b_len, b_hei, trunc):
             conn.send({"error": str(exc)})
         except Exception:
             pass
+    finally:
+        # atexit в дочернем процессе не отработает — дописываем буфер логов сами.
+        flush_log_writer()
 
 def _load_roster_config():
     config = {
@@ -2463,10 +2564,13 @@ def _sample_random_action_from_sizes(action_sizes, shoot_mask=None):
     return action_list
 
 
-def _select_actions_batch(env_contexts, states, steps_done, policy_net, action_sizes, shoot_masks=None):
-    decay_steps = max(1.0, float(EPS_DECAY))
-    progress = min(float(steps_done) / decay_steps, 1.0)
-    eps_threshold = EPS_START + (EPS_END - EPS_START) * progress
+def _select_actions_batch(
+    env_contexts, states, steps_done, policy_net, action_sizes, shoot_masks=None, eps_threshold=None
+):
+    if eps_threshold is None:
+        decay_steps = max(1.0, float(EPS_DECAY))
+        progress = min(float(steps_done) / decay_steps, 1.0)
+        eps_threshold = EPS_START + (EPS_END - EPS_START) * progress
 
     dev = next(policy_net.parameters()).device
     state_tensors = []
@@ -2689,6 +2793,17 @@ AZ_MCTS_PARALLEL_SIMS = int(os.getenv("AZ_MCTS_PARALLEL_SIMS", str(AZ_CFG.get("m
 AZ_MCTS_SIMULATE_ENEMY = str(
     os.getenv("AZ_MCTS_SIMULATE_ENEMY", str(AZ_CFG.get("mcts_simulate_enemy", 1)))
 ).strip() == "1"
+# full = snapshot_state/restore_state на каждую симуляцию; delta = журнал изменений (begin_delta/undo_delta),
+# стоимость отката O(изменённых полей) — делает max_depth > 1 доступным.
+AZ_MCTS_SNAPSHOT_MODE = (
+    str(os.getenv("AZ_MCTS_SNAPSHOT_MODE", str(AZ_CFG.get("mcts_snapshot_mode", "full")))).strip().lower() or "full"
+)
+# thread = клоны env в потоках (упирается в GIL); process = воркер-процессы со своими копиями env
+# (корень раздаётся через shared memory) — реальное масштабирование по ядрам.
+AZ_MCTS_PARALLEL_BACKEND = (
+    str(os.getenv("AZ_MCTS_PARALLEL_BACKEND", str(AZ_CFG.get("mcts_parallel_backend", "thread")))).strip().lower()
+    or "thread"
+)
 
 # --- Inference Server (variant B) ---
 # GAZ едет на общей AZ-инфре, но управляется своими GAZ_* env (свои порты 5565/5567),
@@ -2902,7 +3017,9 @@ def _az_mcts_config(*, progress: float = 0.0, move_count: int = 0) -> MCTSConfig
         temperature_opening_moves=int(AZ_TEMP_OPENING_MOVES),
         batch_eval_size=int(AZ_MCTS_BATCH_EVAL_SIZE),
         parallel_simulations=int(AZ_MCTS_PARALLEL_SIMS),
+        parallel_backend=str(AZ_MCTS_PARALLEL_BACKEND),
         simulate_enemy_in_tree=bool(AZ_MCTS_SIMULATE_ENEMY),
+        snapshot_mode=str(AZ_MCTS_SNAPSHOT_MODE),
     )
 
 
@@ -2927,6 +3044,8 @@ def _az_honest_eval_mcts_config(*, mcts_mode: str) -> MCTSConfig:
         temperature_opening_moves=int(AZ_TEMP_OPENING_MOVES),
         batch_eval_size=int(AZ_MCTS_BATCH_EVAL_SIZE),
         parallel_simulations=int(AZ_MCTS_PARALLEL_SIMS),
+        parallel_backend=str(AZ_MCTS_PARALLEL_BACKEND),
+        snapshot_mode=str(AZ_MCTS_SNAPSHOT_MODE),
     )
 
 
@@ -3010,7 +3129,9 @@ def _build_az_search(net, payload: dict, device, *, evaluator=None):
             temperature_opening_moves=int(AZ_TEMP_OPENING_MOVES),
             batch_eval_size=int(payload.get("batch_eval_size", AZ_MCTS_BATCH_EVAL_SIZE)),
             parallel_simulations=int(payload.get("parallel_simulations", AZ_MCTS_PARALLEL_SIMS)),
+            parallel_backend=str(payload.get("parallel_backend", AZ_MCTS_PARALLEL_BACKEND)),
             simulate_enemy_in_tree=bool(payload.get("simulate_enemy_in_tree", AZ_MCTS_SIMULATE_ENEMY)),
+            snapshot_mode=str(payload.get("snapshot_mode", AZ_MCTS_SNAPSHOT_MODE)),
         ),
         device=device,
         evaluator=evaluator,
@@ -3069,6 +3190,14 @@ GMZ_VTRACE_RHO_CLIP = float(os.getenv("GMZ_VTRACE_RHO_CLIP", str(GMZ_CFG.get("vt
 GMZ_VTRACE_C_CLIP = float(os.getenv("GMZ_VTRACE_C_CLIP", str(GMZ_CFG.get("vtrace_c_clip", 0.7))))
 # B2: fraction of training steps to run reanalysis (0=disabled)
 GMZ_REANALYZE_FRACTION = float(os.getenv("GMZ_REANALYZE_FRACTION", str(GMZ_CFG.get("reanalyze_fraction", 0.15))))
+# B2: transitions per reanalysis call / rows per batched search / staleness selector power
+GMZ_REANALYZE_BATCH = max(1, int(os.getenv("GMZ_REANALYZE_BATCH", str(GMZ_CFG.get("reanalyze_batch", 256)))))
+GMZ_REANALYZE_CHUNK = max(1, int(os.getenv("GMZ_REANALYZE_CHUNK", str(GMZ_CFG.get("reanalyze_chunk", 256)))))
+GMZ_REANALYZE_STALENESS_POWER = float(os.getenv("GMZ_REANALYZE_STALENESS_POWER", str(GMZ_CFG.get("reanalyze_staleness_power", 1.0))))
+# B2: доля root value поиска в value target (0 = оставить outcome-таргеты)
+GMZ_REANALYZE_VALUE_MIX = float(os.getenv("GMZ_REANALYZE_VALUE_MIX", str(GMZ_CFG.get("reanalyze_value_mix", 0.0))))
+# B2: поиск reanalysis в фоновом потоке на eager-снимке сети (opt-in: =1)
+GMZ_REANALYZE_BACKGROUND = str(os.getenv("GMZ_REANALYZE_BACKGROUND", str(GMZ_CFG.get("reanalyze_background", 0)))).strip() == "1"
 # B3: tree reuse across moves
 GMZ_TREE_REUSE = str(os.getenv("GMZ_TREE_REUSE", str(GMZ_CFG.get("tree_reuse", 1)))).strip() == "1"
 GMZ_HONEST_EVAL_EPISODES = max(1, int(os.getenv("GMZ_HONEST_EVAL_EPISODES", "20")))
@@ -3197,6 +3326,11 @@ SMZ_VTRACE_FULL = int(os.getenv("SMZ_VTRACE_FULL", str(SMZ_CFG.get("vtrace_full"
 SMZ_VTRACE_RHO_CLIP = float(os.getenv("SMZ_VTRACE_RHO_CLIP", str(SMZ_CFG.get("vtrace_rho_clip", 0.7))))
 SMZ_VTRACE_C_CLIP = float(os.getenv("SMZ_VTRACE_C_CLIP", str(SMZ_CFG.get("vtrace_c_clip", 0.7))))
 SMZ_REANALYZE_FRACTION = float(os.getenv("SMZ_REANALYZE_FRACTION", str(SMZ_CFG.get("reanalyze_fraction", 0.15))))
+SMZ_REANALYZE_BATCH = max(1, int(os.getenv("SMZ_REANALYZE_BATCH", str(SMZ_CFG.get("reanalyze_batch", 256)))))
+SMZ_REANALYZE_CHUNK = max(1, int(os.getenv("SMZ_REANALYZE_CHUNK", str(SMZ_CFG.get("reanalyze_chunk", 256)))))
+SMZ_REANALYZE_STALENESS_POWER = float(os.getenv("SMZ_REANALYZE_STALENESS_POWER", str(SMZ_CFG.get("reanalyze_staleness_power", 1.0))))
+SMZ_REANALYZE_VALUE_MIX = float(os.getenv("SMZ_REANALYZE_VALUE_MIX", str(SMZ_CFG.get("reanalyze_value_mix", 0.0))))
+SMZ_REANALYZE_BACKGROUND = str(os.getenv("SMZ_REANALYZE_BACKGROUND", str(SMZ_CFG.get("reanalyze_background", 0)))).strip() == "1"
 SMZ_EMA_TAU = float(os.getenv("SMZ_EMA_TAU", str(SMZ_CFG.get("ema_tau", 0.005))))
 SMZ_LEARNER_COMPILE = str(os.getenv("SMZ_LEARNER_COMPILE", str(SMZ_CFG.get("learner_compile", 1)))).strip() == "1"
 # Вариант A: GPU/CPU-акторы; вариант B: inference_server + CPU env workers (local|remote)
@@ -3284,8 +3418,48 @@ UPDATES_PER_STEP = int(data.get("updates_per_step", 1))  # 1 = как было 
 WARMUP_STEPS     = int(data.get("warmup_steps", 0))      # 0 = без прогрева
 
 
+def _attach_shared_vec_env(env_contexts, head_sizes) -> SharedMemoryVecEnv:
+    """Переводит subprocess env в shared-memory режим; ctx получает shm_vec/shm_idx."""
+    first = env_contexts[0]
+    len_model = int(first["len_model"])
+    keys = ordered_action_keys(len_model)
+    info = first.get("info") or {}
+    spec = SharedVecSpec(
+        n_envs=len(env_contexts),
+        obs_dim=int(np.asarray(first["state"]).size),
+        keys=tuple(keys),
+        head_sizes=tuple(int(x) for x in head_sizes),
+        n_model=len_model,
+        n_enemy=len(info.get("player health", []) or []),
+        mission=str(info.get("mission", DEFAULT_MISSION_NAME)),
+    )
+    vec = SharedMemoryVecEnv([ctx["conn"] for ctx in env_contexts], spec)
+    for idx, ctx in enumerate(env_contexts):
+        ctx["shm_vec"] = vec
+        ctx["shm_idx"] = idx
+    return vec
+
+
+def _detach_shared_vec_env(env_contexts) -> None:
+    vec = env_contexts[0].get("shm_vec") if env_contexts else None
+    if vec is None:
+        return
+    vec.close()
+    for ctx in env_contexts:
+        ctx.pop("shm_vec", None)
+        ctx.pop("shm_idx", None)
+
+
+def _shm_reset_ctx(ctx):
+    """reset одного env в shared-memory режиме -> (state, info, shoot_mask) как у pipe-reset."""
+    vec, idx = ctx["shm_vec"], ctx["shm_idx"]
+    state, info = vec.reset(idx)
+    return state, info, torch.as_tensor(vec.head_mask(idx, "shoot"), dtype=torch.bool)
+
+
 def _cleanup_train_envs(env_contexts, subproc_envs, use_subproc: bool) -> None:
     if use_subproc:
+        _detach_shared_vec_env(env_contexts)
         for ctx in env_contexts:
             try:
                 ctx["conn"].send(("close", None))
@@ -3869,8 +4043,9 @@ def run_ppo_training_subproc(env_contexts, totLifeT, n_actions, n_observations,
     print(f"[PPO][CONFIG] vec_env_count={vec_env_count} use_subproc=1", flush=True)
 
     # В subproc у нас нет доступа к env.action_space, поэтому делаем "быстрый" контракт масок:
-    # - shoot_mask приходит по IPC (если включено TRAIN_IPC_INCLUDE_MASKS=1)
+    # - shoot_mask приходит по IPC (если включено TRAIN_IPC_INCLUDE_MASKS=1) или из shared memory
     # - остальные головы = all_true.
+    shm_vec = env_contexts[0].get("shm_vec")
     while episodes_finished < int(totLifeT):
         obs_batch = []
         shoot_masks = []
@@ -3894,10 +4069,13 @@ def run_ppo_training_subproc(env_contexts, totLifeT, n_actions, n_observations,
             masks_by_head.append(mask)
 
         # enemy_turn синхронно (до model step)
-        for ctx in env_contexts:
-            ctx["conn"].send(("enemy_turn", None))
-        for ctx in env_contexts:
-            _ = ctx["conn"].recv()
+        if shm_vec is not None:
+            shm_vec.enemy_turn_all()
+        else:
+            for ctx in env_contexts:
+                ctx["conn"].send(("enemy_turn", None))
+            for ctx in env_contexts:
+                _ = ctx["conn"].recv()
 
         action_t, logprob_t, value_t = actor_critic.act(obs_t, masks_by_head=masks_by_head, deterministic=False)
         action_np = action_t.detach().cpu().numpy()
@@ -3905,16 +4083,25 @@ def run_ppo_training_subproc(env_contexts, totLifeT, n_actions, n_observations,
         value_np = value_t.detach().cpu().numpy()
 
         # step синхронно
-        for env_idx, ctx in enumerate(env_contexts):
-            action_row = action_np[env_idx]
-            action_dict = convertToDict(torch.tensor([action_row], device="cpu"))
-            for i_u in range(int(ctx["len_model"])):
-                key = f"move_num_{i_u}"
-                action_dict[key] = int(action_row[6 + i_u])
-            ctx["conn"].send(("step", action_dict))
+        if shm_vec is not None:
+            # action_np уже в порядке ordered_action_keys (move_num_i с индекса 6).
+            obs_all, rew_all, done_all, info_all = shm_vec.step_all(action_np)
+        else:
+            for env_idx, ctx in enumerate(env_contexts):
+                action_row = action_np[env_idx]
+                action_dict = convertToDict(torch.tensor([action_row], device="cpu"))
+                for i_u in range(int(ctx["len_model"])):
+                    key = f"move_num_{i_u}"
+                    action_dict[key] = int(action_row[6 + i_u])
+                ctx["conn"].send(("step", action_dict))
 
         for env_idx, ctx in enumerate(env_contexts):
-            next_obs, reward, done, _, info, next_mask = ctx["conn"].recv()
+            if shm_vec is not None:
+                done = bool(done_all[env_idx])
+                next_obs, reward, info = obs_all[env_idx], float(rew_all[env_idx]), info_all[env_idx]
+                next_mask = None if done else torch.as_tensor(shm_vec.head_mask(env_idx, "shoot"), dtype=torch.bool)
+            else:
+                next_obs, reward, done, _, info, next_mask = ctx["conn"].recv()
 
             # сохраняем transition
             masks_cpu = []
@@ -4014,8 +4201,11 @@ def run_ppo_training_subproc(env_contexts, totLifeT, n_actions, n_observations,
                 log_train_episode_line(episode_row, total=int(totLifeT), algo="ppo")
 
                 # reset env сразу после done
-                ctx["conn"].send(("reset", None))
-                state, info0, mask0 = ctx["conn"].recv()
+                if shm_vec is not None:
+                    state, info0, mask0 = _shm_reset_ctx(ctx)
+                else:
+                    ctx["conn"].send(("reset", None))
+                    state, info0, mask0 = ctx["conn"].recv()
                 ctx["state"] = state
                 ctx["info"] = info0
                 ctx["shoot_mask"] = mask0
@@ -4428,6 +4618,8 @@ def main():
     if USE_SUBPROC_ENVS:
         primary_ctx["conn"].send(("get_action_space", ordered_keys))
         n_actions = primary_ctx["conn"].recv()
+        if SHM_VEC_ENV:
+            _attach_shared_vec_env(env_contexts, n_actions)
     else:
         n_actions = []
         for k in ordered_keys:
@@ -4587,7 +4779,7 @@ def main():
     if PER_ENABLED:
         memory = PrioritizedReplayMemory(replay_capacity, alpha=PER_ALPHA, eps=PER_EPS)
     else:
-        memory = ReplayMemory(replay_capacity)
+        memory = _make_uniform_replay(replay_capacity)
 
     resume_meta = {
         "global_step": 0,
@@ -4622,6 +4814,8 @@ def main():
             print(f"[WARN] torch.compile недоступен: {exc}")
     
     opponent_policy_net = None
+    # Registry-оппонент другого algo (PPO/AZ/GMZ/SMZ против DQN): своя сеть, один батч на все среды шага.
+    opponent_batch_policy = None
     current_selfplay_update_every = SELF_PLAY_UPDATE_EVERY_EPISODES
     opponent_eps_state = {"value": float(SELF_PLAY_OPPONENT_EPSILON)}
     opponent_pool_entries = collections.deque(maxlen=SELF_PLAY_POOL_SIZE)
@@ -4813,16 +5007,29 @@ def main():
                     f"Несовместимый агент-оппонент '{selected_id}': {mismatch_reason}. "
                     "Что делать: переобучите агента с тем же ruleset/action/obs контрактом."
                 )
-            loaded_policy = normalize_state_dict(payload["policy_state"])
-            opponent_policy_net.load_state_dict(loaded_policy)
-            opponent_source_state["source"] = str(league_pick.get("source", "registry"))
-            opponent_source_state["id"] = selected_id
-            opponent_source_state["score"] = league_pick.get("reason")
+            _opp_sp = None
             try:
                 _opp_sp = load_agent_opponent(agent_id=selected_id, expected_contract=env_contract)
                 opponent_snapshot_sync_enabled = str(_opp_sp.algo).lower() == str(TRAIN_ALGO).lower()
             except Exception:
                 pass
+            if _opp_sp is not None and not opponent_snapshot_sync_enabled and not USE_SUBPROC_ENVS:
+                try:
+                    opponent_batch_policy = build_policy_batch_fn(
+                        len_model=int(env_contexts[0]["len_model"]),
+                        opponent=_opp_sp,
+                        deterministic=True,
+                    )
+                except ValueError as exc:
+                    append_agent_log(
+                        f"[LEAGUE][WARN] батч-оппонент недоступен agent_id={selected_id} algo={_opp_sp.algo}: {exc}"
+                    )
+            if opponent_batch_policy is None:
+                loaded_policy = normalize_state_dict(payload["policy_state"])
+                opponent_policy_net.load_state_dict(loaded_policy)
+            opponent_source_state["source"] = str(league_pick.get("source", "registry"))
+            opponent_source_state["id"] = selected_id
+            opponent_source_state["score"] = league_pick.get("reason")
             append_agent_log(
                 f"[LEAGUE] выбран оппонент agent_id={selected_id} source={opponent_source_state['source']} mode=roster_fixed"
             )
@@ -4924,6 +5131,8 @@ def main():
     scaler = torch.cuda.amp.GradScaler(enabled=USE_AMP)
     
     def opponent_policy(obs, env, len_model):
+        if opponent_batch_policy is not None:
+            return opponent_batch_policy([obs], [opponent_batch_policy.masks_for(unwrap_env(env))])[0]
         if opponent_policy_net is None:
             return None
         action = select_action_with_epsilon(
@@ -4972,7 +5181,9 @@ def main():
     pending_pbar_updates = 0
     
     for ctx in env_contexts:
-        if USE_SUBPROC_ENVS:
+        if USE_SUBPROC_ENVS and ctx.get("shm_vec") is not None:
+            ctx["state"], ctx["info"], ctx["shoot_mask"] = _shm_reset_ctx(ctx)
+        elif USE_SUBPROC_ENVS:
             ctx["conn"].send(("reset", None))
             ctx["state"], ctx["info"], ctx["shoot_mask"] = ctx["conn"].recv()
         else:
@@ -5011,6 +5222,7 @@ def main():
     models_root = os.path.join(MODELS_DIR, algo_tag)
     fold = os.path.join(models_root, safe_name)
     fileName = os.path.join(fold, "model-" + date + ".pickle")
+    replay_ckpt = _make_replay_checkpoint_writer(os.path.join(fold, "replay"), resume_meta)
     randNum = np.random.randint(0, 10000000)
     metrics_obj = metrics(fold, randNum, date)
     ep_rows = []
@@ -5170,11 +5382,34 @@ def main():
         perf_stats["action_select_s"] += time.perf_counter() - action_start
     
         enemy_turn_start = time.perf_counter()
-        if USE_SUBPROC_ENVS:
+        shm_vec = env_contexts[0].get("shm_vec") if USE_SUBPROC_ENVS else None
+        if shm_vec is not None:
+            shm_vec.enemy_turn_all()
+        elif USE_SUBPROC_ENVS:
             for ctx in env_contexts:
                 ctx["conn"].send(("enemy_turn", None))
             for ctx in env_contexts:
                 ctx["conn"].recv()
+        elif SELF_PLAY_ENABLED and opponent_batch_policy is not None:
+            enemy_turns_batched(
+                [unwrap_env(ctx["env"]) for ctx in env_contexts],
+                opponent_batch_policy,
+                trunc=trunc,
+            )
+        elif SELF_PLAY_ENABLED and opponent_policy_net is not None and BATCH_ACT and len(env_contexts) > 1:
+            # Один forward оппонента на все среды шага вместо batch-of-one в каждом enemyTurn.
+            enemy_envs = [unwrap_env(ctx["env"]) for ctx in env_contexts]
+            enemy_obs = [env_u.begin_enemy_turn(trunc=trunc) for env_u in enemy_envs]
+            enemy_actions, _ = _select_actions_batch(
+                env_contexts,
+                enemy_obs,
+                global_step,
+                opponent_policy_net,
+                n_actions,
+                eps_threshold=float(opponent_eps_state["value"]),
+            )
+            for env_u, enemy_action in zip(enemy_envs, enemy_actions):
+                env_u.enemyTurn(trunc=trunc, action=convertToDict(enemy_action))
         else:
             for idx, ctx in enumerate(env_contexts):
                 env_unwrapped = unwrap_env(ctx["env"])
@@ -5226,7 +5461,20 @@ def main():
                     ctx["action_head_invalid"]["shoot"] += 1
 
         step_results = [None] * len(env_contexts)
-        if USE_SUBPROC_ENVS:
+        if shm_vec is not None:
+            step_start = time.perf_counter()
+            keys = shm_vec.spec.keys
+            obs_all, rew_all, done_all, info_all = shm_vec.step_all(
+                [[int(d.get(k, 0)) for k in keys] for d in action_dicts]
+            )
+            for idx in range(len(env_contexts)):
+                next_mask = None
+                if not done_all[idx]:
+                    next_mask = torch.as_tensor(shm_vec.head_mask(idx, "shoot"), dtype=torch.bool)
+                step_results[idx] = (obs_all[idx], float(rew_all[idx]), bool(done_all[idx]), False, info_all[idx], next_mask)
+            perf_stats["env_step_s"] += time.perf_counter() - step_start
+            perf_counts["env_steps"] += len(env_contexts)
+        elif USE_SUBPROC_ENVS:
             # Batched IPC: сначала отправляем step всем env, затем собираем ответы.
             step_start = time.perf_counter()
             for idx, ctx in enumerate(env_contexts):
@@ -5600,7 +5848,7 @@ def main():
                                 "global_step": int(global_step),
                                 "optimize_steps": int(optimize_steps),
                                 "episode": int(resume_episode_base + numLifeT + 1),
-                                "replay_memory": memory.state_dict(),
+                                **replay_ckpt.snapshot(memory, best_path),
                                 "best_eval_score": float(best_eval_score),
                                 "best_eval_episode": int(best_eval_episode),
                                 "eval_window_metrics": {
@@ -5767,7 +6015,7 @@ def main():
                             "global_step": int(global_step),
                             "optimize_steps": int(optimize_steps),
                             "episode": int(total_episode),
-                            "replay_memory": memory.state_dict(),
+                            **replay_ckpt.snapshot(memory, checkpoint_path),
                         }
                         ckpt_payload.update(_dqn_checkpoint_extra(policy_net, target_net, optimizer, lr_scheduler))
                         torch.save(ckpt_payload, checkpoint_path)
@@ -5851,7 +6099,9 @@ def main():
                 # numLifeT == totLifeT (без +1, иначе якорь сработал бы и на предпоследнем).
                 _run_deterministic_eval(total_episode, force=(numLifeT >= totLifeT))
     
-                if USE_SUBPROC_ENVS:
+                if USE_SUBPROC_ENVS and ctx.get("shm_vec") is not None:
+                    ctx["state"], ctx["info"], ctx["shoot_mask"] = _shm_reset_ctx(ctx)
+                elif USE_SUBPROC_ENVS:
                     ctx["conn"].send(("reset", None))
                     ctx["state"], ctx["info"], ctx["shoot_mask"] = ctx["conn"].recv()
                 else:
@@ -6107,16 +6357,20 @@ def main():
             "global_step": int(global_step),
             "optimize_steps": int(optimize_steps),
             "episode": int(resume_episode_base + numLifeT),
-            "replay_memory": memory.state_dict(),
+            **replay_ckpt.snapshot(memory, model_rel_path),
         }
         final_ckpt.update(_dqn_checkpoint_extra(policy_net, target_net, optimizer, lr_scheduler))
         torch.save(final_ckpt, model_rel_path)
+        replay_ckpt.flush()
     with IO_PROFILER.timed("metrics save"):
         det_gui = save_actor_det_eval_plot(run_id=str(randNum), metrics_dir=METRICS_DIR)
         opponent_source = str(opponent_source_state.get("source", "unknown"))
         opponent_id = opponent_source_state.get("id")
         if SELF_PLAY_ENABLED:
-            opponent_algo = "dqn" if opponent_policy_net is not None else "heuristic"
+            if opponent_batch_policy is not None:
+                opponent_algo = str(opponent_batch_policy.algo)
+            else:
+                opponent_algo = "dqn" if opponent_policy_net is not None else "heuristic"
         else:
             opponent_algo = "heuristic"
         learner_side = str(learner_identity.side or "P1").strip().upper() or "P1"
@@ -6198,6 +6452,9 @@ def main():
         f"model-{date}_{learner_identity.side}_{learner_identity.faction}_{mission_tag_s}_final_ep{final_episode}.pickle",
     )
 
+    if USE_SUBPROC_ENVS:
+        # save_pickle/close идут обычными pickle-командами.
+        _detach_shared_vec_env(env_contexts)
     if "env" in primary_ctx and "model" in primary_ctx and "enemy" in primary_ctx:
         toSave = [primary_ctx["env"], primary_ctx["model"], primary_ctx["enemy"]]
         with open(fileName, "wb") as file:
@@ -6506,7 +6763,7 @@ def _main_actor_learner(*, roster_config, totLifeT, clip_reward_enabled, clip_re
     if PER_ENABLED:
         memory = PrioritizedReplayMemory(replay_capacity, alpha=PER_ALPHA, eps=PER_EPS)
     else:
-        memory = ReplayMemory(replay_capacity)
+        memory = _make_uniform_replay(replay_capacity)
 
     # Resume до формирования init_weights, чтобы акторы (локальные и ПК2 через sync_path)
     # стартовали с восстановленных весов, а не случайных.
@@ -6529,6 +6786,9 @@ def _main_actor_learner(*, roster_config, totLifeT, clip_reward_enabled, clip_re
                 "[RESUME][WARN] Не удалось загрузить lr_scheduler state (DQN actor-learner). "
                 f"Где: train.py (_main_actor_learner). Детали: {exc}"
             )
+    # Writer сразу после resume, как в однопроцессном DQN: adopt подхватывает цепочку чанков
+    # резюмированного буфера до того, как акторы начнут его перезаписывать.
+    replay_ckpt = _make_replay_checkpoint_writer(os.path.join(MODELS_DIR, "ACTOR_LEARNER", "replay"), resume_meta)
     target_net.eval()
     scaler = torch.cuda.amp.GradScaler(enabled=bool(USE_AMP and device.type == "cuda"))
 
@@ -6576,7 +6836,7 @@ def _main_actor_learner(*, roster_config, totLifeT, clip_reward_enabled, clip_re
         )
         rollout_receiver.start()
         try:
-            torch.save({"state_dict": init_weights}, sync_path)
+            publish_weights(sync_path, init_weights, file_fallback=bool(DQN_DISTRIBUTED_ACTORS))
         except Exception as exc:
             append_agent_log(f"[DQN][DIST][WARN] не удалось записать стартовые веса {sync_path}: {exc}")
         try:
@@ -7222,11 +7482,12 @@ def _main_actor_learner(*, roster_config, totLifeT, clip_reward_enabled, clip_re
             # периодически публикуем свежие веса для акторов
             if sync_enabled and (optimize_steps - last_sync_opt_steps) >= sync_every_updates:
                 try:
-                    cpu_sd = {
-                        k: v.detach().cpu()
-                        for k, v in normalize_state_dict(policy_net.state_dict()).items()
-                    }
-                    torch.save({"optimize_steps": int(optimize_steps), "state_dict": cpu_sd}, sync_path)
+                    publish_weights(
+                        sync_path,
+                        normalize_state_dict(policy_net.state_dict()),
+                        {"optimize_steps": int(optimize_steps)},
+                        file_fallback=bool(DQN_DISTRIBUTED_ACTORS),
+                    )
                     last_sync_opt_steps = int(optimize_steps)
                 except Exception:
                     pass
@@ -7297,10 +7558,11 @@ def _main_actor_learner(*, roster_config, totLifeT, clip_reward_enabled, clip_re
                 "global_step": int(global_step),
                 "optimize_steps": int(optimize_steps),
                 "episode": int(resume_episode_base + len(ep_rows)),
-                "replay_memory": memory.state_dict(),
+                **replay_ckpt.snapshot(memory, model_path),
             }
             actor_ckpt.update(_dqn_checkpoint_extra(policy_net, target_net, optimizer, lr_scheduler))
             torch.save(actor_ckpt, model_path)
+            replay_ckpt.flush()
 
         det_gui = save_actor_det_eval_plot(run_id=run_id, metrics_dir=METRICS_DIR)
         if det_gui:
@@ -7830,13 +8092,10 @@ def _main_actor_learner_ppo(*, roster_config, totLifeT, clip_reward_enabled, cli
                             },
                         )
                         append_agent_log(f"[LEAGUE][SAVE][PPO] agent_id={agent_id} artifact_dir={artifact_dir}")
-                        torch.save(
-                            {
-                                "episode": int(episodes_finished),
-                                "agent_id": str(agent_id),
-                                "state_dict": opponent_state_dict_cpu,
-                            },
+                        publish_weights(
                             opp_sync_path,
+                            opponent_state_dict_cpu,
+                            {"episode": int(episodes_finished), "agent_id": str(agent_id)},
                         )
                         opponent_source_label = "snapshot_policy_fn"
                         opponent_agent_id = str(agent_id)
@@ -7918,8 +8177,11 @@ def _main_actor_learner_ppo(*, roster_config, totLifeT, clip_reward_enabled, cli
                 # sync weights
                 if sync_enabled and (ppo_update_step - last_sync_update_step) >= sync_every_updates:
                     try:
-                        cpu_sd = {k: v.detach().cpu() for k, v in normalize_state_dict(actor_critic.state_dict()).items()}
-                        torch.save({"update_step": int(ppo_update_step), "state_dict": cpu_sd}, sync_path)
+                        publish_weights(
+                            sync_path,
+                            normalize_state_dict(actor_critic.state_dict()),
+                            {"update_step": int(ppo_update_step)},
+                        )
                         last_sync_update_step = int(ppo_update_step)
                     except Exception:
                         pass
@@ -8057,7 +8319,7 @@ def _actor_learner_actor_entry(
         sync_enabled = os.getenv("ACTOR_SYNC_ENABLED", "1") == "1"
         sync_path = os.path.join(MODELS_DIR, "actor_sync", "latest_policy.pth")
         sync_check_every_ep = max(1, int(os.getenv("ACTOR_SYNC_CHECK_EVERY_EP", "10")))
-        last_sync_mtime = -1.0
+        sync_weights = WeightSync(sync_path)
 
         opponent_policy_fn = None
         if int(self_play_enabled) == 1 and opponent_spec is not None:
@@ -8101,15 +8363,11 @@ def _actor_learner_actor_entry(
 
             if sync_enabled and (_ep % sync_check_every_ep == 0):
                 try:
-                    if os.path.isfile(sync_path):
-                        mtime = os.path.getmtime(sync_path)
-                        if mtime > last_sync_mtime:
-                            payload = torch.load(sync_path, map_location="cpu", weights_only=False)
-                            sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                            if isinstance(sd, dict):
-                                cpu_net.load_state_dict(normalize_state_dict(sd))
-                                cpu_net.eval()
-                                last_sync_mtime = float(mtime)
+                    payload = sync_weights.poll()
+                    sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                    if isinstance(sd, dict):
+                        cpu_net.load_state_dict(normalize_state_dict(sd))
+                        cpu_net.eval()
                 except Exception:
                     pass
             # ВАЖНО: повторяем init как в основном train-loop / _env_worker:
@@ -8433,7 +8691,7 @@ def _actor_learner_actor_entry_ppo(
         sync_enabled = os.getenv("ACTOR_SYNC_ENABLED", "1") == "1"
         sync_path = os.path.join(MODELS_DIR, "actor_sync", "latest_ppo.pth")
         sync_check_every_ep = max(1, int(os.getenv("ACTOR_SYNC_CHECK_EVERY_EP", "5")))
-        last_sync_mtime = -1.0
+        sync_weights = WeightSync(sync_path)
 
         opponent_policy_fn = None
         # 1) Explicit opponent via registry (supports cross-algo)
@@ -8445,7 +8703,7 @@ def _actor_learner_actor_entry_ppo(
                 opponent_policy_fn = None
         # 2) Fallback: PPO snapshot sync file (PPO vs PPO), if explicit not set
         opp_sync_path = os.path.join(MODELS_DIR, "actor_sync", "latest_ppo_opp.pth")
-        last_opp_sync_mtime = -1.0
+        opp_sync_weights = WeightSync(opp_sync_path)
         opponent_net = make_actor_critic(n_observations, n_actions).to(torch.device("cpu"))
         opponent_net.eval()
         opponent_loaded = False
@@ -8461,31 +8719,23 @@ def _actor_learner_actor_entry_ppo(
             ep_idx_1based = int(_ep) + 1
             if sync_enabled and (_ep % sync_check_every_ep == 0):
                 try:
-                    if os.path.isfile(sync_path):
-                        mtime = os.path.getmtime(sync_path)
-                        if mtime > last_sync_mtime:
-                            payload = torch.load(sync_path, map_location="cpu", weights_only=False)
-                            sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                            if isinstance(sd, dict):
-                                cpu_net.load_state_dict(normalize_state_dict(sd))
-                                cpu_net.eval()
-                                last_sync_mtime = float(mtime)
+                    payload = sync_weights.poll()
+                    sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                    if isinstance(sd, dict):
+                        cpu_net.load_state_dict(normalize_state_dict(sd))
+                        cpu_net.eval()
                 except Exception:
                     pass
 
             # Обновление оппонента для self-play через sync-файл (если снапшот появился)
             if opponent_policy_fn is None and int(SELF_PLAY_ENABLED) == 1 and (_ep % sync_check_every_ep == 0):
                 try:
-                    if os.path.isfile(opp_sync_path):
-                        mtime = os.path.getmtime(opp_sync_path)
-                        if mtime > last_opp_sync_mtime:
-                            payload = torch.load(opp_sync_path, map_location="cpu", weights_only=False)
-                            sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                            if isinstance(sd, dict):
-                                opponent_net.load_state_dict(normalize_state_dict(sd))
-                                opponent_net.eval()
-                                opponent_loaded = True
-                                last_opp_sync_mtime = float(mtime)
+                    payload = opp_sync_weights.poll()
+                    sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                    if isinstance(sd, dict):
+                        opponent_net.load_state_dict(normalize_state_dict(sd))
+                        opponent_net.eval()
+                        opponent_loaded = True
                 except Exception:
                     pass
 
@@ -8727,7 +8977,7 @@ def _actor_learner_actor_entry_alphazero(
             _az_sync_tag = "proxy"
         sync_path = os.path.join(MODELS_DIR, "actor_sync", f"latest_az_{_az_sync_tag}_policy.pth")
         sync_check_every_ep = max(1, int(os.getenv("ACTOR_SYNC_CHECK_EVERY_EP", "5")))
-        last_sync_mtime = -1.0
+        sync_weights = WeightSync(sync_path)
         current_policy_version = int(outcome_payload.get("policy_version", 0) or 0)
 
         opponent_policy_fn = None
@@ -8760,21 +9010,20 @@ def _actor_learner_actor_entry_alphazero(
             )
             if sync_enabled and (_ep % sync_check_every_ep == 0):
                 try:
-                    if os.path.isfile(sync_path):
-                        mtime = os.path.getmtime(sync_path)
-                        if mtime > last_sync_mtime:
-                            payload = torch.load(sync_path, map_location="cpu", weights_only=False)
-                            sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                            if isinstance(sd, dict):
-                                load_alphazero_state_dict(az_net, normalize_state_dict(sd))
-                                az_net.eval()
-                                mcts.net = az_net
-                                last_sync_mtime = float(mtime)
-                                current_policy_version = int(payload.get("policy_version", current_policy_version) or current_policy_version)
-                                append_agent_log(
-                                    f"[AZ][ACTOR] weight_sync actor={int(actor_idx)} "
-                                    f"version={current_policy_version} file={os.path.basename(sync_path)}"
-                                )
+                    payload = sync_weights.poll()
+                    sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                    if isinstance(sd, dict):
+                        load_alphazero_state_dict(az_net, normalize_state_dict(sd))
+                        az_net.eval()
+                        if hasattr(mcts, "set_net"):
+                            mcts.set_net(az_net)
+                        else:
+                            mcts.net = az_net
+                        current_policy_version = int(payload.get("policy_version", current_policy_version) or current_policy_version)
+                        append_agent_log(
+                            f"[AZ][ACTOR] weight_sync actor={int(actor_idx)} "
+                            f"version={current_policy_version} file={os.path.basename(sync_path)}"
+                        )
                 except Exception:
                     pass
 
@@ -8889,6 +9138,11 @@ def _actor_learner_actor_entry_alphazero(
         except Exception:
             pass
     finally:
+        try:
+            if "mcts" in locals() and hasattr(mcts, "close"):
+                mcts.close()
+        except Exception:
+            pass
         try:
             if "sink" in locals():
                 sink.close()
@@ -9112,6 +9366,11 @@ def _az_env_worker_entry(
         except Exception:
             pass
     finally:
+        try:
+            if "mcts" in locals() and hasattr(mcts, "close"):
+                mcts.close()
+        except Exception:
+            pass
         try:
             if "sink" in locals():
                 sink.close()
@@ -9346,15 +9605,12 @@ def _main_actor_learner_alphazero(*, roster_config, totLifeT, clip_reward_enable
     sync_path = os.path.join(sync_dir, f"latest_az_{_az_sync_tag}_policy.pth")
 
     def _save_az_sync() -> None:
-        cpu_sd = {k: v.detach().cpu() for k, v in normalize_state_dict(az_net.state_dict()).items()}
-        _torch_save_atomic(
-            {
-                "policy_version": int(policy_version),
-                "optimize_steps": int(optimize_steps),
-                "state_dict": cpu_sd,
-            },
+        publish_weights(
             sync_path,
-            label="latest_az_policy",
+            normalize_state_dict(az_net.state_dict()),
+            {"policy_version": int(policy_version), "optimize_steps": int(optimize_steps)},
+            file_fallback=bool(AZ_DISTRIBUTED_ACTORS or AZ_INFERENCE_REMOTE),
+            save_file=lambda payload, path: _torch_save_atomic(payload, path, label="latest_az_policy"),
         )
 
     def _save_checkpoint(episode_idx: int) -> str:
@@ -9408,7 +9664,9 @@ def _main_actor_learner_alphazero(*, roster_config, totLifeT, clip_reward_enable
             "prior_weight_early": AZ_PRIOR_WEIGHT_EARLY,
             "batch_eval_size": AZ_MCTS_BATCH_EVAL_SIZE,
             "parallel_simulations": AZ_MCTS_PARALLEL_SIMS,
+            "parallel_backend": AZ_MCTS_PARALLEL_BACKEND,
             "simulate_enemy_in_tree": AZ_MCTS_SIMULATE_ENEMY,
+            "snapshot_mode": AZ_MCTS_SNAPSHOT_MODE,
         }
     _sp_cfg_payload = {
         "temperature_opening_moves": AZ_TEMP_OPENING_MOVES,
@@ -10390,7 +10648,7 @@ def _actor_learner_actor_entry_gumbel_muzero(
         sync_enabled = os.getenv("ACTOR_SYNC_ENABLED", "1") == "1"
         sync_path = os.path.join(MODELS_DIR, "actor_sync", "latest_gmz_policy.pth")
         sync_check_every_ep = max(1, int(os.getenv("ACTOR_SYNC_CHECK_EVERY_EP", "5")))
-        last_sync_mtime = -1.0
+        sync_weights = WeightSync(sync_path)
         current_policy_version = int(outcome_payload.get("policy_version", 0) or 0)
 
         opponent_policy_fn = None
@@ -10410,17 +10668,13 @@ def _actor_learner_actor_entry_gumbel_muzero(
             ep_idx_1based = int(_ep) + 1
             if sync_enabled and (_ep % sync_check_every_ep == 0):
                 try:
-                    if os.path.isfile(sync_path):
-                        mtime = os.path.getmtime(sync_path)
-                        if mtime > last_sync_mtime:
-                            payload = torch.load(sync_path, map_location="cpu", weights_only=False)
-                            sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                            if isinstance(sd, dict):
-                                gmz_net.load_state_dict(normalize_state_dict(sd))
-                                gmz_net.eval()
-                                search.net = gmz_net
-                                last_sync_mtime = float(mtime)
-                                current_policy_version = int(payload.get("policy_version", current_policy_version) or current_policy_version)
+                    payload = sync_weights.poll()
+                    sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                    if isinstance(sd, dict):
+                        gmz_net.load_state_dict(normalize_state_dict(sd))
+                        gmz_net.eval()
+                        search.net = gmz_net
+                        current_policy_version = int(payload.get("policy_version", current_policy_version) or current_policy_version)
                 except Exception:
                     pass
 
@@ -10599,7 +10853,7 @@ def _actor_learner_actor_entry_sampled_muzero(
         sync_enabled = os.getenv("ACTOR_SYNC_ENABLED", "1") == "1"
         sync_path = os.path.join(MODELS_DIR, "actor_sync", "latest_smz_policy.pth")
         sync_check_every_ep = max(1, int(os.getenv("ACTOR_SYNC_CHECK_EVERY_EP", "5")))
-        last_sync_mtime = -1.0
+        sync_weights = WeightSync(sync_path)
         current_policy_version = int(outcome_payload.get("policy_version", 0) or 0)
 
         opponent_policy_fn = None
@@ -10619,17 +10873,13 @@ def _actor_learner_actor_entry_sampled_muzero(
             ep_idx_1based = int(_ep) + 1
             if sync_enabled and (_ep % sync_check_every_ep == 0):
                 try:
-                    if os.path.isfile(sync_path):
-                        mtime = os.path.getmtime(sync_path)
-                        if mtime > last_sync_mtime:
-                            payload = torch.load(sync_path, map_location="cpu", weights_only=False)
-                            sd = payload.get("state_dict") if isinstance(payload, dict) else None
-                            if isinstance(sd, dict):
-                                smz_net.load_state_dict(normalize_state_dict(sd))
-                                smz_net.eval()
-                                search.net = smz_net
-                                last_sync_mtime = float(mtime)
-                                current_policy_version = int(payload.get("policy_version", current_policy_version) or current_policy_version)
+                    payload = sync_weights.poll()
+                    sd = payload.get("state_dict") if isinstance(payload, dict) else None
+                    if isinstance(sd, dict):
+                        smz_net.load_state_dict(normalize_state_dict(sd))
+                        smz_net.eval()
+                        search.net = smz_net
+                        current_policy_version = int(payload.get("policy_version", current_policy_version) or current_policy_version)
                 except Exception:
                     pass
 
@@ -10895,11 +11145,22 @@ def _main_actor_learner_gumbel_muzero(*, roster_config, totLifeT, clip_reward_en
             device=device,
         )
         gmz_reanalyzer = GumbelMuZeroReanalyzer(
-            config=GumbelMuZeroReanalysisConfig(fast_sims=max(1, int(GMZ_MCTS_SIMS) // 2)),
+            config=GumbelMuZeroReanalysisConfig(
+                fast_sims=max(1, int(GMZ_MCTS_SIMS) // 2),
+                batch_size=GMZ_REANALYZE_BATCH,
+                chunk_size=GMZ_REANALYZE_CHUNK,
+                staleness_power=GMZ_REANALYZE_STALENESS_POWER,
+                value_target_mix=GMZ_REANALYZE_VALUE_MIX,
+                background=GMZ_REANALYZE_BACKGROUND,
+            ),
             search=_search_for_reanalyze,
             device=device,
+            log=append_agent_log,
+        )
+        append_agent_log(
+            f"[GMZ][REANALYZE] fraction={reanalyze_frac} fast_sims={max(1, int(GMZ_MCTS_SIMS) // 2)} "
+            f"batch={GMZ_REANALYZE_BATCH} chunk={GMZ_REANALYZE_CHUNK} background={int(GMZ_REANALYZE_BACKGROUND)}"
         )
-        append_agent_log(f"[GMZ][REANALYZE] fraction={reanalyze_frac} fast_sims={max(1, int(GMZ_MCTS_SIMS) // 2)}")
 
     policy_version = 0
     optimize_steps = 0
@@ -11055,15 +11316,12 @@ def _main_actor_learner_gumbel_muzero(*, roster_config, totLifeT, clip_reward_en
     sync_path = os.path.join(sync_dir, "latest_gmz_policy.pth")
 
     def _save_gmz_sync() -> None:
-        cpu_sd = {k: v.detach().cpu() for k, v in normalize_state_dict(gmz_net.state_dict()).items()}
-        _torch_save_atomic(
-            {
-                "policy_version": int(policy_version),
-                "optimize_steps": int(optimize_steps),
-                "state_dict": cpu_sd,
-            },
+        publish_weights(
             sync_path,
-            label="latest_gmz_policy",
+            normalize_state_dict(gmz_net.state_dict()),
+            {"policy_version": int(policy_version), "optimize_steps": int(optimize_steps)},
+            file_fallback=bool(GMZ_INFERENCE_REMOTE),
+            save_file=lambda payload, path: _torch_save_atomic(payload, path, label="latest_gmz_policy"),
         )
 
     def _save_checkpoint(episode_idx: int) -> str:
@@ -11427,7 +11685,9 @@ def _main_actor_learner_gumbel_muzero(*, roster_config, totLifeT, clip_reward_en
                 and optimize_steps > 0
                 and (optimize_steps % max(1, int(1.0 / float(reanalyze_frac)))) == 0
             ):
-                n_reanalyzed = gmz_reanalyzer.update_replay_with_reanalysis(replay, gmz_net)
+                n_reanalyzed = gmz_reanalyzer.update_replay_with_reanalysis(
+                    replay, gmz_net, policy_version=policy_version
+                )
                 if n_reanalyzed > 0:
                     append_agent_log(f"[GMZ][REANALYZE] step={optimize_steps} updated={n_reanalyzed}")
             append_agent_log(
@@ -11461,6 +11721,9 @@ def _main_actor_learner_gumbel_muzero(*, roster_config, totLifeT, clip_reward_en
         except Exception:
             pass
 
+    if gmz_reanalyzer is not None:
+        gmz_reanalyzer.close()
+
     if not last_checkpoint:
         last_checkpoint = _save_checkpoint(int(resume_episode_base + (episodes_finished or totLifeT)))
         append_agent_log(f"[GMZ][CHECKPOINT] final path={last_checkpoint}")
@@ -11678,11 +11941,22 @@ def _main_actor_learner_sampled_muzero(*, roster_config, totLifeT, clip_reward_e
             device=device,
         )
         smz_reanalyzer = GumbelMuZeroReanalyzer(
-            config=GumbelMuZeroReanalysisConfig(fast_sims=max(1, int(SMZ_NUM_SAMPLES) // 2)),
+            config=GumbelMuZeroReanalysisConfig(
+                fast_sims=max(1, int(SMZ_NUM_SAMPLES) // 2),
+                batch_size=SMZ_REANALYZE_BATCH,
+                chunk_size=SMZ_REANALYZE_CHUNK,
+                staleness_power=SMZ_REANALYZE_STALENESS_POWER,
+                value_target_mix=SMZ_REANALYZE_VALUE_MIX,
+                background=SMZ_REANALYZE_BACKGROUND,
+            ),
             search=_search_for_reanalyze,
             device=device,
+            log=append_agent_log,
+        )
+        append_agent_log(
+            f"[SMZ][REANALYZE] fraction={reanalyze_frac} fast_samples={max(1, int(SMZ_NUM_SAMPLES) // 2)} "
+            f"batch={SMZ_REANALYZE_BATCH} chunk={SMZ_REANALYZE_CHUNK} background={int(SMZ_REANALYZE_BACKGROUND)}"
         )
-        append_agent_log(f"[SMZ][REANALYZE] fraction={reanalyze_frac} fast_samples={max(1, int(SMZ_NUM_SAMPLES) // 2)}")
 
     policy_version = 0
     optimize_steps = 0
@@ -11837,15 +12111,12 @@ def _main_actor_learner_sampled_muzero(*, roster_config, totLifeT, clip_reward_e
     sync_path = os.path.join(sync_dir, "latest_smz_policy.pth")
 
     def _save_smz_sync() -> None:
-        cpu_sd = {k: v.detach().cpu() for k, v in normalize_state_dict(smz_net.state_dict()).items()}
-        _torch_save_atomic(
-            {
-                "policy_version": int(policy_version),
-                "optimize_steps": int(optimize_steps),
-                "state_dict": cpu_sd,
-            },
+        publish_weights(
             sync_path,
-            label="latest_smz_policy",
+            normalize_state_dict(smz_net.state_dict()),
+            {"policy_version": int(policy_version), "optimize_steps": int(optimize_steps)},
+            file_fallback=bool(SMZ_INFERENCE_REMOTE),
+            save_file=lambda payload, path: _torch_save_atomic(payload, path, label="latest_smz_policy"),
         )
 
     def _save_checkpoint(episode_idx: int) -> str:
@@ -12208,7 +12479,9 @@ def _main_actor_learner_sampled_muzero(*, roster_config, totLifeT, clip_reward_e
                 and optimize_steps > 0
                 and (optimize_steps % max(1, int(1.0 / float(reanalyze_frac)))) == 0
             ):
-                n_reanalyzed = smz_reanalyzer.update_replay_with_reanalysis(replay, smz_net)
+                n_reanalyzed = smz_reanalyzer.update_replay_with_reanalysis(
+                    replay, smz_net, policy_version=policy_version
+                )
                 if n_reanalyzed > 0:
                     append_agent_log(f"[SMZ][REANALYZE] step={optimize_steps} updated={n_reanalyzed}")
             append_agent_log(
@@ -12242,6 +12515,9 @@ def _main_actor_learner_sampled_muzero(*, roster_config, totLifeT, clip_reward_e
         except Exception:
             pass
 
+    if smz_reanalyzer is not None:
+        smz_reanalyzer.close()
+
     if not last_checkpoint:
         last_checkpoint = _save_checkpoint(int(resume_episode_base + (episodes_finished or totLifeT)))
         append_agent_log(f"[SMZ][CHECKPOINT] final path={last_checkpoint}")